@@ -23,9 +23,11 @@ BACKEND_DIR="$PROJECT_ROOT/svg-draw-backend"
 FRONTEND_DIR="$PROJECT_ROOT/svg-draw-frontend"
 PID_FILE="$PROJECT_ROOT/.svgdraw.pid"
 
-# 加载统一配置
+# 加载统一配置（set -a：其中的变量全部导出，后端调优项与 api_key_env 引用的密钥都能传给 Django）
 if [ -f "$PROJECT_ROOT/config.env" ]; then
+    set -a
     source "$PROJECT_ROOT/config.env"
+    set +a
 else
     echo -e "${RED}错误: 未找到配置文件 config.env${NC}"
     exit 1
@@ -126,10 +128,7 @@ echo -e "${YELLOW}启动后端服务...${NC}"
 # 设置环境变量供 Django settings.py 使用
 export FRONTEND_URL="${FRONTEND_URL}"
 export FRONTEND_PORT="${FRONTEND_PORT}"
-# SiliconFlow（若在 config.env 中已设置则传给后端）
-[ -n "${SILICONFLOW_API_KEY}" ] && export SILICONFLOW_API_KEY
-[ -n "${SILICONFLOW_BASE_URL}" ] && export SILICONFLOW_BASE_URL
-[ -n "${SILICONFLOW_MODEL}" ] && export SILICONFLOW_MODEL
+# config.env 中的 SILICONFLOW_* / LLM_* / ORCHESTRATOR_* / RUN_* / BLOB_STORE_* 等已在加载时导出
 python manage.py runserver ${BACKEND_HOST}:${BACKEND_PORT} > /tmp/svgdraw-backend.log 2>&1 &
 BACKEND_PID=$!
 
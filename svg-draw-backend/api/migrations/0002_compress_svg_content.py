@@ -0,0 +1,30 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:41
+
+import common.fields
+from common.fields import convert_rows
+from django.db import migrations
+
+
+def compress_rows(apps, schema_editor):
+    convert_rows(apps.get_model('api', 'SvgDraw'), 'svg_content', using=schema_editor.connection.alias)
+
+
+def decompress_rows(apps, schema_editor):
+    convert_rows(apps.get_model('api', 'SvgDraw'), 'svg_content', to_text=True, using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='svgdraw',
+            name='svg_content',
+            field=common.fields.CompressedTextField(verbose_name='SVG 内容'),
+        ),
+        # 已有的未压缩行分批转换为压缩格式
+        migrations.RunPython(compress_rows, decompress_rows),
+    ]
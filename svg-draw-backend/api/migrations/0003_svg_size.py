@@ -0,0 +1,28 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_compress_svg_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='svgdraw',
+            name='height',
+            field=models.FloatField(blank=True, null=True, verbose_name='高度'),
+        ),
+        migrations.AddField(
+            model_name='svgdraw',
+            name='view_box',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='viewBox'),
+        ),
+        migrations.AddField(
+            model_name='svgdraw',
+            name='width',
+            field=models.FloatField(blank=True, null=True, verbose_name='宽度'),
+        ),
+    ]
@@ -1,10 +1,15 @@
 from django.db import models
+from common.fields import CompressedTextField
 
 
 class SvgDraw(models.Model):
     """SVG 绘图数据模型"""
     name = models.CharField(max_length=200, verbose_name='名称')
-    svg_content = models.TextField(verbose_name='SVG 内容')
+    svg_content = CompressedTextField(verbose_name='SVG 内容')
+    # 由 svg_geometry 从内容推导（保存时更新，已有数据用 backfill_svg_meta 补齐）
+    width = models.FloatField(null=True, blank=True, verbose_name='宽度')
+    height = models.FloatField(null=True, blank=True, verbose_name='高度')
+    view_box = models.CharField(max_length=100, blank=True, default='', verbose_name='viewBox')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
 
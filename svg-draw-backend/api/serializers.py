@@ -4,11 +4,12 @@ from .models import SvgDraw
 
 class SvgDrawSerializer(serializers.ModelSerializer):
     """SVG 绘图序列化器"""
+    svg_content = serializers.CharField()  # 模型字段为压缩存储，按普通文本读写
     
     class Meta:
         model = SvgDraw
-        fields = ['id', 'name', 'svg_content', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'svg_content', 'width', 'height', 'view_box', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'width', 'height', 'view_box', 'created_at', 'updated_at']
 
 
 class SvgDrawCreateSerializer(serializers.Serializer):
@@ -1,4 +1,6 @@
 from typing import Dict, Any, Optional
+from common.svg_geometry import measure
+from common.svg_optimizer import optimize_if_enabled
 from .models import SvgDraw
 
 
@@ -7,12 +9,20 @@ class SvgDrawService:
 
     @staticmethod
     def create_svg_draw(name: str, svg_content: str) -> SvgDraw:
-        """创建 SVG 绘图"""
+        """创建 SVG 绘图（内容先经 svg_optimizer 优化，尺寸由 svg_geometry 推导）"""
+        svg_content, _ = optimize_if_enabled(svg_content, source="svg_draw")
         return SvgDraw.objects.create(
             name=name,
-            svg_content=svg_content
+            svg_content=svg_content,
+            **SvgDrawService.size_fields(svg_content)
         )
 
+    @staticmethod
+    def size_fields(svg_content: str) -> Dict[str, Any]:
+        """SVG 内容对应的 width / height / view_box 字段值"""
+        size = measure(svg_content)
+        return {'width': size['width'], 'height': size['height'], 'view_box': size['viewBox'] or ''}
+
     @staticmethod
     def get_svg_draw_list() -> list:
         """获取 SVG 绘图列表"""
@@ -28,7 +38,7 @@ class SvgDrawService:
 
     @staticmethod
     def update_svg_draw(draw_id: int, name: str = None, svg_content: str = None) -> Optional[SvgDraw]:
-        """更新 SVG 绘图"""
+        """更新 SVG 绘图（新内容先经 svg_optimizer 优化并重新推导尺寸）"""
         draw = SvgDrawService.get_svg_draw_by_id(draw_id)
         if not draw:
             return None
@@ -36,7 +46,9 @@ class SvgDrawService:
         if name is not None:
             draw.name = name
         if svg_content is not None:
-            draw.svg_content = svg_content
+            draw.svg_content, _ = optimize_if_enabled(svg_content, source="svg_draw")
+            for field, value in SvgDrawService.size_fields(draw.svg_content).items():
+                setattr(draw, field, value)
         draw.save()
         return draw
 
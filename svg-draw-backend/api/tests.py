@@ -1,3 +1,212 @@
-from django.test import TestCase
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from api.models import SvgDraw
+from common import fields, timing
+from common.fields import codec_of, convert_rows, decode_text, encode_text, save_dictionary, train_dictionary
+from m1_runs.models import Run, RunStepLog
+from m3_llm_providers.tests import MockLLMMixin
+
+
+SVG = '<svg xmlns="http://www.w3.org/2000/svg" width="300" height="150"><rect x="10" y="20" width="30" height="40"/></svg>'
+
+
+class SvgDrawSizeTests(TestCase):
+    """svg_draw 的 width / height / view_box 随内容保存时推导"""
+
+    def test_create_derives_size(self):
+        resp = self.client.post("/api/svg-draws/", {"name": "a", "svg_content": SVG}, content_type="application/json")
+        data = resp.json()["data"]
+        self.assertEqual((data["width"], data["height"], data["view_box"]), (300, 150, "0 0 300 150"))
+
+    def test_update_recomputes_size(self):
+        draw_id = self.client.post("/api/svg-draws/", {"name": "a", "svg_content": SVG}, content_type="application/json").json()["data"]["id"]
+        svg = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 40 20"><circle cx="10" cy="10" r="5"/></svg>'
+        self.client.put(f"/api/svg-draws/{draw_id}/", {"name": "a", "svg_content": svg}, content_type="application/json")
+        draw = SvgDraw.objects.get(pk=draw_id)
+        self.assertEqual((draw.width, draw.height, draw.view_box), (40, 20, "0 0 40 20"))
+
+
+def sample_svg(i: int) -> str:
+    shapes = "".join(f'<rect x="{i * 7 + n}" y="{n * 3}" width="40" height="20" fill="#4a90d9" stroke="#333"/>' for n in range(20))
+    return f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 800 600">{shapes}<text x="{i}" y="9">节点 {i}</text></svg>'
+
+
+class EncodeTextTests(SimpleTestCase):
+    """encode_text / decode_text：各编码往返、短文本与无收益时保存原文"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        patcher = mock.patch.dict(os.environ, {"COMPRESSION_DICT_DIR": self.root})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        fields.load_dictionary.cache_clear()
+        self.addCleanup(fields.load_dictionary.cache_clear)
+
+    def test_round_trip(self):
+        text = sample_svg(1)
+        for codec, expected in (("zlib", "zlib"), ("lzma", "lzma")):
+            packed = encode_text(text, codec=codec)
+            self.assertEqual(codec_of(packed), expected)
+            self.assertLess(len(packed), len(text.encode()))
+            self.assertEqual(decode_text(packed), text)
+            self.assertEqual(decode_text(memoryview(packed)), text)
+
+    def test_raw_when_short_or_incompressible(self):
+        self.assertEqual(encode_text("<svg/>", min_size=256), b"\x00<svg/>")
+        # min_size=0 时压缩后反而更大，也保存原文
+        self.assertEqual(encode_text("ab", min_size=0), b"\x00ab")
+        self.assertEqual(decode_text(encode_text("ab")), "ab")
+
+    def test_legacy_text_and_unknown_tag(self):
+        self.assertEqual(decode_text("<svg/>"), "<svg/>")
+        self.assertEqual(codec_of("<svg/>"), "text")
+        self.assertEqual(codec_of(None), "null")
+        with self.assertRaises(ValueError):
+            decode_text(b"?abc")
+
+    def test_dictionary(self):
+        samples = [sample_svg(i) for i in range(10)]
+        zdict = train_dictionary(samples, size=4096)
+        self.assertLessEqual(len(zdict), 4096)
+        zdict_id = save_dictionary(zdict)
+
+        text = sample_svg(42)
+        packed = encode_text(text, zdict_id=zdict_id)
+        self.assertEqual(codec_of(packed), "zlib+dict")
+        self.assertLess(len(packed), len(encode_text(text)))
+        self.assertEqual(decode_text(packed), text)
+
+        fields.load_dictionary.cache_clear()
+        os.remove(os.path.join(self.root, f"{zdict_id}.zdict"))
+        with self.assertRaises(ValueError):
+            decode_text(packed)
+
+    def test_training_needs_repeated_content(self):
+        with self.assertRaises(ValueError):
+            train_dictionary(["<svg/>"])
+
+
+class CompressedFieldTests(TestCase):
+    """压缩字段：数据库中为压缩二进制，模型侧为 str / dict；旧文本行可读并可批量转换"""
+
+    def raw_value(self, table, column, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT {column} FROM {table} WHERE id = %s", [pk])
+            return cursor.fetchone()[0]
+
+    def test_text_field_is_stored_compressed(self):
+        text = sample_svg(1)
+        draw = SvgDraw.objects.create(name="a", svg_content=text)
+        self.assertEqual(codec_of(self.raw_value("svg_draw", "svg_content", draw.pk)), "zlib")
+        self.assertEqual(SvgDraw.objects.get(pk=draw.pk).svg_content, text)
+
+        with mock.patch.dict(os.environ, {"COMPRESSED_FIELD_CODEC": "lzma"}):
+            draw.save()
+        self.assertEqual(codec_of(self.raw_value("svg_draw", "svg_content", draw.pk)), "lzma")
+        self.assertEqual(SvgDraw.objects.get(pk=draw.pk).svg_content, text)
+
+    def test_json_field_round_trip(self):
+        data = {"code": sample_svg(1), "provider": {"model": "m", "attempts": 1}}
+        step = RunStepLog.objects.create(run=Run.objects.create(), name="codegen", output_data=data)
+        self.assertEqual(RunStepLog.objects.get(pk=step.pk).output_data, data)
+
+    def test_legacy_rows_are_converted(self):
+        text = sample_svg(1)
+        draw = SvgDraw.objects.create(name="a", svg_content=text)
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE svg_draw SET svg_content = %s WHERE id = %s", [text, draw.pk])
+        self.assertEqual(SvgDraw.objects.get(pk=draw.pk).svg_content, text)
+
+        self.assertEqual(convert_rows(SvgDraw, "svg_content"), 1)
+        self.assertEqual(codec_of(self.raw_value("svg_draw", "svg_content", draw.pk)), "zlib")
+        self.assertEqual(convert_rows(SvgDraw, "svg_content"), 0)
+        self.assertEqual(convert_rows(SvgDraw, "svg_content", to_text=True), 1)
+        self.assertEqual(self.raw_value("svg_draw", "svg_content", draw.pk), text)
+
+    def test_compression_report(self):
+        SvgDraw.objects.create(name="a", svg_content=sample_svg(1))
+        out = StringIO()
+        call_command("compression_report", "--sample", "5", stdout=out)
+        self.assertIn("svg_draw.svg_content", out.getvalue())
+
+
+def server_timing(response) -> dict:
+    """Server-Timing 头解析为 {名称: (毫秒, 描述)}"""
+    parts = {}
+    for item in response["Server-Timing"].split(", "):
+        match = re.fullmatch(r'(\w+);dur=([\d.]+)(?:;desc="([^"]*)")?', item)
+        parts[match.group(1)] = (float(match.group(2)), match.group(3))
+    return parts
+
+
+class ServerTimingTests(TestCase):
+    """Server-Timing：数据库、渲染与其余耗时的拆分"""
+
+    def test_header(self):
+        SvgDraw.objects.create(name="a", svg_content=SVG)
+        parts = server_timing(self.client.get("/api/svg-draws/"))
+        self.assertEqual(list(parts), ["db", "llm", "render", "app", "total"])
+        self.assertRegex(parts["db"][1], r"^[1-9]\d* queries$")
+        self.assertEqual(parts["llm"][1], "0 calls")
+        self.assertGreater(parts["render"][0], 0)
+        self.assertGreaterEqual(parts["total"][0], parts["db"][0] + parts["render"][0])
+
+    def test_disabled(self):
+        with mock.patch.dict(os.environ, {"SERVER_TIMING_ENABLED": "0"}):
+            self.assertFalse(self.client.get("/api/svg-draws/").has_header("Server-Timing"))
+
+    def test_slow_request_logs_queries(self):
+        with mock.patch.dict(os.environ, {"SERVER_TIMING_SLOW_MS": "0.001"}):
+            with self.assertLogs("common.timing", "WARNING") as logs:
+                self.client.get("/api/svg-draws/")
+        self.assertIn("Slow request GET /api/svg-draws/", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+    def test_worker_threads_count_towards_request(self):
+        request_timing = timing.RequestTiming()
+        token = timing._current.set(request_timing)
+        try:
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                futures = [timing.run_in_context(pool, timing.add, "llm", 0.5) for _ in range(2)]
+                for future in futures:
+                    future.result()
+                # 直接提交的任务不在请求上下文中
+                pool.submit(timing.add, "llm", 0.5).result()
+        finally:
+            timing._current.reset(token)
+        self.assertEqual(request_timing.counts["llm"], 2)
+        self.assertEqual(request_timing.summary()["llm_ms"], 1000)
+
+    def test_recorded_queries_are_capped(self):
+        request_timing = timing.RequestTiming(record_queries=True)
+        with mock.patch.object(timing, "MAX_RECORDED_QUERIES", 2):
+            for _ in range(3):
+                request_timing.add("db", 0.001, sql="SELECT 1")
+        self.assertEqual((len(request_timing.queries), request_timing.dropped_queries, request_timing.counts["db"]), (2, 1, 3))
+
+
+class ServerTimingLLMTests(MockLLMMixin, TransactionTestCase):
+    """编排请求的 LLM 调用（在线程池中执行）计入 Server-Timing"""
+
+    env = {"ORCHESTRATOR_SINGLEFLIGHT_DB": "0"}
+
+    def test_llm_calls_counted(self):
+        self.configure_mock(latency="fixed:0.1")
+        response = self.client.post(
+            "/api/orchestrator/run/", {"text": "画一个矩形", "enable_kg": "false", "enable_rag": "false"},
+            content_type="application/json",
+        )
+        parts = server_timing(response)
+        self.assertEqual(parts["llm"][1], "1 calls")
+        self.assertGreaterEqual(parts["llm"][0], 100)
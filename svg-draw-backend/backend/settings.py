@@ -45,7 +45,7 @@ CORS_ALLOW_CREDENTIALS = True
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'common.timing.TimedJSONRenderer',  # JSONRenderer + Server-Timing 渲染耗时
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
@@ -73,9 +73,11 @@ INSTALLED_APPS = [
     'm5_rag',
     'm6_orchestrator',
     'm7_editors',
+    'm8_blobs',
 ]
 
 MIDDLEWARE = [
+    'common.timing.ServerTimingMiddleware',  # 最外层：统计整个请求的耗时拆分
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
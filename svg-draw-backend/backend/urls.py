@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from common.metrics import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -27,6 +28,7 @@ urlpatterns = [
     path('api/orchestrator/', include('m6_orchestrator.urls')),
     path('api/runs/', include('m1_runs.urls')),
     path('api/editors/', include('m7_editors.urls')),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
 
 # 开发环境：提供媒体文件服务
@@ -0,0 +1,69 @@
+"""
+运行截止时间与协作式取消
+每次编排创建一个 Deadline，沿调用链显式传递（与 meta 一样作为参数）；
+各步骤与 LLM 调用据此计算剩余预算（超时），在预算耗尽或被取消（如客户端断开）时提前放弃。
+"""
+import time
+import threading
+from typing import Optional
+
+
+class DeadlineExceeded(Exception):
+    """运行预算耗尽或被取消；不是 ValueError，避免被当作可失败转移的 provider 错误"""
+
+    def __init__(self, message: str, reason: str = "deadline"):
+        super().__init__(message)
+        self.reason = reason  # 'deadline' | 'cancelled'
+
+
+class Deadline:
+    """截止时间 + 取消标记（线程安全）；seconds 为 None 时不限时，只响应取消"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.budget = seconds
+        self.started = time.monotonic()
+        self.expires = self.started + seconds if seconds is not None else None
+        self.cancelled = threading.Event()
+        self.cancel_reason: Optional[str] = None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        """剩余秒数（不限时为 inf；已取消为 0）"""
+        if self.cancelled.is_set():
+            return 0.0
+        if self.expires is None:
+            return float("inf")
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        self.cancel_reason = reason
+        self.cancelled.set()
+
+    def error(self, where: str = "") -> DeadlineExceeded:
+        """构造当前状态对应的异常"""
+        suffix = f" during {where}" if where else ""
+        if self.cancelled.is_set():
+            return DeadlineExceeded(f"Run cancelled ({self.cancel_reason}){suffix}", reason="cancelled")
+        return DeadlineExceeded(f"Run deadline of {self.budget:g}s exceeded{suffix}")
+
+    def check(self, where: str = "") -> None:
+        """预算耗尽或已取消时抛出 DeadlineExceeded"""
+        if self.expired():
+            raise self.error(where)
+
+    def timeout(self, cap: float, where: str = "") -> float:
+        """min(cap, 剩余预算)，用作单次 I/O 的超时；预算已耗尽时直接抛出"""
+        self.check(where)
+        return min(cap, self.remaining())
+
+    def sleep(self, seconds: float, where: str = "") -> None:
+        """可被取消打断的 sleep；睡完会超出截止时间时立即抛出，不做无用的等待"""
+        if seconds >= self.remaining():
+            raise self.error(where)
+        if self.cancelled.wait(seconds):
+            raise self.error(where)
@@ -0,0 +1,273 @@
+"""
+压缩存储的文本 / JSON 字段
+SVG 等重复度很高的文本在保存时压缩为二进制，读取时自动解压，模型代码按普通 str / dict 使用。
+
+存储格式：首字节为编码标记，其后为数据
+- 0x00  未压缩（短文本或压缩无收益）
+- 'z'   zlib
+- 'x'   lzma（xz 容器，不带校验）
+- 'd'   raw deflate + 预置字典，标记后 4 字节为字典 ID（CRC32）
+旧的未压缩文本行（迁移前的 TEXT 值）读取时按原样返回，可逐批转换。
+
+预置字典由 compression_report --train-dict 从现有 SVG 语料训练，保存为
+<COMPRESSION_DICT_DIR>/<字典 ID>.zdict；读取时按 ID 加载，已使用过的字典文件不能删除。
+
+可通过环境变量调整（均为可选）：
+- COMPRESSED_FIELD_CODEC  写入编码：zlib（默认）/ lzma，覆盖字段声明，读取不受影响
+- COMPRESSED_FIELD_DICT   写入时使用的字典 ID（仅 zlib），不设置时不用字典
+- COMPRESSION_DICT_DIR    字典目录（相对路径基于项目目录），默认 compression_dicts
+"""
+import os
+import re
+import json
+import lzma
+import zlib
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Union
+
+from django import forms
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+RAW, ZLIB, LZMA, ZDICT = b"\x00", b"z", b"x", b"d"
+CODECS = ("zlib", "lzma")
+
+
+def dict_dir() -> Path:
+    path = Path(os.environ.get("COMPRESSION_DICT_DIR", "compression_dicts"))
+    return path if path.is_absolute() else Path(settings.BASE_DIR) / path
+
+
+def dict_id(zdict: bytes) -> str:
+    return f"{zlib.crc32(zdict):08x}"
+
+
+@lru_cache(maxsize=8)
+def load_dictionary(zdict_id: str) -> bytes:
+    path = dict_dir() / f"{zdict_id}.zdict"
+    if not path.exists():
+        raise ValueError(f"Compression dictionary {zdict_id} not found in {dict_dir()}")
+    return path.read_bytes()
+
+
+def save_dictionary(zdict: bytes) -> str:
+    """保存字典并返回其 ID"""
+    zdict_id = dict_id(zdict)
+    directory = dict_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / f"{zdict_id}.zdict").write_bytes(zdict)
+    return zdict_id
+
+
+# SVG 片段：标签名、短属性（含值）、标签结尾、文本
+_TOKEN_RE = re.compile(r'<[A-Za-z!?/][^\s>/]*|\s[A-Za-z_:][-\w:.]*="[^"]{0,32}"|/>|[^<>]{2,48}')
+
+
+def train_dictionary(samples, size: int = 32 * 1024) -> bytes:
+    """
+    从样本中挑选在多个文档里反复出现的片段拼成 zlib 预置字典（窗口最多 32KB）。
+    片段按 文档频次 × 长度 打分，得分最高的放在字典末尾（距离最近、匹配编码最短）。
+    """
+    doc_freq = Counter()
+    for text in samples:
+        doc_freq.update(set(_TOKEN_RE.findall(text)))
+    scored = sorted(((n * len(token.encode("utf-8")), token) for token, n in doc_freq.items() if n >= 2), reverse=True)
+    chosen, total = [], 0
+    for _, token in scored:
+        data = token.encode("utf-8")
+        if total + len(data) > size:
+            continue
+        chosen.append(data)
+        total += len(data)
+    if not chosen:
+        raise ValueError("Not enough repeated content in samples to train a dictionary")
+    return b"".join(reversed(chosen))
+
+
+def encode_text(text: str, codec: str = "zlib", level: int = 6, min_size: int = 0, zdict_id: Optional[str] = None) -> bytes:
+    """按指定编码压缩文本；短于 min_size 或压缩后不更小时保存原文"""
+    raw = text.encode("utf-8")
+    if len(raw) < min_size:
+        return RAW + raw
+    if codec == "lzma":
+        packed = LZMA + lzma.compress(raw, preset=level, check=lzma.CHECK_NONE)
+    elif zdict_id:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=load_dictionary(zdict_id))
+        packed = ZDICT + bytes.fromhex(zdict_id) + compressor.compress(raw) + compressor.flush()
+    else:
+        packed = ZLIB + zlib.compress(raw, level)
+    return packed if len(packed) < len(raw) + 1 else RAW + raw
+
+
+def decode_text(value: Union[bytes, memoryview, str]) -> str:
+    """解码 encode_text 的结果；str 为尚未转换的旧行，原样返回"""
+    if isinstance(value, str):
+        return value
+    data = bytes(value)
+    tag, body = data[:1], data[1:]
+    if tag == RAW:
+        return body.decode("utf-8")
+    if tag == ZLIB:
+        return zlib.decompress(body).decode("utf-8")
+    if tag == LZMA:
+        return lzma.decompress(body).decode("utf-8")
+    if tag == ZDICT:
+        zdict_id = body[:4].hex()
+        decompressor = zlib.decompressobj(-15, zdict=load_dictionary(zdict_id))
+        return (decompressor.decompress(body[4:]) + decompressor.flush()).decode("utf-8")
+    raise ValueError(f"Unknown compressed value tag {tag!r}")
+
+
+def codec_of(value) -> str:
+    """存储值的编码名（报表用）"""
+    if value is None:
+        return "null"
+    if isinstance(value, str):
+        return "text"
+    return {RAW: "raw", ZLIB: "zlib", LZMA: "lzma", ZDICT: "zlib+dict"}.get(bytes(value[:1]), "unknown")
+
+
+class CompressedTextField(models.BinaryField):
+    """透明压缩的文本字段：Python 侧为 str，数据库中为压缩后的二进制"""
+    description = "Compressed text"
+
+    def __init__(self, *args, codec: str = "zlib", level: int = 6, min_size: int = 256, **kwargs):
+        if codec not in CODECS:
+            raise ValueError(f"Unsupported codec: {codec}")
+        self.codec = codec
+        self.level = level
+        self.min_size = min_size
+        kwargs.setdefault("editable", True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        # BinaryField 默认不可编辑，本字段默认可编辑
+        if self.editable:
+            kwargs.pop("editable", None)
+        else:
+            kwargs["editable"] = False
+        if self.codec != "zlib":
+            kwargs["codec"] = self.codec
+        if self.level != 6:
+            kwargs["level"] = self.level
+        if self.min_size != 256:
+            kwargs["min_size"] = self.min_size
+        return name, path, args, kwargs
+
+    def get_default(self):
+        if self.has_default():
+            return super().get_default()
+        return None if self.null else ""
+
+    def encode(self, text: str) -> bytes:
+        codec = os.environ.get("COMPRESSED_FIELD_CODEC") or self.codec
+        zdict_id = os.environ.get("COMPRESSED_FIELD_DICT") if codec == "zlib" else None
+        return encode_text(text, codec=codec, level=self.level, min_size=self.min_size, zdict_id=zdict_id)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return decode_text(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        return decode_text(value)
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        if value is None:
+            return value
+        return self.encode(str(value))
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj) or ""
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{"form_class": forms.CharField, "widget": forms.Textarea, **kwargs})
+
+
+class CompressedJSONField(CompressedTextField):
+    """透明压缩的 JSON 字段（不支持 JSON 路径查询）"""
+    description = "Compressed JSON"
+
+    def __init__(self, *args, encoder=DjangoJSONEncoder, **kwargs):
+        self.encoder = encoder
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.encoder is not DjangoJSONEncoder:
+            kwargs["encoder"] = self.encoder
+        return name, path, args, kwargs
+
+    def get_default(self):
+        if self.has_default():
+            return super().get_default()
+        return None
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return json.loads(decode_text(value))
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return json.loads(decode_text(value))
+        return value
+
+    def get_prep_value(self, value):
+        if value is None:
+            return value
+        return self.encode(json.dumps(value, ensure_ascii=False, cls=self.encoder))
+
+    def value_to_string(self, obj):
+        return json.dumps(self.value_from_object(obj), ensure_ascii=False, cls=self.encoder)
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{"form_class": forms.JSONField, "encoder": self.encoder, **kwargs})
+
+
+def convert_rows(model, field_name: str, to_text: bool = False, chunk_size: int = 500, using: str = "default") -> int:
+    """
+    分批重写某列（数据迁移用）：默认把旧的未压缩行写成压缩格式；
+    to_text=True 时反向解压为普通文本（回滚迁移用）。返回改写的行数。
+    """
+    from django.db import connections, transaction
+
+    field = model._meta.get_field(field_name)
+    table, column, pk_column = model._meta.db_table, field.column, model._meta.pk.column
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    pks = list(model._base_manager.using(using).values_list("pk", flat=True).order_by("pk"))
+    converted = 0
+    for start in range(0, len(pks), chunk_size):
+        chunk = pks[start:start + chunk_size]
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            # 直接读写原始列值，绕过字段的编解码
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                f"SELECT {quote(pk_column)}, {quote(column)} FROM {quote(table)} WHERE {quote(pk_column)} IN ({placeholders})",
+                chunk,
+            )
+            for pk, value in cursor.fetchall():
+                if value is None:
+                    continue
+                if to_text:
+                    if isinstance(value, str):
+                        continue
+                    new_value = decode_text(value)
+                else:
+                    if not isinstance(value, str):
+                        continue
+                    # 旧 TEXT 值：JSON 列本身就是 JSON 文本，直接压缩
+                    new_value = connection.Database.Binary(field.encode(value))
+                cursor.execute(
+                    f"UPDATE {quote(table)} SET {quote(column)} = %s WHERE {quote(pk_column)} = %s", [new_value, pk],
+                )
+                converted += 1
+    return converted
@@ -0,0 +1,390 @@
+"""
+进程内指标（不依赖 prometheus_client）
+计数器 / 仪表 / 直方图在进程内聚合，/metrics 以 Prometheus 文本格式输出。
+
+多进程（gunicorn 多 worker）：设置 METRICS_DIR 后，每个进程由后台线程定期把自己的快照
+原子写入 <METRICS_DIR>/metrics-<pid>.json（退出时再写一次）；抓取时合并目录下所有快照：
+计数器与直方图按进程求和（已退出进程的累计值保留），仪表只合并仍存活的进程。
+目录需在部署 / 重启时清空，且只能由同一服务的进程共用。
+
+埋点位置：RunLogger / RunJournal 的 start_step、end_step（步骤耗时），
+chat_completion / achat_completion / chat_completion_stream（调用耗时与 usage 中的令牌数），
+LLM 响应缓存的查询（命中率 = hit / (hit + miss)）；队列深度在抓取时从 run_jobs 表读取。
+
+可通过环境变量调整（均为可选）：
+- METRICS_ENABLED         是否记录指标，默认 1
+- METRICS_DIR             多进程快照目录，不设置时只输出本进程的指标
+- METRICS_FLUSH_INTERVAL  快照写入间隔（秒），默认 5
+- METRICS_TOKEN           设置后 /metrics 需携带 Authorization: Bearer <token>
+"""
+import os
+import json
+import time
+import atexit
+import bisect
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.http import HttpResponse
+from django.views import View
+
+logger = logging.getLogger(__name__)
+
+# 秒；覆盖毫秒级的缓存命中到分钟级的 LLM 调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _env_flag(name: str, default: str = "1") -> bool:
+    return os.environ.get(name, default).strip().lower() not in ("0", "false", "no", "off", "")
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, registry: "Registry", name: str, help: str, labelnames: Iterable[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._samples: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _dump(self) -> dict:
+        return {"type": self.type, "help": self.help, "labels": list(self.labelnames),
+                "samples": [[list(k), v] for k, v in self._samples.items()]}
+
+    def reset(self):
+        self._samples.clear()
+
+
+class Counter(_Metric):
+    """单调递增计数"""
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled or amount < 0:
+            return
+        key = self._key(labels)
+        with self.registry.lock:
+            self.registry.touch()
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """当前值；set_function 注册的取值函数在抓取时调用（只在抓取进程中计算，不写入快照）"""
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def set(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self.registry.lock:
+            self.registry.touch()
+            self._samples[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self.registry.lock:
+            self.registry.touch()
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], Dict[Tuple[str, ...], float]]):
+        """function 返回 {标签值元组: 数值}"""
+        self._function = function
+
+    def collect_live(self) -> Optional[dict]:
+        if self._function is None:
+            return None
+        try:
+            samples = self._function()
+        except Exception as e:
+            logger.warning(f"Metric {self.name} collection failed: {e}")
+            samples = {}
+        return {"type": self.type, "help": self.help, "labels": list(self.labelnames),
+                "samples": [[list(k), v] for k, v in samples.items()]}
+
+
+class Histogram(_Metric):
+    """分桶计数 + 总和；每个样本为 [各桶计数（非累计，末尾为 +Inf）, 总和, 次数]"""
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            self.registry.touch()
+            sample = self._samples.get(key)
+            if sample is None:
+                sample = self._samples[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            sample[0][index] += 1
+            sample[1] += value
+            sample[2] += 1
+
+    def _dump(self) -> dict:
+        data = super()._dump()
+        data["buckets"] = list(self.buckets)
+        data["samples"] = [[k, [list(v[0]), v[1], v[2]]] for k, v in data["samples"]]
+        return data
+
+
+class Registry:
+    """指标注册表与多进程快照"""
+
+    def __init__(self):
+        self.enabled = _env_flag("METRICS_ENABLED")
+        self.directory = Path(os.environ["METRICS_DIR"]) if os.environ.get("METRICS_DIR") else None
+        self.flush_interval = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5))
+        self.lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._pid = os.getpid()
+        self._dirty = False
+        self._flusher: Optional[threading.Thread] = None
+        if self.directory:
+            atexit.register(self.flush)
+
+    def _register(self, cls, name, help, labelnames=(), **kwargs):
+        with self.lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.type}")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    # ---------- 多进程快照 ----------
+
+    def _check_fork(self):
+        """（已持有 lock）fork 出的子进程丢弃从父进程继承的值，父进程的快照文件中已有"""
+        if self.directory is not None and self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._flusher = None
+            for metric in self._metrics.values():
+                metric.reset()
+
+    def touch(self):
+        """记录时调用（已持有 lock）：标记待写入，必要时启动写入线程"""
+        self._dirty = True
+        if self.directory is None:
+            return
+        self._check_fork()
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._pid != os.getpid():
+                return
+            if self._dirty:
+                self.flush()
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self.lock:
+            self._check_fork()
+            self._dirty = False
+            return {name: metric._dump() for name, metric in self._metrics.items()}
+
+    def flush(self):
+        """把本进程的快照写入 METRICS_DIR（原子替换）"""
+        if self.directory is None:
+            return
+        path = self.directory / f"metrics-{os.getpid()}.json"
+        tmp = path.with_suffix(".json.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps({"pid": os.getpid(), "metrics": self.snapshot()}), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Metrics flush to {path} failed: {e}")
+
+    def _snapshots(self) -> List[Tuple[bool, Dict[str, dict]]]:
+        """[(进程是否存活, 快照)]；本进程使用内存中的最新值"""
+        snapshots = [(True, self.snapshot())]
+        if self.directory is None or not self.directory.exists():
+            return snapshots
+        for path in self.directory.glob("metrics-*.json"):
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            pid = data.get("pid")
+            if pid == os.getpid():
+                continue
+            snapshots.append((_pid_alive(pid), data.get("metrics") or {}))
+        return snapshots
+
+    def collect(self) -> Dict[str, dict]:
+        """合并所有进程的快照与抓取时计算的仪表"""
+        merged: Dict[str, dict] = {}
+        for alive, metrics in self._snapshots():
+            for name, data in metrics.items():
+                if data["type"] == "gauge" and not alive:
+                    continue
+                target = merged.setdefault(name, {**data, "samples": {}})
+                for labels, value in data["samples"]:
+                    key = tuple(labels)
+                    current = target["samples"].get(key)
+                    if current is None:
+                        target["samples"][key] = value
+                    elif data["type"] == "histogram":
+                        current[0] = [a + b for a, b in zip(current[0], value[0])]
+                        current[1] += value[1]
+                        current[2] += value[2]
+                    else:
+                        target["samples"][key] = current + value
+        with self.lock:
+            gauges = [metric for metric in self._metrics.values() if isinstance(metric, Gauge)]
+        for gauge in gauges:
+            live = gauge.collect_live()
+            if live is not None:
+                merged[gauge.name] = {**live, "samples": {tuple(k): v for k, v in live["samples"]}}
+        return merged
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        for name, data in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {_escape_help(data['help'])}")
+            lines.append(f"# TYPE {name} {data['type']}")
+            labelnames = data["labels"]
+            for key, value in sorted(data["samples"].items()):
+                labels = list(zip(labelnames, key))
+                if data["type"] != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(list(data["buckets"]) + ["+Inf"], counts):
+                    cumulative += bucket_count
+                    le = bound if bound == "+Inf" else _number(bound)
+                    lines.append(f"{name}_bucket{_labels(labels + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _pid_alive(pid) -> bool:
+    if not isinstance(pid, int):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() and abs(value) < 1e15 else repr(value)
+    return str(value)
+
+
+REGISTRY = Registry()
+
+# ---------- 指标定义 ----------
+
+STEPS_STARTED = REGISTRY.counter(
+    "svgdraw_steps_started_total", "Orchestration steps started", ["step"],
+)
+STEP_DURATION = REGISTRY.histogram(
+    "svgdraw_step_duration_seconds", "Orchestration step latency (started_at to ended_at)", ["step", "outcome"],
+)
+LLM_REQUEST_DURATION = REGISTRY.histogram(
+    "svgdraw_llm_request_duration_seconds", "LLM provider call latency including retries",
+    ["endpoint", "model", "mode", "outcome"],
+)
+LLM_TOKENS = REGISTRY.counter(
+    "svgdraw_llm_tokens_total", "Tokens reported in provider usage", ["endpoint", "model", "kind"],
+)
+LLM_CACHE_LOOKUPS = REGISTRY.counter(
+    "svgdraw_llm_cache_lookups_total", "LLM response cache lookups", ["result", "tier"],
+)
+RUNS_FINISHED = REGISTRY.counter(
+    "svgdraw_runs_finished_total", "Runs that reached a terminal status", ["status"],
+)
+SVG_VALIDATIONS = REGISTRY.counter(
+    "svgdraw_svg_validations_total", "Generated SVG validation outcome (valid / repaired / fixed / invalid)", ["result"],
+)
+SVG_OPTIMIZER_SAVED_BYTES = REGISTRY.counter(
+    "svgdraw_svg_optimizer_saved_bytes_total", "Bytes removed by each SVG optimizer pass", ["source", "stage"],
+)
+RUN_JOBS = REGISTRY.gauge(
+    "svgdraw_run_jobs", "Queued orchestration jobs by status (read from run_jobs at scrape time)", ["status"],
+)
+
+
+def observe_step(name: str, started_at, ended_at, error=None):
+    """记录步骤结束；没有开始时间（未调用 start_step）的步骤不计入耗时"""
+    if started_at is None or ended_at is None:
+        return
+    STEP_DURATION.observe(
+        max(0.0, (ended_at - started_at).total_seconds()), step=name, outcome="error" if error else "ok",
+    )
+
+
+def observe_llm_call(endpoint: str, model: str, mode: str, seconds: float, ok: bool, usage=None):
+    """记录一次 provider 调用；usage 为响应中的 usage 字段"""
+    LLM_REQUEST_DURATION.observe(seconds, endpoint=endpoint, model=model, mode=mode, outcome="ok" if ok else "error")
+    if isinstance(usage, dict):
+        for kind in ("prompt_tokens", "completion_tokens"):
+            tokens = usage.get(kind)
+            if isinstance(tokens, (int, float)) and tokens > 0:
+                LLM_TOKENS.inc(tokens, endpoint=endpoint, model=model, kind=kind[:-len("_tokens")])
+
+
+class MetricsView(View):
+    """GET /metrics：Prometheus 文本格式"""
+
+    def get(self, request):
+        token = os.environ.get("METRICS_TOKEN")
+        if token and request.headers.get("Authorization") != f"Bearer {token}":
+            return HttpResponse("Unauthorized\n", status=401, content_type="text/plain")
+        return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
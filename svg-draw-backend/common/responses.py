@@ -1,6 +1,9 @@
 """
 统一 API 响应格式
 """
+import json
+from django.http import JsonResponse
+from common.timing import span
 from rest_framework.response import Response
 from typing import Any, Optional
 
@@ -21,3 +24,28 @@ def error_response(error: str, status: int = 400, data: Any = None) -> Response:
         'data': data,
         'error': error
     }, status=status)
+
+
+def success_json_response(data: Any = None, status: int = 200) -> JsonResponse:
+    """成功响应（纯 Django 版本，供不经过 DRF 的异步视图使用）"""
+    with span('render'):
+        return JsonResponse({
+            'ok': True,
+            'data': data,
+            'error': None
+        }, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def error_json_response(error: str, status: int = 400, data: Any = None) -> JsonResponse:
+    """错误响应（纯 Django 版本，供不经过 DRF 的异步视图使用）"""
+    with span('render'):
+        return JsonResponse({
+            'ok': False,
+            'data': data,
+            'error': error
+        }, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def sse_event(event: str, data: Any = None) -> str:
+    """格式化一条 Server-Sent Events 消息（data 以 JSON 编码）"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
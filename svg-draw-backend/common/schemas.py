@@ -160,11 +160,13 @@ class RunRecord:
     status: str  # 'created' | 'running' | 'success' | 'failed'
     steps: List[StepLog] = field(default_factory=list)
     artifacts: List[ArtifactInfo] = field(default_factory=list)
+    coalesced_from: Optional[str] = None  # codegen 结果复用自的运行 ID
 
     def to_dict(self) -> Dict[str, Any]:
         return {
             'run_id': self.run_id,
             'status': self.status,
             'steps': [s.to_dict() for s in self.steps],
-            'artifacts': [a.to_dict() for a in self.artifacts]
+            'artifacts': [a.to_dict() for a in self.artifacts],
+            'coalesced_from': self.coalesced_from
         }
@@ -0,0 +1,738 @@
+"""
+SVG 几何：计算内容包围盒并推导草稿的 width / height / viewBox 元数据（DslDraft.meta、Draft.meta_json、svg_draw）。
+
+遍历元素树时只收集图元参数与所在坐标系（CTM 下标），计算全部在 numpy 数组上批量完成：
+- 多条路径数据拼接后在字节数组上判定记号边界，一次 np.fromstring 解析全部数字，按命令参数个数散布成 (段数, 7) 的参数矩阵；
+  相对坐标转绝对坐标（含 z 回到子路径起点、相对 m 的链式依赖）与 T 的控制点反射链都化为"带重置的累加和"
+- 二次贝塞尔升阶为三次；三次贝塞尔在变换后的控制点上求导数根得到各轴极值
+- 圆、椭圆与椭圆弧统一为参数椭圆 C + U·cosθ + V·sinθ，变换只作用于 C / U / V，极值角 θ = atan2(V, U) 再按扫过的角度范围筛选
+- 矩形、折线、多边形、线段取顶点；文本按字号与字符宽度估算（全角一个字号，其余 0.6 个字号）
+默认把描边宽度的一半（按变换缩放）计入包围盒，便于 viewBox 不裁掉边缘的描边。
+
+<style> 中只识别类型 / 类 / 类型.类 选择器（足以覆盖生成的 SVG），用于取 stroke、stroke-width、font-size 等属性。
+"""
+import re
+import math
+import logging
+import warnings
+from typing import Dict, List, Optional, Tuple
+from xml.etree import ElementTree as ET
+
+import numpy as np
+
+from common.svg_optimizer import parse_path
+
+logger = logging.getLogger(__name__)
+
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+
+# 不直接渲染的子树（<use> 引用的 symbol 等另行处理）
+_SKIP = {
+    "defs", "clipPath", "mask", "marker", "pattern", "symbol", "linearGradient", "radialGradient", "filter",
+    "style", "script", "title", "desc", "metadata",
+}
+_INHERITED = ("stroke", "stroke-width", "font-size", "text-anchor", "visibility")
+_PROPERTIES = _INHERITED + ("display",)
+_UNITS = {"": 1.0, "px": 1.0, "pt": 4 / 3, "pc": 16.0, "mm": 96 / 25.4, "cm": 96 / 2.54, "in": 96.0}
+DEFAULT_FONT_SIZE = 16.0
+USE_DEPTH = 8
+
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_LENGTH = re.compile(r"^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([a-zA-Z%]*)\s*$")
+_TRANSFORM = re.compile(r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)")
+_CSS_RULE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+_SELECTOR = re.compile(r"^\s*([A-Za-z][\w-]*)?(?:\.([A-Za-z_][\w-]*))?\s*$")
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+# 路径命令：大写字符码 -> 参数个数；终点在参数中的列
+_CMD_ARGS = {"M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "T": 2, "A": 7, "Z": 0}
+_NARGS = np.full(128, -1, dtype=np.int64)
+for _cmd, _n in _CMD_ARGS.items():
+    _NARGS[ord(_cmd)] = _NARGS[ord(_cmd.lower())] = _n
+_END_SLOT = np.zeros(128, dtype=np.int64)
+for _cmd, _slot in {"C": 4, "S": 2, "Q": 2, "A": 5}.items():
+    _END_SLOT[ord(_cmd)] = _slot
+M, Z, L, H, V, C, S, Q, T, A = (ord(c) for c in "MZLHVCSQTA")
+
+
+# ---------- 解析工具 ----------
+
+def _local(name) -> str:
+    return name.rsplit("}", 1)[-1] if isinstance(name, str) else ""
+
+
+def parse_length(value, default: Optional[float] = None, font_size: float = DEFAULT_FONT_SIZE) -> Optional[float]:
+    """绝对长度转 px（无单位 / px / pt / pc / mm / cm / in / em）；百分比等无法确定的返回 default"""
+    if value is None:
+        return default
+    m = _LENGTH.match(str(value))
+    if not m:
+        return default
+    number, unit = float(m.group(1)), m.group(2).lower()
+    if unit == "em":
+        return number * font_size
+    if unit not in _UNITS:
+        return default
+    return number * _UNITS[unit]
+
+
+def parse_view_box(value) -> Optional[Tuple[float, float, float, float]]:
+    numbers = [float(n) for n in _NUMBER.findall(value or "")]
+    if len(numbers) != 4 or numbers[2] <= 0 or numbers[3] <= 0:
+        return None
+    return tuple(numbers)
+
+
+def _multiply(m, n) -> tuple:
+    """矩阵 m·n（先作用 n），均为 SVG matrix(a b c d e f) 形式"""
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (a * a2 + c * b2, b * a2 + d * b2, a * c2 + c * d2, b * c2 + d * d2,
+            a * e2 + c * f2 + e, b * e2 + d * f2 + f)
+
+
+def parse_transform(value) -> tuple:
+    """解析 transform 属性为 (a, b, c, d, e, f)；无法识别的部分忽略"""
+    matrix = IDENTITY
+    for name, raw in _TRANSFORM.findall(value or ""):
+        args = [float(n) for n in _NUMBER.findall(raw)]
+        if name == "matrix" and len(args) == 6:
+            step = tuple(args)
+        elif name == "translate" and args:
+            step = (1.0, 0.0, 0.0, 1.0, args[0], args[1] if len(args) > 1 else 0.0)
+        elif name == "scale" and args:
+            step = (args[0], 0.0, 0.0, args[1] if len(args) > 1 else args[0], 0.0, 0.0)
+        elif name == "rotate" and args:
+            cos, sin = math.cos(math.radians(args[0])), math.sin(math.radians(args[0]))
+            step = (cos, sin, -sin, cos, 0.0, 0.0)
+            if len(args) == 3:
+                cx, cy = args[1], args[2]
+                step = _multiply(_multiply((1.0, 0.0, 0.0, 1.0, cx, cy), step), (1.0, 0.0, 0.0, 1.0, -cx, -cy))
+        elif name == "skewX" and args:
+            step = (1.0, 0.0, math.tan(math.radians(args[0])), 1.0, 0.0, 0.0)
+        elif name == "skewY" and args:
+            step = (1.0, math.tan(math.radians(args[0])), 0.0, 1.0, 0.0, 0.0)
+        else:
+            continue
+        matrix = _multiply(matrix, step)
+    return matrix
+
+
+class _StyleSheet:
+    """<style> 中简单选择器的属性（按特异性与出现顺序排列）"""
+
+    def __init__(self, root: ET.Element):
+        rules = []
+        for el in root.iter():
+            if _local(el.tag) != "style" or not el.text:
+                continue
+            for selectors, body in _CSS_RULE.findall(re.sub(r"/\*.*?\*/", "", el.text, flags=re.S)):
+                declarations = _declarations(body)
+                if not declarations:
+                    continue
+                for selector in selectors.split(","):
+                    m = _SELECTOR.match(selector)
+                    if m and (m.group(1) or m.group(2)):
+                        specificity = (10 if m.group(2) else 0) + (1 if m.group(1) else 0)
+                        rules.append((specificity, len(rules), m.group(1), m.group(2), declarations))
+        rules.sort(key=lambda r: (r[0], r[1]))
+        self.rules = rules
+
+    def apply(self, el: ET.Element, tag: str, props: dict):
+        if not self.rules:
+            return
+        classes = set((el.get("class") or "").split())
+        for _, _, rule_tag, rule_class, declarations in self.rules:
+            if (rule_tag is None or rule_tag == tag) and (rule_class is None or rule_class in classes):
+                props.update(declarations)
+
+
+def _declarations(text: str) -> dict:
+    result = {}
+    for part in (text or "").split(";"):
+        if ":" in part:
+            name, value = part.split(":", 1)
+            name = name.strip().lower()
+            if name in _PROPERTIES:
+                result[name] = value.replace("!important", "").strip()
+    return result
+
+
+# ---------- 路径 ----------
+
+_CMD_CHARS = "".join(_CMD_ARGS) + "".join(_CMD_ARGS).lower()
+_IS_CMD = np.zeros(256, dtype=bool)
+_IS_CMD[[ord(c) for c in _CMD_CHARS]] = True
+_IS_SEP = np.zeros(256, dtype=bool)
+_IS_SEP[[ord(c) for c in " \t\r\n,|"]] = True
+_IS_DIGIT = np.zeros(256, dtype=bool)
+_IS_DIGIT[[ord(c) for c in "0123456789"]] = True
+_IS_EXP = np.zeros(256, dtype=bool)
+_IS_EXP[[ord("e"), ord("E")]] = True
+_IS_SIGN = np.zeros(256, dtype=bool)
+_IS_SIGN[[ord("+"), ord("-")]] = True
+_IS_NUMBER = _IS_DIGIT | _IS_EXP | _IS_SIGN
+_IS_NUMBER[ord(".")] = True
+_VALID_BYTE = _IS_CMD | _IS_SEP | _IS_NUMBER
+
+
+def _tokenize(ds: List[str]):
+    """
+    批量切分多条路径数据，返回 (命令字符码（大写）, 是否相对, (段数, 7) 参数矩阵, 所属路径, 是否路径首段)。
+    在字节数组上判定记号起点（命令字母、路径分隔 |、数字开头：前一字符非数字字符 / 非指数后的正负号 / 第二个小数点），
+    数字补空格后一次 np.fromstring 解析；
+    任一路径不规范（未知字符、不以 moveto 开头、参数个数不符、弧线标志压缩书写）时返回 None。
+    """
+    text = "|".join(ds)
+    if not text.isascii():
+        return None
+    raw = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+    if not len(raw) or not _VALID_BYTE[raw].all():
+        return None
+    prev = np.empty_like(raw)
+    prev[0], prev[1:] = ord(" "), raw[:-1]
+    is_dot = raw == ord(".")
+    is_sign = _IS_SIGN[raw]
+    begins = (_IS_DIGIT[raw] | is_dot | is_sign) & (~_IS_NUMBER[prev] | (is_sign & ~_IS_EXP[prev]))
+    # 一个数字只含一个小数点：同一段中第二个及之后的小数点开始新的数字
+    dots = np.cumsum(is_dot)
+    run_start = np.maximum.accumulate(np.where(begins, np.arange(len(raw)), 0))
+    begins |= is_dot & (dots - dots[run_start] + is_dot[run_start] >= 2)
+    is_cmd = _IS_CMD[raw]
+    is_marker = raw == ord("|")
+    starts = np.flatnonzero(begins | is_cmd | is_marker)
+    kind = np.where(is_cmd[starts], 1, np.where(is_marker[starts], 2, 0)).astype(np.int8)
+
+    spaced = np.where(is_cmd | _IS_SEP[raw], np.uint8(32), raw)
+    spaced = np.insert(spaced, np.flatnonzero(begins), np.uint8(32))
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            values = np.fromstring(spaced.tobytes().decode("ascii"), sep=" ")
+    except ValueError:
+        return None
+    if len(values) != np.count_nonzero(kind == 0):
+        return None
+
+    path_of = np.cumsum(kind == 2)[kind != 2]
+    is_letter = kind[kind != 2] == 1
+    if not len(is_letter):
+        return None
+    codes = raw[is_cmd].astype(np.int64)
+    letter_pos = np.flatnonzero(is_letter)
+    letter_of = np.cumsum(is_letter) - 1
+    starts = np.flatnonzero(np.r_[True, path_of[1:] != path_of[:-1]])
+    if not is_letter[starts].all() or ((codes[letter_of[starts]] & ~0x20) != M).any():
+        return None
+    nargs = _NARGS[codes]
+    count = np.diff(np.append(letter_pos, len(is_letter))) - 1
+    if ((nargs == 0) & (count > 0)).any() or (count[(codes | 0x20) == ord("a")] % 7).any():
+        return None
+
+    nseg = np.where(nargs > 0, count // np.maximum(nargs, 1), 1)
+    seg_offset = np.cumsum(nseg) - nseg
+    total = int(nseg.sum())
+    upper = codes & ~0x20
+    seg_code = np.repeat(upper, nseg)
+    seg_rel = np.repeat(codes != upper, nseg)
+    seg_index = np.arange(total) - np.repeat(seg_offset, nseg)
+    seg_code[(seg_code == M) & (seg_index > 0)] = L
+
+    num_pos = np.flatnonzero(~is_letter)
+    chunk = letter_of[num_pos]
+    k = num_pos - letter_pos[chunk] - 1
+    n = nargs[chunk]
+    keep = k < nseg[chunk] * n      # 参数不足的尾段按出错处截断
+    args = np.zeros((total, 7))
+    args[seg_offset[chunk[keep]] + k[keep] // n[keep], k[keep] % n[keep]] = values[keep]
+    arcs = seg_code == A
+    if arcs.any() and not np.isin(args[arcs][:, 3:5], (0.0, 1.0)).all():
+        return None
+    owner = np.repeat(path_of[letter_pos], nseg)
+    first = np.r_[True, owner[1:] != owner[:-1]]
+    return seg_code, seg_rel, args, owner, first
+
+
+def _parse_one(d: str):
+    """单条路径退回逐字符解析（svg_optimizer.parse_path，支持压缩书写的弧线标志）"""
+    try:
+        segments = parse_path(d)
+    except ValueError:
+        return None
+    if not segments or segments[0][0] not in "Mm":
+        return None
+    codes = np.array([ord(cmd.upper()) for cmd, _ in segments], dtype=np.int64)
+    rel = np.array([cmd.islower() for cmd, _ in segments])
+    args = np.zeros((len(segments), 7))
+    for i, (_, values) in enumerate(segments):
+        args[i, :len(values)] = values
+    first = np.zeros(len(segments), dtype=bool)
+    first[0] = True
+    return codes, rel, args, np.zeros(len(segments), dtype=np.int64), first
+
+
+def _reset_cumsum(reset: np.ndarray, base: np.ndarray, increment: np.ndarray) -> np.ndarray:
+    """out[i] = base[r] + sum(increment[r+1..i])，r 为 i 之前（含）最近的 reset 位置；reset[0] 须为真"""
+    index = np.arange(len(reset))
+    last = np.maximum.accumulate(np.where(reset, index, 0))
+    mask = reset[:, None] if increment.ndim == 2 else reset
+    csum = np.cumsum(np.where(mask, 0.0, increment), axis=0)
+    return base[last] + csum - csum[last]
+
+
+def _resolve_axis(is_m, is_z, first, absolute, value, delta) -> np.ndarray:
+    """
+    单个坐标轴上各段的终点。段内终点写成 A·(子路径起点) + B（A ∈ {0, 1}），
+    子路径起点之间同样是 A 为 0 / 1 的线性递推，两步都是带重置的累加和。
+    """
+    assign = absolute & ~is_m & ~is_z
+    reset = is_m | is_z | assign
+    coef = _reset_cumsum(reset, np.where(assign, 0.0, 1.0), np.zeros(len(reset)))
+    offset = _reset_cumsum(reset, np.where(assign, value, 0.0), delta)
+
+    m_idx = np.flatnonzero(is_m)
+    prev = np.maximum(m_idx - 1, 0)
+    # 路径首段的相对 m 以原点为基准
+    restart = first[m_idx] | absolute[m_idx] | (coef[prev] == 0)
+    base = np.where(first[m_idx] | absolute[m_idx], value[m_idx], offset[prev] + value[m_idx])
+    starts = _reset_cumsum(restart, base, offset[prev] + value[m_idx])
+    return coef * starts[np.cumsum(is_m) - 1] + offset
+
+
+def paths_geometry(ds: List[str]):
+    """
+    批量计算多条路径的几何（各自的局部坐标系），返回
+    (顶点 (N,2), 所属路径, 三次贝塞尔 (K,4,2), 所属路径, 参数椭圆弧 (E,8), 所属路径)。
+    整批不规范时逐条处理，仍无法解析的路径跳过。
+    """
+    parsed = _tokenize(ds) if ds else None
+    if parsed is None:
+        parts = [(i, _tokenize([d]) or _parse_one(d)) for i, d in enumerate(ds)]
+        parts = [(i, p) for i, p in parts if p is not None]
+        if not parts:
+            return np.zeros((0, 2)), np.zeros(0, np.int64), np.zeros((0, 4, 2)), np.zeros(0, np.int64), \
+                np.zeros((0, 8)), np.zeros(0, np.int64)
+        parsed = (
+            np.concatenate([p[0] for _, p in parts]), np.concatenate([p[1] for _, p in parts]),
+            np.concatenate([p[2] for _, p in parts]), np.concatenate([np.full(len(p[0]), i) for i, p in parts]),
+            np.concatenate([p[4] for _, p in parts]),
+        )
+    return _geometry(*parsed)
+
+
+def path_geometry(d: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """单条路径的 (顶点, 三次贝塞尔, 参数椭圆弧)"""
+    points, _, cubics, _, arcs, _ = paths_geometry([d])
+    return points, cubics, arcs
+
+
+def _geometry(code, rel, args, owner, first):
+    count = len(code)
+    rows = np.arange(count)
+    is_m, is_z, is_h, is_v = code == M, code == Z, code == H, code == V
+    slot = _END_SLOT[code]
+    raw_x, raw_y = args[rows, slot], args[rows, slot + 1]
+    raw_y = np.where(is_v, args[:, 0], raw_y)
+
+    has_x = ~is_z & ~is_v
+    has_y = ~is_z & ~is_h
+    end_x = _resolve_axis(is_m, is_z, first, has_x & ~rel, raw_x, np.where(has_x & rel, raw_x, 0.0))
+    end_y = _resolve_axis(is_m, is_z, first, has_y & ~rel, raw_y, np.where(has_y & rel, raw_y, 0.0))
+    end = np.column_stack([end_x, end_y])
+    start = np.vstack([[0.0, 0.0], end[:-1]])
+    start[first] = 0.0
+    origin = np.where(rel[:, None], start, 0.0)
+
+    # 控制点（绝对坐标）
+    ctrl1 = args[:, 0:2] + origin
+    ctrl2 = args[:, 2:4] + origin
+    prev_code = np.append(-1, code[:-1])
+    is_s = (code == S)[:, None]
+    # S：第一个控制点为上一段（C / S）第二个控制点的反射
+    cubic_ctrl2 = np.where(is_s, ctrl1, ctrl2)
+    c2_prev = np.vstack([start[:1], cubic_ctrl2[:-1]])
+    reflect = ((prev_code == C) | (prev_code == S))[:, None]
+    cubic_ctrl1 = np.where(is_s, np.where(reflect, 2 * start - c2_prev, start), ctrl1)
+    # T：控制点沿 T 链反射；σ 交替符号把 c_i = 2s_i - c_{i-1} 化为累加和
+    is_t = code == T
+    quad_ctrl = ctrl1
+    if is_t.any():
+        sigma = np.where(rows % 2 == 0, 1.0, -1.0)[:, None]
+        prev_q = np.vstack([start[:1], ctrl1[:-1]])
+        chain_reset = ~is_t | (prev_code != T)
+        first_ctrl = np.where((is_t & (prev_code == Q))[:, None], 2 * start - prev_q, start)
+        chained = sigma * _reset_cumsum(chain_reset, sigma * first_ctrl, 2 * sigma * start)
+        quad_ctrl = np.where(is_t[:, None], chained, ctrl1)
+
+    cubic = (code == C) | (code == S)
+    quad = (code == Q) | is_t
+    cubics = np.stack([start[cubic], cubic_ctrl1[cubic], cubic_ctrl2[cubic], end[cubic]], axis=1)
+    cubic_owner = owner[cubic]
+    if quad.any():
+        p0, p1, p2 = start[quad], quad_ctrl[quad], end[quad]
+        elevated = np.stack([p0, p0 + 2 / 3 * (p1 - p0), p2 + 2 / 3 * (p1 - p2), p2], axis=1)
+        cubics = np.concatenate([cubics, elevated])
+        cubic_owner = np.concatenate([cubic_owner, owner[quad]])
+    arc = code == A
+    arcs, valid = _arc_ellipses(start[arc], end[arc], args[arc])
+    return end, owner, cubics, cubic_owner, arcs, owner[arc][valid]
+
+
+def _arc_ellipses(start: np.ndarray, end: np.ndarray, args: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    端点参数化的椭圆弧转为 [cx, cy, Ux, Uy, Vx, Vy, θ1, Δθ]（SVG 规范 F.6.5），并返回保留的弧的掩码；
+    半径为 0 或端点重合的弧按直线处理（只保留终点）
+    """
+    rx, ry = np.abs(args[:, 0]), np.abs(args[:, 1])
+    valid = (rx > 0) & (ry > 0) & np.any(start != end, axis=1)
+    if not valid.any():
+        return np.zeros((0, 8)), valid
+    start, end, args, rx, ry = start[valid], end[valid], args[valid], rx[valid], ry[valid]
+    phi = np.radians(args[:, 2])
+    cos, sin = np.cos(phi), np.sin(phi)
+    dx, dy = (start[:, 0] - end[:, 0]) / 2, (start[:, 1] - end[:, 1]) / 2
+    x1, y1 = cos * dx + sin * dy, -sin * dx + cos * dy
+    scale = np.sqrt(np.maximum(x1 ** 2 / rx ** 2 + y1 ** 2 / ry ** 2, 1.0))
+    rx, ry = rx * scale, ry * scale
+    num = rx ** 2 * ry ** 2 - rx ** 2 * y1 ** 2 - ry ** 2 * x1 ** 2
+    den = rx ** 2 * y1 ** 2 + ry ** 2 * x1 ** 2
+    coef = np.sqrt(np.maximum(num, 0.0) / den) * np.where(args[:, 3] == args[:, 4], -1.0, 1.0)
+    cxp, cyp = coef * rx * y1 / ry, -coef * ry * x1 / rx
+    cx = cos * cxp - sin * cyp + (start[:, 0] + end[:, 0]) / 2
+    cy = sin * cxp + cos * cyp + (start[:, 1] + end[:, 1]) / 2
+    theta1 = np.arctan2((y1 - cyp) / ry, (x1 - cxp) / rx)
+    delta = np.arctan2((-y1 - cyp) / ry, (-x1 - cxp) / rx) - theta1
+    sweep = args[:, 4] == 1
+    delta = np.where(~sweep & (delta > 0), delta - 2 * np.pi, delta)
+    delta = np.where(sweep & (delta < 0), delta + 2 * np.pi, delta)
+    return np.column_stack([cx, cy, rx * cos, rx * sin, -ry * sin, ry * cos, theta1, delta]), valid
+
+
+# ---------- 包围盒 ----------
+
+class _Collector:
+    """收集图元（局部坐标 + CTM 下标 + 描边外扩），最后统一变换并求极值"""
+
+    def __init__(self):
+        self.ctms: List[tuple] = []
+        self.points: List[tuple] = []           # (x, y, ctm, pad)
+        self.ellipses: List[tuple] = []         # (cx, cy, ux, uy, vx, vy, θ1, Δθ, ctm, pad)
+        self.paths: List[tuple] = []            # (d, ctm, pad)
+        self.polylines: List[tuple] = []        # (points (N,2), ctm, pad)
+
+    def ctm(self, matrix: tuple) -> int:
+        self.ctms.append(matrix)
+        return len(self.ctms) - 1
+
+    def bbox(self) -> Optional[Tuple[float, float, float, float]]:
+        if not (self.points or self.ellipses or self.paths or self.polylines):
+            return None
+        ctms = np.array(self.ctms, dtype=np.float64)
+        lows, highs = [], []
+
+        def transform(xy: np.ndarray, index: np.ndarray) -> np.ndarray:
+            m = ctms[index]
+            if xy.ndim == 3:
+                m = m[:, None, :]
+            return np.stack([
+                m[..., 0] * xy[..., 0] + m[..., 2] * xy[..., 1] + m[..., 4],
+                m[..., 1] * xy[..., 0] + m[..., 3] * xy[..., 1] + m[..., 5],
+            ], axis=-1)
+
+        point_sets, ellipse_sets = [], []
+        if self.points:
+            rows = np.array(self.points, dtype=np.float64)
+            point_sets.append((rows[:, :2], rows[:, 2].astype(np.int64), rows[:, 3]))
+        if self.polylines:
+            point_sets.append(_concat(self.polylines))
+        if self.ellipses:
+            rows = np.array(self.ellipses, dtype=np.float64)
+            ellipse_sets.append((rows[:, :8], rows[:, 8].astype(np.int64), rows[:, 9]))
+        if self.paths:
+            points, point_owner, cubics, cubic_owner, arcs, arc_owner = paths_geometry([d for d, _, _ in self.paths])
+            path_ctm = np.array([ctm for _, ctm, _ in self.paths], dtype=np.int64)
+            path_pad = np.array([pad for _, _, pad in self.paths], dtype=np.float64)
+            point_sets.append((points, path_ctm[point_owner], path_pad[point_owner]))
+            ellipse_sets.append((arcs, path_ctm[arc_owner], path_pad[arc_owner]))
+            if len(cubics):
+                index = path_ctm[cubic_owner]
+                xy, owner = _cubic_extrema(transform(cubics, index))
+                _extend(lows, highs, xy, path_pad[cubic_owner][owner] * _scale(ctms[index[owner]]))
+        for xy, index, pad in point_sets:
+            if len(xy):
+                _extend(lows, highs, transform(xy, index), pad * _scale(ctms[index]))
+        for rows, index, pad in ellipse_sets:
+            if len(rows):
+                xy, owner = _ellipse_extrema(rows, ctms[index])
+                _extend(lows, highs, xy, pad[owner] * _scale(ctms[index[owner]]))
+        if not lows:
+            return None
+        low, high = np.min(lows, axis=0), np.max(highs, axis=0)
+        if not (np.isfinite(low).all() and np.isfinite(high).all()):
+            return None
+        return float(low[0]), float(low[1]), float(high[0] - low[0]), float(high[1] - low[1])
+
+
+def _extend(lows: list, highs: list, xy: np.ndarray, pad: np.ndarray):
+    if len(xy):
+        lows.append([np.min(xy[:, 0] - pad), np.min(xy[:, 1] - pad)])
+        highs.append([np.max(xy[:, 0] + pad), np.max(xy[:, 1] + pad)])
+
+
+def _concat(items) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    arrays = [a for a, _, _ in items]
+    lengths = [len(a) for a in arrays]
+    index = np.repeat(np.array([c for _, c, _ in items], dtype=np.int64), lengths)
+    pad = np.repeat(np.array([p for _, _, p in items], dtype=np.float64), lengths)
+    return np.concatenate(arrays), index, pad
+
+
+def _scale(m: np.ndarray) -> np.ndarray:
+    return np.sqrt(np.abs(m[:, 0] * m[:, 3] - m[:, 1] * m[:, 2]))
+
+
+def _cubic_extrema(p: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(K,4,2) 三次贝塞尔的端点与各轴导数根处的点，返回 (点, 所属曲线下标)"""
+    p0, p1, p2, p3 = p[:, 0], p[:, 1], p[:, 2], p[:, 3]
+    a = -p0 + 3 * p1 - 3 * p2 + p3
+    b = 2 * (p0 - 2 * p1 + p2)
+    c = p1 - p0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        disc = np.sqrt(b * b - 4 * a * c)
+        quadratic = np.abs(a) > 1e-12
+        t1 = np.where(quadratic, (-b + disc) / (2 * a), -c / b)
+        t2 = np.where(quadratic, (-b - disc) / (2 * a), np.nan)
+    t = np.concatenate([t1, t2], axis=1)                      # (K, 4)：x、y 各两个根
+    t = np.where((t > 0) & (t < 1), t, np.nan)
+    t = np.concatenate([np.zeros((len(p), 1)), np.ones((len(p), 1)), t], axis=1)
+    owner = np.repeat(np.arange(len(p)), t.shape[1])
+    t = t.reshape(-1)
+    keep = ~np.isnan(t)
+    t, owner = t[keep][:, None], owner[keep]
+    mt = 1 - t
+    q = p[owner]
+    xy = mt ** 3 * q[:, 0] + 3 * mt ** 2 * t * q[:, 1] + 3 * mt * t ** 2 * q[:, 2] + t ** 3 * q[:, 3]
+    return xy, owner
+
+
+def _ellipse_extrema(rows: np.ndarray, m: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """参数椭圆弧在变换后的端点与各轴极值点，返回 (点, 所属弧下标)"""
+    cx = m[:, 0] * rows[:, 0] + m[:, 2] * rows[:, 1] + m[:, 4]
+    cy = m[:, 1] * rows[:, 0] + m[:, 3] * rows[:, 1] + m[:, 5]
+    ux = m[:, 0] * rows[:, 2] + m[:, 2] * rows[:, 3]
+    uy = m[:, 1] * rows[:, 2] + m[:, 3] * rows[:, 3]
+    vx = m[:, 0] * rows[:, 4] + m[:, 2] * rows[:, 5]
+    vy = m[:, 1] * rows[:, 4] + m[:, 3] * rows[:, 5]
+    theta1, delta = rows[:, 6], rows[:, 7]
+    tx, ty = np.arctan2(vx, ux), np.arctan2(vy, uy)
+    angles = np.column_stack([theta1, theta1 + delta, tx, tx + np.pi, ty, ty + np.pi])
+    offset = np.mod((angles - theta1[:, None]) * np.where(delta < 0, -1.0, 1.0)[:, None], 2 * np.pi)
+    inside = offset <= np.abs(delta)[:, None] + 1e-9
+    inside[:, :2] = True
+    owner = np.nonzero(inside)[0]
+    theta = angles[inside]
+    xy = np.column_stack([
+        cx[owner] + ux[owner] * np.cos(theta) + vx[owner] * np.sin(theta),
+        cy[owner] + uy[owner] * np.cos(theta) + vy[owner] * np.sin(theta),
+    ])
+    return xy, owner
+
+
+class _Walker:
+    """遍历渲染树，解析样式与变换并把图元交给 _Collector"""
+
+    def __init__(self, root: ET.Element, stroke: bool):
+        self.root = root
+        self.stroke = stroke
+        self.css = _StyleSheet(root)
+        self.ids = {el.get("id"): el for el in root.iter() if isinstance(el.tag, str) and el.get("id")}
+        self.out = _Collector()
+
+    def run(self) -> Optional[Tuple[float, float, float, float]]:
+        inherited = {"stroke": "none", "stroke-width": "1", "font-size": str(DEFAULT_FONT_SIZE),
+                     "text-anchor": "start", "visibility": "visible"}
+        for child in self.root:
+            self.visit(child, IDENTITY, inherited, set())
+        return self.out.bbox()
+
+    def properties(self, el: ET.Element, tag: str, inherited: dict) -> dict:
+        props = {name: value for name, value in inherited.items() if name in _INHERITED}
+        for name in _PROPERTIES:
+            if el.get(name) is not None:
+                props[name] = el.get(name).strip()
+        self.css.apply(el, tag, props)
+        props.update(_declarations(el.get("style")))
+        parent_size = float(inherited["font-size"])
+        props["font-size"] = str(parse_length(props.get("font-size"), parent_size, parent_size))
+        return props
+
+    def visit(self, el: ET.Element, ctm: tuple, inherited: dict, using: set):
+        tag = _local(el.tag)
+        if not tag or tag in _SKIP:
+            return
+        props = self.properties(el, tag, inherited)
+        if props.get("display") == "none":
+            return
+        if el.get("transform"):
+            ctm = _multiply(ctm, parse_transform(el.get("transform")))
+
+        if tag in ("g", "a", "switch"):
+            for child in el:
+                self.visit(child, ctm, props, using)
+            return
+        if tag == "svg":
+            self.visit_nested_svg(el, ctm, props, using)
+            return
+        if tag == "use":
+            self.visit_use(el, ctm, props, using)
+            return
+        if props.get("visibility") in ("hidden", "collapse"):
+            return
+        pad = self.pad(props)
+        get = lambda name: parse_length(el.get(name), 0.0) or 0.0  # noqa: E731
+
+        if tag == "path":
+            if (el.get("d") or "").strip():
+                self.out.paths.append((el.get("d"), self.out.ctm(ctm), pad))
+        elif tag in ("rect", "image", "foreignObject"):
+            x, y, w, h = get("x"), get("y"), get("width"), get("height")
+            if w > 0 and h > 0:
+                index = self.out.ctm(ctm)
+                pad = pad if tag == "rect" else 0.0
+                self.out.points.extend(((x, y, index, pad), (x + w, y, index, pad),
+                                        (x, y + h, index, pad), (x + w, y + h, index, pad)))
+        elif tag in ("circle", "ellipse"):
+            rx = get("r") if tag == "circle" else get("rx")
+            ry = get("r") if tag == "circle" else get("ry")
+            if rx > 0 and ry > 0:
+                self.out.ellipses.append((get("cx"), get("cy"), rx, 0.0, 0.0, ry, 0.0, 2 * math.pi,
+                                          self.out.ctm(ctm), pad))
+        elif tag == "line":
+            index = self.out.ctm(ctm)
+            self.out.points.extend(((get("x1"), get("y1"), index, pad), (get("x2"), get("y2"), index, pad)))
+        elif tag in ("polyline", "polygon"):
+            numbers = np.array(_NUMBER.findall(el.get("points") or ""), dtype=np.float64)
+            if len(numbers) >= 2:
+                points = numbers[:len(numbers) // 2 * 2].reshape(-1, 2)
+                self.out.polylines.append((points, self.out.ctm(ctm), pad))
+        elif tag == "text":
+            self.visit_text(el, ctm, props)
+
+    def pad(self, props: dict) -> float:
+        if not self.stroke or props.get("stroke") in (None, "", "none", "transparent"):
+            return 0.0
+        return max(parse_length(props.get("stroke-width"), 1.0) or 0.0, 0.0) / 2
+
+    def visit_text(self, el: ET.Element, ctm: tuple, props: dict):
+        text = "".join(el.itertext()).strip()
+        if not text:
+            return
+        size = float(props["font-size"])
+        x = parse_length((el.get("x") or "0").replace(",", " ").split()[0], 0.0) if el.get("x") else 0.0
+        y = parse_length((el.get("y") or "0").replace(",", " ").split()[0], 0.0) if el.get("y") else 0.0
+        width = sum(size if ord(ch) >= 0x2E80 else size * 0.6 for ch in " ".join(text.split()))
+        anchor = props.get("text-anchor", "start")
+        left = x - width / 2 if anchor == "middle" else x - width if anchor == "end" else x
+        index = self.out.ctm(ctm)
+        self.out.points.extend(((left, y - 0.8 * size, index, 0.0), (left + width, y + 0.2 * size, index, 0.0)))
+
+    def visit_use(self, el: ET.Element, ctm: tuple, props: dict, using: set):
+        href = el.get("href") or el.get(XLINK_HREF) or ""
+        target = self.ids.get(href[1:]) if href.startswith("#") else None
+        if target is None or href in using or len(using) >= USE_DEPTH:
+            return
+        ctm = _multiply(ctm, (1.0, 0.0, 0.0, 1.0, parse_length(el.get("x"), 0.0), parse_length(el.get("y"), 0.0)))
+        if _local(target.tag) == "symbol":
+            for child in target:
+                self.visit(child, ctm, props, using | {href})
+        else:
+            self.visit(target, ctm, props, using | {href})
+
+    def visit_nested_svg(self, el: ET.Element, ctm: tuple, props: dict, using: set):
+        """嵌套 <svg>：平移到 x / y，有 viewBox 与宽高时按 xMidYMid meet 缩放"""
+        ctm = _multiply(ctm, (1.0, 0.0, 0.0, 1.0, parse_length(el.get("x"), 0.0), parse_length(el.get("y"), 0.0)))
+        view_box = parse_view_box(el.get("viewBox"))
+        width, height = parse_length(el.get("width")), parse_length(el.get("height"))
+        if view_box and width and height:
+            vx, vy, vw, vh = view_box
+            scale = min(width / vw, height / vh)
+            ctm = _multiply(ctm, (scale, 0.0, 0.0, scale,
+                                  (width - vw * scale) / 2 - vx * scale, (height - vh * scale) / 2 - vy * scale))
+        for child in el:
+            self.visit(child, ctm, props, using)
+
+
+def content_bbox(svg, stroke: bool = True) -> Optional[Tuple[float, float, float, float]]:
+    """内容包围盒 (x, y, width, height)，为根元素的用户坐标；svg 可为文本或已解析的根元素；没有可见内容时返回 None"""
+    root = ET.fromstring(svg) if isinstance(svg, str) else svg
+    return _Walker(root, stroke).run()
+
+
+def _round(value: Optional[float]):
+    if value is None:
+        return None
+    value = round(value, 2)
+    return int(value) if value == int(value) else value
+
+
+def measure(svg: str) -> Dict[str, object]:
+    """
+    草稿元数据中的尺寸：{"width", "height", "viewBox", "bbox"}。
+    viewBox 优先取根元素声明的值；未声明但 width / height 都是绝对长度时为 "0 0 width height"（与浏览器的
+    初始用户坐标系一致），否则取内容包围盒（向外取整）。width / height 优先取声明的绝对长度，
+    只声明一个时按 viewBox 比例补齐，都没有时取 viewBox 的宽高。bbox 为内容包围盒 [x, y, w, h]。
+    无法解析时各项为 None。
+    """
+    result = {"width": None, "height": None, "viewBox": None, "bbox": None}
+    try:
+        root = ET.fromstring(svg or "")
+    except ET.ParseError as e:
+        logger.debug("SVG geometry skipped: %s", e)
+        return result
+    if _local(root.tag) != "svg":
+        return result
+    try:
+        box = content_bbox(root)
+    except (ValueError, IndexError, FloatingPointError) as e:
+        logger.warning("SVG bounding box failed: %s", e)
+        box = None
+    if box is not None:
+        result["bbox"] = [_round(v) for v in box]
+
+    width, height = parse_length(root.get("width")), parse_length(root.get("height"))
+    view_box = parse_view_box(root.get("viewBox"))
+    if view_box is None and width and height and width > 0 and height > 0:
+        view_box = (0, 0, width, height)
+    if view_box is None and box is not None and box[2] > 0 and box[3] > 0:
+        x0, y0 = math.floor(box[0]), math.floor(box[1])
+        view_box = (x0, y0, math.ceil(box[0] + box[2]) - x0, math.ceil(box[1] + box[3]) - y0)
+    if view_box is not None:
+        result["viewBox"] = " ".join(str(_round(v)) for v in view_box)
+
+    if view_box is not None:
+        if width and not height:
+            height = width * view_box[3] / view_box[2]
+        elif height and not width:
+            width = height * view_box[2] / view_box[3]
+        elif not width and not height:
+            width, height = view_box[2], view_box[3]
+    result["width"], result["height"] = _round(width), _round(height)
+    return result
+
+
+META_KEYS = ("width", "height", "viewBox", "bbox")
+
+
+def fill_meta(meta: Optional[dict], svg: str, force: bool = False) -> dict:
+    """
+    返回补齐了 width / height / viewBox / bbox 的 meta 副本：只填缺失或为 None 的键（force=True 时全部重算）；
+    SVG 无法解析时原样返回。
+    """
+    meta = dict(meta or {})
+    if not force and all(meta.get(key) is not None for key in META_KEYS):
+        return meta
+    for key, value in measure(svg).items():
+        if value is not None and (force or meta.get(key) is None):
+            meta[key] = value
+    return meta
@@ -0,0 +1,726 @@
+"""
+SVG 优化：在不改变渲染结果的前提下缩小文档，用于 codegen 之后、草稿保存（DraftCreateView）与 SvgDraw 保存。
+解析为 ElementTree 后依次执行各遍处理，每遍之后重新序列化计算节省的字节数：
+- comments：注释、处理指令、DOCTYPE（解析时即丢弃）与 <metadata>
+- whitespace：元素之间的空白（<text> / <style> 等保留）
+- default_attributes：取默认值的属性（可继承属性仅在祖先未设置、且文档没有 <style> 时删除）、空属性、version
+- precision：坐标与长度类属性、transform、viewBox、points 中数字的小数位（按画布大小确定，见 canvas_precision）
+- path_data：路径重新编码，每段在绝对 / 相对坐标中取较短者，省略重复命令与多余分隔符（相对坐标按已渲染位置累计，误差不累积）
+- empty_groups：删除空的 <g> / <defs>，展开没有属性的 <g>
+- style_classes：重复出现的 style 提升为 <style> 中的类
+- use_dedup：只差平移（transform / x、y / cx、cy）的相同图形在 <defs> 中定义一次，各处改为 <use>
+含选择器的已有 <style> 不是简单的类型 / 单类选择器时，跳过 style_classes 与 use_dedup（避免改变层叠结果）；
+已有 type.class 规则（优先级高于单个类）能匹配的元素不提升 style。
+
+可通过环境变量调整（均为可选）：
+- SVG_OPTIMIZER_ENABLED    是否启用，默认 1
+- SVG_OPTIMIZER_PRECISION  画布边长不小于 100 时坐标保留的小数位，默认 2；画布每小一个数量级多保留 1 位
+                           （transform 再多保留 2 位）
+"""
+import os
+import re
+import math
+import time
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from xml.etree import ElementTree as ET
+
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+_KNOWN_PREFIXES = {SVG_NS: "", XLINK_NS: "xlink", XML_NS: "xml"}
+
+PASSES = (
+    "comments", "whitespace", "default_attributes", "precision", "path_data",
+    "empty_groups", "style_classes", "use_dedup",
+)
+
+# 内容中的空白有意义的元素
+_TEXT_ELEMENTS = {"text", "tspan", "textPath", "title", "desc", "style", "script", "foreignObject"}
+# 不参与 <use> 合并的子树（定义、裁剪、蒙版等）
+_DEFINITION_ELEMENTS = {
+    "defs", "clipPath", "mask", "pattern", "marker", "symbol", "linearGradient", "radialGradient", "filter",
+    "text", "foreignObject", "switch",
+}
+_SHAPES = {"path", "rect", "circle", "ellipse", "line", "polyline", "polygon"}
+# (形状, 平移属性)：合并时移到 <use> 的 x / y 上
+_OFFSET_ATTRS = {"rect": ("x", "y"), "circle": ("cx", "cy"), "ellipse": ("cx", "cy")}
+
+_NUMERIC_ATTRS = {
+    "x", "y", "width", "height", "cx", "cy", "r", "rx", "ry", "x1", "y1", "x2", "y2", "dx", "dy",
+    "stroke-width", "font-size", "stroke-dashoffset", "stroke-dasharray", "points", "viewBox",
+    "refX", "refY", "markerWidth", "markerHeight", "fx", "fy",
+}
+# 不可继承属性的默认值（可直接删除）
+_DEFAULTS = {
+    "opacity": "1", "display": "inline", "transform": "",
+    "rect": {"x": "0", "y": "0", "rx": "0", "ry": "0"},
+    "circle": {"cx": "0", "cy": "0"},
+    "ellipse": {"cx": "0", "cy": "0"},
+    "line": {"x1": "0", "y1": "0", "x2": "0", "y2": "0"},
+    "use": {"x": "0", "y": "0"},
+    "image": {"x": "0", "y": "0"},
+}
+# 可继承属性的默认值：祖先设置过同名属性时保留
+_INHERITED_DEFAULTS = {
+    "fill-opacity": "1", "stroke-opacity": "1", "stroke-width": "1", "stroke": "none",
+    "stroke-linecap": "butt", "stroke-linejoin": "miter", "stroke-miterlimit": "4", "stroke-dashoffset": "0",
+    "stroke-dasharray": "none", "fill-rule": "nonzero", "clip-rule": "nonzero", "visibility": "visible",
+    "font-style": "normal", "font-weight": "normal", "text-anchor": "start",
+}
+
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_PATH_SEP = re.compile(r"[\s,]*")
+_PATH_ARGS = {"M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "T": 2, "A": 7, "Z": 0}
+_SIMPLE_SELECTOR = re.compile(r"^\s*([A-Za-z][\w-]*|\*)?(?:\.([A-Za-z_][\w-]*))?\s*$")
+_CSS_RULE = re.compile(r"([^{}]+)\{[^{}]*\}")
+
+
+def optimizer_enabled() -> bool:
+    return os.environ.get("SVG_OPTIMIZER_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off", "")
+
+
+def default_precision() -> int:
+    try:
+        return max(0, int(os.environ.get("SVG_OPTIMIZER_PRECISION", 2)))
+    except ValueError:
+        return 2
+
+
+def _local(name: str) -> str:
+    return name.rsplit("}", 1)[-1]
+
+
+def _size(text: str) -> int:
+    return len(text.encode("utf-8"))
+
+
+# ---------- 序列化 ----------
+
+_NEEDS_ESCAPE = re.compile(r'[&<>"]')
+
+
+def _escape_text(text: str) -> str:
+    if not _NEEDS_ESCAPE.search(text):
+        return text
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _escape_attr(value: str) -> str:
+    if not _NEEDS_ESCAPE.search(value):
+        return value
+    return _escape_text(value).replace('"', "&quot;")
+
+
+def parse(svg: str) -> Tuple[ET.Element, Dict[str, str]]:
+    """解析 SVG，返回 (根元素, 命名空间 -> 原文中的前缀)；不是合法 XML 时抛出 ET.ParseError"""
+    parser = ET.XMLPullParser(events=("start", "start-ns"))
+    parser.feed(svg)
+    parser.close()
+    root, prefixes = None, {}
+    for event, item in parser.read_events():
+        if event == "start-ns":
+            prefix, uri = item
+            if prefix and uri not in _KNOWN_PREFIXES:
+                prefixes.setdefault(uri, prefix)
+        elif root is None:
+            root = item
+    if root is None:
+        raise ET.ParseError("no element found")
+    return root, prefixes
+
+
+def serialize(root: ET.Element, namespaces: Dict[str, str] = None, declare: bool = True) -> str:
+    """
+    紧凑序列化：命名空间声明只写在根元素上，SVG 为默认命名空间；namespaces 为其他命名空间沿用的前缀。
+    declare=False 时不写声明（用于估算片段大小）。
+    """
+    prefixes = {**(namespaces or {}), **_KNOWN_PREFIXES}
+    used = set()
+    for el in root.iter():
+        for name in (el.tag, *el.attrib):
+            if isinstance(name, str) and name[0] == "{":
+                uri = name[1:].split("}", 1)[0]
+                used.add(uri)
+                if uri not in prefixes:
+                    prefixes[uri] = f"ns{len(prefixes)}"
+                while list(prefixes.values()).count(prefixes[uri]) > 1:
+                    prefixes[uri] += "_"
+
+    names: Dict[str, str] = {}
+
+    def qname(name: str) -> str:
+        if name in names:
+            return names[name]
+        if name.startswith("{"):
+            uri, local = name[1:].split("}", 1)
+            names[name] = f"{prefixes[uri]}:{local}" if prefixes[uri] else local
+        else:
+            names[name] = name
+        return names[name]
+
+    declarations = "".join(
+        f' xmlns="{uri}"' if not prefixes[uri] else f' xmlns:{prefixes[uri]}="{uri}"'
+        for uri in sorted(used, key=lambda u: (prefixes[u] != "", prefixes[u])) if uri != XML_NS
+    )
+    parts: List[str] = []
+
+    def write(el: ET.Element, is_root: bool):
+        if not isinstance(el.tag, str):
+            return
+        tag = qname(el.tag)
+        attrs = "".join(f' {qname(k)}="{_escape_attr(v)}"' for k, v in el.attrib.items())
+        parts.append(f"<{tag}{declarations if is_root and declare else ''}{attrs}")
+        if len(el) or el.text:
+            parts.append(">")
+            if el.text:
+                parts.append(_escape_text(el.text))
+            for child in el:
+                write(child, False)
+                if child.tail:
+                    parts.append(_escape_text(child.tail))
+            parts.append(f"</{tag}>")
+        else:
+            parts.append("/>")
+
+    write(root, True)
+    return "".join(parts)
+
+
+# ---------- 数字 ----------
+
+def _fmt(value: float, precision: int) -> str:
+    """按小数位舍入并去掉多余的 0：0.50 -> .5，-0.5 -> -.5，-0 -> 0"""
+    text = f"{round(value, precision):.{precision}f}" if precision > 0 else str(int(round(value)))
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    if text in ("-0", ""):
+        return "0"
+    if text.startswith("0.") and len(text) > 2:
+        return text[1:]
+    if text.startswith("-0.") and len(text) > 3:
+        return "-" + text[2:]
+    return text
+
+
+_PX_LENGTH = re.compile(r"\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*(?:px)?\s*$")
+
+
+def canvas_precision(root: ET.Element, precision: int) -> int:
+    """
+    按画布大小换算实际保留的小数位：取 viewBox 的较长边（没有时取无单位 / px 的 width、height），
+    边长不小于 100 时为 precision，每小一个数量级多保留 1 位，使舍入误差始终约为画布的万分之一；
+    画布大小未知时为 precision。
+    """
+    numbers = [float(n) for n in _NUMBER.findall(root.get("viewBox") or "")]
+    if len(numbers) == 4:
+        extent = max(numbers[2], numbers[3])
+    else:
+        lengths = [_PX_LENGTH.match(root.get(name) or "") for name in ("width", "height")]
+        extent = max((float(m.group(1)) for m in lengths if m), default=0.0)
+    if not extent > 0 or extent == float("inf"):
+        return precision
+    return precision + max(0, 2 - math.floor(math.log10(extent)))
+
+
+def _round_numbers(value: str, precision: int) -> str:
+    if "." not in value and "e" not in value and "E" not in value:
+        return value
+    return _NUMBER.sub(lambda m: _fmt(float(m.group(0)), precision), value)
+
+
+def _same_value(value: str, default: str) -> bool:
+    value = value.strip()
+    if value == default:
+        return True
+    try:
+        return float(value.removesuffix("px")) == float(default)
+    except ValueError:
+        return False
+
+
+# ---------- 路径 ----------
+
+def parse_path(d: str) -> List[Tuple[str, List[float]]]:
+    """解析路径数据为 [(命令, 参数)]（保留原始大小写），格式错误时抛出 ValueError"""
+    segments = []
+    pos, cmd, n = 0, None, len(d)
+    while True:
+        pos = _PATH_SEP.match(d, pos).end()
+        if pos >= n:
+            break
+        ch = d[pos]
+        if ch.upper() in _PATH_ARGS and ch.isalpha():
+            cmd = ch
+            pos += 1
+            if cmd in "Zz":
+                segments.append((cmd, []))
+                continue
+        elif cmd is None or cmd in "Zz":
+            raise ValueError(f"path data: unexpected '{ch}' at {pos}")
+        args = []
+        for i in range(_PATH_ARGS[cmd.upper()]):
+            pos = _PATH_SEP.match(d, pos).end()
+            if cmd in "Aa" and i in (3, 4):
+                if pos >= n or d[pos] not in "01":
+                    raise ValueError(f"path data: bad arc flag at {pos}")
+                args.append(float(d[pos]))
+                pos += 1
+                continue
+            m = _NUMBER.match(d, pos)
+            if not m:
+                raise ValueError(f"path data: expected number at {pos}")
+            args.append(float(m.group(0)))
+            pos = m.end()
+        segments.append((cmd, args))
+        # M 之后的隐式坐标对按 L 处理
+        if cmd == "M":
+            cmd = "L"
+        elif cmd == "m":
+            cmd = "l"
+    return segments
+
+
+def _join(numbers: List[str], previous: Optional[str]) -> str:
+    """数字之间只在必要时加空格：负号与第二个小数点都能充当分隔符"""
+    out = []
+    for text in numbers:
+        if previous is not None and not (text[0] == "-" or (text[0] == "." and "." in previous)):
+            out.append(" ")
+        out.append(text)
+        previous = text
+    return "".join(out)
+
+
+def compact_path(d: str, precision: int) -> str:
+    """重新编码路径数据；每段在绝对 / 相对坐标（直线还有 H / V）中取最短者"""
+    segments = parse_path(d)
+    out: List[str] = []
+    last_cmd, last_num = None, None
+    cx = cy = 0.0          # 原始（精确）当前点
+    rx = ry = 0.0          # 已输出（舍入后）的当前点
+    sx = sy = srx = sry = 0.0
+
+    for cmd, args in segments:
+        upper = cmd.upper()
+        relative = cmd != upper
+        if upper == "Z":
+            text = "z"
+            out.append(text)
+            last_cmd, last_num = "z", None
+            cx, cy, rx, ry = sx, sy, srx, sry
+            continue
+        # 转为绝对坐标
+        absolute = list(args)
+        if upper == "H":
+            absolute[0] += cx if relative else 0
+            points = [(absolute[0], cy)]
+        elif upper == "V":
+            absolute[0] += cy if relative else 0
+            points = [(cx, absolute[0])]
+        elif upper == "A":
+            if relative:
+                absolute[5] += cx
+                absolute[6] += cy
+            points = [(absolute[5], absolute[6])]
+        else:
+            if relative:
+                for i in range(0, len(absolute), 2):
+                    absolute[i] += cx
+                    absolute[i + 1] += cy
+            points = [(absolute[i], absolute[i + 1]) for i in range(0, len(absolute), 2)]
+
+        def encode(kind: str, use_relative: bool) -> Tuple[List[str], Tuple[float, float]]:
+            ox, oy = (rx, ry) if use_relative else (0.0, 0.0)
+            if kind == "H":
+                value = _fmt(points[-1][0] - ox, precision)
+                return [value], (ox + float(value), ry)
+            if kind == "V":
+                value = _fmt(points[-1][1] - oy, precision)
+                return [value], (rx, oy + float(value))
+            if kind == "A":
+                head = [_fmt(a, precision) for a in absolute[:3]] + [str(int(absolute[3])), str(int(absolute[4]))]
+                x, y = _fmt(absolute[5] - ox, precision), _fmt(absolute[6] - oy, precision)
+                return head + [x, y], (ox + float(x), oy + float(y))
+            numbers = []
+            for px, py in points:
+                numbers += [_fmt(px - ox, precision), _fmt(py - oy, precision)]
+            return numbers, (ox + float(numbers[-2]), oy + float(numbers[-1]))
+
+        kinds = [upper]
+        if upper == "L":
+            # 水平 / 竖直线段改写为 H / V
+            if _fmt(points[0][1], precision) == _fmt(ry, precision):
+                kinds.append("H")
+            elif _fmt(points[0][0], precision) == _fmt(rx, precision):
+                kinds.append("V")
+        best = None
+        for kind in kinds:
+            for use_relative in (False, True):
+                letter = kind.lower() if use_relative else kind
+                numbers, end = encode(kind, use_relative)
+                # 同一命令可省略字母；M/m 之后的坐标对按 L/l 解析，所以 M 不能隐式重复
+                implicit = (letter == last_cmd and letter not in "Mm") or (letter, last_cmd) in (("L", "M"), ("l", "m"))
+                text = _join(numbers, last_num) if implicit else letter + _join(numbers, None)
+                if best is None or len(text) < len(best[0]):
+                    best = (text, letter, numbers, end)
+        text, last_cmd, numbers, (rx, ry) = best
+        out.append(text)
+        last_num = numbers[-1]
+        cx, cy = points[-1]
+        if upper == "M":
+            sx, sy, srx, sry = cx, cy, rx, ry
+    return "".join(out)
+
+
+# ---------- 各遍处理 ----------
+
+class _Context:
+    def __init__(self, root: ET.Element, precision: int):
+        self.root = root
+        self.precision = precision
+        self.styles = [el for el in root.iter() if isinstance(el.tag, str) and _local(el.tag) == "style"]
+
+    def simple_css(self) -> bool:
+        """已有 <style> 只含类型 / 单类选择器（且无 !important）"""
+        for el in self.styles:
+            css = el.text or ""
+            if "!important" in css or "@" in css:
+                return False
+            for selectors in _CSS_RULE.findall(css):
+                if not all(_SIMPLE_SELECTOR.match(s) for s in selectors.split(",")):
+                    return False
+        return True
+
+    def typed_class_rules(self) -> set:
+        """已有 <style> 中 type.class 选择器的 (类型, 类)；其优先级高于提升后的单类规则"""
+        pairs = set()
+        for el in self.styles:
+            for selectors in _CSS_RULE.findall(el.text or ""):
+                for selector in selectors.split(","):
+                    match = _SIMPLE_SELECTOR.match(selector)
+                    if match and match.group(1) not in (None, "*") and match.group(2):
+                        pairs.add((match.group(1), match.group(2)))
+        return pairs
+
+
+def _pass_whitespace(ctx: _Context):
+    def visit(el: ET.Element, keep: bool):
+        keep = keep or _local(el.tag) in _TEXT_ELEMENTS or el.get(f"{{{XML_NS}}}space") == "preserve"
+        if not keep and el.text and not el.text.strip():
+            el.text = None
+        for child in el:
+            if not keep and child.tail and not child.tail.strip():
+                child.tail = None
+            if isinstance(child.tag, str):
+                visit(child, keep)
+    visit(ctx.root, False)
+
+
+def _style_properties(el: ET.Element) -> set:
+    style = el.get("style") or ""
+    return {part.split(":", 1)[0].strip().lower() for part in style.split(";") if ":" in part}
+
+
+def _pass_default_attributes(ctx: _Context):
+    inherited_ok = not ctx.styles
+
+    def visit(el: ET.Element, inherited: set):
+        tag = _local(el.tag)
+        if el is ctx.root:
+            for name in ("version", "baseProfile"):
+                el.attrib.pop(name, None)
+        defaults = _DEFAULTS.get(tag, {})
+        for name, value in list(el.attrib.items()):
+            if name in ("class", "style", "transform") and not value.strip():
+                del el.attrib[name]
+            elif name in defaults and _same_value(value, defaults[name]):
+                del el.attrib[name]
+            elif isinstance(_DEFAULTS.get(name), str) and _same_value(value, _DEFAULTS[name]):
+                del el.attrib[name]
+            elif inherited_ok and name in _INHERITED_DEFAULTS and name not in inherited \
+                    and _same_value(value, _INHERITED_DEFAULTS[name]):
+                del el.attrib[name]
+        here = inherited | set(el.attrib) | _style_properties(el)
+        for child in el:
+            if isinstance(child.tag, str):
+                visit(child, here)
+    visit(ctx.root, set())
+
+
+def _pass_precision(ctx: _Context):
+    for el in ctx.root.iter():
+        if not isinstance(el.tag, str):
+            continue
+        for name, value in el.attrib.items():
+            if name in _NUMERIC_ATTRS or name in ("opacity", "fill-opacity", "stroke-opacity"):
+                el.set(name, _round_numbers(value, ctx.precision if "opacity" not in name else max(ctx.precision, 2)))
+            elif name in ("transform", "gradientTransform", "patternTransform"):
+                el.set(name, _round_numbers(value, ctx.precision + 2))
+
+
+def _pass_path_data(ctx: _Context):
+    for el in ctx.root.iter():
+        if isinstance(el.tag, str) and _local(el.tag) == "path" and el.get("d"):
+            try:
+                compact = compact_path(el.get("d"), ctx.precision)
+            except ValueError as e:
+                logger.debug("Path left as is: %s", e)
+                continue
+            if len(compact) < len(el.get("d")):
+                el.set("d", compact)
+
+
+def _pass_empty_groups(ctx: _Context):
+    def visit(el: ET.Element):
+        index = 0
+        while index < len(el):
+            child = el[index]
+            if not isinstance(child.tag, str):
+                index += 1
+                continue
+            visit(child)
+            tag = _local(child.tag)
+            if tag in ("g", "defs") and not len(child) and not (child.text or "").strip() and "id" not in child.attrib:
+                _remove(el, index)
+                continue
+            if tag == "g" and not child.attrib and not (child.text or "").strip():
+                grandchildren = list(child)
+                tail = child.tail
+                el.remove(child)
+                for offset, grandchild in enumerate(grandchildren):
+                    el.insert(index + offset, grandchild)
+                if grandchildren:
+                    last = grandchildren[-1]
+                    last.tail = (last.tail or "") + (tail or "") or None
+                index += len(grandchildren)
+                continue
+            index += 1
+    visit(ctx.root)
+
+
+def _remove(parent: ET.Element, index: int):
+    """删除子元素并把其 tail 文本接到前一个节点上"""
+    child = parent[index]
+    if child.tail and child.tail.strip():
+        if index:
+            parent[index - 1].tail = (parent[index - 1].tail or "") + child.tail
+        else:
+            parent.text = (parent.text or "") + child.tail
+    parent.remove(child)
+
+
+def _existing_classes(root: ET.Element) -> set:
+    names = set()
+    for el in root.iter():
+        if isinstance(el.tag, str):
+            names.update((el.get("class") or "").split())
+    return names
+
+
+def _unique_names(prefix: str, taken: set):
+    index = 0
+    while True:
+        name = f"{prefix}{index}"
+        index += 1
+        if name not in taken:
+            yield name
+
+
+def _pass_style_classes(ctx: _Context):
+    if not ctx.simple_css():
+        return
+    typed = ctx.typed_class_rules()
+    by_style: Dict[str, List[ET.Element]] = defaultdict(list)
+    for el in ctx.root.iter():
+        if not isinstance(el.tag, str) or not el.get("style"):
+            continue
+        if any((_local(el.tag), name) in typed for name in (el.get("class") or "").split()):
+            # 内联样式优先于任何规则；改成 .sN 后会输给 rect.a 这类规则
+            continue
+        declarations = {}
+        for part in el.get("style").split(";"):
+            if ":" in part:
+                name, value = part.split(":", 1)
+                if name.strip() and value.strip():
+                    declarations[name.strip().lower()] = " ".join(value.split())
+        canonical = ";".join(f"{k}:{v}" for k, v in declarations.items())
+        if not canonical:
+            del el.attrib["style"]
+        elif "{" in canonical or "}" in canonical:
+            continue
+        else:
+            el.set("style", canonical)
+            by_style[canonical].append(el)
+
+    names = _unique_names("s", _existing_classes(ctx.root))
+    rules = []
+    for canonical, elements in by_style.items():
+        if len(elements) < 2:
+            continue
+        name = next(names)
+        before = len(elements) * (len(canonical) + 9)
+        after = len(canonical) + len(name) + 3 + sum(len(name) + (1 if el.get("class") else 9) for el in elements)
+        if after >= before:
+            continue
+        for el in elements:
+            del el.attrib["style"]
+            el.set("class", f"{el.get('class')} {name}" if el.get("class") else name)
+        rules.append(f".{name}{{{canonical}}}")
+    if not rules:
+        return
+    if ctx.styles:
+        # 追加到最后一个已有 <style>，同等优先级时后定义的规则生效，与原内联样式一致
+        last = ctx.styles[-1]
+        last.text = (last.text or "") + "".join(rules)
+    else:
+        style = ET.Element(f"{{{SVG_NS}}}style" if ctx.root.tag.startswith("{") else "style")
+        style.text = "".join(rules)
+        ctx.root.insert(0, style)
+        ctx.styles.append(style)
+
+
+def _pass_use_dedup(ctx: _Context):
+    if not ctx.simple_css():
+        return
+    ns = ctx.root.tag[:-len(_local(ctx.root.tag))]
+    groups: Dict[tuple, List[tuple]] = defaultdict(list)
+
+    def visit(el: ET.Element):
+        for child in el:
+            if not isinstance(child.tag, str):
+                continue
+            tag = _local(child.tag)
+            if tag in _DEFINITION_ELEMENTS:
+                continue
+            if tag in _SHAPES and not len(child) and not child.text and "id" not in child.attrib:
+                attrs = dict(child.attrib)
+                offset = []
+                for name in _OFFSET_ATTRS.get(tag, ()):
+                    value = attrs.pop(name, "0")
+                    if not _NUMBER.fullmatch(value.strip()):
+                        break
+                    offset.append(value.strip())
+                else:
+                    transform = attrs.pop("transform", None)
+                    groups[(tag, tuple(sorted(attrs.items())))].append((child, offset, transform))
+                    continue
+            visit(child)
+
+    visit(ctx.root)
+    candidates = [(key, items) for key, items in groups.items() if len(items) >= 2]
+    if not candidates:
+        return
+
+    ids = {el.get("id") for el in ctx.root.iter() if isinstance(el.tag, str) and el.get("id")}
+    names = _unique_names("u", ids)
+    href = f"{{{XLINK_NS}}}href"
+    replacements: Dict[ET.Element, ET.Element] = {}
+    defs = None
+    for (tag, attrs), items in candidates:
+        name = next(names)
+        first = items[0][0]
+        skip = set(_OFFSET_ATTRS.get(tag, ())) | {"transform"}
+        definition = ET.Element(first.tag, {"id": name, **{k: v for k, v in first.attrib.items() if k not in skip}})
+        uses = []
+        for el, offset, transform in items:
+            use_attrs = {href: f"#{name}"}
+            if offset and any(float(v) for v in offset):
+                use_attrs.update(zip(("x", "y"), offset))
+            if transform:
+                use_attrs["transform"] = transform
+            uses.append(ET.Element(f"{ns}use", use_attrs))
+        before = sum(len(serialize(el, declare=False)) for el, _, _ in items)
+        after = len(serialize(definition, declare=False)) + (13 if defs is None else 0) \
+            + sum(len(serialize(use, declare=False)) for use in uses)
+        if after >= before:
+            continue
+        if defs is None:
+            defs = next((c for c in ctx.root if isinstance(c.tag, str) and _local(c.tag) == "defs"), None)
+            if defs is None:
+                defs = ET.Element(f"{ns}defs")
+                ctx.root.insert(0, defs)
+        defs.append(definition)
+        for (el, _, _), use in zip(items, uses):
+            use.tail = el.tail
+            replacements[el] = use
+    if replacements:
+        for parent in ctx.root.iter():
+            for index, child in enumerate(parent):
+                if child in replacements:
+                    parent[index] = replacements[child]
+
+
+_PASS_FUNCTIONS = {
+    "whitespace": _pass_whitespace,
+    "default_attributes": _pass_default_attributes,
+    "precision": _pass_precision,
+    "path_data": _pass_path_data,
+    "empty_groups": _pass_empty_groups,
+    "style_classes": _pass_style_classes,
+    "use_dedup": _pass_use_dedup,
+}
+
+
+def optimize(svg: str, precision: int = None, passes=None) -> Tuple[str, dict]:
+    """
+    优化 SVG，返回 (优化后的文本, 报告)。报告含 input_bytes / output_bytes / saved_ratio 与 passes（每遍节省的字节数）。
+    无法解析或根元素不是 svg 时原样返回，报告中 skipped 为原因；结果反而更大时也返回原文。
+    """
+    started = time.perf_counter()
+    precision = default_precision() if precision is None else precision
+    input_bytes = _size(svg or "")
+    report = {"input_bytes": input_bytes, "output_bytes": input_bytes, "saved_ratio": 0.0, "passes": {}}
+    try:
+        root, namespaces = parse(svg or "")
+    except ET.ParseError as e:
+        report["skipped"] = f"not well-formed: {e}"
+        return svg, report
+    if _local(root.tag) != "svg":
+        report["skipped"] = f"root element is <{_local(root.tag)}>"
+        return svg, report
+
+    for parent in list(root.iter()):
+        for child in [c for c in parent if isinstance(c.tag, str) and _local(c.tag) == "metadata"]:
+            _remove(parent, list(parent).index(child))
+    ctx = _Context(root, canvas_precision(root, precision))
+    current = serialize(root, namespaces)
+    report["passes"]["comments"] = input_bytes - _size(current)
+    for name in passes or PASSES:
+        if name not in _PASS_FUNCTIONS:
+            continue
+        _PASS_FUNCTIONS[name](ctx)
+        optimized = serialize(root, namespaces)
+        report["passes"][name] = _size(current) - _size(optimized)
+        current = optimized
+
+    output_bytes = _size(current)
+    if output_bytes >= input_bytes:
+        current, output_bytes = svg, input_bytes
+    report.update(
+        output_bytes=output_bytes,
+        saved_ratio=round(1 - output_bytes / input_bytes, 4) if input_bytes else 0.0,
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+    )
+    return current, report
+
+
+def optimize_if_enabled(svg: str, source: str) -> Tuple[str, Optional[dict]]:
+    """
+    保存 / 生成路径使用的入口：SVG_OPTIMIZER_ENABLED 关闭时原样返回 (svg, None)。
+    source 标明调用方（codegen / draft / svg_draw），各遍节省的字节数计入 svgdraw_svg_optimizer_saved_bytes_total。
+    """
+    if not optimizer_enabled() or not svg:
+        return svg, None
+    svg, report = optimize(svg)
+    if "skipped" in report:
+        logger.info("SVG optimizer skipped (%s): %s", source, report["skipped"])
+    for stage, saved in report["passes"].items():
+        if saved > 0:
+            metrics.SVG_OPTIMIZER_SAVED_BYTES.inc(saved, source=source, stage=stage)
+    return svg, report
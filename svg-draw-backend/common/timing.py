@@ -0,0 +1,218 @@
+"""
+请求耗时拆分（Server-Timing）
+ServerTimingMiddleware 为每个请求创建一个 RequestTiming（放在 contextvar 中），以下位置向其累计耗时：
+- db：数据库执行包装器（connection.execute_wrappers，每个连接建立时安装），含查询次数
+- llm：SiliconFlow 客户端的每次调用（含限流排队与重试；并发调用按累计时间计）
+- render：DRF JSON 渲染（TimedJSONRenderer）与 success_json_response / error_json_response 的序列化
+编排的线程池通过 run_in_context 提交任务，工作线程中的查询与 LLM 调用也计入发起请求。
+响应头 Server-Timing 中另有 app（其余耗时）与 total；流式响应只统计到响应头发出为止。
+
+可通过环境变量调整（均为可选）：
+- SERVER_TIMING_ENABLED   是否启用，默认 1
+- SERVER_TIMING_LOG       每个请求输出一行 JSON 结构化日志，默认 0
+- SERVER_TIMING_SLOW_MS   慢请求阈值（毫秒），超过时以 WARNING 输出完整查询列表，默认 1000，0 为关闭
+"""
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+# 单个请求最多保留的查询条数（慢请求日志用）
+MAX_RECORDED_QUERIES = 500
+
+_current: contextvars.ContextVar[Optional["RequestTiming"]] = contextvars.ContextVar("request_timing", default=None)
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.environ.get(name, default).strip().lower() not in ("0", "false", "no", "off", "")
+
+
+class RequestTiming:
+    """单个请求的耗时累计（多个线程可同时写入）"""
+
+    def __init__(self, record_queries: bool = False):
+        self.started = time.perf_counter()
+        self.record_queries = record_queries
+        self.durations = {"db": 0.0, "llm": 0.0, "render": 0.0}
+        self.counts = {"db": 0, "llm": 0, "render": 0}
+        self.queries: List[Tuple[str, float]] = []
+        self.dropped_queries = 0
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float, sql: str = None):
+        with self._lock:
+            self.durations[name] += seconds
+            self.counts[name] += 1
+            if sql is not None and self.record_queries:
+                if len(self.queries) < MAX_RECORDED_QUERIES:
+                    self.queries.append((sql, seconds))
+                else:
+                    self.dropped_queries += 1
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> dict:
+        """各部分耗时（毫秒）与次数"""
+        total = self.total()
+        with self._lock:
+            durations = dict(self.durations)
+            counts = dict(self.counts)
+        app = max(0.0, total - sum(durations.values()))
+        return {
+            "total_ms": round(total * 1000, 2),
+            "app_ms": round(app * 1000, 2),
+            **{f"{name}_ms": round(seconds * 1000, 2) for name, seconds in durations.items()},
+            "db_queries": counts["db"],
+            "llm_calls": counts["llm"],
+        }
+
+    def header(self) -> str:
+        s = self.summary()
+        return ", ".join([
+            f'db;dur={s["db_ms"]};desc="{s["db_queries"]} queries"',
+            f'llm;dur={s["llm_ms"]};desc="{s["llm_calls"]} calls"',
+            f'render;dur={s["render_ms"]}',
+            f'app;dur={s["app_ms"]}',
+            f'total;dur={s["total_ms"]}',
+        ])
+
+
+def current() -> Optional[RequestTiming]:
+    return _current.get()
+
+
+def add(name: str, seconds: float):
+    """向当前请求累计耗时；不在请求中时忽略"""
+    timing = _current.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+
+@contextmanager
+def span(name: str):
+    """计时代码块并计入当前请求"""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - started)
+
+
+def run_in_context(pool, fn, *args, **kwargs):
+    """pool.submit 的替代：在当前 contextvars 上下文中执行，使工作线程的耗时计入发起请求"""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+# ---------- 数据库 ----------
+
+def _db_wrapper(execute, sql, params, many, context):
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.add("db", time.perf_counter() - started, sql=sql)
+
+
+def install_db_wrapper(connection):
+    """在连接上安装计时包装器（重复调用无副作用）"""
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    install_db_wrapper(connection)
+
+
+connection_created.connect(_on_connection_created, dispatch_uid="common.timing.db_wrapper")
+
+
+# ---------- 渲染 ----------
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer，渲染耗时计入当前请求"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with span("render"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+# ---------- 中间件 ----------
+
+class ServerTimingMiddleware:
+    """统计请求各部分耗时，写入 Server-Timing 响应头；同时支持同步与异步请求"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = _env_flag("SERVER_TIMING_ENABLED", "1")
+        self.log_requests = _env_flag("SERVER_TIMING_LOG", "0")
+        self.slow_ms = float(os.environ.get("SERVER_TIMING_SLOW_MS", 1000))
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        timing, token = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timing)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        timing, token = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timing)
+
+    def _start(self):
+        # 连接早于本模块导入建立时（如启动阶段）补装包装器
+        for connection in connections.all(initialized_only=True):
+            install_db_wrapper(connection)
+        timing = RequestTiming(record_queries=self.slow_ms > 0)
+        return timing, _current.set(timing)
+
+    def _finish(self, request, response, timing: RequestTiming):
+        response["Server-Timing"] = timing.header()
+        summary = timing.summary()
+        if self.log_requests:
+            logger.info(json.dumps({
+                "method": request.method, "path": request.path, "status": response.status_code, **summary,
+            }))
+        if self.slow_ms > 0 and summary["total_ms"] >= self.slow_ms:
+            queries = "\n".join(f"  {seconds * 1000:8.2f}ms  {sql}" for sql, seconds in timing.queries)
+            if timing.dropped_queries:
+                queries += f"\n  ... {timing.dropped_queries} more queries"
+            logger.warning(
+                f"Slow request {request.method} {request.path} ({summary['total_ms']}ms, "
+                f"db {summary['db_ms']}ms / {summary['db_queries']} queries, llm {summary['llm_ms']}ms, "
+                f"render {summary['render_ms']}ms)\n{queries}"
+            )
+        return response
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Run, RunStepLog, Artifact
+from .models import Run, RunBatch, RunStepLog, Artifact
 
 
 @admin.register(Run)
@@ -9,6 +9,13 @@ class RunAdmin(admin.ModelAdmin):
     search_fields = ['id']
 
 
+@admin.register(RunBatch)
+class RunBatchAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'total', 'succeeded', 'failed', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['id']
+
+
 @admin.register(RunStepLog)
 class RunStepLogAdmin(admin.ModelAdmin):
     list_display = ['run', 'name', 'started_at', 'ended_at']
@@ -0,0 +1,256 @@
+"""
+运行历史归档：把过期的运行（含步骤与产物）移出 runs / run_step_logs / artifacts 表，
+写入只追加的压缩分段文件，热表只保留最近的运行。
+
+分段文件（RUN_ARCHIVE_DIR 下，写完即不再修改）：
+- runs-<时间戳>-<序号>.seg  逐条独立 zlib 压缩的 JSON 记录首尾相接（每条可单独解压）
+- runs-<时间戳>-<序号>.idx  偏移索引：8 字节文件头 + 按运行 ID 排序的定长条目
+                           （16 字节 UUID、8 字节偏移、4 字节长度），读取时 mmap 后二分查找
+先写临时文件再改名，.idx 出现即表示分段完整；读取方只认有 .idx 的分段。
+
+归档流程可中断、可重复执行，并可与线上流量同时运行：
+- 只处理已结束（success / failed）且超过保留期未更新的运行，线上请求不会再修改它们
+- 每批先写分段再分小事务删除；写完分段后中断的，下次执行发现运行已在归档中，只做删除
+- 删除走 ORM 级联，步骤 / 产物的 blob 引用随之释放（归档记录中已内联完整内容）
+- 归档目录下的 .lock 文件锁保证同一时间只有一个归档任务在写分段
+
+可通过环境变量调整（均为可选）：
+- RUN_ARCHIVE_DIR   分段目录（相对路径基于项目目录），默认 run_archive
+- RUN_ARCHIVE_DAYS  archive_runs 默认保留天数，默认 30
+"""
+import os
+import json
+import fcntl
+import mmap
+import zlib
+import uuid
+import time
+import struct
+import logging
+import threading
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Run
+from .services import run_record
+
+logger = logging.getLogger(__name__)
+
+INDEX_MAGIC = b"RIDX\x00\x01\x00\x00"
+INDEX_ENTRY = struct.Struct(">16sQI")
+TERMINAL_STATUSES = ("success", "failed")
+
+
+def archive_dir() -> Path:
+    path = Path(os.environ.get("RUN_ARCHIVE_DIR", "run_archive"))
+    return path if path.is_absolute() else Path(settings.BASE_DIR) / path
+
+
+class Segment:
+    """一个只读分段：mmap 索引与数据文件"""
+
+    def __init__(self, index_path: Path):
+        self.index_path = index_path
+        self.data_path = index_path.with_suffix(".seg")
+        with open(index_path, "rb") as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._index[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError(f"Invalid archive index: {index_path}")
+        self.count = (len(self._index) - len(INDEX_MAGIC)) // INDEX_ENTRY.size
+        self._data = None
+
+    def _entry(self, i: int) -> Tuple[bytes, int, int]:
+        return INDEX_ENTRY.unpack_from(self._index, len(INDEX_MAGIC) + i * INDEX_ENTRY.size)
+
+    def locate(self, run_id: uuid.UUID) -> Optional[Tuple[int, int]]:
+        """二分查找运行 ID，返回 (偏移, 长度)"""
+        target = run_id.bytes
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key, offset, length = self._entry(mid)
+            if key == target:
+                return offset, length
+            if key < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def read(self, offset: int, length: int) -> dict:
+        if self._data is None:
+            with open(self.data_path, "rb") as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return json.loads(zlib.decompress(self._data[offset:offset + length]))
+
+    def close(self):
+        self._index.close()
+        if self._data is not None:
+            self._data.close()
+
+
+class RunArchive:
+    """归档读写；分段列表在目录变化时刷新"""
+
+    def __init__(self, directory: Path = None):
+        self.directory = Path(directory) if directory else archive_dir()
+        self._segments: Dict[str, Segment] = {}
+        self._listed_mtime = None
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> List[Segment]:
+        try:
+            mtime = self.directory.stat().st_mtime_ns
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            # 目录 mtime 的精度有限（通常为一个时钟周期），最近一秒内修改过的目录总是重新列出
+            if mtime != self._listed_mtime or time.time_ns() - mtime < 1_000_000_000:
+                for path in sorted(self.directory.glob("runs-*.idx")):
+                    if path.name not in self._segments:
+                        self._segments[path.name] = Segment(path)
+                self._listed_mtime = mtime
+            # 新分段优先（同一运行重复归档时取最新的记录）
+            return [self._segments[name] for name in sorted(self._segments, reverse=True)]
+
+    def get(self, run_id) -> Optional[dict]:
+        """读取归档的运行，返回归档条目（含 record）；不在归档中时返回 None"""
+        run_id = run_id if isinstance(run_id, uuid.UUID) else uuid.UUID(str(run_id))
+        for segment in self._refresh():
+            found = segment.locate(run_id)
+            if found:
+                return segment.read(*found)
+        return None
+
+    def contains(self, run_id) -> bool:
+        run_id = run_id if isinstance(run_id, uuid.UUID) else uuid.UUID(str(run_id))
+        return any(segment.locate(run_id) for segment in self._refresh())
+
+    def write_segment(self, entries: Iterable[Tuple[uuid.UUID, dict]]) -> Path:
+        """写入一个新分段并返回索引路径"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # 时间戳精确到微秒：分段按文件名排序即为写入顺序（同一秒内写入多个分段时也是如此）
+        stem = f"runs-{timezone.now():%Y%m%d%H%M%S%f}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        data_path = self.directory / f"{stem}.seg"
+        index_path = self.directory / f"{stem}.idx"
+        tmp_data = data_path.with_suffix(".seg.tmp")
+        tmp_index = index_path.with_suffix(".idx.tmp")
+
+        index = []
+        offset = 0
+        with open(tmp_data, "wb") as f:
+            for run_id, entry in entries:
+                frame = zlib.compress(json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+                f.write(frame)
+                index.append((run_id.bytes, offset, len(frame)))
+                offset += len(frame)
+            f.flush()
+            os.fsync(f.fileno())
+        index.sort()
+        with open(tmp_index, "wb") as f:
+            f.write(INDEX_MAGIC)
+            for item in index:
+                f.write(INDEX_ENTRY.pack(*item))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_data, data_path)
+        os.replace(tmp_index, index_path)  # 索引就位即分段完整
+        logger.info(f"Wrote archive segment {index_path.name} ({len(index)} runs, {offset} bytes)")
+        return index_path
+
+    def cleanup(self) -> int:
+        """删除中断遗留的临时文件与没有索引的数据文件"""
+        removed = 0
+        if not self.directory.exists():
+            return removed
+        for path in list(self.directory.glob("*.tmp")) + list(self.directory.glob("runs-*.seg")):
+            if path.suffix == ".tmp" or not path.with_suffix(".idx").exists():
+                path.unlink()
+                removed += 1
+        return removed
+
+
+def archive_entry(run: Run) -> dict:
+    """归档条目：运行详情（与 RunDetailView 的返回相同）及元数据"""
+    return {
+        "record": run_record(run).to_dict(),
+        "created_at": run.created_at.isoformat(),
+        "updated_at": run.updated_at.isoformat(),
+        "batch_id": str(run.batch_id) if run.batch_id else None,
+        "archived_at": timezone.now().isoformat(),
+    }
+
+
+def archive_runs(days: float, batch_size: int = 1000, delete_chunk: int = 200, max_runs: int = None,
+                 dry_run: bool = False, archive: RunArchive = None, log=None) -> dict:
+    """
+    把 days 天前结束的运行写入分段并从热表删除，返回统计。
+    每批 batch_size 个运行一个分段；删除按 delete_chunk 分小事务，避免长时间持有写锁。
+    """
+    archive = archive or get_archive()
+    cutoff = timezone.now() - timedelta(days=days)
+    candidates = Run.objects.filter(status__in=TERMINAL_STATUSES, created_at__lt=cutoff, updated_at__lt=cutoff)
+    if dry_run:
+        count = candidates.count()
+        return {"archived": count if max_runs is None else min(count, max_runs), "deleted": 0, "segments": 0, "cleaned": 0}
+
+    archive.directory.mkdir(parents=True, exist_ok=True)
+    with open(archive.directory / ".lock", "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise ValueError(f"Another archive job is running in {archive.directory}")
+        return _archive_locked(archive, candidates, cutoff, batch_size, delete_chunk, max_runs, log)
+
+
+def _archive_locked(archive, candidates, cutoff, batch_size, delete_chunk, max_runs, log) -> dict:
+    stats = {"archived": 0, "deleted": 0, "segments": 0, "cleaned": archive.cleanup()}
+
+    while max_runs is None or stats["deleted"] < max_runs:
+        limit = batch_size if max_runs is None else min(batch_size, max_runs - stats["deleted"])
+        runs = list(candidates.order_by("created_at").prefetch_related("steps", "artifacts")[:limit])
+        if not runs:
+            break
+
+        # 上次写完分段后中断的运行已在归档中，只需删除
+        pending = [run for run in runs if not archive.contains(run.id)]
+        if pending:
+            archive.write_segment((run.id, archive_entry(run)) for run in pending)
+            stats["segments"] += 1
+            stats["archived"] += len(pending)
+
+        ids = [run.id for run in runs]
+        deleted = 0
+        for start in range(0, len(ids), delete_chunk):
+            with transaction.atomic():
+                # 归档期间被再次更新的运行（条件不再满足）保留在热表
+                _, per_model = Run.objects.filter(
+                    id__in=ids[start:start + delete_chunk], status__in=TERMINAL_STATUSES, updated_at__lt=cutoff,
+                ).delete()
+            deleted += per_model.get(Run._meta.label, 0)
+        stats["deleted"] += deleted
+        if not deleted:
+            break
+        if log:
+            log(f"已归档 {stats['archived']} 个运行，删除 {stats['deleted']} 个")
+    return stats
+
+
+_archive: Optional[RunArchive] = None
+_archive_lock = threading.Lock()
+
+
+def get_archive() -> RunArchive:
+    """获取进程级归档读取器"""
+    global _archive
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                _archive = RunArchive()
+    return _archive
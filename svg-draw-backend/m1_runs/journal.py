@@ -0,0 +1,217 @@
+"""
+内存运行日志（RunJournal）
+接口与 RunLogger 相同，但只修改内存中的模型实例，
+由 flush / flush_many 以 bulk_create / bulk_update 在一个事务内统一写库。
+- autoflush=True 时在每个步骤开始时刷新（步骤边界：上一步的结束与新步骤的开始合并为一个事务），
+  进度事件流仍能看到正在执行的步骤
+- 刷新遇到 SQLite 锁冲突等 OperationalError 时退避重试；仍失败时保留缓冲，由下一次刷新补写
+- 进程正常退出（含 worker 收到 SIGTERM 后退出）时刷新所有仍有缓冲的日志
+- put_blob 登记的大文本（生成的 SVG）在同一事务中先于引用它的步骤与产物写入 blob 存储
+依赖 bulk_create 回填主键（SQLite 3.35+ / PostgreSQL）。
+
+RUN_LOG_MODE 选择编排使用的运行日志（open_run_log）：
+- end（默认）：RunJournal，只在运行结束时刷新一次（写库最少，进度事件流要到结束才有步骤）
+- step：RunJournal，步骤边界刷新（运行中即可看到进行中的步骤）
+- sync：RunLogger，每次调用立即写库（便于调试）
+"""
+import os
+import time
+import atexit
+import weakref
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+from .models import Run, RunStepLog, Artifact
+from .services import RunLogger
+from m8_blobs.services import BlobStore
+from common import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+RUN_LOG_MODES = ('end', 'step', 'sync')
+# 刷新失败（如 database is locked）时的重试次数
+FLUSH_RETRIES = 3
+
+# 尚未析构的日志，进程退出时刷新
+_live_journals = weakref.WeakSet()
+
+
+def run_log_mode() -> str:
+    mode = os.environ.get('RUN_LOG_MODE', 'end').strip().lower()
+    return mode if mode in RUN_LOG_MODES else 'end'
+
+
+def open_run_log(run: Run):
+    """按 RUN_LOG_MODE 返回运行日志：RunJournal 实例，或 sync 模式下的 RunLogger"""
+    mode = run_log_mode()
+    if mode == 'sync':
+        return RunLogger
+    return RunJournal(run, autoflush=(mode == 'step'))
+
+
+class RunJournal:
+    """单个运行的缓冲日志；可直接替代 RunLogger 传给编排步骤"""
+
+    def __init__(self, run: Run, autoflush: bool = False):
+        self.run = run
+        self.autoflush = autoflush
+        self._new_steps = []
+        self._dirty_steps = []
+        self._artifacts = []
+        self._blobs = {}  # key -> [文本, 引用数]
+        self._run_dirty = False
+        _live_journals.add(self)
+
+    @property
+    def pending(self) -> bool:
+        """是否有尚未写库的内容"""
+        return bool(self._new_steps or self._dirty_steps or self._artifacts or self._blobs or self._run_dirty)
+
+    def log_step(self, run: Run, name: str, input_data=None, output_data=None, error=None):
+        """记录步骤（仅内存）"""
+        step = RunStepLog(
+            run=run,
+            name=name,
+            input_data=input_data,
+            output_data=output_data,
+            error=error
+        )
+        self._new_steps.append(step)
+        logger.info(f"Run {run.id} - Step {name}: {'OK' if not error else 'FAILED'}")
+        return step
+
+    def start_step(self, step: RunStepLog, at=None):
+        """开始步骤；autoflush 时在此刷新缓冲"""
+        step.started_at = at or timezone.now()
+        self._touch(step)
+        metrics.STEPS_STARTED.inc(step=step.name)
+        logger.info(f"Step {step.name} started")
+        if self.autoflush:
+            self.flush(raise_errors=False)
+
+    def end_step(self, step: RunStepLog, output_data=None, error=None, at=None):
+        """结束步骤"""
+        step.ended_at = at or timezone.now()
+        if output_data is not None:
+            step.output_data = output_data
+        if error is not None:
+            step.error = error
+        self._touch(step)
+        metrics.observe_step(step.name, step.started_at, step.ended_at, step.error)
+        logger.info(f"Step {step.name} ended: {'OK' if not error else 'FAILED'}")
+
+    def add_artifact(self, run: Run, type: str, ref_id=None, preview_text=None, blob_id=None):
+        """添加产物（仅内存）"""
+        artifact = Artifact(
+            run=run,
+            type=type,
+            ref_id=ref_id,
+            preview_text=preview_text,
+            blob_id=blob_id
+        )
+        self._artifacts.append(artifact)
+        logger.info(f"Run {run.id} - Added artifact: {type}")
+        return artifact
+
+    def put_blob(self, text: str, refs: int = 1):
+        """登记大文本（仅内存），返回 blob key；文本未达到 blob 阈值时返回 None，由调用方内联保存"""
+        if not BlobStore.should_store(text):
+            return None
+        key = BlobStore.key(text)
+        self._blobs.setdefault(key, [text, 0])[1] += refs
+        return key
+
+    def mark_coalesced(self, run: Run, leader_run_id):
+        """记录该运行的 codegen 结果复用自 leader 运行"""
+        run.coalesced_from_id = leader_run_id
+        self._run_dirty = True
+        logger.info(f"Run {run.id} coalesced from {leader_run_id}")
+
+    def update_status(self, run: Run, status: str):
+        """更新运行状态"""
+        run.status = status
+        self._run_dirty = True
+        if status in ('success', 'failed'):
+            metrics.RUNS_FINISHED.inc(status=status)
+        logger.info(f"Run {run.id} status updated to {status}")
+
+    def _touch(self, step: RunStepLog):
+        # 已落库的步骤再次修改时需要 bulk_update；未落库的随 bulk_create 一起写入
+        if step.pk is not None and step not in self._dirty_steps:
+            self._dirty_steps.append(step)
+
+    def flush(self, raise_errors: bool = True) -> bool:
+        """
+        把缓冲内容写库，返回是否成功。
+        raise_errors=False 时写库失败只记录日志并保留缓冲（步骤边界的刷新不应让运行失败）。
+        """
+        if not self.pending:
+            return True
+        try:
+            RunJournal.flush_many([self])
+            return True
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.error(f"Run {self.run.id} journal flush failed, keeping {self._count()} buffered rows: {e}")
+            return False
+
+    def _count(self) -> int:
+        return len(self._new_steps) + len(self._dirty_steps) + len(self._artifacts) + len(self._blobs) + int(self._run_dirty)
+
+    @staticmethod
+    def flush_many(journals):
+        """把多个运行的缓冲内容在一个事务内批量写库；锁冲突时退避重试"""
+        steps = [s for j in journals for s in j._new_steps]
+        dirty = [s for j in journals for s in j._dirty_steps]
+        artifacts = [a for j in journals for a in j._artifacts]
+        blobs = [blob for j in journals for blob in j._blobs.items()]
+        runs = [j.run for j in journals if j._run_dirty]
+        if not (steps or dirty or artifacts or blobs or runs):
+            return
+
+        now = timezone.now()
+        for run in runs:
+            run.updated_at = now  # bulk_update 不会触发 auto_now
+
+        attempt = 0
+        while True:
+            try:
+                with transaction.atomic():
+                    # blob 先于引用它的步骤与产物写入
+                    for key, (text, refs) in blobs:
+                        BlobStore.put(text, refs=refs)
+                    if steps:
+                        RunStepLog.objects.bulk_create(steps)
+                    if dirty:
+                        RunStepLog.objects.bulk_update(dirty, ['started_at', 'ended_at', 'output_data', 'output_blob', 'error'])
+                    if artifacts:
+                        Artifact.objects.bulk_create(artifacts)
+                    if runs:
+                        Run.objects.bulk_update(runs, ['status', 'coalesced_from', 'updated_at'])
+                break
+            except OperationalError:
+                # 事务已回滚，但 bulk_create 已回填主键：清除后下次重新插入
+                for obj in steps + artifacts:
+                    obj.pk = None
+                    obj._state.adding = True
+                # 处于外层事务中时重试无意义
+                if attempt >= FLUSH_RETRIES or connection.in_atomic_block:
+                    raise
+                time.sleep(0.05 * 2 ** attempt)
+                attempt += 1
+
+        for j in journals:
+            j._new_steps = []
+            j._dirty_steps = []
+            j._artifacts = []
+            j._blobs = {}
+            j._run_dirty = False
+
+
+@atexit.register
+def _flush_on_exit():
+    """进程退出时尽量写入仍在缓冲中的运行日志"""
+    for journal in list(_live_journals):
+        if journal.pending:
+            journal.flush(raise_errors=False)
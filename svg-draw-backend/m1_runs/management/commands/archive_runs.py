@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from m1_runs.archive import archive_runs, get_archive
+
+
+class Command(BaseCommand):
+    help = (
+        '把超过保留期的已结束运行（含步骤与产物）写入 RUN_ARCHIVE_DIR 下的压缩分段并从数据库删除；'
+        '可中断后重复执行，运行详情接口仍可按 ID 读取已归档的运行'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=float(os.environ.get('RUN_ARCHIVE_DAYS', 30)),
+                            help='保留天数，默认 RUN_ARCHIVE_DAYS（30）')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每个分段的运行数，默认 1000')
+        parser.add_argument('--delete-chunk', type=int, default=200, help='每个删除事务的运行数，默认 200')
+        parser.add_argument('--max-runs', type=int, help='本次最多归档的运行数')
+        parser.add_argument('--dry-run', action='store_true', help='只统计，不写分段也不删除')
+
+    def handle(self, *args, **options):
+        try:
+            stats = archive_runs(
+                options['days'],
+                batch_size=options['batch_size'],
+                delete_chunk=options['delete_chunk'],
+                max_runs=options['max_runs'],
+                dry_run=options['dry_run'],
+                log=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"可归档 {stats['archived']} 个运行"))
+            return
+        if stats['cleaned']:
+            self.stdout.write(f"清理了 {stats['cleaned']} 个中断遗留的文件")
+        self.stdout.write(self.style.SUCCESS(
+            f"写入 {stats['segments']} 个分段，归档 {stats['archived']} 个运行，删除 {stats['deleted']} 个；"
+            f"目录 {get_archive().directory}"
+        ))
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('m1_runs', '0002_alter_artifact_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='run',
+            name='coalesced_from',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='coalesced_runs', to='m1_runs.run'),
+        ),
+    ]
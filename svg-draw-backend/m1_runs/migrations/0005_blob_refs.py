@@ -0,0 +1,25 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('m1_runs', '0004_run_batch'),
+        ('m8_blobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artifact',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='artifacts', to='m8_blobs.blob'),
+        ),
+        migrations.AddField(
+            model_name='runsteplog',
+            name='output_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='run_steps', to='m8_blobs.blob'),
+        ),
+    ]
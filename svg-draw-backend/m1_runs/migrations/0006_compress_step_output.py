@@ -0,0 +1,30 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:41
+
+import common.fields
+from common.fields import convert_rows
+from django.db import migrations
+
+
+def compress_rows(apps, schema_editor):
+    convert_rows(apps.get_model('m1_runs', 'RunStepLog'), 'output_data', using=schema_editor.connection.alias)
+
+
+def decompress_rows(apps, schema_editor):
+    convert_rows(apps.get_model('m1_runs', 'RunStepLog'), 'output_data', to_text=True, using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('m1_runs', '0005_blob_refs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='runsteplog',
+            name='output_data',
+            field=common.fields.CompressedJSONField(blank=True, null=True),
+        ),
+        # 已有的未压缩行分批转换为压缩格式
+        migrations.RunPython(compress_rows, decompress_rows),
+    ]
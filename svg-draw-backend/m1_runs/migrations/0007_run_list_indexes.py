@@ -0,0 +1,26 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('m1_runs', '0006_compress_step_output'),
+        ('m8_blobs', '0002_blob_packed_codec'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='run',
+            index=models.Index(fields=['created_at', 'id'], name='runs_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='run',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='runs_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='runsteplog',
+            index=models.Index(fields=['run', 'started_at'], name='run_steps_run_started_idx'),
+        ),
+    ]
@@ -1,9 +1,37 @@
 from django.db import models
 from django.utils import timezone
+from m8_blobs.services import BlobStore
+from common.fields import CompressedJSONField
 import uuid
 import json
 
 
+class RunBatch(models.Model):
+    """批量运行记录"""
+    STATUS_CHOICES = [
+        ('running', '运行中'),
+        ('success', '成功'),
+        ('partial', '部分成功'),
+        ('failed', '失败'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    total = models.PositiveIntegerField(default=0)
+    succeeded = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    max_concurrency = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'run_batches'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"RunBatch {self.id} ({self.succeeded}/{self.total})"
+
+
 class Run(models.Model):
     """运行记录"""
     STATUS_CHOICES = [
@@ -18,9 +46,19 @@ class Run(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # 与并发的相同 codegen 请求合并时，指向实际调用 LLM 的运行
+    coalesced_from = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='coalesced_runs')
+    # 通过批量接口创建时所属的批次
+    batch = models.ForeignKey(RunBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='runs')
+    
     class Meta:
         db_table = 'runs'
         ordering = ['-created_at']
+        indexes = [
+            # 运行列表的键集分页（按 created_at, id 倒序扫描）及按状态过滤
+            models.Index(fields=['created_at', 'id'], name='runs_created_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='runs_status_created_idx'),
+        ]
     
     def __str__(self):
         return f"Run {self.id} ({self.status})"
@@ -33,16 +71,29 @@ class RunStepLog(models.Model):
     started_at = models.DateTimeField(null=True, blank=True)
     ended_at = models.DateTimeField(null=True, blank=True)
     input_data = models.JSONField(null=True, blank=True)
-    output_data = models.JSONField(null=True, blank=True)
+    output_data = CompressedJSONField(null=True, blank=True)  # 压缩存储，不支持 JSON 路径查询
+    # 较大的代码正文（output_data 的 code 字段）移入 blob 存储，与草稿、产物共用一份
+    output_blob = models.ForeignKey('m8_blobs.Blob', on_delete=models.PROTECT, null=True, blank=True, related_name='run_steps')
     error = models.TextField(null=True, blank=True)
     
     class Meta:
         db_table = 'run_step_logs'
         ordering = ['started_at']
+        indexes = [
+            # 取某个运行的步骤（prefetch / 详情）时直接按 started_at 有序读取
+            models.Index(fields=['run', 'started_at'], name='run_steps_run_started_idx'),
+        ]
     
     def __str__(self):
         return f"{self.run.id} - {self.name}"
 
+    @property
+    def output(self):
+        """output_data，并把 blob 中的代码正文内联回 code 字段"""
+        if not self.output_blob_id:
+            return self.output_data
+        return {**(self.output_data or {}), 'code': BlobStore.get(self.output_blob_id)}
+
 
 class Artifact(models.Model):
     """产物"""
@@ -58,6 +109,8 @@ class Artifact(models.Model):
     type = models.CharField(max_length=50, choices=TYPE_CHOICES)
     ref_id = models.CharField(max_length=255, null=True, blank=True)  # 关联到其他模型的 ID
     preview_text = models.TextField(null=True, blank=True)
+    # 产物对应的完整内容（如 SVG 草稿）
+    blob = models.ForeignKey('m8_blobs.Blob', on_delete=models.PROTECT, null=True, blank=True, related_name='artifacts')
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
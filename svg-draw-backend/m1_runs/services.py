@@ -1,5 +1,12 @@
+from django.db.models import Exists, OuterRef, Prefetch, Q
+from django.utils.dateparse import parse_datetime
 from .models import Run, RunStepLog, Artifact
+from common.schemas import RunRecord, StepLog, ArtifactInfo
+from m8_blobs.services import BlobStore
+from common import metrics
+import base64
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -28,40 +35,183 @@ class RunLogger:
         return step
     
     @staticmethod
-    def start_step(step: RunStepLog):
-        """开始步骤"""
+    def start_step(step: RunStepLog, at=None):
+        """开始步骤；at 可传入实际开始时间（如步骤在其他线程中执行）"""
         from django.utils import timezone
-        step.started_at = timezone.now()
+        step.started_at = at or timezone.now()
         step.save()
+        metrics.STEPS_STARTED.inc(step=step.name)
         logger.info(f"Step {step.name} started")
     
     @staticmethod
-    def end_step(step: RunStepLog, output_data=None, error=None):
-        """结束步骤"""
+    def end_step(step: RunStepLog, output_data=None, error=None, at=None):
+        """结束步骤；at 可传入实际结束时间"""
         from django.utils import timezone
-        step.ended_at = timezone.now()
+        step.ended_at = at or timezone.now()
         if output_data is not None:
             step.output_data = output_data
         if error is not None:
             step.error = error
         step.save()
+        metrics.observe_step(step.name, step.started_at, step.ended_at, step.error)
         logger.info(f"Step {step.name} ended: {'OK' if not error else 'FAILED'}")
     
     @staticmethod
-    def add_artifact(run: Run, type: str, ref_id=None, preview_text=None):
+    def add_artifact(run: Run, type: str, ref_id=None, preview_text=None, blob_id=None):
         """添加产物"""
         artifact = Artifact.objects.create(
             run=run,
             type=type,
             ref_id=ref_id,
-            preview_text=preview_text
+            preview_text=preview_text,
+            blob_id=blob_id
         )
         logger.info(f"Run {run.id} - Added artifact: {type}")
         return artifact
     
+    @staticmethod
+    def put_blob(text: str, refs: int = 1):
+        """把大文本写入 blob 存储并返回 key；未达到 blob 阈值时返回 None，由调用方内联保存"""
+        blob = BlobStore.put_if_large(text, refs=refs)
+        return blob.key if blob else None
+    
+    @staticmethod
+    def mark_coalesced(run: Run, leader_run_id):
+        """记录该运行的 codegen 结果复用自 leader 运行"""
+        run.coalesced_from_id = leader_run_id
+        run.save(update_fields=['coalesced_from', 'updated_at'])
+        logger.info(f"Run {run.id} coalesced from {leader_run_id}")
+    
     @staticmethod
     def update_status(run: Run, status: str):
         """更新运行状态"""
         run.status = status
         run.save()
+        if status in ('success', 'failed'):
+            metrics.RUNS_FINISHED.inc(status=status)
         logger.info(f"Run {run.id} status updated to {status}")
+
+    @staticmethod
+    def flush(raise_errors: bool = True) -> bool:
+        """与 RunJournal 接口一致；每次调用已即时写库，无需刷新"""
+        return True
+
+
+def run_record(run: Run) -> RunRecord:
+    """运行详情（步骤与产物按各自的默认排序）"""
+    return RunRecord(
+        run_id=str(run.id),
+        status=run.status,
+        steps=[
+            StepLog(
+                name=step.name,
+                started_at=step.started_at,
+                ended_at=step.ended_at,
+                input=step.input_data,
+                output=step.output,
+                error=step.error
+            )
+            for step in run.steps.all()
+        ],
+        artifacts=[
+            ArtifactInfo(type=art.type, ref_id=art.ref_id or '', preview_text=art.preview_text or '')
+            for art in run.artifacts.all()
+        ],
+        coalesced_from=str(run.coalesced_from_id) if run.coalesced_from_id else None
+    )
+
+
+class RunQuery:
+    """运行列表查询：按 (created_at, id) 倒序的键集分页，翻页代价与偏移量无关"""
+
+    MAX_LIMIT = 100
+    EMBEDS = ('steps', 'artifacts')
+
+    @staticmethod
+    def encode_cursor(run: Run) -> str:
+        raw = f"{run.created_at.isoformat()}|{run.id.hex}".encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        """返回 (created_at, id)；格式不对时抛出 ValueError"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+            created_at, run_id = raw.split('|')
+            created_at = parse_datetime(created_at)
+            run_id = uuid.UUID(run_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError(f"Invalid cursor: {cursor}")
+        if created_at is None:
+            raise ValueError(f"Invalid cursor: {cursor}")
+        return created_at, run_id
+
+    @staticmethod
+    def list_runs(status=None, created_after=None, created_before=None, step=None,
+                  cursor: str = None, limit: int = 20, embed=()):
+        """
+        返回 (运行列表, 下一页游标)；没有下一页时游标为 None。
+        status 可为多个状态；step 为步骤名，只返回包含该步骤的运行；
+        embed 中的 steps / artifacts 通过 prefetch_related 一次取回（步骤不含输入输出）。
+        """
+        limit = max(1, min(int(limit), RunQuery.MAX_LIMIT))
+        unknown = set(embed) - set(RunQuery.EMBEDS)
+        if unknown:
+            raise ValueError(f"Unknown embed: {', '.join(sorted(unknown))}")
+
+        qs = Run.objects.all()
+        if status:
+            unknown = set(status) - {value for value, _ in Run.STATUS_CHOICES}
+            if unknown:
+                raise ValueError(f"Unknown status: {', '.join(sorted(unknown))}")
+            qs = qs.filter(status__in=status)
+        if created_after:
+            qs = qs.filter(created_at__gte=created_after)
+        if created_before:
+            qs = qs.filter(created_at__lt=created_before)
+        if step:
+            qs = qs.filter(Exists(RunStepLog.objects.filter(run=OuterRef('pk'), name=step)))
+        if cursor:
+            created_at, run_id = RunQuery.decode_cursor(cursor)
+            qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=run_id))
+
+        qs = qs.order_by('-created_at', '-id')
+        if 'steps' in embed:
+            qs = qs.prefetch_related(Prefetch(
+                'steps', queryset=RunStepLog.objects.defer('input_data', 'output_data').order_by('started_at', 'id'),
+            ))
+        if 'artifacts' in embed:
+            qs = qs.prefetch_related(Prefetch('artifacts', queryset=Artifact.objects.order_by('created_at', 'id')))
+
+        # 多取一条判断是否还有下一页
+        runs = list(qs[:limit + 1])
+        next_cursor = RunQuery.encode_cursor(runs[limit - 1]) if len(runs) > limit else None
+        return runs[:limit], next_cursor
+
+    @staticmethod
+    def summary(run: Run, embed=()) -> dict:
+        """列表中的单个运行"""
+        item = {
+            'run_id': str(run.id),
+            'status': run.status,
+            'created_at': run.created_at.isoformat(),
+            'updated_at': run.updated_at.isoformat(),
+            'batch_id': str(run.batch_id) if run.batch_id else None,
+            'coalesced_from': str(run.coalesced_from_id) if run.coalesced_from_id else None,
+        }
+        if 'steps' in embed:
+            item['steps'] = [
+                {
+                    'name': step.name,
+                    'started_at': step.started_at.isoformat() if step.started_at else None,
+                    'ended_at': step.ended_at.isoformat() if step.ended_at else None,
+                    'error': step.error,
+                }
+                for step in run.steps.all()
+            ]
+        if 'artifacts' in embed:
+            item['artifacts'] = [
+                ArtifactInfo(type=art.type, ref_id=art.ref_id or '', preview_text=art.preview_text or '').to_dict()
+                for art in run.artifacts.all()
+            ]
+        return item
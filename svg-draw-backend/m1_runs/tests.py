@@ -1,3 +1,307 @@
-from django.test import TestCase
+import os
+import fcntl
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.db import OperationalError
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from m1_runs import archive as archive_module
+from m1_runs import journal as journal_module
+from m1_runs.archive import RunArchive, Segment, archive_runs, get_archive
+from m1_runs.journal import RunJournal, open_run_log
+from m1_runs.models import Artifact, Run, RunStepLog
+from m1_runs.services import RunLogger, RunQuery
+from m8_blobs.models import Blob
+from m8_blobs.services import BlobStore
+
+
+def svg(label: str) -> str:
+    return '<svg xmlns="http://www.w3.org/2000/svg">' + f'<text>{label}</text>' * 80 + "</svg>"
+
+
+class RunJournalTests(TestCase):
+    """RunJournal：只改内存，flush 时批量写库；autoflush 在步骤开始时刷新"""
+
+    def setUp(self):
+        self.run = Run.objects.create()
+
+    def test_nothing_written_before_flush(self):
+        journal = RunJournal(self.run)
+        step = journal.log_step(self.run, "perception", input_data={"text": "t"})
+        journal.start_step(step)
+        journal.end_step(step, output_data={"intent": "flow"})
+        journal.add_artifact(self.run, "scene_spec", preview_text="Intent: flow")
+        journal.update_status(self.run, "success")
+        self.assertTrue(journal.pending)
+        self.assertFalse(RunStepLog.objects.exists())
+        self.assertEqual(Run.objects.get(pk=self.run.pk).status, "created")
+
+        self.assertTrue(journal.flush())
+        self.assertFalse(journal.pending)
+        saved = RunStepLog.objects.get(run=self.run)
+        self.assertEqual((saved.output_data, saved.started_at, saved.ended_at), ({"intent": "flow"}, step.started_at, step.ended_at))
+        self.assertEqual(Artifact.objects.get(run=self.run).type, "scene_spec")
+        self.assertEqual(Run.objects.get(pk=self.run.pk).status, "success")
+
+    def test_autoflush_at_step_start(self):
+        journal = RunJournal(self.run, autoflush=True)
+        first = journal.log_step(self.run, "perception")
+        journal.start_step(first)
+        self.assertIsNone(RunStepLog.objects.get(name="perception").ended_at)
+
+        journal.end_step(first)
+        self.assertIsNone(RunStepLog.objects.get(name="perception").ended_at)
+        # 下一个步骤开始时，上一步的结束随之写库（已落库的步骤走 bulk_update）
+        journal.start_step(journal.log_step(self.run, "codegen"))
+        self.assertIsNotNone(RunStepLog.objects.get(name="perception").ended_at)
+        self.assertEqual(RunStepLog.objects.filter(run=self.run).count(), 2)
+
+    def test_blobs_written_with_summed_refs(self):
+        journal = RunJournal(self.run)
+        text = svg("a")
+        self.assertIsNone(journal.put_blob("<svg/>"))
+        key = journal.put_blob(text)
+        self.assertEqual(journal.put_blob(text, refs=2), key)
+        journal.add_artifact(self.run, "code", blob_id=key)
+        self.assertFalse(Blob.objects.exists())
+
+        journal.flush()
+        self.assertEqual(Blob.objects.get(key=key).refcount, 3)
+        self.assertEqual(Artifact.objects.get(run=self.run).blob_id, key)
+
+    def test_flush_many_writes_all_journals(self):
+        other = Run.objects.create()
+        journals = [RunJournal(self.run), RunJournal(other)]
+        for j in journals:
+            j.add_artifact(j.run, "final_spec")
+            j.update_status(j.run, "success")
+        RunJournal.flush_many(journals)
+        self.assertEqual(Artifact.objects.count(), 2)
+        self.assertEqual(set(Run.objects.values_list("status", flat=True)), {"success"})
+        self.assertFalse(any(j.pending for j in journals))
+
+    def test_open_run_log_modes(self):
+        for mode, autoflush in (("step", True), ("end", False), ("bogus", False)):
+            with mock.patch.dict("os.environ", {"RUN_LOG_MODE": mode}):
+                log = open_run_log(self.run)
+                self.assertIsInstance(log, RunJournal)
+                self.assertEqual(log.autoflush, autoflush)
+        with mock.patch.dict("os.environ", {"RUN_LOG_MODE": "sync"}):
+            self.assertIs(open_run_log(self.run), RunLogger)
+
+
+class RunJournalRetryTests(TransactionTestCase):
+    """刷新遇到锁冲突时退避重试；仍失败时保留缓冲，由下一次刷新补写"""
+
+    def setUp(self):
+        self.run = Run.objects.create()
+        self.journal = RunJournal(self.run)
+        self.journal.start_step(self.journal.log_step(self.run, "codegen"))
+        self.journal.add_artifact(self.run, "code")
+        patcher = mock.patch.object(journal_module.time, "sleep")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def locked(self, times):
+        """前 times 次产物写入抛出 OperationalError（此时步骤已在同一事务中插入，随回滚撤销）"""
+        bulk_create = Artifact.objects.bulk_create
+        calls = []
+
+        def side_effect(objs, *args, **kwargs):
+            calls.append(1)
+            if len(calls) <= times:
+                raise OperationalError("database is locked")
+            return bulk_create(objs, *args, **kwargs)
+
+        return mock.patch.object(Artifact.objects, "bulk_create", side_effect=side_effect)
+
+    def test_retry_after_lock(self):
+        with self.locked(2):
+            self.assertTrue(self.journal.flush())
+        self.assertEqual(RunStepLog.objects.filter(run=self.run).count(), 1)
+        self.assertEqual(Artifact.objects.filter(run=self.run).count(), 1)
+
+    def test_buffer_kept_when_retries_exhausted(self):
+        with self.locked(journal_module.FLUSH_RETRIES + 1):
+            self.assertFalse(self.journal.flush(raise_errors=False))
+        self.assertTrue(self.journal.pending)
+        self.assertFalse(RunStepLog.objects.exists())
+
+        self.assertTrue(self.journal.flush())
+        self.assertEqual(RunStepLog.objects.filter(run=self.run).count(), 1)
+        self.assertEqual(Artifact.objects.filter(run=self.run).count(), 1)
+
+
+class TempArchiveMixin:
+    """RUN_ARCHIVE_DIR 指向临时目录，并重置进程级归档读取器"""
+
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        patcher = mock.patch.dict(os.environ, {"RUN_ARCHIVE_DIR": self.root})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        archive_module._archive = None
+        self.addCleanup(setattr, archive_module, "_archive", None)
+
+
+class RunArchiveSegmentTests(TempArchiveMixin, TestCase):
+    """分段文件：按运行 ID 二分查找，单条记录独立解压"""
+
+    def test_lookup(self):
+        archive = get_archive()
+        entries = {uuid.uuid4(): {"record": {"n": n}} for n in range(50)}
+        archive.write_segment(entries.items())
+        for run_id, entry in entries.items():
+            self.assertEqual(archive.get(run_id), entry)
+            self.assertTrue(archive.contains(str(run_id)))
+        self.assertIsNone(archive.get(uuid.uuid4()))
+
+    def test_newer_segment_wins(self):
+        archive = get_archive()
+        run_id = uuid.uuid4()
+        archive.write_segment([(run_id, {"record": {"v": 1}})])
+        self.assertEqual(archive.get(run_id)["record"]["v"], 1)
+        archive.write_segment([(run_id, {"record": {"v": 2}})])
+        self.assertEqual(archive.get(run_id)["record"]["v"], 2)
+        # 新的读取器看到的也是最新记录
+        self.assertEqual(RunArchive(archive.directory).get(run_id)["record"]["v"], 2)
+
+    def test_missing_directory(self):
+        self.assertIsNone(RunArchive(os.path.join(self.root, "missing")).get(uuid.uuid4()))
+
+    def test_invalid_index(self):
+        path = os.path.join(self.root, "runs-bad.idx")
+        with open(path, "wb") as f:
+            f.write(b"garbage!")
+        with self.assertRaises(ValueError):
+            Segment(archive_module.Path(path))
+
+    def test_cleanup_removes_partial_files(self):
+        archive = get_archive()
+        index = archive.write_segment([(uuid.uuid4(), {})])
+        for name in ("runs-x.seg.tmp", "runs-y.seg"):
+            open(os.path.join(self.root, name), "wb").close()
+        self.assertEqual(archive.cleanup(), 2)
+        self.assertEqual(sorted(os.listdir(self.root)), sorted([index.name, index.with_suffix(".seg").name]))
+
+
+class ArchiveRunsTests(TempArchiveMixin, TestCase):
+    """archive_runs：只移走超过保留期的已结束运行，可中断后重复执行；详情接口仍可读取"""
+
+    def make_run(self, status="success", age_days=40):
+        run = Run.objects.create(status=status)
+        step = RunStepLog.objects.create(
+            run=run, name="codegen", output_data={"provider": {"model": "m"}}, output_blob=BlobStore.put(svg("a")),
+        )
+        Artifact.objects.create(run=run, type="code", preview_text="<svg")
+        stamp = timezone.now() - timedelta(days=age_days)
+        Run.objects.filter(pk=run.pk).update(created_at=stamp, updated_at=stamp)
+        return Run.objects.get(pk=run.pk), step
+
+    def test_archive_and_read_back(self):
+        old, _ = self.make_run()
+        recent, _ = self.make_run(age_days=1)
+        running, _ = self.make_run(status="running")
+        detail = self.client.get(f"/api/runs/{old.id}/").json()["data"]
+
+        self.assertEqual(archive_runs(30, dry_run=True)["archived"], 1)
+        stats = archive_runs(30)
+        self.assertEqual((stats["archived"], stats["deleted"], stats["segments"]), (1, 1, 1))
+        self.assertEqual(set(Run.objects.values_list("id", flat=True)), {recent.id, running.id})
+        self.assertFalse(RunStepLog.objects.filter(run_id=old.id).exists())
+
+        response = self.client.get(f"/api/runs/{old.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"], detail)
+        self.assertEqual(self.client.get(f"/api/runs/{old.id}/artifacts/").json()["data"], detail["artifacts"])
+        self.assertEqual(self.client.get(f"/api/runs/{uuid.uuid4()}/").status_code, 404)
+
+    def test_blob_references_released(self):
+        _, step = self.make_run()
+        key = RunStepLog.objects.get(pk=step.pk).output_blob_id
+        self.assertIsNotNone(key)
+        archive_runs(30)
+        self.assertEqual(Blob.objects.get(key=key).refcount, 0)
+        self.assertEqual(get_archive().get(step.run_id)["record"]["steps"][0]["output"]["code"], svg("a"))
+
+    def test_resume_after_segment_written(self):
+        old, _ = self.make_run()
+        # 上次执行写完分段后中断：本次只删除，不重复写入
+        get_archive().write_segment([(old.id, archive_module.archive_entry(old))])
+        stats = archive_runs(30)
+        self.assertEqual((stats["archived"], stats["deleted"], stats["segments"]), (0, 1, 0))
+
+    def test_single_writer(self):
+        self.make_run()
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            with self.assertRaises(ValueError):
+                archive_runs(30)
+        self.assertEqual(Run.objects.count(), 1)
+
+
+class RunQueryTests(TestCase):
+    """运行列表：(created_at, id) 倒序的键集分页，同一时刻创建的运行也不重复、不遗漏"""
+
+    def setUp(self):
+        base = timezone.now() - timedelta(hours=1)
+        self.runs = []
+        for i in range(7):
+            run = Run.objects.create(status="failed" if i % 3 == 0 else "success")
+            # 每两个运行共用一个创建时间
+            Run.objects.filter(pk=run.pk).update(created_at=base + timedelta(minutes=i // 2))
+            self.runs.append(Run.objects.get(pk=run.pk))
+        RunStepLog.objects.create(run=self.runs[1], name="kg_augmentation")
+        self.expected = [run.id for run in sorted(self.runs, key=lambda r: (r.created_at, r.id.hex), reverse=True)]
+
+    def page_through(self, url):
+        ids, cursor = [], ""
+        while True:
+            data = self.client.get(url + cursor).json()["data"]
+            ids += [uuid.UUID(item["run_id"]) for item in data["items"]]
+            if not data["next_cursor"]:
+                return ids
+            cursor = f"&cursor={data['next_cursor']}"
+
+    def test_pages_cover_all_runs_in_order(self):
+        for limit in (1, 2, 3, 7, 50):
+            self.assertEqual(self.page_through(f"/api/runs/?limit={limit}"), self.expected)
+
+    def test_last_full_page_has_no_cursor(self):
+        runs, cursor = RunQuery.list_runs(limit=7)
+        self.assertEqual(len(runs), 7)
+        self.assertIsNone(cursor)
+
+    def test_filters(self):
+        failed = [run_id for run_id in self.expected if Run.objects.get(pk=run_id).status == "failed"]
+        self.assertEqual(self.page_through("/api/runs/?status=failed&limit=1"), failed)
+        self.assertEqual(self.page_through("/api/runs/?step=kg_augmentation"), [self.runs[1].id])
+        after = self.runs[4].created_at.isoformat().replace("+", "%2B")
+        self.assertEqual(self.page_through(f"/api/runs/?created_after={after}"), self.expected[:3])
+
+    def test_embed_is_prefetched(self):
+        RunLogger.add_artifact(self.runs[1], "code", preview_text="<svg")
+        with self.assertNumQueries(3):
+            runs, _ = RunQuery.list_runs(embed=("steps", "artifacts"))
+            items = [RunQuery.summary(run, ("steps", "artifacts")) for run in runs]
+        item = next(item for item in items if item["run_id"] == str(self.runs[1].id))
+        self.assertEqual([step["name"] for step in item["steps"]], ["kg_augmentation"])
+        self.assertEqual(item["artifacts"][0]["type"], "code")
+
+    def test_cursor_round_trip(self):
+        run = self.runs[0]
+        self.assertEqual(RunQuery.decode_cursor(RunQuery.encode_cursor(run)), (run.created_at, run.id))
+
+    def test_invalid_parameters(self):
+        for query in ("cursor=bogus", "status=done", "embed=drafts", "created_after=yesterday"):
+            response = self.client.get(f"/api/runs/?{query}")
+            self.assertEqual(response.status_code, 400, query)
+        self.assertEqual(len(self.client.get("/api/runs/?limit=1000").json()["data"]["items"]), 7)
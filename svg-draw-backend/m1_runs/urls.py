@@ -1,9 +1,11 @@
 from django.urls import path
-from .views import RunDetailView, RunArtifactsView
+from .views import RunListView, RunDetailView, RunArtifactsView, RunEventsView
 
 app_name = 'runs'
 
 urlpatterns = [
+    path('', RunListView.as_view(), name='run-list'),
     path('<uuid:run_id>/', RunDetailView.as_view(), name='run-detail'),
     path('<uuid:run_id>/artifacts/', RunArtifactsView.as_view(), name='run-artifacts'),
+    path('<uuid:run_id>/events/', RunEventsView.as_view(), name='run-events'),
 ]
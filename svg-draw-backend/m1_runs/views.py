@@ -1,47 +1,81 @@
 from rest_framework.views import APIView
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
-from django.shortcuts import get_object_or_404
+from django.http import StreamingHttpResponse
+from django.views import View
+from django.utils.dateparse import parse_datetime
 from .models import Run, Artifact
-from common.responses import success_response, error_response
-from common.schemas import RunRecord, StepLog, ArtifactInfo
+from .archive import get_archive
+from .services import RunQuery, run_record
+from common.responses import success_response, error_response, error_json_response, sse_event
+from common.schemas import ArtifactInfo
 from datetime import datetime
+import os
+import time
+
+# 进度事件流：轮询间隔、最长持续时间与心跳间隔（秒）
+RUN_EVENTS_POLL_INTERVAL = float(os.environ.get('RUN_EVENTS_POLL_INTERVAL', 0.5))
+RUN_EVENTS_TIMEOUT = float(os.environ.get('RUN_EVENTS_TIMEOUT', 600))
+RUN_EVENTS_KEEPALIVE = 15
+
+
+class RunListView(APIView):
+    """
+    运行列表，按创建时间倒序，键集分页
+    参数：status（逗号分隔）、created_after / created_before（ISO 时间）、step（包含该步骤）、
+    embed=steps,artifacts、limit（最大 100）、cursor（上一页返回的 next_cursor）
+    """
+    parser_classes = [JSONParser]
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            status = [s for s in params.get('status', '').split(',') if s]
+            embed = [e for e in params.get('embed', '').split(',') if e]
+            created_after = _parse_time(params.get('created_after'), 'created_after')
+            created_before = _parse_time(params.get('created_before'), 'created_before')
+            runs, next_cursor = RunQuery.list_runs(
+                status=status,
+                created_after=created_after,
+                created_before=created_before,
+                step=params.get('step') or None,
+                cursor=params.get('cursor') or None,
+                limit=params.get('limit', 20),
+                embed=embed,
+            )
+        except ValueError as e:
+            return error_response(str(e), status=400)
+        except Exception as e:
+            return error_response(str(e), status=500)
+
+        return success_response({
+            'items': [RunQuery.summary(run, embed) for run in runs],
+            'next_cursor': next_cursor,
+        })
+
+
+def _parse_time(value, name):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid {name}: {value}")
+    return parsed
 
 
 class RunDetailView(APIView):
-    """获取运行详情"""
+    """获取运行详情；已归档的运行从归档分段中读取"""
     parser_classes = [JSONParser]
     
     def get(self, request, run_id):
         try:
-            run = get_object_or_404(Run, id=run_id)
-            
-            steps = []
-            for step in run.steps.all():
-                steps.append(StepLog(
-                    name=step.name,
-                    started_at=step.started_at,
-                    ended_at=step.ended_at,
-                    input=step.input_data,
-                    output=step.output_data,
-                    error=step.error
-                ))
-            
-            artifacts = []
-            for art in run.artifacts.all():
-                artifacts.append(ArtifactInfo(
-                    type=art.type,
-                    ref_id=art.ref_id or '',
-                    preview_text=art.preview_text or ''
-                ))
-            
-            record = RunRecord(
-                run_id=str(run.id),
-                status=run.status,
-                steps=steps,
-                artifacts=artifacts
-            )
+            run = Run.objects.filter(id=run_id).first()
+            if run is None:
+                entry = get_archive().get(run_id)
+                if entry is None:
+                    return error_response(f"Run {run_id} not found", status=404)
+                return success_response(entry['record'])
             
-            return success_response(record.to_dict())
+            return success_response(run_record(run).to_dict())
         except Exception as e:
             return error_response(str(e), status=500)
 
@@ -52,7 +86,12 @@ class RunArtifactsView(APIView):
     
     def get(self, request, run_id):
         try:
-            run = get_object_or_404(Run, id=run_id)
+            run = Run.objects.filter(id=run_id).first()
+            if run is None:
+                entry = get_archive().get(run_id)
+                if entry is None:
+                    return error_response(f"Run {run_id} not found", status=404)
+                return success_response(entry['record']['artifacts'])
             artifacts = []
             for art in run.artifacts.all():
                 artifacts.append(ArtifactInfo(
@@ -64,3 +103,79 @@ class RunArtifactsView(APIView):
             return success_response(artifacts)
         except Exception as e:
             return error_response(str(e), status=500)
+
+
+def _run_events(run_id, poll_interval=None, timeout=None):
+    """
+    轮询运行状态与步骤日志，产出 SSE 消息：
+    status（状态变化）、step（步骤开始 / 结束）、done（运行结束，附产物列表）、timeout（超过最长持续时间）
+    """
+    poll_interval = poll_interval or RUN_EVENTS_POLL_INTERVAL
+    deadline = time.monotonic() + (timeout or RUN_EVENTS_TIMEOUT)
+    last_status = None
+    seen = {}
+    last_sent = time.monotonic()
+
+    while True:
+        run = Run.objects.get(id=run_id)
+        for step in run.steps.order_by('id').only('id', 'name', 'started_at', 'ended_at', 'error'):
+            state = (step.started_at, step.ended_at, step.error)
+            if seen.get(step.id) == state:
+                continue
+            seen[step.id] = state
+            yield sse_event('step', {
+                'name': step.name,
+                'phase': 'ended' if step.ended_at else 'started',
+                'started_at': step.started_at,
+                'ended_at': step.ended_at,
+                'error': step.error,
+            })
+            last_sent = time.monotonic()
+
+        if run.status != last_status:
+            last_status = run.status
+            yield sse_event('status', {'run_id': str(run_id), 'status': run.status})
+            last_sent = time.monotonic()
+
+        if run.status in ('success', 'failed'):
+            artifacts = [
+                ArtifactInfo(type=a.type, ref_id=a.ref_id or '', preview_text=a.preview_text or '').to_dict()
+                for a in run.artifacts.all()
+            ]
+            yield sse_event('done', {'run_id': str(run_id), 'status': run.status, 'artifacts': artifacts})
+            return
+        if time.monotonic() > deadline:
+            yield sse_event('timeout', {'run_id': str(run_id), 'status': run.status})
+            return
+        if time.monotonic() - last_sent > RUN_EVENTS_KEEPALIVE:
+            # SSE 注释行，防止代理因空闲断开连接
+            yield ': keepalive\n\n'
+            last_sent = time.monotonic()
+        time.sleep(poll_interval)
+
+
+def _archived_run_events(record):
+    """已归档的运行早已结束：直接发送最终状态与 done"""
+    yield sse_event('status', {'run_id': record['run_id'], 'status': record['status']})
+    yield sse_event('done', {'run_id': record['run_id'], 'status': record['status'], 'artifacts': record['artifacts']})
+
+
+class RunEventsView(View):
+    """
+    运行进度事件流（SSE）：推送状态变化与步骤开始 / 结束，运行结束后发送 done 并关闭
+    使用纯 Django 视图：浏览器 EventSource 请求头为 Accept: text/event-stream，DRF 内容协商会拒绝
+    """
+
+    def get(self, request, run_id):
+        if Run.objects.filter(id=run_id).exists():
+            events = _run_events(run_id)
+        else:
+            entry = get_archive().get(run_id)
+            if entry is None:
+                return error_json_response(f"Run {run_id} not found", status=404)
+            events = _archived_run_events(entry['record'])
+
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,243 @@
+"""
+LLM 响应缓存：按 (model, messages, temperature) 内容寻址
+- L1：进程内有界 LRU（OrderedDict + 锁）
+- L2：SQLite 文件，同机多个 gunicorn worker 共享；按 TTL、条目数与总字节数淘汰
+只缓存成功且非空的响应；是否使用缓存由调用方（编排层）决定。
+
+可通过环境变量调整（均为可选）：
+- LLM_CACHE_ENABLED       是否启用，默认 1
+- LLM_CACHE_MEMORY_SIZE   L1 最大条目数，默认 256
+- LLM_CACHE_PATH          L2 SQLite 文件路径，默认 <BASE_DIR>/llm_cache.sqlite3；设为空串则只用 L1
+- LLM_CACHE_TTL           过期时间（秒），默认 604800（7 天）
+- LLM_CACHE_MAX_ENTRIES   L2 最大条目数，默认 10000
+- LLM_CACHE_MAX_BYTES     L2 最大总字节数，默认 256MB
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+# 每写入多少次执行一次 L2 淘汰，摊薄 COUNT/SUM 的开销
+_PRUNE_EVERY = 50
+
+
+def make_key(model: str, messages: List[Dict[str, str]], temperature: float) -> str:
+    """计算缓存键：对规范化后的 (model, messages, temperature) 取 sha256"""
+    canonical = json.dumps(
+        {"model": model, "messages": messages, "temperature": round(float(temperature), 4)},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """两级 LLM 响应缓存"""
+
+    def __init__(
+        self,
+        memory_size: int = 256,
+        path: Optional[str] = None,
+        ttl: float = 7 * 24 * 3600,
+        max_entries: int = 10000,
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.memory_size = max(0, memory_size)
+        self.path = path or None
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "sets": 0}
+
+    # ---------- L2（SQLite） ----------
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        """每个线程 / 进程一条连接（sqlite3 连接不能跨线程，也不能跨 fork 复用）"""
+        if not self.path:
+            return None
+        pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == pid:
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+        self._local.conn = conn
+        self._local.pid = pid
+        return conn
+
+    def _disk_get(self, key: str, now: float) -> Optional[str]:
+        conn = self._conn()
+        if conn is None:
+            return None
+        row = conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        if now - created_at > self.ttl:
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def _disk_set(self, key: str, value: str, now: float) -> None:
+        conn = self._conn()
+        if conn is None:
+            return
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at, size) VALUES (?, ?, ?, ?, ?)",
+            (key, value, now, now, len(value.encode("utf-8"))),
+        )
+        self._writes += 1
+        if self._writes % _PRUNE_EVERY == 0:
+            self.prune(now)
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """淘汰 L2 中过期条目，并按最近访问时间裁剪到条目数 / 字节数上限，返回删除条数"""
+        conn = self._conn()
+        if conn is None:
+            return 0
+        now = now or time.time()
+        removed = conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,)).rowcount
+
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if count > self.max_entries or total > self.max_bytes:
+            # 从最久未访问的开始删，直到两个上限都满足
+            excess_rows = max(0, count - self.max_entries)
+            excess_bytes = max(0, total - self.max_bytes)
+            victims = []
+            freed = 0
+            for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at"):
+                if len(victims) >= excess_rows and freed >= excess_bytes:
+                    break
+                victims.append((key,))
+                freed += size
+            conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+            removed += len(victims)
+        if removed:
+            logger.info("LLM cache pruned %s entries", removed)
+        return removed
+
+    # ---------- 对外接口 ----------
+
+    def get(self, key: str) -> Tuple[Optional[str], Optional[str]]:
+        """查询缓存，返回 (value, tier)；tier 为 'memory' / 'disk'，未命中时均为 None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    metrics.LLM_CACHE_LOOKUPS.inc(result="hit", tier="memory")
+                    return value, "memory"
+                del self._memory[key]
+
+        try:
+            value = self._disk_get(key, now)
+        except sqlite3.Error as e:
+            logger.warning("LLM cache disk read failed: %s", e)
+            value = None
+
+        with self._lock:
+            if value is None:
+                self._stats["misses"] += 1
+            else:
+                self._stats["hits"] += 1
+                self._stats["disk_hits"] += 1
+                self._remember(key, value, now)
+        if value is None:
+            metrics.LLM_CACHE_LOOKUPS.inc(result="miss", tier="none")
+            return None, None
+        metrics.LLM_CACHE_LOOKUPS.inc(result="hit", tier="disk")
+        return value, "disk"
+
+    def set(self, key: str, value: str) -> None:
+        """写入缓存（两级同时写入）；空值不缓存"""
+        if not value:
+            return
+        now = time.time()
+        with self._lock:
+            self._stats["sets"] += 1
+            self._remember(key, value, now)
+        try:
+            self._disk_set(key, value, now)
+        except sqlite3.Error as e:
+            logger.warning("LLM cache disk write failed: %s", e)
+
+    def _remember(self, key: str, value: str, now: float) -> None:
+        if self.memory_size <= 0:
+            return
+        self._memory[key] = (value, now)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """进程内命中统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self) -> None:
+        """清空两级缓存"""
+        with self._lock:
+            self._memory.clear()
+        conn = self._conn()
+        if conn is not None:
+            conn.execute("DELETE FROM llm_cache")
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def _default_path() -> str:
+    try:
+        from django.conf import settings
+        return str(settings.BASE_DIR / "llm_cache.sqlite3")
+    except Exception:
+        return os.path.abspath("llm_cache.sqlite3")
+
+
+def get_cache() -> Optional[LLMResponseCache]:
+    """获取进程级缓存单例；LLM_CACHE_ENABLED=0 时返回 None"""
+    global _cache
+    if os.environ.get("LLM_CACHE_ENABLED", "1").lower() in ("0", "false", "no"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                path = os.environ.get("LLM_CACHE_PATH")
+                _cache = LLMResponseCache(
+                    memory_size=int(os.environ.get("LLM_CACHE_MEMORY_SIZE", 256)),
+                    path=_default_path() if path is None else path,
+                    ttl=float(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600)),
+                    max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 10000)),
+                    max_bytes=int(os.environ.get("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+                )
+    return _cache
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from m3_llm_providers.mock_server import MockLLMServer, MockConfig, parse_distribution
+
+
+class Command(BaseCommand):
+    help = '启动本地 OpenAI 兼容模拟服务（/chat/completions，支持流式、延迟分布与故障注入），用于离线压测'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--latency', default='fixed:0.2',
+                            help='首 token 延迟分布：fixed:S | uniform:A,B | normal:MEAN,STD | lognormal:MEDIAN,SIGMA | pareto:MIN,ALPHA')
+        parser.add_argument('--tokens-per-sec', type=float, default=0.0, help='输出 token 速率，0 表示不限')
+        parser.add_argument('--rate-429', type=float, default=0.0, help='随机返回 429 的概率')
+        parser.add_argument('--rate-5xx', type=float, default=0.0, help='随机返回 500/502/503 的概率')
+        parser.add_argument('--rate-truncate', type=float, default=0.0, help='截断响应的概率')
+        parser.add_argument('--retry-after', type=float, default=1.0, help='429 的 Retry-After 秒数，负数表示不带')
+        parser.add_argument('--max-concurrency', type=int, default=0, help='并发上限，超出返回 429；0 表示不限')
+        parser.add_argument('--markdown-ratio', type=float, default=0.0, help='用 ```xml 代码块包裹输出的概率')
+        parser.add_argument('--shapes', type=int, default=12, help='程序化 SVG 的图形数')
+        parser.add_argument('--svg-file', help='固定返回该文件中的 SVG')
+        parser.add_argument('--seed', type=int, help='随机种子（故障与延迟可复现）')
+
+    def handle(self, *args, **options):
+        try:
+            parse_distribution(options['latency'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        svg = None
+        if options['svg_file']:
+            with open(options['svg_file'], encoding='utf-8') as f:
+                svg = f.read().strip()
+
+        config = MockConfig(
+            latency=options['latency'],
+            tokens_per_sec=options['tokens_per_sec'],
+            rate_429=options['rate_429'],
+            rate_5xx=options['rate_5xx'],
+            rate_truncate=options['rate_truncate'],
+            retry_after=options['retry_after'] if options['retry_after'] >= 0 else None,
+            max_concurrency=options['max_concurrency'],
+            markdown_ratio=options['markdown_ratio'],
+            shapes=options['shapes'],
+            svg=svg,
+            seed=options['seed'],
+        )
+        server = MockLLMServer(config, host=options['host'], port=options['port'])
+        self.stdout.write(self.style.SUCCESS(f'Mock LLM server listening on {server.base_url}'))
+        self.stdout.write(f'  export SILICONFLOW_BASE_URL={server.base_url}  SILICONFLOW_API_KEY=mock')
+        self.stdout.write(f'  stats: GET {server.base_url}/stats')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
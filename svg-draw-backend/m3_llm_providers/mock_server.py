@@ -0,0 +1,326 @@
+"""
+本地 OpenAI 兼容模拟服务（压测 / 离线联调用）
+实现 POST .../chat/completions 的非流式与 SSE 流式两种形式，返回固定或按提示词程序化生成的 SVG
+（system prompt 要求紧凑场景 JSON 时返回等价的场景描述，见 m6_orchestrator.scene_dsl），
+支持延迟分布、token 速率、429 / 5xx / 截断注入与并发上限（超出返回 429）。
+相同提示词生成相同 SVG，便于验证缓存与请求合并；GET /stats 返回服务端计数。
+
+通过管理命令启动：python manage.py mock_llm_server --port 8001 --latency lognormal:0.8,0.5
+然后设置 SILICONFLOW_BASE_URL=http://127.0.0.1:8001/v1（SILICONFLOW_API_KEY 任意非空值）。
+"""
+import json
+import math
+import time
+import random
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_PALETTE = ["#4e79a7", "#f28e2b", "#e15759", "#76b7b2", "#59a14f", "#edc948", "#b07aa1", "#ff9da7"]
+
+
+def parse_distribution(spec: str) -> Callable[[random.Random], float]:
+    """
+    解析延迟分布（秒），返回采样函数：
+    - fixed:0.5
+    - uniform:0.2,1.0
+    - normal:均值,标准差
+    - lognormal:中位数,sigma
+    - pareto:最小值,alpha        重尾，适合观察 p99 与对冲效果
+    """
+    kind, _, args = (spec or "fixed:0").partition(":")
+    try:
+        values = [float(x) for x in args.split(",") if x.strip()]
+    except ValueError:
+        raise ValueError(f"Invalid latency distribution: {spec}")
+    kind = kind.strip().lower()
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal" and len(values) == 2:
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    if kind == "pareto" and len(values) == 2:
+        return lambda rng: values[0] * rng.paretovariate(values[1])
+    raise ValueError(f"Invalid latency distribution: {spec}")
+
+
+def generate_svg(prompt: str, shapes: int = 12) -> str:
+    """按提示词哈希确定性地生成一张 SVG（同一提示词结果相同）"""
+    seed = int(hashlib.sha256((prompt or "").encode("utf-8")).hexdigest()[:16], 16)
+    rng = random.Random(seed)
+    width, height = 800, 600
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">',
+        f'<rect x="0" y="0" width="{width}" height="{height}" fill="#ffffff"/>',
+    ]
+    for i in range(shapes):
+        color = rng.choice(_PALETTE)
+        x, y = rng.randint(20, width - 180), rng.randint(20, height - 120)
+        kind = rng.random()
+        if kind < 0.4:
+            w, h = rng.randint(60, 160), rng.randint(40, 100)
+            parts.append(f'<rect x="{x}" y="{y}" width="{w}" height="{h}" rx="6" fill="{color}" stroke="#333"/>')
+            parts.append(f'<text x="{x + w // 2}" y="{y + h // 2}" text-anchor="middle" font-size="14">节点 {i + 1}</text>')
+        elif kind < 0.7:
+            r = rng.randint(15, 50)
+            parts.append(f'<circle cx="{x + r}" cy="{y + r}" r="{r}" fill="{color}" opacity="0.8"/>')
+        else:
+            x2, y2 = rng.randint(20, width - 20), rng.randint(20, height - 20)
+            cx, cy = rng.randint(0, width), rng.randint(0, height)
+            parts.append(f'<path d="M{x},{y} Q{cx},{cy} {x2},{y2}" fill="none" stroke="{color}" stroke-width="2"/>')
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+def generate_scene(prompt: str, shapes: int = 12) -> str:
+    """generate_svg 的紧凑场景版本（m6_orchestrator.scene_dsl 格式），同一提示词结果相同"""
+    seed = int(hashlib.sha256((prompt or "").encode("utf-8")).hexdigest()[:16], 16)
+    rng = random.Random(seed)
+    styles = ["primary", "accent", "success", "warning", "danger", "muted"]
+    items, ids = [], []
+    for i in range(shapes):
+        style = rng.choice(styles)
+        x, y = rng.randint(100, 700), rng.randint(70, 530)
+        if rng.random() < 0.6:
+            items.append({"id": f"n{i + 1}", "type": "round", "x": x, "y": y,
+                          "w": rng.randint(60, 160), "h": rng.randint(40, 100), "text": f"节点 {i + 1}", "style": style})
+        else:
+            items.append({"id": f"n{i + 1}", "type": "circle", "x": x, "y": y, "r": rng.randint(15, 50), "style": style})
+        ids.append(f"n{i + 1}")
+    edges = [[ids[i], ids[rng.randrange(len(ids))]] for i in range(len(ids) - 1) if rng.random() < 0.7]
+    edges = [e for e in edges if e[0] != e[1]]
+    return json.dumps({"size": [800, 600], "shapes": items, "edges": edges}, ensure_ascii=False, separators=(",", ":"))
+
+
+@dataclass
+class MockConfig:
+    """模拟服务配置"""
+    latency: str = "fixed:0.2"          # 首 token 前的延迟分布
+    tokens_per_sec: float = 0.0         # 输出速率（约 4 字符 / token），0 表示不限
+    rate_429: float = 0.0               # 随机返回 429 的概率
+    rate_5xx: float = 0.0               # 随机返回 500/502/503 的概率
+    rate_truncate: float = 0.0          # 截断响应的概率（流式：中途断开；非流式：finish_reason=length）
+    retry_after: Optional[float] = 1.0  # 429 时的 Retry-After（秒），None 表示不带
+    max_concurrency: int = 0            # 同时处理的请求上限，超出返回 429；0 表示不限
+    markdown_ratio: float = 0.0         # 用 ```xml 代码块包裹输出的概率（验证提取逻辑）
+    shapes: int = 12                    # 程序化 SVG 的图形数
+    svg: Optional[str] = None           # 固定返回的 SVG（设置后不再程序化生成）
+    seed: Optional[int] = None
+
+
+class MockLLMServer:
+    """模拟服务；start() 在后台线程运行（测试 / 基准用），serve_forever() 在前台运行"""
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockConfig()
+        self.sample_latency = parse_distribution(self.config.latency)
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {
+            "requests": 0, "streams": 0, "ok": 0, "throttled": 0, "errors": 0,
+            "truncated": 0, "disconnects": 0, "inflight": 0, "max_inflight": 0,
+        }
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def serve_forever(self) -> None:
+        self.httpd.serve_forever()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # ---------- 请求处理 ----------
+
+    def _roll(self) -> Dict[str, Any]:
+        """为一次请求抽取随机量（加锁以保证 seed 下的可复现性）"""
+        cfg = self.config
+        with self._lock:
+            r = self._rng
+            return {
+                "latency": self.sample_latency(r),
+                "fault": r.random(),
+                "status_5xx": r.choice([500, 502, 503]),
+                "truncate": r.random() < cfg.rate_truncate,
+                "markdown": r.random() < cfg.markdown_ratio,
+            }
+
+    def _count(self, key: str, delta: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += delta
+            if key == "inflight":
+                self.stats["max_inflight"] = max(self.stats["max_inflight"], self.stats["inflight"])
+
+    def _content(self, body: Dict[str, Any], markdown: bool) -> str:
+        messages = body.get("messages") or []
+        prompt = "\n".join(str(m.get("content") or "") for m in messages if m.get("role") == "user")
+        system = "\n".join(str(m.get("content") or "") for m in messages if m.get("role") == "system")
+        if self.config.svg:
+            svg = self.config.svg
+        elif '"shapes"' in system and '"edges"' in system:
+            return generate_scene(prompt, self.config.shapes)
+        else:
+            svg = generate_svg(prompt, self.config.shapes)
+        return f"好的，以下是 SVG：\n```xml\n{svg}\n```" if markdown else svg
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, fmt, *args):
+                logger.debug("mock-llm %s", fmt % args)
+
+            def _json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/stats"):
+                    with server._lock:
+                        self._json(200, dict(server.stats))
+                elif self.path.rstrip("/").endswith("/models"):
+                    self._json(200, {"object": "list", "data": [{"id": "mock-svg", "object": "model"}]})
+                else:
+                    self._json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._json(404, {"error": {"message": "not found"}})
+                    return
+                try:
+                    body = json.loads(raw or b"{}")
+                except ValueError:
+                    self._json(400, {"error": {"message": "invalid JSON"}})
+                    return
+
+                server._count("requests")
+                server._count("inflight")
+                try:
+                    self._complete(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    server._count("disconnects")
+                finally:
+                    server._count("inflight", -1)
+
+            def _complete(self, body: Dict[str, Any]):
+                cfg = server.config
+                roll = server._roll()
+
+                if cfg.max_concurrency and server.stats["inflight"] > cfg.max_concurrency:
+                    server._count("throttled")
+                    self._throttle("concurrency limit exceeded")
+                    return
+                if roll["fault"] < cfg.rate_429:
+                    server._count("throttled")
+                    self._throttle("rate limit exceeded")
+                    return
+                if roll["fault"] < cfg.rate_429 + cfg.rate_5xx:
+                    server._count("errors")
+                    time.sleep(roll["latency"] / 2)
+                    self._json(roll["status_5xx"], {"error": {"message": "injected upstream error"}})
+                    return
+
+                content = server._content(body, roll["markdown"])
+                time.sleep(roll["latency"])
+                if body.get("stream"):
+                    server._count("streams")
+                    self._stream(body, content, roll["truncate"])
+                else:
+                    self._non_stream(body, content, roll["truncate"])
+
+            def _throttle(self, message: str):
+                headers = {}
+                if server.config.retry_after is not None:
+                    headers["Retry-After"] = f"{server.config.retry_after:g}"
+                self._json(429, {"error": {"message": message, "type": "rate_limit"}}, headers)
+
+            def _usage(self, body: Dict[str, Any], content: str) -> Dict[str, int]:
+                prompt_chars = sum(len(str(m.get("content") or "")) for m in body.get("messages") or [])
+                prompt, completion = prompt_chars // 2, max(1, len(content) // 4)
+                return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+            def _non_stream(self, body: Dict[str, Any], content: str, truncate: bool):
+                if server.config.tokens_per_sec > 0:
+                    time.sleep(len(content) / 4 / server.config.tokens_per_sec)
+                finish = "stop"
+                if truncate:
+                    content, finish = content[: len(content) // 2], "length"
+                    server._count("truncated")
+                self._json(200, {
+                    "id": f"mock-{time.time_ns()}",
+                    "object": "chat.completion",
+                    "model": body.get("model") or "mock-svg",
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish}],
+                    "usage": self._usage(body, content),
+                })
+                server._count("ok")
+
+            def _stream(self, body: Dict[str, Any], content: str, truncate: bool):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def send(event: str):
+                    data = event.encode("utf-8")
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    self.wfile.flush()
+
+                # 约 4 字符一个 token，每个 chunk 一个 token
+                step = 4
+                pause = 1.0 / server.config.tokens_per_sec if server.config.tokens_per_sec > 0 else 0.0
+                cut = len(content) // 2 if truncate else len(content)
+                model = body.get("model") or "mock-svg"
+                for i in range(0, cut, step):
+                    chunk = {"object": "chat.completion.chunk", "model": model,
+                             "choices": [{"index": 0, "delta": {"content": content[i:min(i + step, cut)]}, "finish_reason": None}]}
+                    send("data: " + json.dumps(chunk, ensure_ascii=False) + "\n\n")
+                    if pause:
+                        time.sleep(pause)
+
+                if truncate:
+                    # 模拟上游中途断开：不发 [DONE]，直接关闭连接
+                    server._count("truncated")
+                    self.close_connection = True
+                    self.wfile.flush()
+                    self.connection.shutdown(2)
+                    return
+
+                final = {"object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                send("data: " + json.dumps(final) + "\n\n")
+                send("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+                server._count("ok")
+
+        return Handler
@@ -0,0 +1,403 @@
+"""
+LLM 调用限流与自适应并发控制
+- RateLimiter：RPM / TPM 两个令牌桶，状态存于本机 SQLite 文件，同机多个 worker 进程共享配额
+  （BEGIN IMMEDIATE 串行化扣减）；按估算 token 预扣，拿到 usage 后再按实际用量结算
+- AdaptiveConcurrency：进程内 AIMD 并发窗口（默认关闭），成功时加性增大，429/503（以及配置了延迟倍数时的延迟突增）
+  时乘性缩小；超出窗口的请求排队等待而不是直接失败。启用后每个进程同时进行的 LLM 调用不超过
+  SILICONFLOW_CONCURRENCY_MAX，排队超过 SILICONFLOW_THROTTLE_MAX_WAIT 秒的请求失败；
+  不启用时并发只受连接池（SILICONFLOW_POOL_SIZE / SILICONFLOW_ASYNC_POOL_SIZE）限制
+- Throttle：两者的组合，由 transport 在每次 HTTP 尝试前后调用
+
+可通过环境变量调整（均为可选）：
+- SILICONFLOW_RPM                    每分钟请求数上限，默认 0（不限）
+- SILICONFLOW_TPM                    每分钟 token 上限，默认 0（不限）
+- SILICONFLOW_RATELIMIT_PATH         令牌桶 SQLite 文件路径，默认 <BASE_DIR>/llm_ratelimit.sqlite3；设为空串则仅进程内
+- SILICONFLOW_EST_COMPLETION_TOKENS  预扣时估算的输出 token 数（请求未指定 max_tokens 时），默认 1024
+- SILICONFLOW_CONCURRENCY_ADAPTIVE   是否启用 AIMD 并发窗口，默认 0
+- SILICONFLOW_CONCURRENCY_INITIAL    初始窗口，默认 8
+- SILICONFLOW_CONCURRENCY_MIN        最小窗口，默认 1
+- SILICONFLOW_CONCURRENCY_MAX        最大窗口，默认 64
+- SILICONFLOW_LATENCY_FACTOR         延迟超过基线多少倍视为突增并缩小窗口，默认 0（不按延迟调整：LLM 延迟随输出长度变化，
+                                     长输出不代表服务端过载）
+- SILICONFLOW_THROTTLE_MAX_WAIT      单次请求排队（窗口 + 令牌桶）最长等待秒数，默认 60
+"""
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+
+logger = logging.getLogger(__name__)
+
+# 视为"服务端过载"的状态码：触发窗口乘性缩小
+THROTTLE_STATUS = frozenset({429, 503})
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def estimate_tokens(payload: Dict[str, Any]) -> int:
+    """
+    估算一次请求的 token 消耗（输入 + 输出），用于 TPM 预扣。
+    输入按约 2 字符 / token 估算（中英文混合时偏保守），输出取 max_tokens 或默认值。
+    """
+    chars = sum(len(str(m.get("content") or "")) for m in payload.get("messages") or [])
+    completion = payload.get("max_tokens") or int(_env_float("SILICONFLOW_EST_COMPLETION_TOKENS", 1024))
+    return chars // 2 + int(completion)
+
+
+class RateLimiter:
+    """RPM / TPM 令牌桶（桶容量为一分钟的配额），跨进程共享"""
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0, path: Optional[str] = None):
+        self.name = name
+        self.rpm = max(0.0, rpm)
+        self.tpm = max(0.0, tpm)
+        self.path = path or None
+        self._lock = threading.Lock()
+        self._conn_pid: Optional[int] = None
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm > 0 or self.tpm > 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """进程内共享一条连接（所有操作都在 self._lock 内）；fork 后重新打开"""
+        pid = os.getpid()
+        if self._conn is None or self._conn_pid != pid:
+            conn = sqlite3.connect(self.path or ":memory:", timeout=10, isolation_level=None, check_same_thread=False)
+            if self.path:
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                " name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn, self._conn_pid = conn, pid
+        return self._conn
+
+    def _buckets(self, tokens: int):
+        """本次需要扣减的桶：(桶名, 每分钟配额, 扣减量)"""
+        buckets = []
+        if self.rpm > 0:
+            buckets.append((f"{self.name}:rpm", self.rpm, 1.0))
+        if self.tpm > 0:
+            # 单次估算超过整桶容量时按整桶扣，否则永远拿不到
+            buckets.append((f"{self.name}:tpm", self.tpm, float(min(tokens, self.tpm))))
+        return buckets
+
+    def try_acquire(self, tokens: int) -> float:
+        """尝试扣减一次请求与 tokens 个 token；成功返回 0，否则返回建议等待的秒数（不扣减）"""
+        if not self.enabled:
+            return 0.0
+        buckets = self._buckets(tokens)
+        with self._lock:
+            conn = self._connection()
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                levels = []
+                wait = 0.0
+                for name, rate, cost in buckets:
+                    row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE name = ?", (name,)).fetchone()
+                    level = rate if row is None else min(rate, row[0] + max(0.0, now - row[1]) * rate / 60.0)
+                    levels.append(level)
+                    if level < cost:
+                        wait = max(wait, (cost - level) * 60.0 / rate)
+                for (name, rate, cost), level in zip(buckets, levels):
+                    remaining = level - cost if wait <= 0 else level
+                    conn.execute(
+                        "INSERT OR REPLACE INTO rate_buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                        (name, remaining, now),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def settle(self, delta_tokens: int) -> None:
+        """按实际用量结算 TPM：delta 为 实际 - 预扣，正数追加扣减，负数退还（不超过桶容量）"""
+        if self.tpm <= 0 or not delta_tokens:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "UPDATE rate_buckets SET tokens = MIN(?, tokens - ?) WHERE name = ?",
+                (self.tpm, float(delta_tokens), f"{self.name}:tpm"),
+            )
+
+
+class AdaptiveConcurrency:
+    """AIMD 并发窗口（进程内）"""
+
+    def __init__(
+        self,
+        initial: float = 8,
+        minimum: float = 1,
+        maximum: float = 64,
+        latency_factor: float = 0.0,
+        decrease: float = 0.5,
+        cooldown: float = 1.0,
+    ):
+        self.minimum = max(1.0, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.window = min(self.maximum, max(self.minimum, initial))
+        self.latency_factor = latency_factor
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.inflight = 0
+        self.waiting = 0
+        self.baseline: Optional[float] = None
+        self._samples = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _has_room(self) -> bool:
+        return self.inflight < int(self.window)
+
+    def acquire(self, timeout: float) -> Tuple[float, int]:
+        """占用一个并发槽，窗口已满时排队；返回 (等待秒数, 入队时前面的排队数)"""
+        started = time.monotonic()
+        with self._cond:
+            depth = self.waiting
+            if not self._has_room():
+                self.waiting += 1
+                try:
+                    if not self._cond.wait_for(self._has_room, timeout):
+                        raise ValueError(f"LLM concurrency queue timeout after {timeout:.0f}s (window={int(self.window)})")
+                finally:
+                    self.waiting -= 1
+            self.inflight += 1
+        return time.monotonic() - started, depth
+
+    async def aacquire(self, timeout: float) -> Tuple[float, int]:
+        """acquire 的异步版本：轮询窗口，排队期间不阻塞事件循环"""
+        started = time.monotonic()
+        with self._cond:
+            depth = self.waiting
+            if self._has_room():
+                self.inflight += 1
+                return 0.0, depth
+            self.waiting += 1
+        try:
+            while True:
+                await asyncio.sleep(0.02)
+                with self._cond:
+                    if self._has_room():
+                        self.inflight += 1
+                        return time.monotonic() - started, depth
+                if time.monotonic() - started > timeout:
+                    raise ValueError(f"LLM concurrency queue timeout after {timeout:.0f}s (window={int(self.window)})")
+        finally:
+            with self._cond:
+                self.waiting -= 1
+
+    def release(self, status: Optional[int], latency: Optional[float]) -> None:
+        """归还并发槽并按结果调整窗口"""
+        with self._cond:
+            self.inflight = max(0, self.inflight - 1)
+            now = time.monotonic()
+            if status in THROTTLE_STATUS:
+                self._shrink(now, f"HTTP {status}")
+            elif status == 200:
+                spike = (
+                    latency is not None and self.latency_factor > 0 and self.baseline is not None
+                    and self._samples >= 5 and latency > self.baseline * self.latency_factor
+                )
+                if spike:
+                    self._shrink(now, f"latency {latency:.2f}s > {self.latency_factor}x baseline {self.baseline:.2f}s")
+                else:
+                    self.window = min(self.maximum, self.window + 1.0 / self.window)
+                if latency is not None:
+                    self._samples += 1
+                    self.baseline = latency if self.baseline is None else 0.9 * self.baseline + 0.1 * latency
+            self._cond.notify_all()
+
+    def _shrink(self, now: float, reason: str) -> None:
+        # 同一波拥塞中的多个失败只缩小一次
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        old = self.window
+        self.window = max(self.minimum, self.window * self.decrease)
+        logger.warning("LLM concurrency window %.1f -> %.1f (%s)", old, self.window, reason)
+
+
+class _Slot:
+    """一次 HTTP 尝试占用的并发槽"""
+
+    def __init__(self, window: Optional[AdaptiveConcurrency]):
+        self._window = window
+        self._released = False
+        self.started = time.monotonic()
+
+    def release(self, status: Optional[int], latency: Optional[float] = None) -> None:
+        """归还并发槽；latency 默认取占槽至今的耗时（仅 status 为 200 时参与窗口调整）"""
+        if self._released:
+            return
+        self._released = True
+        if self._window is not None:
+            self._window.release(status, time.monotonic() - self.started if latency is None else latency)
+
+
+class Throttle:
+    """令牌桶 + 并发窗口；每次 HTTP 尝试前 acquire，结束后 release 返回的槽"""
+
+    def __init__(
+        self,
+        limiter: Optional[RateLimiter] = None,
+        window: Optional[AdaptiveConcurrency] = None,
+        max_wait: float = 60.0,
+    ):
+        self.limiter = limiter
+        self.window = window
+        self.max_wait = max_wait
+
+    def acquire(self, tokens: int, meta: Optional[Dict[str, Any]] = None, deadline=None) -> _Slot:
+        """
+        同步占槽：先排队进入并发窗口，再等待令牌桶；等待情况累加到 meta["throttle"]。
+        deadline（common.deadline.Deadline）为运行截止时间：等待上限取 min(max_wait, 剩余预算)，
+        因预算不足放弃时抛出 DeadlineExceeded。
+        """
+        max_wait = self._max_wait(deadline)
+        give_up = time.monotonic() + max_wait
+        try:
+            queue_wait, depth = self.window.acquire(max_wait) if self.window else (0.0, 0)
+        except ValueError:
+            self._check_deadline(deadline, max_wait)
+            raise
+        slot = _Slot(self.window)
+        try:
+            rate_wait = 0.0
+            while self.limiter is not None:
+                wait = self.limiter.try_acquire(tokens)
+                if wait <= 0:
+                    break
+                if time.monotonic() + wait > give_up:
+                    self._check_deadline(deadline, max_wait)
+                    raise ValueError(f"LLM rate limit wait exceeds {self.max_wait:.0f}s")
+                time.sleep(wait)
+                rate_wait += wait
+        except BaseException:
+            slot.release(None)
+            raise
+        slot.started = time.monotonic()
+        self._record(meta, tokens, queue_wait, depth, rate_wait)
+        return slot
+
+    async def aacquire(self, tokens: int, meta: Optional[Dict[str, Any]] = None, deadline=None) -> _Slot:
+        """acquire 的异步版本；令牌桶的 SQLite 扣减在线程池中执行，不阻塞事件循环"""
+        max_wait = self._max_wait(deadline)
+        give_up = time.monotonic() + max_wait
+        try:
+            queue_wait, depth = await self.window.aacquire(max_wait) if self.window else (0.0, 0)
+        except ValueError:
+            self._check_deadline(deadline, max_wait)
+            raise
+        slot = _Slot(self.window)
+        try:
+            rate_wait = 0.0
+            while self.limiter is not None:
+                wait = await sync_to_async(self.limiter.try_acquire, thread_sensitive=False)(tokens)
+                if wait <= 0:
+                    break
+                if time.monotonic() + wait > give_up:
+                    self._check_deadline(deadline, max_wait)
+                    raise ValueError(f"LLM rate limit wait exceeds {self.max_wait:.0f}s")
+                await asyncio.sleep(wait)
+                rate_wait += wait
+        except BaseException:
+            slot.release(None)
+            raise
+        slot.started = time.monotonic()
+        self._record(meta, tokens, queue_wait, depth, rate_wait)
+        return slot
+
+    def _max_wait(self, deadline) -> float:
+        if deadline is None:
+            return self.max_wait
+        deadline.check("LLM queue")
+        return min(self.max_wait, deadline.remaining())
+
+    def _check_deadline(self, deadline, max_wait: float) -> None:
+        """等待上限由运行预算决定（而非 max_wait）时，以 DeadlineExceeded 报告"""
+        if deadline is not None and max_wait < self.max_wait:
+            raise deadline.error("LLM queue")
+
+    def settle(self, estimated: int, usage: Optional[Dict[str, Any]]) -> None:
+        """拿到响应 usage 后按实际 token 数修正 TPM 桶"""
+        if self.limiter is None or not usage or not usage.get("total_tokens"):
+            return
+        self.limiter.settle(int(usage["total_tokens"]) - int(estimated))
+
+    async def asettle(self, estimated: int, usage: Optional[Dict[str, Any]]) -> None:
+        """settle 的异步版本"""
+        if self.limiter is None or not usage or not usage.get("total_tokens"):
+            return
+        await sync_to_async(self.limiter.settle, thread_sensitive=False)(int(usage["total_tokens"]) - int(estimated))
+
+    def _record(self, meta, tokens: int, queue_wait: float, depth: int, rate_wait: float) -> None:
+        if meta is None:
+            return
+        info = meta.setdefault("throttle", {"queue_wait_s": 0.0, "rate_wait_s": 0.0, "queue_depth": 0})
+        info["queue_wait_s"] = round(info["queue_wait_s"] + queue_wait, 3)
+        info["rate_wait_s"] = round(info["rate_wait_s"] + rate_wait, 3)
+        info["queue_depth"] = max(info["queue_depth"], depth)
+        info["est_tokens"] = tokens
+        if self.window is not None:
+            info["window"] = round(self.window.window, 2)
+            info["inflight"] = self.window.inflight
+
+
+# base_url -> (pid, Throttle)
+_throttles: Dict[str, Tuple[int, Throttle]] = {}
+_throttles_lock = threading.Lock()
+
+
+def _default_path() -> str:
+    try:
+        from django.conf import settings
+        return str(settings.BASE_DIR / "llm_ratelimit.sqlite3")
+    except Exception:
+        return os.path.abspath("llm_ratelimit.sqlite3")
+
+
+def get_throttle(base_url: str) -> Optional[Throttle]:
+    """获取 base_url 对应的进程级 Throttle；未配置配额且关闭自适应并发时返回 None"""
+    key = base_url.rstrip("/")
+    pid = os.getpid()
+    with _throttles_lock:
+        entry = _throttles.get(key)
+        if entry is not None and entry[0] == pid:
+            return entry[1]
+
+        rpm = _env_float("SILICONFLOW_RPM", 0)
+        tpm = _env_float("SILICONFLOW_TPM", 0)
+        limiter = None
+        if rpm > 0 or tpm > 0:
+            path = os.environ.get("SILICONFLOW_RATELIMIT_PATH")
+            limiter = RateLimiter(key, rpm=rpm, tpm=tpm, path=_default_path() if path is None else path)
+
+        window = None
+        if os.environ.get("SILICONFLOW_CONCURRENCY_ADAPTIVE", "0").lower() in ("1", "true", "yes"):
+            window = AdaptiveConcurrency(
+                initial=_env_float("SILICONFLOW_CONCURRENCY_INITIAL", 8),
+                minimum=_env_float("SILICONFLOW_CONCURRENCY_MIN", 1),
+                maximum=_env_float("SILICONFLOW_CONCURRENCY_MAX", 64),
+                latency_factor=_env_float("SILICONFLOW_LATENCY_FACTOR", 0),
+            )
+
+        throttle = None
+        if limiter is not None or window is not None:
+            throttle = Throttle(limiter, window, max_wait=_env_float("SILICONFLOW_THROTTLE_MAX_WAIT", 60))
+        _throttles[key] = (pid, throttle)
+        return throttle
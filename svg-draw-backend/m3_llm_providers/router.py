@@ -0,0 +1,477 @@
+"""
+多端点路由与对冲请求（hedged requests）
+- 端点列表来自 SILICONFLOW_ENDPOINTS（JSON 数组），未配置时退化为单个 SILICONFLOW_BASE_URL / SILICONFLOW_MODEL 端点
+- 每个端点在进程内维护延迟 EWMA、最近延迟样本（用于 p95）与健康状态（连续失败后熔断一段时间）
+- 路由：在健康端点中选 EWMA 最小者（无样本的端点优先，以便探测），小概率随机探索
+- 对冲：主请求在 p95 之前未返回时，向另一个端点发出相同请求，取先完成者，另一个被取消
+  （同步路径用流式调用，取消即关闭连接；异步路径直接取消协程）
+- 失败转移：所选端点调用失败时换一个健康端点重试一次
+各端点视为等价的模型池，缓存与单飞键仍按默认模型计算。
+
+SILICONFLOW_ENDPOINTS 示例：
+  [{"name": "sf-a", "base_url": "https://api.siliconflow.cn/v1", "model": "Qwen/Qwen3-Coder-480B-A35B-Instruct"},
+   {"name": "backup", "base_url": "http://10.0.0.2:8000/v1", "model": "qwen-coder", "api_key_env": "BACKUP_API_KEY"}]
+
+其余环境变量（均为可选）：
+- SILICONFLOW_HEDGE              是否默认开启对冲，默认 0（请求可用 params.hedge 覆盖）
+- SILICONFLOW_HEDGE_DELAY        样本不足时的对冲等待秒数，默认 20
+- SILICONFLOW_HEDGE_MIN_DELAY    对冲等待下限（秒），默认 0.5
+- SILICONFLOW_HEDGE_MIN_SAMPLES  用 p95 作为对冲等待所需的最少样本数，默认 20
+- SILICONFLOW_UNHEALTHY_AFTER    连续失败多少次后熔断，默认 3
+- SILICONFLOW_UNHEALTHY_COOLDOWN 熔断时长（秒），默认 30
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from common.deadline import Deadline
+from common.timing import run_in_context
+from .siliconflow_client import (
+    DEFAULT_BASE_URL, resolve_model,
+    chat_completion, achat_completion, chat_completion_stream,
+)
+
+logger = logging.getLogger(__name__)
+
+# EWMA 平滑系数与保留的延迟样本数
+_EWMA_ALPHA = 0.2
+_SAMPLES = 200
+# 随机探索概率：让较慢的端点偶尔也有新样本
+_EXPLORE = 0.05
+
+
+class HedgeCancelled(Exception):
+    """对冲中落败的请求被取消"""
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass
+class Endpoint:
+    """一个 OpenAI 兼容端点及其运行时统计"""
+    name: str
+    base_url: str
+    model: str
+    api_key: Optional[str] = None
+    ewma: Optional[float] = None
+    samples: Deque[float] = field(default_factory=lambda: deque(maxlen=_SAMPLES))
+    successes: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    unhealthy_until: float = 0.0
+
+    def p95(self) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def healthy(self, now: float) -> bool:
+        # 熔断期过后进入半开状态：允许请求，成功即恢复
+        return now >= self.unhealthy_until
+
+    def to_dict(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        return {
+            "name": self.name,
+            "model": self.model,
+            "ewma_s": round(self.ewma, 3) if self.ewma is not None else None,
+            "p95_s": round(p95, 3) if p95 is not None else None,
+            "successes": self.successes,
+            "failures": self.failures,
+            "healthy": self.healthy(time.monotonic()),
+        }
+
+
+class EndpointRouter:
+    """端点路由器（进程级单例见 get_router）"""
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        hedge: bool = False,
+        hedge_delay: float = 20.0,
+        hedge_min_delay: float = 0.5,
+        hedge_min_samples: int = 20,
+        unhealthy_after: int = 3,
+        unhealthy_cooldown: float = 30.0,
+    ):
+        if not endpoints:
+            raise ValueError("EndpointRouter requires at least one endpoint")
+        self.endpoints = endpoints
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.unhealthy_after = unhealthy_after
+        self.unhealthy_cooldown = unhealthy_cooldown
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    # ---------- 统计与选择 ----------
+
+    def choose(self, exclude=()) -> Optional[Endpoint]:
+        """选出最快的健康端点；全部熔断时选最早恢复的；没有其他可选端点时返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [e for e in self.endpoints if e not in exclude]
+            if not candidates:
+                return None
+            healthy = [e for e in candidates if e.healthy(now)]
+            if not healthy:
+                return min(candidates, key=lambda e: e.unhealthy_until)
+            if len(healthy) > 1 and random.random() < _EXPLORE:
+                return random.choice(healthy)
+            return min(healthy, key=lambda e: -1.0 if e.ewma is None else e.ewma)
+
+    def record(self, endpoint: Endpoint, latency: Optional[float], ok: bool) -> None:
+        """记录一次调用结果；被取消的请求不计入（latency 为 None 且 ok 为 True）"""
+        with self._lock:
+            if ok:
+                endpoint.consecutive_failures = 0
+                endpoint.unhealthy_until = 0.0
+                if latency is not None:
+                    endpoint.successes += 1
+                    endpoint.samples.append(latency)
+                    endpoint.ewma = latency if endpoint.ewma is None else (
+                        _EWMA_ALPHA * latency + (1 - _EWMA_ALPHA) * endpoint.ewma
+                    )
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.unhealthy_after:
+                endpoint.unhealthy_until = time.monotonic() + self.unhealthy_cooldown
+                logger.warning(
+                    "LLM endpoint %s marked unhealthy for %.0fs after %s failures",
+                    endpoint.name, self.unhealthy_cooldown, endpoint.consecutive_failures,
+                )
+
+    def hedge_after(self, endpoint: Endpoint) -> float:
+        """主请求发出多久后触发对冲：样本足够时取 p95，否则取默认值"""
+        if len(endpoint.samples) >= self.hedge_min_samples:
+            return max(self.hedge_min_delay, endpoint.p95())
+        return max(self.hedge_min_delay, self.hedge_delay)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [e.to_dict() for e in self.endpoints]
+
+    # ---------- 调用 ----------
+
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        temperature: float = 0.2,
+        meta: Optional[Dict[str, Any]] = None,
+        hedge: Optional[bool] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> str:
+        """
+        路由 + （可选）对冲的非流式调用，返回 content。
+        meta 写入 endpoint / model / hedge，以及胜出请求的传输元信息（attempts、throttle 等）。
+        deadline 为运行截止时间：各次调用共享剩余预算，DeadlineExceeded 不触发失败转移。
+        """
+        meta = meta if meta is not None else {}
+        hedge = self.hedge if hedge is None else hedge
+        if hedge and len(self.endpoints) > 1:
+            return self._chat_hedged(messages, temperature, meta, deadline)
+
+        primary = self.choose()
+        try:
+            return self._call(primary, messages, temperature, meta, deadline)
+        except ValueError as e:
+            fallback = self.choose(exclude=(primary,))
+            if fallback is None:
+                raise
+            logger.warning("LLM endpoint %s failed (%s), failing over to %s", primary.name, e, fallback.name)
+            meta["failover_from"] = primary.name
+            return self._call(fallback, messages, temperature, meta, deadline)
+
+    def _call(self, endpoint: Endpoint, messages, temperature: float, meta: Dict[str, Any], deadline=None) -> str:
+        meta["endpoint"] = endpoint.name
+        meta["model"] = endpoint.model
+        started = time.monotonic()
+        try:
+            content = chat_completion(
+                messages, api_key=endpoint.api_key, base_url=endpoint.base_url,
+                model=endpoint.model, temperature=temperature, meta=meta, deadline=deadline,
+            )
+        except ValueError:
+            self.record(endpoint, None, ok=False)
+            raise
+        self.record(endpoint, time.monotonic() - started, ok=True)
+        return content
+
+    def _collect(
+        self, endpoint: Endpoint, messages, temperature: float, meta: Dict[str, Any], cancel: threading.Event, deadline=None,
+    ) -> str:
+        """以流式调用收集完整输出，期间检查取消标记；取消时关闭连接，不再消费 token"""
+        started = time.monotonic()
+        parts = []
+        stream = chat_completion_stream(
+            messages, api_key=endpoint.api_key, base_url=endpoint.base_url,
+            model=endpoint.model, temperature=temperature, meta=meta, deadline=deadline,
+        )
+        try:
+            for delta in stream:
+                if cancel.is_set():
+                    raise HedgeCancelled(endpoint.name)
+                parts.append(delta)
+            if cancel.is_set():
+                raise HedgeCancelled(endpoint.name)
+        except HedgeCancelled:
+            self.record(endpoint, None, ok=True)
+            raise
+        except ValueError:
+            self.record(endpoint, None, ok=False)
+            raise
+        finally:
+            stream.close()
+        self.record(endpoint, time.monotonic() - started, ok=True)
+        return "".join(parts).strip()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="llm-hedge")
+            return self._executor
+
+    def _chat_hedged(self, messages, temperature: float, meta: Dict[str, Any], deadline=None) -> str:
+        pool = self._pool()
+        primary = self.choose()
+        delay = self.hedge_after(primary)
+        if deadline is not None:
+            delay = min(delay, deadline.remaining())
+        hedge_info = {"enabled": True, "delay_s": round(delay, 3), "fired": False}
+        meta["hedge"] = hedge_info
+
+        # future -> (endpoint, 该请求自己的 meta, 取消标记)
+        calls = {}
+
+        def launch(endpoint: Endpoint):
+            call_meta, cancel = {}, threading.Event()
+            future = run_in_context(pool, self._collect, endpoint, messages, temperature, call_meta, cancel, deadline)
+            calls[future] = (endpoint, call_meta, cancel)
+
+        launch(primary)
+        pending = set(calls)
+        done, pending = wait(pending, timeout=delay)
+        primary_failed = bool(done) and next(iter(done)).exception() is not None
+        if deadline is not None and deadline.expired():
+            for _, _, cancel in calls.values():
+                cancel.set()
+            raise deadline.error("LLM hedge")
+        if not done or primary_failed:
+            secondary = self.choose(exclude=(primary,))
+            if secondary is not None:
+                hedge_info["fired"] = True
+                hedge_info["reason"] = "error" if primary_failed else "slow"
+                launch(secondary)
+                pending = {f for f in calls if not f.done()}
+
+        # 取第一个成功的结果；全部失败时抛出最后一个错误
+        error = None
+        winner = None
+        finished = [f for f in calls if f.done()]
+        while winner is None:
+            for future in finished:
+                if future.exception() is None:
+                    winner = future
+                    break
+                error = future.exception()
+            if winner is not None or not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+        for future, (endpoint, _, cancel) in calls.items():
+            if future is not winner and not future.done():
+                cancel.set()
+                hedge_info["cancelled"] = endpoint.name
+
+        if winner is None:
+            raise error
+        endpoint, call_meta, _ = calls[winner]
+        meta.update(call_meta)
+        meta["endpoint"] = endpoint.name
+        meta["model"] = endpoint.model
+        hedge_info["winner"] = "primary" if endpoint is primary else "hedge"
+        return winner.result()
+
+    async def achat(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        temperature: float = 0.2,
+        meta: Optional[Dict[str, Any]] = None,
+        hedge: Optional[bool] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> str:
+        """chat 的 asyncio 版本：对冲时落败的协程直接 cancel（httpx 会关闭连接）"""
+        meta = meta if meta is not None else {}
+        hedge = self.hedge if hedge is None else hedge
+        primary = self.choose()
+
+        async def call(endpoint: Endpoint, call_meta: Dict[str, Any]) -> str:
+            started = time.monotonic()
+            try:
+                content = await achat_completion(
+                    messages, api_key=endpoint.api_key, base_url=endpoint.base_url,
+                    model=endpoint.model, temperature=temperature, meta=call_meta, deadline=deadline,
+                )
+            except ValueError:
+                self.record(endpoint, None, ok=False)
+                raise
+            self.record(endpoint, time.monotonic() - started, ok=True)
+            return content
+
+        if not hedge or len(self.endpoints) < 2:
+            meta["endpoint"], meta["model"] = primary.name, primary.model
+            try:
+                return await call(primary, meta)
+            except ValueError as e:
+                fallback = self.choose(exclude=(primary,))
+                if fallback is None:
+                    raise
+                logger.warning("LLM endpoint %s failed (%s), failing over to %s", primary.name, e, fallback.name)
+                meta["failover_from"] = primary.name
+                meta["endpoint"], meta["model"] = fallback.name, fallback.model
+                return await call(fallback, meta)
+
+        delay = self.hedge_after(primary)
+        if deadline is not None:
+            delay = min(delay, deadline.remaining())
+        hedge_info = {"enabled": True, "delay_s": round(delay, 3), "fired": False}
+        meta["hedge"] = hedge_info
+        tasks = {}
+        primary_meta = {}
+        tasks[asyncio.ensure_future(call(primary, primary_meta))] = (primary, primary_meta)
+
+        done, pending = await asyncio.wait(set(tasks), timeout=delay)
+        primary_failed = bool(done) and next(iter(done)).exception() is not None
+        if deadline is not None and deadline.expired():
+            for task in pending:
+                task.cancel()
+            raise deadline.error("LLM hedge")
+        if not done or primary_failed:
+            secondary = self.choose(exclude=(primary,))
+            if secondary is not None:
+                hedge_info["fired"] = True
+                hedge_info["reason"] = "error" if primary_failed else "slow"
+                secondary_meta = {}
+                tasks[asyncio.ensure_future(call(secondary, secondary_meta))] = (secondary, secondary_meta)
+                pending = {t for t in tasks if not t.done()}
+
+        error = None
+        winner = None
+        try:
+            finished = [t for t in tasks if t.done()]
+            while winner is None:
+                for task in finished:
+                    if task.exception() is None:
+                        winner = task
+                        break
+                    error = task.exception()
+                if winner is not None or not pending:
+                    break
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task, (endpoint, _) in tasks.items():
+                if task is not winner and not task.done():
+                    task.cancel()
+                    hedge_info["cancelled"] = endpoint.name
+
+        if winner is None:
+            raise error
+        endpoint, call_meta = tasks[winner]
+        meta.update(call_meta)
+        meta["endpoint"], meta["model"] = endpoint.name, endpoint.model
+        hedge_info["winner"] = "primary" if endpoint is primary else "hedge"
+        return winner.result()
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        temperature: float = 0.2,
+        meta: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> Iterator[str]:
+        """流式调用：只做路由（增量已推给前端，不做对冲与失败转移），流结束后记录总耗时"""
+        meta = meta if meta is not None else {}
+        endpoint = self.choose()
+        meta["endpoint"], meta["model"] = endpoint.name, endpoint.model
+        started = time.monotonic()
+        try:
+            yield from chat_completion_stream(
+                messages, api_key=endpoint.api_key, base_url=endpoint.base_url,
+                model=endpoint.model, temperature=temperature, meta=meta, deadline=deadline,
+            )
+        except ValueError:
+            self.record(endpoint, None, ok=False)
+            raise
+        except GeneratorExit:
+            self.record(endpoint, None, ok=True)
+            raise
+        self.record(endpoint, time.monotonic() - started, ok=True)
+
+
+def load_endpoints() -> List[Endpoint]:
+    """从环境变量读取端点列表"""
+    raw = os.environ.get("SILICONFLOW_ENDPOINTS")
+    default_key = os.environ.get("SILICONFLOW_API_KEY")
+    if not raw:
+        base_url = os.environ.get("SILICONFLOW_BASE_URL") or DEFAULT_BASE_URL
+        return [Endpoint(name="default", base_url=base_url, model=resolve_model(), api_key=default_key)]
+
+    try:
+        items = json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f"SILICONFLOW_ENDPOINTS is not valid JSON: {e}") from e
+    endpoints = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("base_url"):
+            raise ValueError(f"SILICONFLOW_ENDPOINTS[{i}] must be an object with base_url")
+        key = os.environ.get(item["api_key_env"]) if item.get("api_key_env") else item.get("api_key")
+        endpoints.append(Endpoint(
+            name=item.get("name") or f"endpoint-{i}",
+            base_url=item["base_url"],
+            model=resolve_model(item.get("model")),
+            api_key=key or default_key,
+        ))
+    return endpoints
+
+
+_router: Optional[EndpointRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> EndpointRouter:
+    """获取进程级端点路由器（首次调用时按环境变量创建）"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = EndpointRouter(
+                    load_endpoints(),
+                    hedge=os.environ.get("SILICONFLOW_HEDGE", "0").lower() in ("1", "true", "yes"),
+                    hedge_delay=_env_float("SILICONFLOW_HEDGE_DELAY", 20.0),
+                    hedge_min_delay=_env_float("SILICONFLOW_HEDGE_MIN_DELAY", 0.5),
+                    hedge_min_samples=int(_env_float("SILICONFLOW_HEDGE_MIN_SAMPLES", 20)),
+                    unhealthy_after=int(_env_float("SILICONFLOW_UNHEALTHY_AFTER", 3)),
+                    unhealthy_cooldown=_env_float("SILICONFLOW_UNHEALTHY_COOLDOWN", 30.0),
+                )
+    return _router
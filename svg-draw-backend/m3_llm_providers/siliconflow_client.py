@@ -1,50 +1,55 @@
 """
-SiliconFlow 文本 LLM 客户端（OpenAI 兼容，非流式）
+SiliconFlow 文本 LLM 客户端（OpenAI 兼容，支持非流式、SSE 流式与 asyncio 异步）
 职责：仅调用外部大模型 API，不创建 Run、不存草稿、不参与编排。
+连接复用与重试由 transport 模块负责，限流与并发控制由 ratelimit 模块负责。
 """
 import os
+import json
+import time
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
 
 import requests
 
+from common import metrics, timing
+from common.deadline import Deadline
+from .transport import post_with_retry, apost_with_retry, release_stream
+from .ratelimit import get_throttle, estimate_tokens
+
 logger = logging.getLogger(__name__)
 
 DEFAULT_BASE_URL = "https://api.siliconflow.cn/v1"
 DEFAULT_MODEL = "Qwen/Qwen3-Coder-480B-A35B-Instruct"
 
 
-def chat_completion(
+def resolve_model(model: Optional[str] = None) -> str:
+    """解析实际使用的模型名：参数 > SILICONFLOW_MODEL > 默认模型"""
+    return model or os.environ.get("SILICONFLOW_MODEL") or DEFAULT_MODEL
+
+
+def _prepare_request(
     messages: List[Dict[str, str]],
     *,
-    api_key: Optional[str] = None,
-    base_url: Optional[str] = None,
-    model: Optional[str] = None,
-    temperature: float = 0.2,
-) -> str:
-    """
-    调用 SiliconFlow chat/completions（非流式），返回 assistant 的 content 字符串。
-
-    :param messages: [{"role": "system"|"user"|"assistant", "content": "..."}, ...]
-    :param api_key: 默认从环境变量 SILICONFLOW_API_KEY 读取
-    :param base_url: 默认 SILICONFLOW_BASE_URL 或 https://api.siliconflow.cn/v1
-    :param model: 默认 SILICONFLOW_MODEL 或 Qwen/Qwen3-Coder-480B-A35B-Instruct
-    :param temperature: 默认 0.2
-    :return: assistant 的 content 文本
-    :raises: ValueError 当 API 失败或返回无法解析时
-    """
+    api_key: Optional[str],
+    base_url: Optional[str],
+    model: Optional[str],
+    temperature: float,
+    stream: bool,
+) -> Tuple[str, str, Dict[str, Any], Dict[str, str]]:
+    """解析配置并构建请求，返回 (base_url, endpoint, payload, headers)"""
     key = api_key or os.environ.get("SILICONFLOW_API_KEY")
     if not key:
         raise ValueError("SILICONFLOW_API_KEY is not set")
 
     url = (base_url or os.environ.get("SILICONFLOW_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
     endpoint = f"{url}/chat/completions"
-    model_name = model or os.environ.get("SILICONFLOW_MODEL") or DEFAULT_MODEL
+    model_name = resolve_model(model)
 
     payload = {
         "model": model_name,
         "messages": messages,
-        "stream": False,
+        "stream": stream,
         "temperature": temperature,
     }
 
@@ -52,24 +57,159 @@ def chat_completion(
         "Authorization": f"Bearer {key}",
         "Content-Type": "application/json",
     }
+    if stream:
+        headers["Accept"] = "text/event-stream"
+
+    return url, endpoint, payload, headers
+
 
+def _post(url: str, endpoint: str, payload: Dict[str, Any], headers: Dict[str, str], meta, stream: bool, deadline=None):
+    """发送请求并检查状态码，非 200 时抛 ValueError"""
     try:
-        resp = requests.post(endpoint, json=payload, headers=headers, timeout=120)
+        resp = post_with_retry(
+            endpoint, json=payload, headers=headers, base_url=url, meta=meta, stream=stream, deadline=deadline,
+        )
     except requests.RequestException as e:
         logger.exception("SiliconFlow request failed: %s", e)
         raise ValueError(f"SiliconFlow request failed: {e}") from e
 
     if resp.status_code != 200:
-        raise ValueError(
-            f"SiliconFlow API HTTP {resp.status_code}: {resp.text[:500]}"
-        )
+        try:
+            raise ValueError(
+                f"SiliconFlow API HTTP {resp.status_code}: {resp.text[:500]}"
+            )
+        finally:
+            resp.close()
+    return resp
+
+
+def chat_completion(
+    messages: List[Dict[str, str]],
+    *,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    model: Optional[str] = None,
+    temperature: float = 0.2,
+    meta: Optional[Dict[str, Any]] = None,
+    deadline: Optional[Deadline] = None,
+) -> str:
+    """
+    调用 SiliconFlow chat/completions（非流式），返回 assistant 的 content 字符串。
+
+    :param messages: [{"role": "system"|"user"|"assistant", "content": "..."}, ...]
+    :param api_key: 默认从环境变量 SILICONFLOW_API_KEY 读取
+    :param base_url: 默认 SILICONFLOW_BASE_URL 或 https://api.siliconflow.cn/v1
+    :param model: 默认 SILICONFLOW_MODEL 或 Qwen/Qwen3-Coder-480B-A35B-Instruct
+    :param temperature: 默认 0.2
+    :param meta: 可选，传入 dict 时写入调用元信息（attempts / retry_wait_s / usage 等）
+    :param deadline: 可选，运行截止时间（common.deadline.Deadline），请求超时不超过剩余预算
+    :return: assistant 的 content 文本
+    :raises: ValueError 当 API 失败或返回无法解析时；DeadlineExceeded 当预算耗尽或被取消时
+    """
+    url, endpoint, payload, headers = _prepare_request(
+        messages, api_key=api_key, base_url=base_url, model=model,
+        temperature=temperature, stream=False,
+    )
+    started = time.monotonic()
+    data = None
+    try:
+        resp = _post(url, endpoint, payload, headers, meta, stream=False, deadline=deadline)
+        try:
+            data = resp.json()
+        except Exception as e:
+            logger.exception("SiliconFlow response JSON parse failed: %s", e)
+            raise ValueError(f"SiliconFlow response not valid JSON: {e}") from e
+        _settle_usage(url, payload, data)
+        _record_usage(meta, data.get("usage") if isinstance(data, dict) else None)
+        content = _parse_completion(data, meta)
+    except Exception:
+        _observe(url, payload, "sync", started, ok=False, data=data)
+        raise
+    _observe(url, payload, "sync", started, ok=True, data=data)
+    return content
+
 
+async def achat_completion(
+    messages: List[Dict[str, str]],
+    *,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    model: Optional[str] = None,
+    temperature: float = 0.2,
+    meta: Optional[Dict[str, Any]] = None,
+    deadline: Optional[Deadline] = None,
+) -> str:
+    """
+    chat_completion 的 asyncio 版本（基于 httpx），参数与返回值相同。
+    等待模型输出期间不占用线程，适合在 ASGI 视图中并发大量调用。
+    """
+    import httpx
+
+    url, endpoint, payload, headers = _prepare_request(
+        messages, api_key=api_key, base_url=base_url, model=model,
+        temperature=temperature, stream=False,
+    )
+    started = time.monotonic()
+    data = None
     try:
-        data = resp.json()
-    except Exception as e:
-        logger.exception("SiliconFlow response JSON parse failed: %s", e)
-        raise ValueError(f"SiliconFlow response not valid JSON: {e}") from e
+        try:
+            resp = await apost_with_retry(
+                endpoint, json=payload, headers=headers, base_url=url, meta=meta, deadline=deadline,
+            )
+        except httpx.HTTPError as e:
+            logger.exception("SiliconFlow async request failed: %s", e)
+            raise ValueError(f"SiliconFlow request failed: {e}") from e
+
+        if resp.status_code != 200:
+            raise ValueError(
+                f"SiliconFlow API HTTP {resp.status_code}: {resp.text[:500]}"
+            )
+
+        try:
+            data = resp.json()
+        except Exception as e:
+            logger.exception("SiliconFlow response JSON parse failed: %s", e)
+            raise ValueError(f"SiliconFlow response not valid JSON: {e}") from e
+        await _asettle_usage(url, payload, data)
+        _record_usage(meta, data.get("usage") if isinstance(data, dict) else None)
+        content = _parse_completion(data, meta)
+    except Exception:
+        _observe(url, payload, "async", started, ok=False, data=data)
+        raise
+    _observe(url, payload, "async", started, ok=True, data=data)
+    return content
+
+
+def _observe(url: str, payload: Dict[str, Any], mode: str, started: float, ok: bool, data=None) -> None:
+    """记录调用耗时（含排队与重试）与响应 usage 中的令牌数，耗时同时计入当前请求的 Server-Timing"""
+    usage = data.get("usage") if isinstance(data, dict) else None
+    elapsed = time.monotonic() - started
+    metrics.observe_llm_call(urlsplit(url).netloc or url, payload["model"], mode, elapsed, ok, usage)
+    timing.add("llm", elapsed)
+
+
+def _settle_usage(url: str, payload: Dict[str, Any], data: Dict[str, Any]) -> None:
+    """按响应 usage 修正 TPM 令牌桶的预扣量"""
+    throttle = get_throttle(url)
+    if throttle is not None and isinstance(data, dict):
+        throttle.settle(estimate_tokens(payload), data.get("usage"))
+
+
+async def _asettle_usage(url: str, payload: Dict[str, Any], data: Dict[str, Any]) -> None:
+    """_settle_usage 的异步版本"""
+    throttle = get_throttle(url)
+    if throttle is not None and isinstance(data, dict):
+        await throttle.asettle(estimate_tokens(payload), data.get("usage"))
 
+
+def _record_usage(meta: Optional[Dict[str, Any]], usage) -> None:
+    """把响应 usage 中的令牌数写入调用元信息"""
+    if meta is not None and isinstance(usage, dict):
+        meta["usage"] = {k: usage[k] for k in ("prompt_tokens", "completion_tokens", "total_tokens") if k in usage}
+
+
+def _parse_completion(data: Dict[str, Any], meta: Optional[Dict[str, Any]] = None) -> str:
+    """从非流式响应 JSON 中取出 choices[0].message.content；传入 meta 时写入 finish_reason"""
     choices = data.get("choices")
     if not choices or not isinstance(choices, list):
         raise ValueError("SiliconFlow response missing or empty choices")
@@ -78,6 +218,9 @@ def chat_completion(
     if not isinstance(first, dict):
         raise ValueError("SiliconFlow choices[0] is not an object")
 
+    if meta is not None and first.get("finish_reason"):
+        meta["finish_reason"] = first["finish_reason"]
+
     message = first.get("message")
     if not message or not isinstance(message, dict):
         raise ValueError("SiliconFlow choices[0].message missing or invalid")
@@ -86,3 +229,87 @@ def chat_completion(
     if content is None:
         content = ""
     return str(content).strip()
+
+
+def chat_completion_stream(
+    messages: List[Dict[str, str]],
+    *,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    model: Optional[str] = None,
+    temperature: float = 0.2,
+    meta: Optional[Dict[str, Any]] = None,
+    deadline: Optional[Deadline] = None,
+) -> Iterator[str]:
+    """
+    调用 SiliconFlow chat/completions（SSE 流式），逐块产出 assistant 的 content 增量。
+
+    参数同 chat_completion。重试只发生在建立流之前；流开始后的中断以 ValueError 抛出。
+    生成器被提前关闭（如客户端断开）时会关闭底层连接，停止继续消费 token。
+    meta 额外写入 chunks / first_token_s / finish_reason；连接在 [DONE] 与 finish_reason 之前结束时
+    finish_reason 记为 "incomplete"（输出被截断，调用方不应缓存）。
+    传入 deadline 时每收到一块都检查剩余预算与取消标记，耗尽即关闭连接并抛出 DeadlineExceeded。
+    """
+    url, endpoint, payload, headers = _prepare_request(
+        messages, api_key=api_key, base_url=base_url, model=model,
+        temperature=temperature, stream=True,
+    )
+    started = time.monotonic()
+    try:
+        resp = _post(url, endpoint, payload, headers, meta, stream=True, deadline=deadline)
+    except Exception:
+        _observe(url, payload, "stream", started, ok=False)
+        raise
+    resp.encoding = "utf-8"
+
+    chunks = 0
+    usage = None
+    completed = False
+    finished = False
+    try:
+        for line in resp.iter_lines(decode_unicode=True):
+            if deadline is not None:
+                deadline.check("LLM stream")
+            if not line or not line.startswith("data:"):
+                # 空行为事件分隔符，":" 开头为注释/心跳
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                finished = True
+                break
+            try:
+                event = json.loads(data)
+            except ValueError as e:
+                raise ValueError(f"SiliconFlow stream chunk not valid JSON: {data[:200]}") from e
+
+            if event.get("usage"):
+                usage = event["usage"]
+                _record_usage(meta, usage)
+            choices = event.get("choices") or []
+            if not choices or not isinstance(choices[0], dict):
+                continue
+            first = choices[0]
+            if meta is not None and first.get("finish_reason"):
+                meta["finish_reason"] = first["finish_reason"]
+            delta = (first.get("delta") or {}).get("content")
+            if not delta:
+                continue
+
+            chunks += 1
+            if meta is not None:
+                meta["chunks"] = chunks
+                if chunks == 1:
+                    meta["first_token_s"] = round(time.monotonic() - started, 3)
+            yield delta
+        completed = True
+        if meta is not None and not finished and not meta.get("finish_reason"):
+            meta["finish_reason"] = "incomplete"
+    except requests.RequestException as e:
+        if deadline is not None and deadline.expired():
+            raise deadline.error("LLM stream") from e
+        logger.exception("SiliconFlow stream interrupted: %s", e)
+        raise ValueError(f"SiliconFlow stream interrupted: {e}") from e
+    finally:
+        resp.close()
+        release_stream(resp)
+        _observe(url, payload, "stream", started, ok=completed, data={"usage": usage})
@@ -1,3 +1,624 @@
+import os
+import json
+import time
+import random
+import shutil
+import asyncio
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from unittest import mock
+
+import requests
 from django.test import TestCase
 
-# Create your tests here.
+from m3_llm_providers import cache, ratelimit, router, transport
+from m3_llm_providers.siliconflow_client import achat_completion, chat_completion, chat_completion_stream
+from m3_llm_providers.mock_server import MockConfig, MockLLMServer, generate_scene, generate_svg, parse_distribution
+
+
+def reset_providers():
+    """丢弃 m3 / m6 的进程级单例（路由、缓存、限流、连接池、单飞），下次使用时按当前环境变量重建"""
+    from m6_orchestrator import singleflight
+
+    router._router = None
+    cache._cache = None
+    singleflight._singleflight = None
+    with ratelimit._throttles_lock:
+        ratelimit._throttles.clear()
+    transport.close_sessions()
+
+
+class MockLLMMixin:
+    """
+    测试用：类级启动本地模拟 LLM 服务，环境变量指向它（缓存只用内存层、不重试、无对冲），
+    每个用例开始前重置模拟服务配置、计数与 m3 单例。用例用 self.configure_mock(...) 注入延迟与故障。
+    """
+
+    env = {}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.mock = MockLLMServer(MockConfig(latency="fixed:0"))
+        cls.base_url = cls.mock.start()
+        cls._env = mock.patch.dict(os.environ, {
+            "SILICONFLOW_BASE_URL": cls.base_url,
+            "SILICONFLOW_API_KEY": "mock",
+            "LLM_CACHE_PATH": "",
+            "SILICONFLOW_MAX_RETRIES": "0",
+            "SILICONFLOW_HEDGE": "0",
+            **cls.env,
+        })
+        cls._env.start()
+        for name in ("SILICONFLOW_ENDPOINTS", "SILICONFLOW_RPM", "SILICONFLOW_TPM"):
+            os.environ.pop(name, None)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._env.stop()
+        cls.mock.stop()
+        reset_providers()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.configure_mock()
+        with self.mock._lock:
+            for key in self.mock.stats:
+                self.mock.stats[key] = 0
+        reset_providers()
+
+    def configure_mock(self, **options):
+        """替换模拟服务配置（MockConfig 字段），未给出的字段取默认值，延迟默认为 0"""
+        options.setdefault("latency", "fixed:0")
+        self.mock.config = MockConfig(**options)
+        self.mock.sample_latency = parse_distribution(self.mock.config.latency)
+
+
+class _ScriptedHandler(BaseHTTPRequestHandler):
+    """按 server.script 返回固定的 SSE 事件（逐条作为 chunked 分块发送，正常结束）"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for event in self.server.script:
+            data = f"data: {event if isinstance(event, str) else json.dumps(event)}\n\n".encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def _chunk(content, finish_reason=None):
+    return {"choices": [{"delta": {"content": content} if content else {}, "finish_reason": finish_reason}]}
+
+
+class _StatusHandler(BaseHTTPRequestHandler):
+    """依次返回 server.statuses 中的状态码（用完后一直返回最后一个），200 时返回一条完整回复"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.server.requests += 1
+        status = self.server.statuses.pop(0) if len(self.server.statuses) > 1 else self.server.statuses[0]
+        body = json.dumps({"choices": [{"message": {"content": "<svg/>"}, "finish_reason": "stop"}]}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(handler, **attrs) -> ThreadingHTTPServer:
+    """在后台线程启动测试 HTTP 服务；attrs 设置到 server 上供 handler 读取"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    for name, value in attrs.items():
+        setattr(server, name, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class StreamCompletionTests(TestCase):
+    """chat_completion_stream：finish_reason 与截断标记"""
+
+    def stream(self, script):
+        server = serve(_ScriptedHandler, script=script)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        meta = {}
+        with mock.patch.dict(os.environ, {"SILICONFLOW_CONCURRENCY_ADAPTIVE": "0"}):
+            reset_providers()
+            text = "".join(chat_completion_stream(
+                [{"role": "user", "content": "x"}], api_key="k", base_url=f"http://127.0.0.1:{server.server_port}/v1",
+                meta=meta,
+            ))
+        return text, meta
+
+    def test_complete_stream_records_stop(self):
+        text, meta = self.stream([_chunk("<svg>"), _chunk("</svg>"), _chunk(None, "stop"), "[DONE]"])
+        self.assertEqual(text, "<svg></svg>")
+        self.assertEqual(meta["finish_reason"], "stop")
+        self.assertEqual(meta["chunks"], 2)
+
+    def test_stream_ending_without_done_is_incomplete(self):
+        text, meta = self.stream([_chunk("<svg><rect")])
+        self.assertEqual(text, "<svg><rect")
+        self.assertEqual(meta["finish_reason"], "incomplete")
+
+    def test_length_finish_reason_is_kept(self):
+        _, meta = self.stream([_chunk("<svg>"), _chunk(None, "length"), "[DONE]"])
+        self.assertEqual(meta["finish_reason"], "length")
+
+
+class CompletionFinishReasonTests(MockLLMMixin, TestCase):
+    """非流式调用把 finish_reason 写入调用元信息"""
+
+    def test_finish_reason_recorded(self):
+        meta = {}
+        chat_completion([{"role": "user", "content": "x"}], meta=meta)
+        self.assertEqual(meta["finish_reason"], "stop")
+
+        self.configure_mock(rate_truncate=1.0)
+        meta = {}
+        chat_completion([{"role": "user", "content": "x"}], meta=meta)
+        self.assertEqual(meta["finish_reason"], "length")
+
+
+class AdaptiveConcurrencyTests(TestCase):
+    """AIMD 并发窗口：默认关闭；启用后 429 乘性缩小、成功加性增大，窗口满时排队超时失败"""
+
+    def throttle(self, **env):
+        with mock.patch.dict(os.environ, env):
+            for name in ("SILICONFLOW_RPM", "SILICONFLOW_TPM", "SILICONFLOW_CONCURRENCY_ADAPTIVE"):
+                if name not in env:
+                    os.environ.pop(name, None)
+            reset_providers()
+            throttle = ratelimit.get_throttle("http://llm.test/v1")
+        self.addCleanup(reset_providers)
+        return throttle
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(self.throttle())
+
+    def test_enabled_window_uses_documented_bounds(self):
+        window = self.throttle(SILICONFLOW_CONCURRENCY_ADAPTIVE="1").window
+        self.assertEqual((window.window, window.maximum), (8, 64))
+        self.assertEqual(window.latency_factor, 0)
+
+    def test_throttle_status_halves_window(self):
+        window = ratelimit.AdaptiveConcurrency(initial=8)
+        window.acquire(1)
+        window.release(429, None)
+        self.assertEqual(window.window, 4)
+        window.acquire(1)
+        window.release(503, None)
+        self.assertEqual(window.window, 4)  # 冷却期内同一波拥塞只缩小一次
+
+    def test_slow_success_grows_window_by_default(self):
+        window = ratelimit.AdaptiveConcurrency(initial=8)
+        for latency in [0.1] * 10 + [5.0]:
+            window.acquire(1)
+            window.release(200, latency)
+        self.assertGreater(window.window, 8)
+
+    def test_latency_factor_opt_in_shrinks_on_spike(self):
+        window = ratelimit.AdaptiveConcurrency(initial=8, latency_factor=3)
+        for latency in [0.1] * 10 + [5.0]:
+            window.acquire(1)
+            window.release(200, latency)
+        self.assertLess(window.window, 8)
+
+    def test_full_window_queue_times_out(self):
+        throttle = ratelimit.Throttle(window=ratelimit.AdaptiveConcurrency(initial=1), max_wait=0.05)
+        slot = throttle.acquire(0)
+        with self.assertRaisesRegex(ValueError, "queue timeout"):
+            throttle.acquire(0)
+        slot.release(200)
+        throttle.acquire(0).release(200)
+
+
+class RateLimiterTests(TestCase):
+    """SQLite 令牌桶：容量为一分钟配额，跨进程（同一文件）共享，超额时返回等待秒数"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.path = os.path.join(self.dir, "ratelimit.sqlite3")
+
+    def test_rpm_bucket(self):
+        limiter = ratelimit.RateLimiter("sf", rpm=2, path=self.path)
+        self.assertEqual(limiter.try_acquire(0), 0)
+        self.assertEqual(limiter.try_acquire(0), 0)
+        self.assertAlmostEqual(limiter.try_acquire(0), 30, delta=0.5)
+
+    def test_bucket_shared_through_file(self):
+        ratelimit.RateLimiter("sf", rpm=1, path=self.path).try_acquire(0)
+        self.assertGreater(ratelimit.RateLimiter("sf", rpm=1, path=self.path).try_acquire(0), 0)
+        self.assertEqual(ratelimit.RateLimiter("other", rpm=1, path=self.path).try_acquire(0), 0)
+
+    def test_tpm_rejection_does_not_consume(self):
+        limiter = ratelimit.RateLimiter("sf", rpm=10, tpm=1000, path=self.path)
+        self.assertEqual(limiter.try_acquire(800), 0)
+        self.assertGreater(limiter.try_acquire(800), 0)
+        self.assertEqual(limiter.try_acquire(150), 0)  # 被拒绝的请求没有扣减 RPM / TPM
+
+    def test_settle_refunds_unused_tokens(self):
+        limiter = ratelimit.RateLimiter("sf", tpm=1000, path=self.path)
+        limiter.try_acquire(1000)
+        limiter.settle(-600)
+        self.assertEqual(limiter.try_acquire(500), 0)
+
+    def test_oversized_request_takes_whole_bucket(self):
+        limiter = ratelimit.RateLimiter("sf", tpm=100, path=self.path)
+        self.assertEqual(limiter.try_acquire(5000), 0)
+
+    def test_throttle_gives_up_beyond_max_wait(self):
+        throttle = ratelimit.Throttle(ratelimit.RateLimiter("sf", rpm=1, path=self.path), max_wait=1)
+        meta = {}
+        throttle.acquire(0, meta).release(200)
+        with self.assertRaisesRegex(ValueError, "rate limit wait exceeds"):
+            throttle.acquire(0)
+
+    def test_async_acquire_keeps_sqlite_off_the_event_loop(self):
+        limiter = ratelimit.RateLimiter("sf", tpm=1000, path=self.path)
+        throttle = ratelimit.Throttle(limiter, max_wait=1)
+        threads = []
+        for name in ("try_acquire", "settle"):
+            original = getattr(limiter, name)
+
+            def record(*args, _original=original):
+                threads.append(threading.current_thread())
+                return _original(*args)
+
+            setattr(limiter, name, record)
+
+        async def call():
+            loop_thread = threading.current_thread()
+            (await throttle.aacquire(1000)).release(200)
+            await throttle.asettle(1000, {"total_tokens": 400})
+            return loop_thread
+
+        loop_thread = asyncio.run(call())
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(loop_thread, threads)
+        self.assertEqual(limiter.try_acquire(600), 0)  # 结算退还的 600 个 token 可再用
+
+    def test_estimate_tokens(self):
+        payload = {"messages": [{"content": "x" * 100}], "max_tokens": 50}
+        self.assertEqual(ratelimit.estimate_tokens(payload), 100)
+
+
+class TransportRetryTests(TestCase):
+    """post_with_retry：连接池复用、429 / 5xx / 连接失败按退避重试"""
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {"SILICONFLOW_CONCURRENCY_ADAPTIVE": "0"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        reset_providers()
+        self.addCleanup(reset_providers)
+        self.config = transport.TransportConfig(max_retries=2, backoff_base=0, backoff_max=0)
+
+    def post(self, statuses, config=None):
+        server = serve(_StatusHandler, statuses=list(statuses), requests=0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base_url = f"http://127.0.0.1:{server.server_port}/v1"
+        meta = {}
+        resp = transport.post_with_retry(
+            f"{base_url}/chat/completions", json={}, headers={}, base_url=base_url,
+            config=config or self.config, meta=meta,
+        )
+        return resp, meta, server.requests
+
+    def test_session_is_shared_per_base_url(self):
+        session = transport.get_session("http://llm.test/v1")
+        self.assertIs(transport.get_session("http://llm.test/v1/"), session)
+        self.assertIsNot(transport.get_session("http://other.test/v1"), session)
+
+    def test_transient_statuses_are_retried(self):
+        resp, meta, requests_seen = self.post([503, 429, 200])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(requests_seen, 3)
+        self.assertEqual((meta["attempts"], meta["last_status"]), (3, 200))
+
+    def test_last_response_returned_when_retries_exhausted(self):
+        resp, meta, requests_seen = self.post([500])
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual((requests_seen, meta["attempts"]), (3, 3))
+
+    def test_client_errors_are_not_retried(self):
+        resp, meta, requests_seen = self.post([400])
+        self.assertEqual((resp.status_code, requests_seen, meta["attempts"]), (400, 1, 1))
+
+    def test_connection_error_retried_then_raised(self):
+        server = serve(_StatusHandler, statuses=[200], requests=0)
+        port = server.server_port
+        server.shutdown()
+        server.server_close()
+        meta = {}
+        with self.assertRaises(requests.ConnectionError):
+            transport.post_with_retry(
+                f"http://127.0.0.1:{port}/v1/chat/completions", json={}, headers={},
+                base_url=f"http://127.0.0.1:{port}/v1", config=self.config, meta=meta,
+            )
+        self.assertEqual(meta["attempts"], 3)
+
+    def test_retry_after_parsing(self):
+        self.assertEqual(transport.parse_retry_after("3"), 3.0)
+        self.assertIsNone(transport.parse_retry_after("soon"))
+        self.assertEqual(transport.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+
+    def test_backoff_is_capped_and_honours_retry_after(self):
+        self.assertLessEqual(transport.backoff_delay(10, 0.5, 2.0), 2.0)
+        self.assertEqual(transport.backoff_delay(0, 0, 20, retry_after=5), 5)
+        self.assertEqual(transport.backoff_delay(0, 0, 2, retry_after=5), 2)
+
+
+class AsyncCompletionTests(MockLLMMixin, TestCase):
+    """achat_completion：同一事件循环内并发调用，复用 AsyncClient"""
+
+    def test_concurrent_calls_overlap(self):
+        self.configure_mock(latency="fixed:0.3")
+
+        async def main():
+            started = time.monotonic()
+            results = await asyncio.gather(*[
+                achat_completion([{"role": "user", "content": f"图 {i}"}]) for i in range(10)
+            ])
+            return results, time.monotonic() - started
+
+        results, elapsed = asyncio.run(main())
+        self.assertTrue(all(r.startswith("<svg") for r in results))
+        self.assertGreater(self.mock.stats["max_inflight"], 5)
+        self.assertLess(elapsed, 1.5)
+
+    def test_client_is_reused_within_loop(self):
+        async def main():
+            first = transport.get_async_client(self.base_url)
+            second = transport.get_async_client(self.base_url + "/")
+            await first.aclose()
+            return first is second
+
+        self.assertTrue(asyncio.run(main()))
+
+    def test_http_error_raises_value_error(self):
+        self.configure_mock(rate_5xx=1.0)
+        meta = {}
+        with self.assertRaisesRegex(ValueError, "SiliconFlow API HTTP 5"):
+            asyncio.run(achat_completion([{"role": "user", "content": "x"}], meta=meta))
+        self.assertEqual(meta["attempts"], 1)
+
+
+class LLMResponseCacheTests(TestCase):
+    """两级响应缓存：键规范化、L1 LRU、L2 持久化与 TTL / 容量淘汰"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.path = os.path.join(self.dir, "cache.sqlite3")
+
+    def test_key_ignores_dict_order_and_float_noise(self):
+        messages = [{"role": "user", "content": "画图"}]
+        key = cache.make_key("m", messages, 0.2)
+        self.assertEqual(cache.make_key("m", [{"content": "画图", "role": "user"}], 0.20000001), key)
+        self.assertNotEqual(cache.make_key("m", messages, 0.3), key)
+        self.assertNotEqual(cache.make_key("other", messages, 0.2), key)
+
+    def test_memory_tier_is_lru(self):
+        store = cache.LLMResponseCache(memory_size=2, path="")
+        store.set("a", "1")
+        store.set("b", "2")
+        store.get("a")
+        store.set("c", "3")
+        self.assertEqual(store.get("a"), ("1", "memory"))
+        self.assertEqual(store.get("b"), (None, None))
+        self.assertEqual(store.stats()["memory_entries"], 2)
+
+    def test_disk_tier_survives_new_instance(self):
+        cache.LLMResponseCache(path=self.path).set("k", "<svg/>")
+        store = cache.LLMResponseCache(path=self.path)
+        self.assertEqual(store.get("k"), ("<svg/>", "disk"))
+        self.assertEqual(store.get("k"), ("<svg/>", "memory"))
+        stats = store.stats()
+        self.assertEqual((stats["disk_hits"], stats["memory_hits"], stats["hit_ratio"]), (1, 1, 1.0))
+
+    def test_expired_entries_are_dropped(self):
+        store = cache.LLMResponseCache(path=self.path, ttl=0.05)
+        store.set("k", "v")
+        time.sleep(0.1)
+        self.assertEqual(store.get("k"), (None, None))
+        self.assertEqual(cache.LLMResponseCache(path=self.path).prune(), 0)
+
+    def test_prune_evicts_least_recently_used(self):
+        store = cache.LLMResponseCache(memory_size=0, path=self.path, max_entries=2)
+        for key in ("a", "b", "c"):
+            store.set(key, key)
+            time.sleep(0.01)
+        store.get("a")
+        self.assertEqual(store.prune(), 1)
+        self.assertEqual([store.get(k)[0] for k in ("a", "b", "c")], ["a", None, "c"])
+
+    def test_empty_values_are_not_cached(self):
+        store = cache.LLMResponseCache(path="")
+        store.set("k", "")
+        self.assertEqual(store.stats()["sets"], 0)
+
+    def test_disabled_by_env(self):
+        with mock.patch.dict(os.environ, {"LLM_CACHE_ENABLED": "0"}):
+            self.assertIsNone(cache.get_cache())
+
+
+class EndpointRouterTests(MockLLMMixin, TestCase):
+    """多端点路由：按 EWMA 选择、熔断、失败转移与对冲"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.backup = MockLLMServer(MockConfig(latency="fixed:0"))
+        cls.backup.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.backup.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.configure_backup()
+        patcher = mock.patch.object(router.random, "random", return_value=1.0)  # 关闭随机探索
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def configure_backup(self, **options):
+        options.setdefault("latency", "fixed:0")
+        self.backup.config = MockConfig(**options)
+        self.backup.sample_latency = parse_distribution(self.backup.config.latency)
+        with self.backup._lock:
+            for key in self.backup.stats:
+                self.backup.stats[key] = 0
+
+    def make_router(self, **options):
+        options.setdefault("hedge_delay", 0.2)
+        options.setdefault("hedge_min_delay", 0.1)
+        # main 的 EWMA 较小，默认选中
+        endpoints = [
+            router.Endpoint("main", self.base_url, "m", "mock", ewma=0.01),
+            router.Endpoint("backup", self.backup.base_url, "m", "mock", ewma=0.02),
+        ]
+        return router.EndpointRouter(endpoints, **options)
+
+    def ask(self, r, **kwargs):
+        meta = {}
+        content = r.chat([{"role": "user", "content": "画一个矩形"}], meta=meta, **kwargs)
+        return content, meta
+
+    def test_choose_prefers_unsampled_then_fastest(self):
+        r = self.make_router()
+        main, backup = r.endpoints
+        self.assertIs(r.choose(), main)
+        backup.ewma = None
+        self.assertIs(r.choose(), backup)
+        self.assertIs(r.choose(exclude=(backup,)), main)
+        self.assertIsNone(r.choose(exclude=(main, backup)))
+
+    def test_unhealthy_endpoint_is_skipped_until_cooldown(self):
+        r = self.make_router(unhealthy_after=2, unhealthy_cooldown=0.1)
+        main = r.endpoints[0]
+        r.record(main, None, ok=False)
+        self.assertIs(r.choose(), main)
+        r.record(main, None, ok=False)
+        self.assertEqual(r.choose().name, "backup")
+        time.sleep(0.15)
+        self.assertIs(r.choose(), main)
+
+    def test_hedge_delay_uses_p95_with_enough_samples(self):
+        r = self.make_router(hedge_delay=5, hedge_min_samples=20)
+        main = r.endpoints[0]
+        self.assertEqual(r.hedge_after(main), 5)
+        for i in range(20):
+            r.record(main, 0.2 + i / 100, ok=True)
+        self.assertAlmostEqual(r.hedge_after(main), 0.39)
+
+    def test_failover_to_healthy_endpoint(self):
+        self.configure_mock(rate_5xx=1.0)
+        content, meta = self.ask(self.make_router())
+        self.assertTrue(content.startswith("<svg"))
+        self.assertEqual((meta["failover_from"], meta["endpoint"]), ("main", "backup"))
+        self.assertEqual(self.mock.stats["errors"], 1)
+
+    def test_slow_primary_is_hedged(self):
+        self.configure_mock(latency="fixed:2")
+        started = time.monotonic()
+        content, meta = self.ask(self.make_router(), hedge=True)
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertTrue(content.startswith("<svg"))
+        hedge = meta["hedge"]
+        self.assertEqual((hedge["fired"], hedge["reason"], hedge["winner"], hedge["cancelled"]), (True, "slow", "hedge", "main"))
+        self.assertEqual(meta["endpoint"], "backup")
+
+    def test_fast_primary_is_not_hedged(self):
+        _, meta = self.ask(self.make_router(), hedge=True)
+        self.assertEqual((meta["hedge"]["fired"], meta["hedge"]["winner"]), (False, "primary"))
+        self.assertEqual(self.backup.stats["requests"], 0)
+
+    def test_async_hedge(self):
+        self.configure_mock(latency="fixed:2")
+        meta = {}
+        started = time.monotonic()
+        content = asyncio.run(self.make_router().achat([{"role": "user", "content": "x"}], meta=meta, hedge=True))
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertTrue(content.startswith("<svg"))
+        self.assertEqual((meta["hedge"]["winner"], meta["endpoint"]), ("hedge", "backup"))
+
+    def test_load_endpoints_from_env(self):
+        endpoints = json.dumps([
+            {"name": "a", "base_url": "http://a/v1", "model": "qa"},
+            {"base_url": "http://b/v1", "api_key_env": "BACKUP_KEY"},
+        ])
+        with mock.patch.dict(os.environ, {"SILICONFLOW_ENDPOINTS": endpoints, "BACKUP_KEY": "b-key"}):
+            a, b = router.load_endpoints()
+        self.assertEqual((a.name, a.model, a.api_key), ("a", "qa", "mock"))
+        self.assertEqual((b.name, b.api_key), ("endpoint-1", "b-key"))
+        with mock.patch.dict(os.environ, {"SILICONFLOW_ENDPOINTS": "[{"}):
+            with self.assertRaises(ValueError):
+                router.load_endpoints()
+
+
+class MockServerTests(MockLLMMixin, TestCase):
+    """本地模拟服务：确定性输出、故障注入、并发上限与统计"""
+
+    def post(self, **body):
+        body.setdefault("messages", [{"role": "user", "content": "画一个矩形"}])
+        return requests.post(f"{self.base_url}/chat/completions", json=body, timeout=5)
+
+    def test_output_is_deterministic_per_prompt(self):
+        self.assertEqual(generate_svg("a"), generate_svg("a"))
+        self.assertNotEqual(generate_svg("a"), generate_svg("b"))
+        self.assertEqual(json.loads(generate_scene("a", shapes=5))["size"], [800, 600])
+        content = self.post().json()["choices"][0]["message"]["content"]
+        self.assertEqual(content, generate_svg("画一个矩形"))
+
+    def test_markdown_wrapping(self):
+        self.configure_mock(markdown_ratio=1.0)
+        self.assertIn("```xml", self.post().json()["choices"][0]["message"]["content"])
+
+    def test_injected_faults(self):
+        self.configure_mock(rate_429=1.0, retry_after=2)
+        resp = self.post()
+        self.assertEqual((resp.status_code, resp.headers["Retry-After"]), (429, "2"))
+        self.configure_mock(rate_5xx=1.0)
+        self.assertIn(self.post().status_code, (500, 502, 503))
+        self.assertEqual((self.mock.stats["throttled"], self.mock.stats["errors"]), (1, 1))
+
+    def test_concurrency_limit_returns_429(self):
+        self.configure_mock(latency="fixed:0.3", max_concurrency=1)
+        with ThreadPoolExecutor(3) as pool:
+            statuses = sorted(pool.map(lambda _: self.post().status_code, range(3)))
+        self.assertEqual(statuses[0], 200)
+        self.assertIn(429, statuses)
+
+    def test_latency_distributions(self):
+        rng = random.Random(1)
+        self.assertEqual(parse_distribution("fixed:0.5")(rng), 0.5)
+        self.assertTrue(0.2 <= parse_distribution("uniform:0.2,1")(rng) <= 1)
+        self.assertGreaterEqual(parse_distribution("pareto:0.1,2")(rng), 0.1)
+        with self.assertRaises(ValueError):
+            parse_distribution("gamma:1")
+
+    def test_stats_endpoint(self):
+        self.post()
+        stats = requests.get(f"{self.base_url}/stats", timeout=5).json()
+        self.assertEqual((stats["requests"], stats["ok"], stats["inflight"]), (1, 1, 0))
@@ -0,0 +1,341 @@
+"""
+LLM HTTP 传输层：按 base_url 复用的进程级连接池 + 抖动指数退避重试
+职责：只负责把请求可靠地发出去并拿回 Response，不解析业务内容。
+同步路径基于 requests；异步路径（apost_with_retry）基于 httpx.AsyncClient，按事件循环复用。
+每次尝试前经 ratelimit.Throttle 排队（令牌桶 + 自适应并发窗口），见 ratelimit 模块。
+
+可通过环境变量调整（均为可选）：
+- SILICONFLOW_POOL_SIZE        每个 base_url 的连接池大小，默认 16
+- SILICONFLOW_ASYNC_POOL_SIZE  异步客户端每个 base_url 的最大连接数，默认 256
+- SILICONFLOW_CONNECT_TIMEOUT  建连超时（秒），默认 10
+- SILICONFLOW_READ_TIMEOUT     读超时（秒），默认 120
+- SILICONFLOW_MAX_RETRIES      瞬时错误（429/5xx/连接失败）最大重试次数，默认 3
+- SILICONFLOW_BACKOFF_BASE     退避基数（秒），默认 0.5
+- SILICONFLOW_BACKOFF_MAX      单次退避上限（秒），默认 20
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import weakref
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.deadline import Deadline
+from .ratelimit import get_throttle, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 可重试的 HTTP 状态码：限流 + 网关/服务端瞬时错误
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass
+class TransportConfig:
+    """传输层配置"""
+    pool_size: int = 16
+    async_pool_size: int = 256
+    connect_timeout: float = 10.0
+    read_timeout: float = 120.0
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 20.0
+
+    @classmethod
+    def from_env(cls) -> "TransportConfig":
+        return cls(
+            pool_size=max(1, _env_int("SILICONFLOW_POOL_SIZE", cls.pool_size)),
+            async_pool_size=max(1, _env_int("SILICONFLOW_ASYNC_POOL_SIZE", cls.async_pool_size)),
+            connect_timeout=_env_float("SILICONFLOW_CONNECT_TIMEOUT", cls.connect_timeout),
+            read_timeout=_env_float("SILICONFLOW_READ_TIMEOUT", cls.read_timeout),
+            max_retries=max(0, _env_int("SILICONFLOW_MAX_RETRIES", cls.max_retries)),
+            backoff_base=_env_float("SILICONFLOW_BACKOFF_BASE", cls.backoff_base),
+            backoff_max=_env_float("SILICONFLOW_BACKOFF_MAX", cls.backoff_max),
+        )
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        """requests 使用的 (connect, read) 超时元组"""
+        return (self.connect_timeout, self.read_timeout)
+
+
+# base_url -> (pid, Session)；记录 pid 以免 gunicorn fork 后子进程共用父进程的 socket
+_sessions: Dict[str, Tuple[int, requests.Session]] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(base_url: str, pool_size: Optional[int] = None) -> requests.Session:
+    """获取 base_url 对应的进程级 keep-alive Session（首次调用时创建）"""
+    key = base_url.rstrip("/")
+    pid = os.getpid()
+    with _sessions_lock:
+        entry = _sessions.get(key)
+        if entry is not None and entry[0] == pid:
+            return entry[1]
+
+        size = pool_size or TransportConfig.from_env().pool_size
+        session = requests.Session()
+        # 重试由 post_with_retry 统一处理，适配器层不重试
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _sessions[key] = (pid, session)
+        logger.info("Created pooled HTTP session for %s (pool_size=%s)", key, size)
+        return session
+
+
+def close_sessions() -> None:
+    """关闭所有连接池（测试或进程退出时使用）"""
+    with _sessions_lock:
+        for _, session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头：支持秒数与 HTTP-date 两种格式，无法解析时返回 None"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None) -> float:
+    """
+    计算第 attempt 次重试前的等待时间（full jitter 指数退避）。
+    服务端给出 Retry-After 时以其为下限，避免在限流窗口内提前重试。
+    """
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, cap))
+    return delay
+
+
+def post_with_retry(
+    url: str,
+    *,
+    json: Any,
+    headers: Dict[str, str],
+    base_url: str,
+    config: Optional[TransportConfig] = None,
+    meta: Optional[Dict[str, Any]] = None,
+    stream: bool = False,
+    deadline: Optional[Deadline] = None,
+) -> requests.Response:
+    """
+    通过连接池 POST，遇到 429/5xx 或连接失败时按退避策略重试。
+
+    读超时（ReadTimeout）不重试：此时请求大概率已在服务端执行，重试只会放大尾延迟。
+    重试耗尽后返回最后一次的 Response（状态码由调用方判断）或抛出最后一次的异常。
+
+    stream=True 且返回 200 时，并发槽随 Response 交给调用方，读完流后须调用 release_stream(resp)。
+
+    :param meta: 可选，传入 dict 时写入 attempts / retry_wait_s / last_status 与 throttle
+    :param deadline: 可选，运行截止时间：超时取 min(配置值, 剩余预算)，退避会超出预算时不再重试，
+                     预算耗尽或被取消时抛出 DeadlineExceeded
+    """
+    cfg = config or TransportConfig.from_env()
+    session = get_session(base_url, cfg.pool_size)
+    throttle = get_throttle(base_url)
+    tokens = estimate_tokens(json) if throttle is not None else 0
+    waited = 0.0
+    attempt = 0
+
+    while True:
+        timeout = cfg.timeout
+        if deadline is not None:
+            timeout = (
+                deadline.timeout(cfg.connect_timeout, "LLM request"),
+                deadline.timeout(cfg.read_timeout, "LLM request"),
+            )
+        slot = throttle.acquire(tokens, meta, deadline=deadline) if throttle is not None else None
+        try:
+            resp = session.post(url, json=json, headers=headers, timeout=timeout, stream=stream)
+        except requests.RequestException as e:
+            if slot is not None:
+                slot.release(None)
+            if deadline is not None and deadline.expired():
+                _fill_meta(meta, attempt + 1, waited, None)
+                raise deadline.error("LLM request") from e
+            if not isinstance(e, requests.ConnectionError) or attempt >= cfg.max_retries:
+                _fill_meta(meta, attempt + 1, waited, None)
+                raise
+            delay = backoff_delay(attempt, cfg.backoff_base, cfg.backoff_max)
+            logger.warning(
+                "LLM request connection error (attempt %s/%s), retrying in %.2fs: %s",
+                attempt + 1, cfg.max_retries + 1, delay, e,
+            )
+        except BaseException:
+            if slot is not None:
+                slot.release(None)
+            raise
+        else:
+            if slot is not None:
+                if stream and resp.status_code == 200:
+                    # 流式：响应头到达时间作为延迟信号，槽位持有到流读完
+                    slot.first_byte_s = time.monotonic() - slot.started
+                    resp.throttle_slot = slot
+                else:
+                    slot.release(resp.status_code)
+            if resp.status_code not in RETRYABLE_STATUS or attempt >= cfg.max_retries:
+                _fill_meta(meta, attempt + 1, waited, resp.status_code)
+                return resp
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            delay = backoff_delay(attempt, cfg.backoff_base, cfg.backoff_max, retry_after)
+            logger.warning(
+                "LLM request HTTP %s (attempt %s/%s), retrying in %.2fs",
+                resp.status_code, attempt + 1, cfg.max_retries + 1, delay,
+            )
+            resp.close()
+
+        if deadline is not None:
+            deadline.sleep(delay, "LLM retry backoff")
+        else:
+            time.sleep(delay)
+        waited += delay
+        attempt += 1
+
+
+def release_stream(resp) -> None:
+    """流式响应读完（或被关闭）后归还其占用的并发槽；可重复调用"""
+    slot = getattr(resp, "throttle_slot", None)
+    if slot is not None:
+        slot.release(200, getattr(slot, "first_byte_s", None))
+
+
+def _fill_meta(meta: Optional[Dict[str, Any]], attempts: int, waited: float, status: Optional[int]) -> None:
+    if meta is None:
+        return
+    meta["attempts"] = attempts
+    meta["retry_wait_s"] = round(waited, 3)
+    meta["last_status"] = status
+
+
+# 事件循环 -> {base_url: httpx.AsyncClient}；AsyncClient 绑定创建它的事件循环，不能跨循环复用
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_async_client(base_url: str, config: Optional[TransportConfig] = None):
+    """获取当前事件循环下 base_url 对应的 httpx.AsyncClient（首次调用时创建）"""
+    import httpx
+
+    cfg = config or TransportConfig.from_env()
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    key = base_url.rstrip("/")
+    client = clients.get(key)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=cfg.async_pool_size,
+                max_keepalive_connections=min(cfg.pool_size, cfg.async_pool_size),
+            ),
+            timeout=httpx.Timeout(cfg.read_timeout, connect=cfg.connect_timeout),
+        )
+        clients[key] = client
+        logger.info("Created async HTTP client for %s (max_connections=%s)", key, cfg.async_pool_size)
+    return client
+
+
+async def apost_with_retry(
+    url: str,
+    *,
+    json: Any,
+    headers: Dict[str, str],
+    base_url: str,
+    config: Optional[TransportConfig] = None,
+    meta: Optional[Dict[str, Any]] = None,
+    deadline: Optional[Deadline] = None,
+):
+    """post_with_retry 的异步版本：等待与退避期间不占用线程，返回 httpx.Response"""
+    import httpx
+
+    cfg = config or TransportConfig.from_env()
+    client = get_async_client(base_url, cfg)
+    throttle = get_throttle(base_url)
+    tokens = estimate_tokens(json) if throttle is not None else 0
+    waited = 0.0
+    attempt = 0
+
+    while True:
+        slot = await throttle.aacquire(tokens, meta, deadline=deadline) if throttle is not None else None
+        try:
+            if deadline is None:
+                resp = await client.post(url, json=json, headers=headers)
+            else:
+                # 整个请求（含读取响应体）受剩余预算约束
+                deadline.check("LLM request")
+                remaining = deadline.remaining()
+                resp = await asyncio.wait_for(
+                    client.post(url, json=json, headers=headers), None if remaining == float("inf") else remaining,
+                )
+        except asyncio.TimeoutError as e:
+            if slot is not None:
+                slot.release(None)
+            _fill_meta(meta, attempt + 1, waited, None)
+            raise deadline.error("LLM request") from e
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+            if slot is not None:
+                slot.release(None)
+            if attempt >= cfg.max_retries:
+                _fill_meta(meta, attempt + 1, waited, None)
+                raise
+            delay = backoff_delay(attempt, cfg.backoff_base, cfg.backoff_max)
+            logger.warning(
+                "LLM async request connection error (attempt %s/%s), retrying in %.2fs: %s",
+                attempt + 1, cfg.max_retries + 1, delay, e,
+            )
+        except BaseException:
+            # 含 CancelledError：协程被取消时也要归还槽位
+            if slot is not None:
+                slot.release(None)
+            raise
+        else:
+            if slot is not None:
+                slot.release(resp.status_code)
+            if resp.status_code not in RETRYABLE_STATUS or attempt >= cfg.max_retries:
+                _fill_meta(meta, attempt + 1, waited, resp.status_code)
+                return resp
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            delay = backoff_delay(attempt, cfg.backoff_base, cfg.backoff_max, retry_after)
+            logger.warning(
+                "LLM async request HTTP %s (attempt %s/%s), retrying in %.2fs",
+                resp.status_code, attempt + 1, cfg.max_retries + 1, delay,
+            )
+
+        if deadline is not None and delay >= deadline.remaining():
+            raise deadline.error("LLM retry backoff")
+        await asyncio.sleep(delay)
+        waited += delay
+        attempt += 1
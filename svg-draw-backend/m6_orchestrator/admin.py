@@ -1,3 +1,16 @@
 from django.contrib import admin
+from .models import CodegenFlight, RunJob
 
-# 此 app 主要用于服务层，暂不需要 admin
+
+@admin.register(CodegenFlight)
+class CodegenFlightAdmin(admin.ModelAdmin):
+    list_display = ['key', 'status', 'leader_run', 'expires_at', 'updated_at']
+    list_filter = ['status']
+    search_fields = ['key']
+
+
+@admin.register(RunJob)
+class RunJobAdmin(admin.ModelAdmin):
+    list_display = ['run', 'status', 'attempts', 'worker_id', 'lease_expires_at', 'created_at']
+    list_filter = ['status']
+    search_fields = ['run__id', 'worker_id']
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class OrchestratorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'm6_orchestrator'
+
+    def ready(self):
+        from common import metrics
+        from .jobqueue import job_depth
+        # 队列深度在抓取 /metrics 时从 run_jobs 表读取
+        metrics.RUN_JOBS.set_function(job_depth)
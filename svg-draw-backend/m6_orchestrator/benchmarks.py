@@ -0,0 +1,287 @@
+"""
+基准测试工具：统计汇总、结果落盘与对比，以及编排热点的微基准
+由管理命令 bench_pipeline（端到端压测）与 bench_micro（微基准）调用。
+"""
+import os
+import json
+import math
+import time
+import platform
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """最近秩百分位（输入需已排序）"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values) / 100.0) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], elapsed: Optional[float] = None) -> Dict[str, Any]:
+    """延迟列表（秒）汇总为 count / mean / p50 / p95 / p99 / max（毫秒）与吞吐"""
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    summary = {
+        "count": len(values),
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else None,
+    }
+    if elapsed:
+        summary["throughput_rps"] = round(len(values) / elapsed, 2)
+    return summary
+
+
+def environment() -> Dict[str, Any]:
+    """记录运行环境，便于跨次对比"""
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        rev = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_rev": rev,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+@contextmanager
+def bench_database(path: Optional[str] = None, keep: bool = False):
+    """
+    切换到独立的 SQLite 文件并执行迁移，基准数据不写入开发库；退出时删除临时文件。
+    产出实际使用的文件路径。
+    """
+    from django.core.management import call_command
+    from django.db import connection, connections
+
+    if connection.vendor != "sqlite":
+        raise ValueError("Benchmarks currently support SQLite only")
+    db_path = path or os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.sqlite3")
+    connections.close_all()
+    connections["default"].settings_dict["NAME"] = db_path
+    call_command("migrate", verbosity=0, interactive=False)
+    try:
+        yield db_path
+    finally:
+        connections.close_all()
+        if not keep and not path:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+
+
+def write_report(name: str, report: Dict[str, Any], output: Optional[str] = None) -> Path:
+    """写入 JSON 结果；未指定路径时写到 <BASE_DIR>/bench_results/<name>-<时间戳>.json"""
+    if output:
+        path = Path(output)
+    else:
+        path = Path(settings.BASE_DIR) / "bench_results" / f"{name}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], keys=("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "mean_ms")) -> List[str]:
+    """逐项对比两份结果中同名条目的指标，返回可打印的行"""
+    lines = []
+
+    def walk(cur, base, prefix):
+        for name, value in cur.items():
+            other = base.get(name) if isinstance(base, dict) else None
+            if not isinstance(value, dict) or not isinstance(other, dict):
+                continue
+            for key in keys:
+                a, b = value.get(key), other.get(key)
+                if isinstance(a, (int, float)) and isinstance(b, (int, float)) and b:
+                    lines.append(f"{prefix}{name}.{key}: {b} -> {a} ({(a - b) / b * 100:+.1f}%)")
+            walk(value, other, f"{prefix}{name}.")
+
+    walk(current, baseline, "")
+    return lines
+
+
+# ---------- 微基准 ----------
+
+def timeit(fn: Callable[[], Any], min_time: float = 0.5, min_runs: int = 5) -> Dict[str, Any]:
+    """重复执行 fn 直到累计 min_time 秒（且不少于 min_runs 次），返回每次耗时的统计（微秒）"""
+    fn()  # 预热
+    samples = []
+    total = 0.0
+    while total < min_time or len(samples) < min_runs:
+        started = time.perf_counter()
+        fn()
+        cost = time.perf_counter() - started
+        samples.append(cost)
+        total += cost
+    samples.sort()
+    us = lambda v: round(v * 1e6, 2)
+    return {
+        "runs": len(samples),
+        "mean_us": us(total / len(samples)),
+        "p50_us": us(percentile(samples, 50)),
+        "p95_us": us(percentile(samples, 95)),
+        "min_us": us(samples[0]),
+    }
+
+
+def _sample_svg(shapes: int) -> str:
+    from m3_llm_providers.mock_server import generate_svg
+    return generate_svg(f"bench {shapes}", shapes=shapes)
+
+
+def bench_extract(min_time: float) -> Dict[str, Any]:
+    """SVG 提取与校验：纯 SVG / markdown 包裹 / 大文档带前后说明；validate 为良构检查，repair 为截断后的本地修复"""
+    from .svg_repair import extract_svg, validate
+
+    small = _sample_svg(12)
+    large = _sample_svg(2000)
+    cases = {
+        "plain_small": small,
+        "fenced_small": f"好的，以下是 SVG：\n```xml\n{small}\n```\n说明：……",
+        "fenced_large": f"好的，以下是 SVG：\n```svg\n{large}\n```\n" + "说明。" * 200,
+        "no_svg": "抱歉，无法生成。" * 50,
+    }
+    results = {}
+    for name, text in cases.items():
+        stats = timeit(lambda: extract_svg(text), min_time)
+        stats["input_bytes"] = len(text.encode("utf-8"))
+        results[name] = stats
+    for name, svg in (("small", small), ("large", large)):
+        truncated = svg[:len(svg) * 2 // 3]
+        results[f"validate_{name}"] = timeit(lambda: validate(svg), min_time)
+        results[f"repair_{name}"] = timeit(lambda: validate(truncated), min_time)
+        results[f"repair_{name}"]["input_bytes"] = len(truncated.encode("utf-8"))
+    return results
+
+
+def bench_optimize(min_time: float) -> Dict[str, Any]:
+    """SVG 优化（common.svg_optimizer）：小 / 大文档，记录各遍节省的字节数"""
+    from common.svg_optimizer import optimize
+
+    results = {}
+    for name, shapes in (("small", 12), ("large", 2000)):
+        svg = _sample_svg(shapes)
+        stats = timeit(lambda: optimize(svg), min_time)
+        _, report = optimize(svg)
+        stats.update(input_bytes=report["input_bytes"], output_bytes=report["output_bytes"], passes=report["passes"])
+        results[name] = stats
+    return results
+
+
+def bench_geometry(min_time: float, segments: int = 20000) -> Dict[str, Any]:
+    """SVG 几何（common.svg_geometry.measure）：小 / 大文档，以及单条含大量线段与曲线的路径"""
+    from common.svg_geometry import measure
+
+    results = {}
+    for name, shapes in (("small", 12), ("large", 2000)):
+        svg = _sample_svg(shapes)
+        results[name] = timeit(lambda: measure(svg), min_time)
+    steps = ("l3.5 -2", "c4 -6 10 6 14 0", "q6 8 12 0", "a6 4 30 0 1 10 2", "s5 6 10 0")
+    d = "M0 0" + "".join(steps[i % len(steps)] for i in range(segments))
+    svg = f'<svg xmlns="http://www.w3.org/2000/svg"><path d="{d}" stroke="#333"/></svg>'
+    results["path"] = timeit(lambda: measure(svg), min_time)
+    results["path"]["segments"] = segments
+    return results
+
+
+def bench_run_logger(min_time: float, steps: int = 6) -> Dict[str, Any]:
+    """
+    运行日志写入模式：每步即时写库（RunLogger）对比内存缓冲后批量写库（RunJournal，
+    buffered 为运行结束时一次写入，buffered_step 为在步骤边界刷新，即 RUN_LOG_MODE=end / step）。
+    在回滚的事务中执行，不留下数据。
+    """
+    from django.db import connection, transaction
+    from m1_runs.services import RunLogger
+    from m1_runs.journal import RunJournal
+
+    def immediate():
+        run = RunLogger.create_run()
+        RunLogger.update_status(run, "running")
+        for i in range(steps):
+            step = RunLogger.log_step(run, f"step_{i}", input_data={"i": i})
+            RunLogger.start_step(step)
+            RunLogger.end_step(step, output_data={"ok": True})
+        RunLogger.add_artifact(run, "draft_svg", preview_text="<svg/>")
+        RunLogger.update_status(run, "success")
+
+    def buffered(autoflush=False):
+        run = RunLogger.create_run()
+        journal = RunJournal(run, autoflush=autoflush)
+        journal.update_status(run, "running")
+        for i in range(steps):
+            step = journal.log_step(run, f"step_{i}", input_data={"i": i})
+            journal.start_step(step)
+            journal.end_step(step, output_data={"ok": True})
+        journal.add_artifact(run, "draft_svg", preview_text="<svg/>")
+        journal.update_status(run, "success")
+        journal.flush()
+
+    results = {}
+    cases = (
+        ("immediate", immediate),
+        ("buffered", buffered),
+        ("buffered_step", lambda: buffered(autoflush=True)),
+    )
+    for name, fn in cases:
+        queries = []
+
+        def counted(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with transaction.atomic():
+            with connection.execute_wrapper(counted):
+                stats = timeit(fn, min_time)
+            transaction.set_rollback(True)
+        stats["queries_per_run"] = round(len(queries) / (stats["runs"] + 1), 1)
+        results[name] = stats
+    return results
+
+
+def bench_draft_serialization(min_time: float) -> Dict[str, Any]:
+    """草稿序列化：DslDraft.to_dict + json.dumps，以及 Draft 模型转 API 字典"""
+    from django.utils import timezone
+    from common.schemas import DslDraft
+    from m7_editors.models import Draft
+
+    results = {}
+    for shapes in (12, 2000):
+        svg = _sample_svg(shapes)
+        meta = {"title": "SVG 草稿", "width": 800, "height": 600, "editable": True, "router_reason": "bench"}
+        draft = DslDraft(dsl_type="svg", code=svg, meta=meta)
+        model = Draft(id=1, dsl_type="svg", code=svg, meta_json=meta)
+        model.created_at = model.updated_at = timezone.now()
+
+        def api_dict():
+            return json.dumps({
+                "id": model.id, "dsl_type": model.dsl_type, "code": model.code, "meta": model.meta,
+                "created_at": model.created_at.isoformat(), "updated_at": model.updated_at.isoformat(),
+            }, ensure_ascii=False)
+
+        results[f"dsl_draft_{shapes}"] = timeit(lambda: json.dumps(draft.to_dict(), ensure_ascii=False), min_time)
+        results[f"draft_model_{shapes}"] = timeit(api_dict, min_time)
+        results[f"dsl_draft_{shapes}"]["code_bytes"] = len(svg.encode("utf-8"))
+    return results
+
+
+MICRO_BENCHMARKS = {
+    "extract": bench_extract,
+    "optimize": bench_optimize,
+    "geometry": bench_geometry,
+    "run_logger": bench_run_logger,
+    "draft_serialization": bench_draft_serialization,
+}
@@ -0,0 +1,195 @@
+"""
+编排任务队列：基于数据库的 RunJob 表，无需外部 broker
+- enqueue：创建 Run（status=created）与 RunJob，立即返回，由 worker 异步执行
+- worker 以乐观锁领取任务（queued 且已到 available_at，或 running 但租约已过期），
+  执行期间后台线程定期续约；多个节点共享同一数据库即可共同消费队列
+- worker 崩溃后租约过期，任务被其他 worker 重新领取；领取次数超过 max_attempts 时标记失败
+
+可通过环境变量调整（均为可选）：
+- ORCHESTRATOR_JOB_LEASE          租约 / 可见性超时（秒），默认 60
+- ORCHESTRATOR_JOB_MAX_ATTEMPTS   最多领取次数（含崩溃后重领），默认 3
+- ORCHESTRATOR_JOB_POLL_INTERVAL  队列为空时的轮询间隔（秒），默认 1
+"""
+import os
+import socket
+import logging
+import threading
+from datetime import timedelta
+from typing import Optional
+
+from django.db import connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from common.schemas import InputPayload, ImageInfo
+from m1_runs.services import RunLogger
+from m1_runs.models import RunStepLog
+from .models import RunJob
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def job_lease() -> timedelta:
+    return timedelta(seconds=_env_float("ORCHESTRATOR_JOB_LEASE", 60))
+
+
+def payload_to_json(payload: InputPayload) -> dict:
+    return {
+        "text": payload.text,
+        "images": [img.__dict__ for img in payload.images],
+        "params": payload.params,
+    }
+
+
+def payload_from_json(data: dict) -> InputPayload:
+    return InputPayload(
+        text=data.get("text"),
+        images=[ImageInfo(**img) for img in data.get("images") or []],
+        params=data.get("params") or {},
+    )
+
+
+def enqueue(payload: InputPayload) -> RunJob:
+    """创建运行与排队任务"""
+    with transaction.atomic():
+        run = RunLogger.create_run()
+        job = RunJob.objects.create(
+            run=run,
+            payload=payload_to_json(payload),
+            max_attempts=int(_env_float("ORCHESTRATOR_JOB_MAX_ATTEMPTS", 3)),
+            available_at=timezone.now(),
+        )
+    logger.info(f"Queued run {run.id}")
+    return job
+
+
+def claim(worker_id: str, lease: timedelta = None) -> Optional[RunJob]:
+    """领取一个任务；没有可领取的任务时返回 None"""
+    lease = lease or job_lease()
+    while True:
+        now = timezone.now()
+        job = (
+            RunJob.objects
+            .filter(Q(status='queued', available_at__lte=now) | Q(status='running', lease_expires_at__lt=now))
+            .order_by('available_at')
+            .first()
+        )
+        if job is None:
+            return None
+
+        reclaimed = job.status == 'running'
+        if reclaimed and job.attempts >= job.max_attempts:
+            # 多次领取后仍未完成（worker 反复崩溃），不再重试
+            if RunJob.objects.filter(pk=job.pk, updated_at=job.updated_at).update(
+                status='failed', error=f"Abandoned after {job.attempts} attempts (worker lost)", updated_at=now,
+            ):
+                logger.error(f"Run {job.run_id} abandoned after {job.attempts} attempts")
+                RunLogger.update_status(job.run, 'failed')
+            continue
+
+        # 以 updated_at 做乐观锁：并发的 worker 只有一个能更新成功
+        taken = RunJob.objects.filter(pk=job.pk, updated_at=job.updated_at).update(
+            status='running', worker_id=worker_id, attempts=job.attempts + 1,
+            lease_expires_at=now + lease, updated_at=now,
+        )
+        if taken:
+            if reclaimed:
+                logger.warning(f"Reclaimed run {job.run_id} from expired worker {job.worker_id}")
+                # 上一次执行中断时未结束的步骤
+                RunStepLog.objects.filter(run_id=job.run_id, ended_at=None).update(
+                    ended_at=now, error=f"Worker {job.worker_id} lost, job reclaimed",
+                )
+            return RunJob.objects.select_related('run').get(pk=job.pk)
+
+
+def renew(job: RunJob, worker_id: str, lease: timedelta = None) -> bool:
+    """续约；任务已被其他 worker 接管时返回 False"""
+    now = timezone.now()
+    return bool(RunJob.objects.filter(pk=job.pk, status='running', worker_id=worker_id).update(
+        lease_expires_at=now + (lease or job_lease()), updated_at=now,
+    ))
+
+
+def finish(job: RunJob, worker_id: str, result: dict = None, error: str = None) -> None:
+    """记录任务结果（仅当任务仍归属本 worker）"""
+    RunJob.objects.filter(pk=job.pk, worker_id=worker_id).update(
+        status='failed' if error else 'done', result=result, error=error,
+        lease_expires_at=None, updated_at=timezone.now(),
+    )
+
+
+def job_depth() -> dict:
+    """各状态未结束的任务数（指标用）：{("queued",): n, ("running",): m}"""
+    depth = {("queued",): 0, ("running",): 0}
+    rows = RunJob.objects.filter(status__in=("queued", "running")).values_list("status").annotate(n=Count("run"))
+    for status, n in rows:
+        depth[(status,)] = n
+    return depth
+
+
+class JobWorker:
+    """单个 worker：循环领取并执行任务；执行期间由心跳线程续约"""
+
+    def __init__(self, worker_id: str = None, poll_interval: float = None, lease: timedelta = None):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval if poll_interval is not None else _env_float("ORCHESTRATOR_JOB_POLL_INTERVAL", 1)
+        self.lease = lease or job_lease()
+        self.stop_event = threading.Event()
+
+    def run_forever(self, max_jobs: int = None) -> int:
+        """持续消费直到 stop_event 被设置（或处理满 max_jobs 个任务），返回处理的任务数"""
+        processed = 0
+        logger.info(f"Worker {self.worker_id} started")
+        while not self.stop_event.is_set() and (max_jobs is None or processed < max_jobs):
+            if self.run_once():
+                processed += 1
+            else:
+                self.stop_event.wait(self.poll_interval)
+        logger.info(f"Worker {self.worker_id} stopped after {processed} jobs")
+        return processed
+
+    def run_once(self) -> bool:
+        """领取并执行一个任务；队列为空时返回 False"""
+        from .services import OrchestrationService
+
+        try:
+            job = claim(self.worker_id, self.lease)
+        except Exception as e:
+            # 数据库繁忙等临时错误：下次轮询重试
+            logger.warning(f"Worker {self.worker_id} failed to claim: {e}")
+            connections.close_all()
+            return False
+        if job is None:
+            return False
+
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, done), daemon=True)
+        heartbeat.start()
+        try:
+            result = OrchestrationService().run(payload_from_json(job.payload), run=job.run)
+            # 草稿内容已在 Draft 表中，任务只记录引用
+            finish(job, self.worker_id, result={"status": result.get("status"), "draft_id": result.get("draft_id")})
+        except Exception as e:
+            # run() 已把运行标记为失败并记录日志
+            finish(job, self.worker_id, error=str(e))
+        finally:
+            done.set()
+            heartbeat.join()
+        return True
+
+    def _heartbeat(self, job: RunJob, done: threading.Event) -> None:
+        interval = self.lease.total_seconds() / 3
+        try:
+            while not done.wait(interval):
+                if not renew(job, self.worker_id, self.lease):
+                    logger.warning(f"Worker {self.worker_id} lost lease on run {job.run_id}")
+                    return
+        finally:
+            connections.close_all()
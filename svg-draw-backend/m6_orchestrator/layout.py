@@ -0,0 +1,457 @@
+"""
+本地分层布局引擎：把结构化的 SceneSpec（实体 + 关系）直接渲染为 SVG，不调用 LLM
+用于 process_flow（自上而下的流程图）与 network_graph（自左向右的网络图）。
+
+Sugiyama 式分层布局：
+1. 去环：DFS 找出回边并临时反向（绘制时仍按原方向画箭头）
+2. 分层：按拓扑序求最长路径层号，源点下沉到其后继的上一层
+3. 跨层边插入虚拟节点，使每条边只连接相邻两层
+4. 交叉最小化：重心法上下交替扫描，层间交叉数用 numpy 广播计算，保留交叉最少的排列
+5. 坐标分配：以"相邻层连线尽量竖直"为目标、同层节点最小间距为约束，逐层交替求解
+   加权保序回归（scipy.optimize.isotonic_regression）
+"""
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import isotonic_regression
+
+from common.schemas import SceneSpec
+
+logger = logging.getLogger(__name__)
+
+# 支持本地布局的意图 -> 布局方向（TB 自上而下 / LR 自左向右）
+LAYOUT_INTENTS = {
+    "process_flow": "TB",
+    "network_graph": "LR",
+}
+# 不显示为连线标签的通用关系名
+GENERIC_RELATIONS = {"leads_to", "next", "then", "to", "connects", "connected_to", "link", "edge"}
+
+FONT_SIZE = 14
+NODE_HEIGHT = 40
+NODE_MIN_WIDTH = 80
+NODE_PADDING = 16
+NODE_SEP = 40       # 同层相邻节点的间距
+RANK_SEP = 70       # 相邻层的间距
+MARGIN = 24
+CROSSING_SWEEPS = 8
+COORD_SWEEPS = 24
+
+# 连线竖直程度的权重：实节点之间 / 一端为虚拟节点 / 两端均为虚拟节点（长边尽量拉直）
+EDGE_WEIGHTS = (1.0, 2.0, 8.0)
+
+
+@dataclass
+class _Node:
+    key: str
+    label: str = ""
+    kind: str = "process"  # start / end / process / decision / node / dummy
+    width: float = 0.0
+    height: float = 0.0
+    layer: int = 0
+    x: float = 0.0
+    y: float = 0.0
+
+
+@dataclass
+class _Edge:
+    src: int
+    dst: int
+    label: str = ""
+    reversed: bool = False
+    chain: List[int] = field(default_factory=list)  # 分层方向上的节点序列（含虚拟节点）
+
+
+def supports(scene: Optional[SceneSpec]) -> bool:
+    """场景是否可以由本地布局渲染"""
+    return scene is not None and scene.intent in LAYOUT_INTENTS and bool(scene.entities)
+
+
+def text_width(text: str, font_size: float = FONT_SIZE) -> float:
+    """估算文本宽度：全角字符按一个字号，其余按 0.6 个字号"""
+    return sum(font_size if ord(ch) >= 0x2E80 else font_size * 0.6 for ch in text)
+
+
+def render_scene(scene: SceneSpec) -> Tuple[str, dict]:
+    """渲染场景为 SVG，返回 (svg 文本, 布局统计)；不支持的意图抛出 ValueError"""
+    if not supports(scene):
+        raise ValueError(f"Scene intent '{scene.intent if scene else None}' is not supported by the layout engine")
+    started = time.perf_counter()
+    layout = _Layout(scene, LAYOUT_INTENTS[scene.intent])
+    layout.run()
+    svg = layout.to_svg()
+    stats = {
+        "engine": "sugiyama",
+        "direction": layout.direction,
+        "nodes": layout.real_count,
+        "edges": len(layout.edges),
+        "layers": len(layout.layers),
+        "dummy_nodes": len(layout.nodes) - layout.real_count,
+        "reversed_edges": sum(1 for e in layout.edges if e.reversed),
+        "crossings": layout.crossings,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+    return svg, stats
+
+
+class _Layout:
+    def __init__(self, scene: SceneSpec, direction: str):
+        self.scene = scene
+        self.direction = direction
+        self.nodes: List[_Node] = []
+        self.edges: List[_Edge] = []
+        self.layers: List[List[int]] = []
+        self.crossings = 0
+        self._build_graph()
+        self.real_count = len(self.nodes)
+
+    # ---------- 图 ----------
+
+    def _build_graph(self):
+        index: Dict[str, int] = {}
+
+        def add(name: str, label: str = None, etype: str = "") -> int:
+            if name not in index:
+                index[name] = len(self.nodes)
+                self.nodes.append(_Node(key=name, label=label or name, kind=etype))
+            return index[name]
+
+        for entity in self.scene.entities:
+            add(entity.name, str((entity.attrs or {}).get("label") or entity.name), (entity.type or "").lower())
+
+        seen = set()
+        for rel in self.scene.relations:
+            src, dst = add(rel.src), add(rel.dst)
+            if src == dst or (src, dst) in seen:
+                continue  # 自环与重复边不绘制
+            seen.add((src, dst))
+            label = "" if (rel.rel or "").lower() in GENERIC_RELATIONS else str(rel.rel or "")
+            self.edges.append(_Edge(src, dst, label))
+
+        has_in = {e.dst for e in self.edges}
+        has_out = {e.src for e in self.edges}
+        for i, node in enumerate(self.nodes):
+            node.kind = self._node_kind(node, i in has_in, i in has_out)
+            node.width = max(NODE_MIN_WIDTH, text_width(node.label) + 2 * NODE_PADDING)
+            node.height = NODE_HEIGHT
+            if node.kind == "decision":
+                node.width *= 1.4
+                node.height *= 1.4
+
+    def _node_kind(self, node: _Node, has_in: bool, has_out: bool) -> str:
+        if self.scene.intent == "network_graph":
+            return "node"
+        if node.kind in ("decision", "condition", "gateway") or node.label.endswith(("?", "？")):
+            return "decision"
+        if node.kind in ("start", "end"):
+            return node.kind
+        if self.edges and not has_in:
+            return "start"
+        if self.edges and not has_out:
+            return "end"
+        return "process"
+
+    def run(self):
+        self._break_cycles()
+        self._assign_layers()
+        self._insert_dummies()
+        self._order_layers()
+        self._assign_coordinates()
+
+    # ---------- 1. 去环 ----------
+
+    def _break_cycles(self):
+        n = len(self.nodes)
+        out: List[List[int]] = [[] for _ in range(n)]
+        for k, e in enumerate(self.edges):
+            out[e.src].append(k)
+        state = np.zeros(n, dtype=np.int8)  # 0 未访问 / 1 在栈中 / 2 已完成
+        for root in range(n):
+            if state[root]:
+                continue
+            state[root] = 1
+            stack = [(root, iter(out[root]))]
+            while stack:
+                node, it = stack[-1]
+                k = next(it, None)
+                if k is None:
+                    state[node] = 2
+                    stack.pop()
+                    continue
+                dst = self.edges[k].dst
+                if state[dst] == 1:
+                    self.edges[k].reversed = True
+                elif state[dst] == 0:
+                    state[dst] = 1
+                    stack.append((dst, iter(out[dst])))
+
+    def _directed(self, e: _Edge) -> Tuple[int, int]:
+        return (e.dst, e.src) if e.reversed else (e.src, e.dst)
+
+    # ---------- 2. 分层 ----------
+
+    def _assign_layers(self):
+        n = len(self.nodes)
+        pairs = np.array([self._directed(e) for e in self.edges], dtype=np.int64).reshape(-1, 2)
+        indegree = np.bincount(pairs[:, 1], minlength=n) if len(pairs) else np.zeros(n, dtype=np.int64)
+        succ: List[List[int]] = [[] for _ in range(n)]
+        for u, v in pairs:
+            succ[u].append(v)
+
+        layer = np.zeros(n, dtype=np.int64)
+        queue = [i for i in range(n) if indegree[i] == 0]
+        order = []
+        while queue:
+            u = queue.pop(0)
+            order.append(u)
+            for v in succ[u]:
+                layer[v] = max(layer[v], layer[u] + 1)
+                indegree[v] -= 1
+                if indegree[v] == 0:
+                    queue.append(v)
+
+        # 源点下沉到紧邻其最近后继的上一层，缩短从源点出发的长边
+        for u in reversed(order):
+            if succ[u] and not np.any(pairs[:, 1] == u):
+                layer[u] = min(layer[v] for v in succ[u]) - 1
+        layer -= layer.min() if n else 0
+
+        for node, value in zip(self.nodes, layer):
+            node.layer = int(value)
+
+    # ---------- 3. 虚拟节点 ----------
+
+    def _insert_dummies(self):
+        for e in self.edges:
+            u, v = self._directed(e)
+            chain = [u]
+            for layer in range(self.nodes[u].layer + 1, self.nodes[v].layer):
+                self.nodes.append(_Node(key=f"_d{len(self.nodes)}", kind="dummy", layer=layer))
+                chain.append(len(self.nodes) - 1)
+            chain.append(v)
+            e.chain = chain
+
+        depth = max((node.layer for node in self.nodes), default=-1) + 1
+        self.layers = [[] for _ in range(depth)]
+        # 初始顺序：按节点出现顺序（实体顺序在前，虚拟节点在后）
+        for i, node in enumerate(self.nodes):
+            self.layers[node.layer].append(i)
+
+    # ---------- 4. 交叉最小化 ----------
+
+    def _segments(self) -> List[Tuple[int, int]]:
+        """相邻层之间的所有连线段（上层节点, 下层节点）"""
+        return [(a, b) for e in self.edges for a, b in zip(e.chain, e.chain[1:])]
+
+    def _layer_matrices(self, segments) -> List[np.ndarray]:
+        """第 i 个矩阵为第 i 层与第 i+1 层之间的邻接矩阵（按节点编号索引，不随排列变化）"""
+        local = {}
+        for layer in self.layers:
+            for j, node in enumerate(layer):
+                local[node] = j
+        matrices = [np.zeros((len(self.layers[i]), len(self.layers[i + 1]))) for i in range(len(self.layers) - 1)]
+        for a, b in segments:
+            matrices[self.nodes[a].layer][local[a], local[b]] += 1
+        return matrices
+
+    @staticmethod
+    def _count_crossings(matrix: np.ndarray, upper: np.ndarray, lower: np.ndarray) -> int:
+        """upper / lower 为两层中各节点的位置；两条边端点顺序相反即交叉"""
+        rows, cols = np.nonzero(matrix)
+        if len(rows) < 2:
+            return 0
+        weights = matrix[rows, cols]
+        a, b = upper[rows], lower[cols]
+        cross = ((a[:, None] - a[None, :]) * (b[:, None] - b[None, :])) < 0
+        return int((np.triu(cross, 1) * np.outer(weights, weights)).sum())
+
+    def _order_layers(self):
+        if len(self.layers) < 2:
+            return
+        matrices = self._layer_matrices(self._segments())
+        # positions[i][j]：第 i 层中初始编号为 j 的节点的当前位置
+        positions = [np.arange(len(layer), dtype=float) for layer in self.layers]
+
+        def total() -> int:
+            return sum(self._count_crossings(m, positions[i], positions[i + 1]) for i, m in enumerate(matrices))
+
+        def reorder(i: int, neighbor_pos: np.ndarray, matrix: np.ndarray):
+            # matrix: 邻接层 × 当前层；无邻居的节点保持原位置
+            weight = matrix.sum(axis=0)
+            bary = np.where(weight > 0, (neighbor_pos @ matrix) / np.maximum(weight, 1), positions[i])
+            # 重心相同时保持原相对顺序（稳定排序）
+            rank = np.lexsort((positions[i], bary))
+            positions[i][rank] = np.arange(len(rank), dtype=float)
+
+        best, best_positions = total(), [p.copy() for p in positions]
+        for sweep in range(CROSSING_SWEEPS):
+            if best == 0:
+                break
+            if sweep % 2 == 0:
+                for i in range(1, len(self.layers)):
+                    reorder(i, positions[i - 1], matrices[i - 1])
+            else:
+                for i in range(len(self.layers) - 2, -1, -1):
+                    reorder(i, positions[i + 1], matrices[i].T)
+            crossings = total()
+            if crossings < best:
+                best, best_positions = crossings, [p.copy() for p in positions]
+
+        self.crossings = best
+        self.layers = [
+            [layer[j] for j in np.argsort(pos, kind="stable")] for layer, pos in zip(self.layers, best_positions)
+        ]
+
+    # ---------- 5. 坐标分配 ----------
+
+    def _breadth(self, node: _Node) -> float:
+        """节点在层内方向上的尺寸"""
+        return node.width if self.direction == "TB" else node.height
+
+    def _depth(self, node: _Node) -> float:
+        return node.height if self.direction == "TB" else node.width
+
+    def _assign_coordinates(self):
+        """
+        层内坐标：最小化 Σ w·(x_u - x_v)²（相邻层连线两端），约束为同层相邻节点间距不小于最小间距。
+        逐层块坐标下降：固定其余层时，本层的子问题令 y_k = x_k - 左侧最小间距之和，
+        即以邻居加权均值为目标的加权保序回归，可精确求解；上下交替扫描直至收敛。
+        """
+        count = len(self.nodes)
+        segments = self._segments()
+        if segments:
+            a = np.array([s[0] for s in segments], dtype=np.int64)
+            b = np.array([s[1] for s in segments], dtype=np.int64)
+            is_dummy = np.array([node.kind == "dummy" for node in self.nodes])
+            weights = np.array(EDGE_WEIGHTS)[is_dummy[a].astype(int) + is_dummy[b].astype(int)]
+            W = sparse.coo_matrix(
+                (np.concatenate([weights, weights]), (np.concatenate([a, b]), np.concatenate([b, a]))),
+                shape=(count, count),
+            ).tocsr()
+        else:
+            W = sparse.csr_matrix((count, count))
+
+        x = np.zeros(count)
+        blocks = []
+        for layer in self.layers:
+            idx = np.array(layer, dtype=np.int64)
+            breadth = np.array([self._breadth(self.nodes[i]) for i in layer])
+            # offsets[k]：第 k 个节点左侧的最小间距之和
+            offsets = np.concatenate([[0.0], np.cumsum((breadth[:-1] + breadth[1:]) / 2 + NODE_SEP)])
+            x[idx] = offsets - offsets[-1] / 2  # 初始：紧凑排列并居中
+            rows = W[idx]
+            blocks.append((idx, offsets, rows, np.asarray(rows.sum(axis=1)).ravel()))
+
+        for sweep in range(COORD_SWEEPS):
+            moved = 0.0
+            sequence = blocks if sweep % 2 == 0 else blocks[::-1]
+            for idx, offsets, rows, wsum in sequence:
+                linked = wsum > 0
+                # 没有连线的节点以当前位置为目标、极小权重，只在被挤压时移动
+                target = np.where(linked, (rows @ x) / np.where(linked, wsum, 1), x[idx])
+                weight = np.where(linked, wsum, 1e-3)
+                new = isotonic_regression(target - offsets, weights=weight).x + offsets
+                moved = max(moved, float(np.abs(new - x[idx]).max()))
+                x[idx] = new
+            if moved < 0.5:
+                break
+
+        # 层间方向：各层按最大深度依次排开
+        depth_pos = []
+        cursor = MARGIN
+        for layer in self.layers:
+            depth = max((self._depth(self.nodes[i]) for i in layer), default=0)
+            depth_pos.append(cursor + depth / 2)
+            cursor += depth + RANK_SEP
+
+        lo = min(x[i] - self._breadth(node) / 2 for i, node in enumerate(self.nodes))
+        for layer_index, layer in enumerate(self.layers):
+            for i in layer:
+                b = x[i] - lo + MARGIN
+                d = depth_pos[layer_index]
+                self.nodes[i].x, self.nodes[i].y = (b, d) if self.direction == "TB" else (d, b)
+
+    # ---------- SVG ----------
+
+    def _port(self, node: _Node, outgoing: bool) -> Tuple[float, float]:
+        """连线在节点边界上的端点（分层方向的出 / 入侧中点）"""
+        if node.kind == "dummy":
+            return node.x, node.y
+        sign = 1 if outgoing else -1
+        if self.direction == "TB":
+            return node.x, node.y + sign * node.height / 2
+        return node.x + sign * node.width / 2, node.y
+
+    def _edge_path(self, e: _Edge) -> Tuple[str, Tuple[float, float]]:
+        points = [self._port(self.nodes[e.chain[0]], True)]
+        points += [(self.nodes[i].x, self.nodes[i].y) for i in e.chain[1:-1]]
+        points.append(self._port(self.nodes[e.chain[-1]], False))
+        if e.reversed:
+            points.reverse()
+        # 相邻点之间用三次贝塞尔连接，切线沿分层方向
+        d = [f"M{points[0][0]:.1f},{points[0][1]:.1f}"]
+        for (x1, y1), (x2, y2) in zip(points, points[1:]):
+            if self.direction == "TB":
+                my = (y1 + y2) / 2
+                d.append(f"C{x1:.1f},{my:.1f} {x2:.1f},{my:.1f} {x2:.1f},{y2:.1f}")
+            else:
+                mx = (x1 + x2) / 2
+                d.append(f"C{mx:.1f},{y1:.1f} {mx:.1f},{y2:.1f} {x2:.1f},{y2:.1f}")
+        mid = len(points) // 2
+        (x1, y1), (x2, y2) = points[mid - 1], points[mid]
+        return " ".join(d), ((x1 + x2) / 2, (y1 + y2) / 2)
+
+    def _node_svg(self, node: _Node) -> str:
+        x, y, w, h = node.x, node.y, node.width, node.height
+        if node.kind == "decision":
+            shape = (f'<polygon class="node decision" points="{x:.1f},{y - h / 2:.1f} {x + w / 2:.1f},{y:.1f} '
+                     f'{x:.1f},{y + h / 2:.1f} {x - w / 2:.1f},{y:.1f}"/>')
+        elif node.kind == "node":
+            shape = f'<ellipse class="node" cx="{x:.1f}" cy="{y:.1f}" rx="{w / 2:.1f}" ry="{h / 2:.1f}"/>'
+        else:
+            radius = h / 2 if node.kind in ("start", "end") else 6
+            shape = (f'<rect class="node {node.kind}" x="{x - w / 2:.1f}" y="{y - h / 2:.1f}" '
+                     f'width="{w:.1f}" height="{h:.1f}" rx="{radius:.1f}"/>')
+        return f'{shape}<text class="label" x="{x:.1f}" y="{y:.1f}">{escape(node.label)}</text>'
+
+    def to_svg(self) -> str:
+        real = self.nodes[:self.real_count]
+        width = max((n.x + n.width / 2 for n in self.nodes), default=0) + MARGIN
+        height = max((n.y + n.height / 2 for n in self.nodes), default=0) + MARGIN
+        directed = self.scene.intent != "network_graph"
+
+        parts = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" height="{height:.0f}" '
+            f'viewBox="0 0 {width:.0f} {height:.0f}" font-family="sans-serif" font-size="{FONT_SIZE}">',
+            "<defs>",
+            '<marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="8" markerHeight="8" '
+            'orient="auto-start-reverse"><path d="M0,0L10,5L0,10z" fill="#5f6368"/></marker>',
+            "<style>"
+            ".node{fill:#e8f0fe;stroke:#4a6fa5;stroke-width:1.5}"
+            ".start,.end{fill:#e6f4ea;stroke:#34a853}"
+            ".decision{fill:#fef7e0;stroke:#f9ab00}"
+            "ellipse.node{fill:#f3e8fd;stroke:#8e44ad}"
+            ".edge{fill:none;stroke:#5f6368;stroke-width:1.5}"
+            ".label{text-anchor:middle;dominant-baseline:central;fill:#202124}"
+            ".edge-label{text-anchor:middle;dominant-baseline:central;fill:#5f6368;font-size:12px;"
+            "paint-order:stroke;stroke:#fff;stroke-width:4px}"
+            "</style>",
+            "</defs>",
+            f'<rect width="{width:.0f}" height="{height:.0f}" fill="#ffffff"/>',
+        ]
+        marker = ' marker-end="url(#arrow)"' if directed else ""
+        labels = []
+        for e in self.edges:
+            d, (lx, ly) = self._edge_path(e)
+            parts.append(f'<path class="edge" d="{d}"{marker}/>')
+            if e.label:
+                labels.append(f'<text class="edge-label" x="{lx:.1f}" y="{ly:.1f}">{escape(e.label)}</text>')
+        parts.extend(self._node_svg(node) for node in real)
+        parts.extend(labels)
+        parts.append("</svg>")
+        return "".join(parts)
@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from m6_orchestrator.benchmarks import MICRO_BENCHMARKS, environment, write_report, compare, bench_database
+
+
+class Command(BaseCommand):
+    help = '编排热点微基准：SVG 提取、运行日志写入模式、草稿序列化；结果写入 JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f"要运行的基准（默认全部）：{', '.join(MICRO_BENCHMARKS)}")
+        parser.add_argument('--min-time', type=float, default=0.5, help='每个用例至少累计运行的秒数')
+        parser.add_argument('--output', help='结果 JSON 路径；默认 bench_results/micro-<时间戳>.json')
+        parser.add_argument('--compare', help='与之前的结果 JSON 对比')
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(MICRO_BENCHMARKS)
+        unknown = [n for n in names if n not in MICRO_BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmark: {', '.join(unknown)}")
+
+        results = {}
+        try:
+            with bench_database():
+                for name in names:
+                    self.stdout.write(f'运行 {name} ...')
+                    results[name] = MICRO_BENCHMARKS[name](options['min_time'])
+                    for case, stats in results[name].items():
+                        extra = {k: v for k, v in stats.items() if k not in ('runs', 'mean_us', 'p50_us', 'p95_us', 'min_us')}
+                        self.stdout.write(
+                            f"  {case:<22} p50={stats['p50_us']}us p95={stats['p95_us']}us runs={stats['runs']}"
+                            + (f' {extra}' if extra else '')
+                        )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        report = {'environment': environment(), 'benchmarks': results}
+        path = write_report('micro', report, options['output'])
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            self.stdout.write('\n对比 ' + options['compare'])
+            for line in compare(results, baseline.get('benchmarks', {}), keys=('p50_us', 'p95_us', 'mean_us')):
+                self.stdout.write('  ' + line)
+        self.stdout.write(self.style.SUCCESS(f'\n结果已写入 {path}'))
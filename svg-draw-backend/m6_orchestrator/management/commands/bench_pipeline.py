@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from m6_orchestrator.benchmarks import summarize, environment, write_report, compare, bench_database
+
+
+class Command(BaseCommand):
+    help = (
+        '端到端压测：并发驱动 api/orchestrator/run、api/runs/<id>/、api/editors/drafts/，'
+        '统计吞吐、p50/p95/p99、每请求 DB 查询数 / 写语句数 / 写事务数与各步骤耗时，结果写入 JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='编排请求总数')
+        parser.add_argument('--concurrency', type=int, default=8, help='并发客户端数')
+        parser.add_argument('--distinct', type=int, default=0,
+                            help='不同提示词的个数（小于 requests 时会命中缓存 / 合并）；0 表示全部不同')
+        parser.add_argument('--endpoint', default='/api/orchestrator/run',
+                            help='编排接口路径，如 /api/orchestrator/run/async')
+        parser.add_argument('--param', action='append', default=[],
+                            help='附加到编排请求的参数 key=value（可多次），如 use_cache=false')
+        parser.add_argument('--database', help='压测使用的 SQLite 文件；默认临时文件（不影响开发库）')
+        parser.add_argument('--keep-db', action='store_true', help='保留压测数据库')
+        parser.add_argument('--no-mock', action='store_true', help='不启动内置模拟 LLM，使用当前 SILICONFLOW_BASE_URL')
+        parser.add_argument('--latency', default='lognormal:0.3,0.4', help='模拟 LLM 延迟分布（见 mock_llm_server）')
+        parser.add_argument('--tokens-per-sec', type=float, default=0.0)
+        parser.add_argument('--rate-429', type=float, default=0.0)
+        parser.add_argument('--rate-5xx', type=float, default=0.0)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='结果 JSON 路径；默认 bench_results/pipeline-<时间戳>.json')
+        parser.add_argument('--compare', help='与之前的结果 JSON 对比')
+
+    def handle(self, *args, **options):
+        # 每次压测从冷缓存开始：LLM 缓存只用进程内 L1，不读写共享的 SQLite 缓存文件
+        os.environ['LLM_CACHE_PATH'] = ''
+        mock = None
+        if not options['no_mock']:
+            from m3_llm_providers.mock_server import MockLLMServer, MockConfig
+            mock = MockLLMServer(MockConfig(
+                latency=options['latency'],
+                tokens_per_sec=options['tokens_per_sec'],
+                rate_429=options['rate_429'],
+                rate_5xx=options['rate_5xx'],
+                retry_after=0.2,
+                seed=options['seed'],
+            ))
+            # 需在首次调用 LLM 之前设置：路由器 / 连接池按环境变量惰性创建
+            os.environ['SILICONFLOW_BASE_URL'] = mock.start()
+            os.environ['SILICONFLOW_API_KEY'] = os.environ.get('SILICONFLOW_API_KEY') or 'mock'
+            os.environ.pop('SILICONFLOW_ENDPOINTS', None)
+
+        try:
+            with bench_database(options['database'], options['keep_db']) as db_path:
+                report = self._run(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if mock is not None:
+                mock.stop()
+
+        if mock is not None:
+            report['mock_llm'] = dict(mock.stats)
+        report['database'] = db_path if (options['keep_db'] or options['database']) else None
+
+        path = write_report('pipeline', report, options['output'])
+        self._print(report)
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            self.stdout.write('\n对比 ' + options['compare'])
+            for line in compare(report['endpoints'], baseline.get('endpoints', {})):
+                self.stdout.write('  ' + line)
+        self.stdout.write(self.style.SUCCESS(f'\n结果已写入 {path}'))
+
+    def _run(self, options):
+        from django.test import Client
+        from m1_runs.models import RunStepLog
+
+        total = options['requests']
+        distinct = options['distinct'] or total
+        extra = dict(kv.split('=', 1) for kv in options['param'])
+        latencies = defaultdict(list)
+        queries = defaultdict(list)
+        writes = defaultdict(list)
+        write_transactions = defaultdict(list)
+        errors = defaultdict(int)
+        run_ids = []
+        lock = threading.Lock()
+        local = threading.local()
+
+        def timed(name, fn):
+            """执行一次请求，记录耗时与本线程连接上的查询数、写语句数与写事务数"""
+            count = [0, 0, 0]
+            begun = [False]  # 已开始、尚未出现写语句的事务
+
+            def counter(execute, sql, params, many, context):
+                count[0] += 1
+                verb = sql.lstrip()[:7].upper()
+                if verb.startswith('BEGIN'):
+                    begun[0] = True
+                elif verb.startswith(('INSERT', 'UPDATE', 'DELETE', 'REPLACE')):
+                    count[1] += 1
+                    # 自动提交的单条写语句自成一个事务；事务内只算第一条
+                    if begun[0] or not context['connection'].in_atomic_block:
+                        count[2] += 1
+                    begun[0] = False
+                return execute(sql, params, many, context)
+
+            started = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                resp = fn()
+            cost = time.perf_counter() - started
+            ok = resp.status_code < 400
+            with lock:
+                if ok:
+                    latencies[name].append(cost)
+                    queries[name].append(count[0])
+                    writes[name].append(count[1])
+                    write_transactions[name].append(count[2])
+                else:
+                    errors[name] += 1
+            return resp if ok else None
+
+        def iteration(i):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client()
+            body = {'text': f'画一个包含 {i % distinct} 号节点的流程图', **extra}
+            resp = timed('run', lambda: client.post(options['endpoint'], data=json.dumps(body), content_type='application/json'))
+            if resp is None:
+                return
+            data = resp.json()['data']
+            with lock:
+                run_ids.append(data['run_id'])
+            timed('run_detail', lambda: client.get(f"/api/runs/{data['run_id']}/"))
+            timed('draft_list', lambda: client.get('/api/editors/drafts/'))
+            if data.get('draft_id'):
+                timed('draft_detail', lambda: client.get(f"/api/editors/drafts/{data['draft_id']}/"))
+
+        def worker(i):
+            try:
+                iteration(i)
+            except Exception as e:
+                self.stderr.write(f'iteration {i} failed: {e}')
+                with lock:
+                    errors['exception'] += 1
+
+        self.stdout.write(f"压测 {options['endpoint']}：{total} 请求，并发 {options['concurrency']}，提示词 {distinct} 种")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(worker, range(total)))
+        elapsed = time.perf_counter() - started
+
+        endpoints = {}
+        for name, values in latencies.items():
+            endpoints[name] = summarize(values, elapsed if name == 'run' else None)
+            endpoints[name]['errors'] = errors.get(name, 0)
+            endpoints[name]['queries_mean'] = round(sum(queries[name]) / len(queries[name]), 2)
+            endpoints[name]['queries_max'] = max(queries[name])
+            endpoints[name]['writes_mean'] = round(sum(writes[name]) / len(writes[name]), 2)
+            endpoints[name]['write_transactions_mean'] = round(sum(write_transactions[name]) / len(write_transactions[name]), 2)
+        for name, count in errors.items():
+            endpoints.setdefault(name, {'count': 0})['errors'] = count
+
+        steps = defaultdict(list)
+        for step in RunStepLog.objects.filter(run_id__in=run_ids).exclude(started_at=None).exclude(ended_at=None):
+            steps[step.name].append((step.ended_at - step.started_at).total_seconds())
+
+        return {
+            'environment': environment(),
+            'config': {k: options[k] for k in (
+                'requests', 'concurrency', 'distinct', 'endpoint', 'param', 'latency',
+                'tokens_per_sec', 'rate_429', 'rate_5xx', 'seed', 'no_mock',
+            )},
+            'elapsed_s': round(elapsed, 3),
+            'endpoints': endpoints,
+            'steps': {name: summarize(values) for name, values in sorted(steps.items())},
+        }
+
+    def _print(self, report):
+        self.stdout.write(f"\n总耗时 {report['elapsed_s']}s")
+        header = f"{'接口':<14}{'次数':>7}{'错误':>6}{'rps':>9}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}{'查询/次':>9}{'写/次':>8}{'写事务/次':>10}"
+        self.stdout.write(header)
+        for name, s in report['endpoints'].items():
+            self.stdout.write(
+                f"{name:<14}{s.get('count', 0):>7}{s.get('errors', 0):>6}{s.get('throughput_rps') or '':>9}"
+                f"{s.get('p50_ms') or '':>10}{s.get('p95_ms') or '':>10}{s.get('p99_ms') or '':>10}{s.get('queries_mean', ''):>9}"
+                f"{s.get('writes_mean', ''):>8}{s.get('write_transactions_mean', ''):>10}"
+            )
+        self.stdout.write('\n步骤耗时')
+        for name, s in report['steps'].items():
+            self.stdout.write(f"  {name:<18} n={s['count']:<6} p50={s['p50_ms']}ms p95={s['p95_ms']}ms p99={s['p99_ms']}ms")
@@ -0,0 +1,88 @@
+import os
+import signal
+import socket
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _worker_main(index, options):
+    """子进程入口：处理 SIGTERM / SIGINT 为“完成当前任务后退出”"""
+    import django
+    django.setup()
+    from m6_orchestrator.jobqueue import JobWorker
+
+    worker = JobWorker(
+        worker_id=f"{socket.gethostname()}:{os.getpid()}:{index}",
+        poll_interval=options['poll_interval'],
+    )
+    stop = lambda *_: worker.stop_event.set()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    if options['burst']:
+        # 处理到队列为空即退出
+        processed = 0
+        while not worker.stop_event.is_set() and worker.run_once():
+            processed += 1
+            if options['max_jobs'] and processed >= options['max_jobs']:
+                break
+    else:
+        worker.run_forever(max_jobs=options['max_jobs'] or None)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        '编排任务 worker：从 run_jobs 队列领取 api/orchestrator/run/submit 提交的任务并执行。'
+        '多个进程 / 多台机器共享同一数据库即可共同消费；Ctrl+C 后各进程完成当前任务再退出'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=int(os.environ.get('ORCHESTRATOR_WORKER_PROCESSES', 2)),
+                            help='worker 进程数，默认 ORCHESTRATOR_WORKER_PROCESSES 或 2')
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help='队列为空时的轮询间隔（秒），默认 ORCHESTRATOR_JOB_POLL_INTERVAL 或 1')
+        parser.add_argument('--max-jobs', type=int, default=0, help='每个进程处理多少个任务后退出（0 表示不限）')
+        parser.add_argument('--burst', action='store_true', help='队列为空时退出，而不是继续等待')
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        # 子进程不能复用父进程的数据库连接
+        connections.close_all()
+
+        children = {}
+
+        def spawn(index):
+            proc = multiprocessing.Process(target=_worker_main, args=(index, options), name=f'run-worker-{index}')
+            proc.start()
+            children[index] = proc
+
+        stopping = False
+
+        def shutdown(*_):
+            nonlocal stopping
+            stopping = True
+            for proc in children.values():
+                if proc.is_alive():
+                    proc.terminate()  # 子进程收到 SIGTERM 后完成当前任务再退出
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        for index in range(processes):
+            spawn(index)
+        self.stdout.write(f'已启动 {processes} 个 worker 进程')
+
+        while children:
+            for index, proc in list(children.items()):
+                proc.join(timeout=1)
+                if proc.is_alive():
+                    continue
+                del children[index]
+                # 异常退出的进程自动重启；其未完成任务的租约过期后会被重新领取
+                if not stopping and proc.exitcode != 0:
+                    self.stderr.write(f'worker {index} exited with code {proc.exitcode}, restarting')
+                    spawn(index)
+        self.stdout.write(self.style.SUCCESS('worker 已全部退出'))
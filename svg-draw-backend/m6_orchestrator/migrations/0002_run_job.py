@@ -0,0 +1,37 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('m1_runs', '0004_run_batch'),
+        ('m6_orchestrator', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunJob',
+            fields=[
+                ('run', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='job', serialize=False, to='m1_runs.run')),
+                ('status', models.CharField(choices=[('queued', '排队中'), ('running', '执行中'), ('done', '完成'), ('failed', '失败')], default='queued', max_length=20)),
+                ('payload', models.JSONField()),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=3)),
+                ('worker_id', models.CharField(blank=True, max_length=200, null=True)),
+                ('available_at', models.DateTimeField()),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'run_jobs',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'available_at'], name='run_jobs_status_avail_idx'), models.Index(fields=['status', 'lease_expires_at'], name='run_jobs_status_lease_idx')],
+            },
+        ),
+    ]
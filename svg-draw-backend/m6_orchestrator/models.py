@@ -1,3 +1,67 @@
 from django.db import models
 
-# 此 app 主要用于服务层，暂不需要模型
+
+class CodegenFlight(models.Model):
+    """
+    进行中的 codegen 调用（跨 worker 单飞锁）
+    同一 key 同时只有一个 leader 调用 LLM，其余请求等待其结果；
+    expires_at 为租约过期时间，leader 崩溃后由等待者接管。
+    """
+    STATUS_CHOICES = [
+        ('running', '进行中'),
+        ('done', '完成'),
+        ('failed', '失败'),
+    ]
+
+    key = models.CharField(max_length=64, primary_key=True)
+    leader_run = models.ForeignKey('m1_runs.Run', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    result = models.TextField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'codegen_flights'
+
+    def __str__(self):
+        return f"Flight {self.key[:12]} ({self.status})"
+
+
+class RunJob(models.Model):
+    """
+    排队中的编排任务（DB 队列，无需外部 broker）
+    worker 以租约领取任务：lease_expires_at 为可见性超时，worker 运行期间定期续约；
+    worker 崩溃后租约过期，任务重新可见并由其他 worker 接管，超过 max_attempts 次后标记失败。
+    """
+    STATUS_CHOICES = [
+        ('queued', '排队中'),
+        ('running', '执行中'),
+        ('done', '完成'),
+        ('failed', '失败'),
+    ]
+
+    run = models.OneToOneField('m1_runs.Run', on_delete=models.CASCADE, primary_key=True, related_name='job')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    payload = models.JSONField()
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    worker_id = models.CharField(max_length=200, null=True, blank=True)
+    available_at = models.DateTimeField()
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'run_jobs'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='run_jobs_status_avail_idx'),
+            models.Index(fields=['status', 'lease_expires_at'], name='run_jobs_status_lease_idx'),
+        ]
+
+    def __str__(self):
+        return f"RunJob {self.run_id} ({self.status})"
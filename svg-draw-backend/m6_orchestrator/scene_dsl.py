@@ -0,0 +1,265 @@
+"""
+紧凑场景描述（codegen_strategy=compact）
+LLM 不再输出完整 SVG，而是输出一段紧凑 JSON（图形、标签、连线、样式标记），
+由本模块校验后在本地展开为 SVG：样式统一放在 <defs> 的 CSS 类中，箭头共用一个 marker，
+连线端点按图形轮廓裁剪。坐标、样式与重复属性都不再由模型逐个生成，输出令牌数大幅减少。
+
+格式（x、y 为图形中心坐标）：
+{"size": [800, 400],
+ "shapes": [{"id": "a", "type": "rect", "x": 120, "y": 60, "w": 120, "h": 40, "text": "开始", "style": "primary"}],
+ "edges": [["a", "b"], ["b", "c", "是", "accent"]]}
+"""
+import re
+import json
+import math
+import logging
+from typing import Dict, List, Tuple
+from xml.sax.saxutils import escape
+
+from .layout import text_width
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = """你是一个图示场景生成器。根据用户的描述，只输出一个紧凑的 JSON 场景描述，不要输出 SVG、解释或 markdown 代码块。
+格式：{"size":[宽,高],"shapes":[{"id":"a","type":"rect","x":120,"y":60,"w":120,"h":40,"text":"开始","style":"primary"}],"edges":[["a","b"],["b","c","是","accent"]]}
+要求：
+1. type 取 rect / round / circle / ellipse / diamond / text；x、y 为图形中心坐标
+2. rect、round、ellipse、diamond 需要 w、h；circle 需要 r；text 只需要 text
+3. style 可选，取 default / primary / accent / success / warning / danger / muted，省略时为 default
+4. edges 每项为 [起点 id, 终点 id, 可选标签, 可选 style]，箭头自动绘制
+5. 数字使用整数，省略可选字段，不要输出其他字段"""
+
+SHAPE_TYPES = ("rect", "round", "circle", "ellipse", "diamond", "text")
+SHAPE_FIELDS = {"id", "type", "x", "y", "w", "h", "r", "text", "style"}
+
+# 样式标记 -> (填充, 描边)；未知标记按 default 处理
+STYLES = {
+    "default": ("#ffffff", "#5f6368"),
+    "primary": ("#e8f0fe", "#4a6fa5"),
+    "accent": ("#f3e8fd", "#8e44ad"),
+    "success": ("#e6f4ea", "#34a853"),
+    "warning": ("#fef7e0", "#f9ab00"),
+    "danger": ("#fce8e6", "#d93025"),
+    "muted": ("#f1f3f4", "#9aa0a6"),
+}
+
+MAX_SIZE = 4096
+MAX_SHAPES = 500
+MAX_EDGES = 1000
+FONT_SIZE = 14
+LINE_HEIGHT = 18
+
+
+def parse(raw: str) -> dict:
+    """从 LLM 输出中取出 JSON（容忍 markdown 代码块与前后说明文字）并校验，返回规范化后的场景"""
+    text = (raw or "").strip()
+    fenced = re.search(r"```(?:json)?\s*([\s\S]*?)```", text)
+    if fenced:
+        text = fenced.group(1).strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("Compact scene: no JSON object in response")
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Compact scene: invalid JSON ({e.msg} at char {e.pos})") from e
+    return validate(data)
+
+
+def _number(value, path: str, positive: bool = False) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"Compact scene: {path} must be a number")
+    if positive and value <= 0:
+        raise ValueError(f"Compact scene: {path} must be positive")
+    if abs(value) > MAX_SIZE * 4:
+        raise ValueError(f"Compact scene: {path} out of range")
+    return float(value)
+
+
+def _style(value, path: str) -> str:
+    if value is None:
+        return "default"
+    if not isinstance(value, str):
+        raise ValueError(f"Compact scene: {path} must be a string")
+    return value if value in STYLES else "default"
+
+
+def validate(data) -> dict:
+    """
+    校验场景结构并规范化（补默认值、text 图形估算尺寸），不合法时抛出 ValueError（消息含出错位置）。
+    未知的样式标记按 default 处理，不视为错误。
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Compact scene: top level must be an object")
+    unknown = set(data) - {"size", "shapes", "edges"}
+    if unknown:
+        raise ValueError(f"Compact scene: unknown keys {sorted(unknown)}")
+
+    size = data.get("size")
+    if not isinstance(size, list) or len(size) != 2:
+        raise ValueError("Compact scene: size must be [width, height]")
+    width, height = (_number(v, f"size[{i}]", positive=True) for i, v in enumerate(size))
+    if width > MAX_SIZE or height > MAX_SIZE:
+        raise ValueError(f"Compact scene: size exceeds {MAX_SIZE}")
+
+    shapes = data.get("shapes")
+    if not isinstance(shapes, list) or not shapes:
+        raise ValueError("Compact scene: shapes must be a non-empty list")
+    if len(shapes) > MAX_SHAPES:
+        raise ValueError(f"Compact scene: more than {MAX_SHAPES} shapes")
+    normalized = []
+    ids = set()
+    for i, shape in enumerate(shapes):
+        path = f"shapes[{i}]"
+        if not isinstance(shape, dict):
+            raise ValueError(f"Compact scene: {path} must be an object")
+        unknown = set(shape) - SHAPE_FIELDS
+        if unknown:
+            raise ValueError(f"Compact scene: {path} has unknown keys {sorted(unknown)}")
+        kind = shape.get("type")
+        if kind not in SHAPE_TYPES:
+            raise ValueError(f"Compact scene: {path}.type must be one of {', '.join(SHAPE_TYPES)}")
+        shape_id = shape.get("id", f"_{i}")
+        if not isinstance(shape_id, str) or not shape_id:
+            raise ValueError(f"Compact scene: {path}.id must be a non-empty string")
+        if shape_id in ids:
+            raise ValueError(f"Compact scene: duplicate shape id '{shape_id}'")
+        ids.add(shape_id)
+        label = shape.get("text", "")
+        if not isinstance(label, (str, int, float)) or isinstance(label, bool):
+            raise ValueError(f"Compact scene: {path}.text must be a string")
+        label = str(label)
+
+        item = {
+            "id": shape_id, "type": kind, "text": label, "style": _style(shape.get("style"), f"{path}.style"),
+            "x": _number(shape.get("x"), f"{path}.x"), "y": _number(shape.get("y"), f"{path}.y"),
+        }
+        if kind == "circle":
+            item["w"] = item["h"] = 2 * _number(shape.get("r"), f"{path}.r", positive=True)
+        elif kind == "text":
+            if not label:
+                raise ValueError(f"Compact scene: {path}.text is required for text shapes")
+            lines = label.split("\n")
+            item["w"] = max(text_width(line) for line in lines)
+            item["h"] = LINE_HEIGHT * len(lines)
+        else:
+            item["w"] = _number(shape.get("w"), f"{path}.w", positive=True)
+            item["h"] = _number(shape.get("h"), f"{path}.h", positive=True)
+        normalized.append(item)
+
+    edges = data.get("edges", [])
+    if not isinstance(edges, list):
+        raise ValueError("Compact scene: edges must be a list")
+    if len(edges) > MAX_EDGES:
+        raise ValueError(f"Compact scene: more than {MAX_EDGES} edges")
+    normalized_edges = []
+    for i, edge in enumerate(edges):
+        path = f"edges[{i}]"
+        if not isinstance(edge, list) or not 2 <= len(edge) <= 4:
+            raise ValueError(f"Compact scene: {path} must be [from, to, label?, style?]")
+        src, dst = edge[0], edge[1]
+        for end, name in ((src, "from"), (dst, "to")):
+            if not isinstance(end, str) or end not in ids:
+                raise ValueError(f"Compact scene: {path} {name} '{end}' is not a shape id")
+        label = edge[2] if len(edge) > 2 and edge[2] is not None else ""
+        if not isinstance(label, (str, int, float)) or isinstance(label, bool):
+            raise ValueError(f"Compact scene: {path} label must be a string")
+        normalized_edges.append({
+            "from": src, "to": dst, "text": str(label),
+            "style": _style(edge[3] if len(edge) > 3 else None, f"{path} style"),
+        })
+
+    return {"size": [width, height], "shapes": normalized, "edges": normalized_edges}
+
+
+def _fmt(value: float) -> str:
+    return f"{value:.1f}".rstrip("0").rstrip(".")
+
+
+def _boundary(shape: dict, dx: float, dy: float) -> Tuple[float, float]:
+    """从图形中心沿 (dx, dy) 方向到轮廓的交点"""
+    hw, hh = shape["w"] / 2, shape["h"] / 2
+    if dx == 0 and dy == 0:
+        return shape["x"], shape["y"]
+    kind = shape["type"]
+    if kind in ("circle", "ellipse"):
+        t = 1 / math.sqrt((dx / hw) ** 2 + (dy / hh) ** 2)
+    elif kind == "diamond":
+        t = 1 / (abs(dx) / hw + abs(dy) / hh)
+    else:
+        t = min(hw / abs(dx) if dx else math.inf, hh / abs(dy) if dy else math.inf)
+    return shape["x"] + dx * t, shape["y"] + dy * t
+
+
+def _label(x: float, y: float, text: str, cls: str) -> str:
+    lines = text.split("\n")
+    if len(lines) == 1:
+        return f'<text class="{cls}" x="{_fmt(x)}" y="{_fmt(y)}">{escape(text)}</text>'
+    top = y - LINE_HEIGHT * (len(lines) - 1) / 2
+    spans = "".join(
+        f'<tspan x="{_fmt(x)}" y="{_fmt(top + LINE_HEIGHT * i)}">{escape(line)}</tspan>' for i, line in enumerate(lines)
+    )
+    return f'<text class="{cls}">{spans}</text>'
+
+
+def _shape(shape: dict) -> str:
+    cls = f"s-{shape['style']}"
+    x, y, w, h = shape["x"], shape["y"], shape["w"], shape["h"]
+    kind = shape["type"]
+    if kind in ("rect", "round"):
+        radius = ' rx="8"' if kind == "round" else ""
+        body = (f'<rect class="{cls}" x="{_fmt(x - w / 2)}" y="{_fmt(y - h / 2)}" '
+                f'width="{_fmt(w)}" height="{_fmt(h)}"{radius}/>')
+    elif kind == "circle":
+        body = f'<circle class="{cls}" cx="{_fmt(x)}" cy="{_fmt(y)}" r="{_fmt(w / 2)}"/>'
+    elif kind == "ellipse":
+        body = f'<ellipse class="{cls}" cx="{_fmt(x)}" cy="{_fmt(y)}" rx="{_fmt(w / 2)}" ry="{_fmt(h / 2)}"/>'
+    elif kind == "diamond":
+        points = [(x, y - h / 2), (x + w / 2, y), (x, y + h / 2), (x - w / 2, y)]
+        body = f'<polygon class="{cls}" points="{" ".join(f"{_fmt(px)},{_fmt(py)}" for px, py in points)}"/>'
+    else:
+        return _label(x, y, shape["text"], f"t t-{shape['style']}")
+    if shape["text"]:
+        body += _label(x, y, shape["text"], "lbl")
+    return body
+
+
+def expand(scene: dict) -> Tuple[str, dict]:
+    """把校验后的场景展开为 SVG，返回 (svg 文本, 统计)；样式类只输出实际用到的"""
+    width, height = scene["size"]
+    shapes: Dict[str, dict] = {s["id"]: s for s in scene["shapes"]}
+
+    used = {s["style"] for s in scene["shapes"]} | {e["style"] for e in scene["edges"]}
+    rules: List[str] = []
+    for name in sorted(used):
+        fill, stroke = STYLES[name]
+        rules.append(f".s-{name}{{fill:{fill};stroke:{stroke};stroke-width:1.5}}")
+        rules.append(f".e-{name}{{stroke:{stroke}}}.t-{name}{{fill:{stroke}}}")
+    rules.append(".lbl,.t,.el{text-anchor:middle;dominant-baseline:central}.lbl{fill:#202124}")
+    rules.append(".e{fill:none;stroke-width:1.5}.el{fill:#5f6368;font-size:12px}")
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{_fmt(width)}" height="{_fmt(height)}" '
+        f'viewBox="0 0 {_fmt(width)} {_fmt(height)}" font-family="sans-serif" font-size="{FONT_SIZE}">',
+        '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="8" markerHeight="8" '
+        'orient="auto-start-reverse"><path d="M0,0L10,5L0,10z" fill="#5f6368"/></marker>'
+        f'<style>{"".join(rules)}</style></defs>',
+    ]
+    # 连线在图形之下
+    for edge in scene["edges"]:
+        a, b = shapes[edge["from"]], shapes[edge["to"]]
+        dx, dy = b["x"] - a["x"], b["y"] - a["y"]
+        x1, y1 = _boundary(a, dx, dy)
+        x2, y2 = _boundary(b, -dx, -dy)
+        parts.append(
+            f'<path class="e e-{edge["style"]}" d="M{_fmt(x1)},{_fmt(y1)}L{_fmt(x2)},{_fmt(y2)}" '
+            f'marker-end="url(#arrow)"/>'
+        )
+        if edge["text"]:
+            parts.append(_label((x1 + x2) / 2, (y1 + y2) / 2 - 10, edge["text"], "el"))
+    for shape in scene["shapes"]:
+        parts.append(_shape(shape))
+    parts.append("</svg>")
+
+    stats = {"shapes": len(scene["shapes"]), "edges": len(scene["edges"]), "styles": sorted(used)}
+    return "".join(parts), stats
@@ -0,0 +1,161 @@
+"""
+编排步骤的 DAG 调度器
+步骤声明依赖关系，依赖已满足的步骤在线程池中并发执行，整体耗时为关键路径而非各步骤之和。
+- 每个步骤有超时；超时或失败的可选步骤（optional）记录错误后以 None 结果继续，必需步骤则终止调度
+- 传入运行的 Deadline 时，步骤超时不超过剩余预算，预算耗尽（或被取消）时抛出 DeadlineExceeded
+- RunStepLog 的读写全部在调用线程中进行（步骤线程不碰运行日志），
+  started_at / ended_at 取步骤在工作线程中的实际起止时间，便于在运行详情中看到重叠
+- 结果按步骤名返回，合并顺序由调用方决定，与完成先后无关
+
+可通过环境变量调整（均为可选）：
+- ORCHESTRATOR_STEP_TIMEOUT          步骤默认超时（秒），默认 30
+- ORCHESTRATOR_STEP_TIMEOUT_<NAME>   单个步骤的超时，如 ORCHESTRATOR_STEP_TIMEOUT_KG_AUGMENTATION=10
+"""
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.db import connections
+from django.utils import timezone
+
+from common.deadline import Deadline
+from common.timing import run_in_context
+from m1_runs.services import RunLogger
+
+logger = logging.getLogger(__name__)
+
+
+class StepFailed(Exception):
+    """必需步骤失败或超时"""
+
+
+def step_timeout(name: str, default: float = None) -> float:
+    """读取步骤超时：ORCHESTRATOR_STEP_TIMEOUT_<NAME> > ORCHESTRATOR_STEP_TIMEOUT > default(30)"""
+    for key in (f"ORCHESTRATOR_STEP_TIMEOUT_{name.upper()}", "ORCHESTRATOR_STEP_TIMEOUT"):
+        value = os.environ.get(key)
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                logger.warning("Invalid %s=%r, ignored", key, value)
+    return 30.0 if default is None else default
+
+
+@dataclass
+class Step:
+    """DAG 中的一个步骤"""
+    name: str
+    fn: Callable[[Dict[str, Any]], Any]      # 参数为已完成依赖的结果 {步骤名: 结果}
+    deps: Tuple[str, ...] = ()
+    timeout: Optional[float] = None
+    optional: bool = False                   # True 时失败 / 超时不终止调度，结果为 None
+    input_data: Optional[dict] = None        # 记入 RunStepLog.input_data
+    describe: Optional[Callable[[Any], dict]] = None  # 把结果转成 RunStepLog.output_data
+
+
+class StepScheduler:
+    """按依赖关系并发执行步骤"""
+
+    def __init__(self, run, log=RunLogger, max_workers: int = 4, deadline: Optional[Deadline] = None):
+        self.run = run
+        self.log = log
+        self.max_workers = max_workers
+        self.deadline = deadline
+        self.steps: Dict[str, Step] = {}
+
+    def add(self, name: str, fn, deps=(), timeout=None, optional=False, input_data=None, describe=None) -> "StepScheduler":
+        for dep in deps:
+            if dep not in self.steps:
+                raise ValueError(f"Step {name} depends on unknown step {dep}")
+        self.steps[name] = Step(
+            name=name, fn=fn, deps=tuple(deps),
+            timeout=step_timeout(name) if timeout is None else timeout,
+            optional=optional, input_data=input_data, describe=describe,
+        )
+        return self
+
+    @staticmethod
+    def _execute(step: Step, inputs: Dict[str, Any]):
+        """工作线程中执行步骤，返回 (结果, 开始时间, 结束时间)"""
+        started = timezone.now()
+        try:
+            return step.fn(inputs), started, timezone.now()
+        finally:
+            # 步骤若访问了数据库，关闭本线程的连接，避免线程池复用时泄漏
+            connections.close_all()
+
+    def run_all(self) -> Dict[str, Any]:
+        """执行全部步骤，返回 {步骤名: 结果}；必需步骤失败时抛出 StepFailed"""
+        results: Dict[str, Any] = {}
+        finished = set()
+        running = {}  # future -> (step, RunStepLog, 截止时间)
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"run-{str(self.run.id)[:8]}")
+
+        def submit_ready():
+            for step in self.steps.values():
+                if step.name in finished or any(step is s for s, _, _ in running.values()):
+                    continue
+                if all(dep in finished for dep in step.deps):
+                    # 步骤超时不超过运行的剩余预算；预算已耗尽时不再启动新步骤
+                    timeout = step.timeout
+                    if self.deadline is not None:
+                        timeout = self.deadline.timeout(timeout, step.name)
+                    record = self.log.log_step(self.run, step.name, input_data=step.input_data)
+                    self.log.start_step(record)
+                    inputs = {dep: results.get(dep) for dep in step.deps}
+                    future = run_in_context(pool, self._execute, step, inputs)
+                    running[future] = (step, record, time.monotonic() + timeout)
+
+        try:
+            submit_ready()
+            while running:
+                now = time.monotonic()
+                timeout = max(0.0, min(deadline for _, _, deadline in running.values()) - now)
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+
+                if not done:
+                    # 最早到期的步骤超时：线程无法强制终止，放弃其结果
+                    now = time.monotonic()
+                    for future, (step, record, deadline) in list(running.items()):
+                        if deadline <= now:
+                            del running[future]
+                            future.cancel()
+                            if self.deadline is not None and self.deadline.expired():
+                                # 运行预算耗尽：无论步骤是否可选都终止整个运行
+                                error = self.deadline.error(step.name)
+                                self.log.end_step(record, error=str(error))
+                                raise error
+                            self._fail(step, record, f"timeout after {step.timeout:g}s")
+                            results[step.name] = None
+                            finished.add(step.name)
+                    submit_ready()
+                    continue
+
+                for future in done:
+                    step, record, _ = running.pop(future)
+                    try:
+                        value, started_at, ended_at = future.result()
+                    except Exception as e:
+                        logger.error("Step %s failed: %s", step.name, e, exc_info=True)
+                        self._fail(step, record, str(e), cause=e)
+                        value = None
+                    else:
+                        record.started_at = started_at
+                        output = step.describe(value) if step.describe else None
+                        self.log.end_step(record, output_data=output, at=ended_at)
+                    results[step.name] = value
+                    finished.add(step.name)
+                submit_ready()
+        finally:
+            # 不等待已超时仍在执行的步骤线程
+            pool.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    def _fail(self, step: Step, record, error: str, cause: Exception = None) -> None:
+        self.log.end_step(record, error=error)
+        if not step.optional:
+            raise StepFailed(f"{step.name}: {error}") from cause
+        logger.warning("Optional step %s skipped: %s", step.name, error)
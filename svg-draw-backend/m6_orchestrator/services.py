@@ -2,17 +2,35 @@
 编排服务：perception（Stub）→ augmentation（Stub）→ codegen（SiliconFlow 生成 SVG）
 m6 为编排核心，流程控制仅在此模块；m3 仅负责调用 LLM API。
 """
-import re
+import os
+import math
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import connections, transaction
+from django.utils import timezone
 from common.schemas import (
     InputPayload, SceneSpec, FinalSpec, DslDraft,
 )
+from common.deadline import Deadline, DeadlineExceeded
+from common.timing import run_in_context
+from common import metrics, svg_geometry, svg_optimizer
 from m3_llm_providers.services import VisionService
 from m4_knowledge_graph.services import KnowledgeGraphService
 from m5_rag.services import RagService
-from m3_llm_providers.siliconflow_client import chat_completion as siliconflow_chat
+from m3_llm_providers.siliconflow_client import resolve_model
+from m3_llm_providers.router import get_router
+from m3_llm_providers.cache import get_cache, make_key
+from .singleflight import get_singleflight, normalize_key
+from .scheduler import StepScheduler
+from . import layout, scene_dsl, svg_repair
+from .svg_repair import SvgChecker, extract_svg
 from m1_runs.services import RunLogger
-from m1_runs.models import Run
+from m1_runs.journal import RunJournal, open_run_log
+from m1_runs.models import Run, RunBatch, RunStepLog
+from m8_blobs.services import BlobStore
 
 logger = logging.getLogger(__name__)
 
@@ -23,149 +41,838 @@ SVG_SYSTEM_PROMPT = """你是一个 SVG 代码生成器。根据用户的自然
 2. 不要输出除 SVG 以外的文字。
 3. 使用标准 SVG 元素（rect, circle, path, text 等），确保语法正确、可被浏览器渲染。"""
 
+CODEGEN_TEMPERATURE = 0.2
 
-def _extract_svg_from_llm_response(raw: str) -> str:
-    """从 LLM 返回文本中提取 SVG：去除 markdown 代码块、前后空白，保证是 <svg>...</svg>。"""
-    text = (raw or "").strip()
-    if not text:
-        return ""
+# codegen 策略：llm（LLM 直接生成 SVG）/ layout（支持的意图由本地布局引擎渲染，其余回退 llm）
+# / compact（LLM 输出紧凑场景 JSON，本地展开为 SVG；输出不合法时回退 llm）
+CODEGEN_STRATEGIES = ("llm", "layout", "compact")
 
-    # 去掉 ```xml / ```svg / ``` 代码块
-    for pattern in [
-        r"```(?:xml|svg|html)?\s*\n?(.*?)```",
-        r"```\s*\n?(.*?)```",
-    ]:
-        m = re.search(pattern, text, re.DOTALL | re.IGNORECASE)
-        if m:
-            text = m.group(1).strip()
+# 批量编排：单批最多条目数与并发上限
+BATCH_MAX_ITEMS = 100
+BATCH_MAX_CONCURRENCY = 16
 
-    # 定位第一个 <svg 到最后一个 </svg>
-    start = text.find("<svg")
-    if start == -1:
-        return text
-    end = text.rfind("</svg>")
-    if end == -1:
-        return text
-    return text[start : end + len("</svg>")].strip()
+# 补全结果合并：KG 先写入，RAG 后写入；列表中的键允许覆盖已有值
+KG_OVERRIDE_KEYS = ("工艺", "材料", "设备", "网络类型", "协议", "组件库", "样式")
+RAG_OVERRIDE_KEYS = ("参数", "标准", "配置参数", "安全标准", "设计规范", "响应式参数")
+
+
+def _param_enabled(params: dict, name: str, default: bool = True) -> bool:
+    """读取布尔型 params 开关，兼容 JSON 布尔与表单字符串"""
+    value = (params or {}).get(name, default)
+    if isinstance(value, str):
+        return value.strip().lower() not in ("0", "false", "no", "off", "")
+    return bool(value)
+
+
+def _hedge_param(payload: InputPayload):
+    """params.hedge：未提供时返回 None（沿用 SILICONFLOW_HEDGE 默认值）"""
+    if (payload.params or {}).get("hedge") is None:
+        return None
+    return _param_enabled(payload.params, "hedge")
+
+
+def _codegen_strategy(payload: InputPayload) -> str:
+    """params.codegen_strategy 或 ORCHESTRATOR_CODEGEN_STRATEGY（默认 llm）；无效值按默认处理"""
+    default = os.environ.get("ORCHESTRATOR_CODEGEN_STRATEGY", "llm").strip().lower()
+    if default not in CODEGEN_STRATEGIES:
+        default = "llm"
+    value = str((payload.params or {}).get("codegen_strategy") or default).strip().lower()
+    return value if value in CODEGEN_STRATEGIES else default
+
+
+def _svg_fix_enabled() -> bool:
+    """ORCHESTRATOR_SVG_FIX：本地修复失败时是否发起片段修正调用，默认 1"""
+    return os.environ.get("ORCHESTRATOR_SVG_FIX", "1").strip().lower() not in ("0", "false", "no", "off", "")
+
+
+def _seconds(name: str, value, default: float) -> float:
+    """解析正的有限秒数；未设置时返回 default，无效值记录警告后同样使用 default"""
+    if value in (None, ""):
+        return default
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        seconds = None
+    if seconds is None or not math.isfinite(seconds) or seconds <= 0:
+        logger.warning("Invalid %s=%r, using %s", name, value, default)
+        return default
+    return seconds
+
+
+def _run_deadline(payload: InputPayload) -> Deadline:
+    """
+    运行截止时间：params.deadline（秒）或 ORCHESTRATOR_DEADLINE（默认 180），
+    不超过 ORCHESTRATOR_DEADLINE_MAX（默认 600）；无效值按默认处理
+    """
+    default = _seconds("ORCHESTRATOR_DEADLINE", os.environ.get("ORCHESTRATOR_DEADLINE"), 180.0)
+    maximum = _seconds("ORCHESTRATOR_DEADLINE_MAX", os.environ.get("ORCHESTRATOR_DEADLINE_MAX"), 600.0)
+    seconds = _seconds("params.deadline", (payload.params or {}).get("deadline"), default)
+    return Deadline(min(seconds, maximum))
+
+
+class SvgStreamExtractor:
+    """
+    流式 SVG 提取器：逐块喂入 LLM 输出，增量产出已确认属于 <svg>...</svg> 的文本。
+
+    - 跳过 <svg 之前的内容（解释文字、```xml 代码块开头等）
+    - 第一个 </svg> 之前的内容直接产出（末尾保留 5 个字符，防止 </svg> 被切在两块之间）
+    - 第一个 </svg> 之后的内容先暂存，直到再次出现 </svg>（嵌套 svg）才产出，
+      因此代码块结尾的 ``` 与尾随说明不会推给前端
+    - 产出的文本同时喂给 SvgChecker，流结束时良构检查已经完成，无需再解析一遍
+    每块只扫描新增部分，总耗时与输出长度线性相关。
+    """
+
+    _OPEN = "<svg"
+    _CLOSE = "</svg>"
+    _HOLD = len(_CLOSE) - 1
+
+    def __init__(self):
+        self._chunks = []
+        self._emitted = []
+        self._carry = ""
+        self._pending = ""
+        self._started = False
+        self._closed = False
+        self._checker = SvgChecker()
+
+    def feed(self, delta: str) -> str:
+        """喂入一块 LLM 输出，返回本次新增的 SVG 文本（可能为空串）"""
+        if not delta:
+            return ""
+        self._chunks.append(delta)
+
+        if not self._started:
+            window = self._carry + delta
+            self._carry = window[-self._HOLD:]
+            start = window.find(self._OPEN)
+            if start == -1:
+                return ""
+            self._started = True
+            self._pending = window[start:]
+        else:
+            self._pending += delta
+
+        end = self._pending.rfind(self._CLOSE)
+        if end != -1:
+            end += len(self._CLOSE)
+            out, self._pending = self._pending[:end], self._pending[end:]
+            self._closed = True
+        elif not self._closed and len(self._pending) > self._HOLD:
+            out, self._pending = self._pending[:-self._HOLD], self._pending[-self._HOLD:]
+        else:
+            out = ""
+
+        if out:
+            self._emitted.append(out)
+            self._checker.feed(out)
+        return out
+
+    @property
+    def raw(self) -> str:
+        """目前为止的完整 LLM 原始输出"""
+        return "".join(self._chunks)
+
+    @property
+    def checker(self):
+        """已喂入最终 SVG 的检查器；未得到完整 <svg>...</svg>（finish 按整段提取兜底）时为 None"""
+        return self._checker if self._closed else None
+
+    def finish(self) -> str:
+        """流结束后返回最终 SVG；未得到完整 <svg>...</svg> 时按整段提取规则兜底"""
+        if self._closed:
+            return "".join(self._emitted)
+        return extract_svg(self.raw)
 
 
 class OrchestrationService:
     """编排服务：perception → augmentation（可选 Stub）→ codegen（SiliconFlow）"""
 
-    def run(self, payload: InputPayload, request=None) -> dict:
-        """执行全链路编排（第一版：仅 SVG 生成，m3/m4/m5 保留调用结构）"""
+    def run(self, payload: InputPayload, request=None, run: Run = None) -> dict:
+        """执行全链路编排（第一版：仅 SVG 生成，m3/m4/m5 保留调用结构）；run 为已创建的运行（如队列任务）时沿用"""
+        run = run or RunLogger.create_run()
+        log = open_run_log(run)
+        log.update_status(run, "running")
+        deadline = _run_deadline(payload)
+        step_codegen = None
+
+        try:
+            final_spec = self._augment(run, payload, log=log, deadline=deadline)
+
+            # Step 3: Code Generation（调用 m3 SiliconFlow，非流式）
+            step_codegen = self._start_codegen(run, log=log)
+
+            provider_meta = {}
+            svg_text = self._codegen(run, payload, final_spec, provider_meta, log=log, deadline=deadline)
+
+            return self._finish(run, payload, final_spec, step_codegen, svg_text, provider_meta, log=log)
+
+        except DeadlineExceeded as e:
+            logger.warning("Run %s aborted: %s", run.id, e)
+            self._abort(run, e, deadline, step_codegen, log=log)
+            raise
+        except Exception as e:
+            logger.error("Orchestration failed: %s", e, exc_info=True)
+            self._fail(run, str(e), log=log)
+            raise
+        finally:
+            log.flush(raise_errors=False)
+
+    async def arun(self, payload: InputPayload, request=None) -> dict:
+        """
+        run 的 asyncio 版本：LLM 调用为原生协程，等待期间不占用线程；
+        ORM 读写（RunLogger / Draft）经 sync_to_async（thread_sensitive）桥接，
+        在同一个同步线程中串行执行，避免 SQLite 写锁竞争。
+        """
+        run = await sync_to_async(RunLogger.create_run)()
+        log = open_run_log(run)
+        await sync_to_async(log.update_status)(run, "running")
+        deadline = _run_deadline(payload)
+        step_codegen = None
+
+        try:
+            final_spec = await sync_to_async(self._augment)(run, payload, log=log, deadline=deadline)
+            step_codegen = await sync_to_async(self._start_codegen)(run, {"async": True}, log=log)
+
+            provider_meta = {}
+            svg_text = await self._acodegen(run, payload, final_spec, provider_meta, log=log, deadline=deadline)
+
+            return await sync_to_async(self._finish)(
+                run, payload, final_spec, step_codegen, svg_text, provider_meta, log=log,
+            )
+
+        except asyncio.CancelledError:
+            # ASGI 下客户端断开会取消视图协程，同时取消正在等待的 LLM 请求
+            logger.info("Run %s cancelled by client", run.id)
+            deadline.cancel("client disconnected")
+            await sync_to_async(self._abort)(run, deadline.error(), deadline, step_codegen, log=log)
+            raise
+        except DeadlineExceeded as e:
+            logger.warning("Run %s aborted: %s", run.id, e)
+            await sync_to_async(self._abort)(run, e, deadline, step_codegen, log=log)
+            raise
+        except Exception as e:
+            logger.error("Orchestration (async) failed: %s", e, exc_info=True)
+            await sync_to_async(self._fail)(run, str(e), log=log)
+            raise
+        finally:
+            await sync_to_async(log.flush)(raise_errors=False)
+
+    def run_stream(self, payload: InputPayload, request=None) -> Iterator[dict]:
+        """
+        流式编排：步骤与持久化同 run()，codegen 改为 SSE 流式调用，边生成边产出事件
+        {"event": ..., "data": ...}：
+        - run:   {"run_id"}，Run 创建后立即发出
+        - delta: {"svg"}，新增的 SVG 片段（前端按序拼接即可渲染）
+        - done:  与 run() 返回值相同的完整结果
+        - error: {"run_id", "error"}
+        """
         run = RunLogger.create_run()
-        RunLogger.update_status(run, "running")
+        log = open_run_log(run)
+        log.update_status(run, "running")
+        yield {"event": "run", "data": {"run_id": str(run.id)}}
+        deadline = _run_deadline(payload)
+        step_codegen = None
 
         try:
-            # Step 1: Perception（多模态识别，Stub）
-            step_perception = RunLogger.log_step(
-                run, "perception", input_data={
-                    "text": payload.text,
-                    "has_images": len(payload.images) > 0,
-                }
+            final_spec = self._augment(run, payload, log=log, deadline=deadline)
+
+            step_codegen = self._start_codegen(run, {"stream": True}, log=log)
+
+            provider_meta = {"stream": True}
+            svg_text = self._structured_codegen(run, payload, final_spec, provider_meta, log=log, deadline=deadline)
+            checker = cache = cache_key = cached = None
+            if svg_text is not None:
+                yield {"event": "delta", "data": {"svg": svg_text}}  # 本地布局 / 紧凑场景：整段作为一个增量推送
+            else:
+                messages = self._build_messages(payload)
+                cache, cache_key, cached = self._cache_lookup(payload, messages, provider_meta)
+                if cached is not None:
+                    deltas = [cached]  # 命中缓存：整段作为一个增量推送
+                else:
+                    provider_meta["deadline_s"] = round(deadline.remaining(), 3)
+                    deltas = get_router().stream(
+                        messages, temperature=CODEGEN_TEMPERATURE, meta=provider_meta, deadline=deadline,
+                    )
+
+                extractor = SvgStreamExtractor()
+                for delta in deltas:
+                    svg_delta = extractor.feed(delta)
+                    if svg_delta:
+                        yield {"event": "delta", "data": {"svg": svg_delta}}
+
+                svg_text = extractor.finish() or extractor.raw.strip()
+                checker = extractor.checker
+            svg_text = self._validate_svg(svg_text, provider_meta, deadline=deadline, checker=checker)
+            if cached is None:
+                self._cache_store(cache, cache_key, svg_text, provider_meta)
+            result = self._finish(run, payload, final_spec, step_codegen, svg_text, provider_meta, log=log)
+
+        except GeneratorExit:
+            # 客户端断开：生成器关闭会级联关闭上游 LLM 流，不再继续消费 token
+            logger.info("Run %s stream closed by client", run.id)
+            deadline.cancel("client disconnected")
+            self._abort(run, deadline.error(), deadline, step_codegen, log=log)
+            log.flush(raise_errors=False)
+            raise
+        except DeadlineExceeded as e:
+            logger.warning("Run %s aborted: %s", run.id, e)
+            self._abort(run, e, deadline, step_codegen, log=log)
+            log.flush(raise_errors=False)
+            yield {"event": "error", "data": {"run_id": str(run.id), "error": str(e)}}
+            return
+        except Exception as e:
+            logger.error("Orchestration (stream) failed: %s", e, exc_info=True)
+            self._fail(run, str(e), log=log)
+            log.flush(raise_errors=False)
+            yield {"event": "error", "data": {"run_id": str(run.id), "error": str(e)}}
+            return
+
+        yield {"event": "done", "data": result}
+
+    def run_batch(self, payloads: List[InputPayload], max_concurrency: int = None) -> dict:
+        """
+        批量编排：每个条目各自一个 Run，挂在同一个 RunBatch 下。
+        - 各条目在有界线程池中并行执行 perception → 补全 → codegen，步骤与产物记入
+          各自的 RunJournal（仅内存），不在工作线程中逐条写库
+        - 全部完成后在一个事务内 bulk_create 草稿、步骤与产物，bulk_update 运行状态
+        单个条目失败不影响其余条目，失败原因记录在该条目的 error 步骤与返回值中。
+        """
+        if max_concurrency is None:
+            max_concurrency = int(os.environ.get("ORCHESTRATOR_BATCH_MAX_CONCURRENCY", 4))
+        workers = max(1, min(int(max_concurrency), BATCH_MAX_CONCURRENCY, len(payloads) or 1))
+
+        batch = RunBatch.objects.create(total=len(payloads), max_concurrency=workers)
+        runs = Run.objects.bulk_create([Run(status="running", batch=batch) for _ in payloads])
+        journals = [RunJournal(run) for run in runs]
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+            futures = [run_in_context(pool, self._generate_item, p, j) for p, j in zip(payloads, journals)]
+            outcomes = [future.result() for future in futures]
+
+        # m7 草稿：仅当 output_mode != "preview-only" 时写入
+        from m7_editors.models import Draft
+
+        pending = []
+        for payload, journal, outcome in zip(payloads, journals, outcomes):
+            if outcome.get("draft") is not None and (payload.params or {}).get("output_mode", "auto") != "preview-only":
+                draft = outcome["draft"]
+                pending.append((journal, outcome, Draft(dsl_type=draft.dsl_type, code=draft.code, meta_json=draft.meta, run=journal.run)))
+
+        with transaction.atomic():
+            for _, _, draft_model in pending:
+                draft_model.store_code()  # bulk_create 不调用 save()
+            Draft.objects.bulk_create([d for _, _, d in pending])
+            for journal, outcome, draft_model in pending:
+                outcome["draft_id"] = draft_model.id
+                if draft_model.code_blob_id:
+                    BlobStore.retain(draft_model.code_blob_id)
+                journal.add_artifact(
+                    journal.run, "code", ref_id=str(draft_model.id), preview_text=draft_model.code[:100],
+                    blob_id=draft_model.code_blob_id,
+                )
+            for journal, outcome in zip(journals, outcomes):
+                if outcome.get("draft") is not None:
+                    journal.update_status(journal.run, "success")
+            RunJournal.flush_many(journals)
+
+        items = []
+        for index, (journal, outcome) in enumerate(zip(journals, outcomes)):
+            if outcome.get("draft") is not None:
+                item = self._result(journal.run, outcome["draft"], outcome.get("draft_id"), outcome["final_spec"])
+            else:
+                item = {"run_id": str(journal.run.id), "status": "failed", "error": outcome["error"]}
+            items.append({"index": index, **item})
+
+        batch.succeeded = sum(1 for item in items if item["status"] == "success")
+        batch.failed = len(items) - batch.succeeded
+        if batch.failed == 0:
+            batch.status = "success"
+        elif batch.succeeded == 0:
+            batch.status = "failed"
+        else:
+            batch.status = "partial"
+        batch.finished_at = timezone.now()
+        batch.save()
+
+        return {
+            "batch_id": str(batch.id),
+            "status": batch.status,
+            "total": batch.total,
+            "succeeded": batch.succeeded,
+            "failed": batch.failed,
+            "max_concurrency": batch.max_concurrency,
+            "items": items,
+        }
+
+    def _generate_item(self, payload: InputPayload, journal: RunJournal) -> dict:
+        """批量中的单个条目（在工作线程中执行），返回 {"draft", "final_spec"} 或 {"error"}"""
+        run = journal.run
+        deadline = _run_deadline(payload)
+        step_codegen = None
+        try:
+            final_spec = self._augment(run, payload, log=journal, deadline=deadline)
+            step_codegen = self._start_codegen(run, {"batch": str(run.batch_id)}, log=journal)
+
+            provider_meta = {}
+            svg_text = self._codegen(run, payload, final_spec, provider_meta, log=journal, deadline=deadline)
+
+            draft = self._end_codegen(run, step_codegen, svg_text, provider_meta, log=journal)
+            return {"draft": draft, "final_spec": final_spec}
+        except DeadlineExceeded as e:
+            logger.warning("Batch item (run %s) aborted: %s", run.id, e)
+            self._abort(run, e, deadline, step_codegen, log=journal)
+            return {"error": str(e)}
+        except Exception as e:
+            logger.error("Batch item (run %s) failed: %s", run.id, e, exc_info=True)
+            self._fail(run, str(e), log=journal)
+            return {"error": str(e)}
+        finally:
+            # 单飞锁行等会在工作线程中打开数据库连接，线程复用前关闭
+            connections.close_all()
+
+    def _augment(self, run: Run, payload: InputPayload, log=RunLogger, deadline: Deadline = None) -> FinalSpec:
+        """
+        Step 1-2：perception → KG/RAG 补全，返回 FinalSpec；log 可传入 RunJournal 以缓冲写库。
+        KG 与 RAG 只依赖 perception，由 StepScheduler 并发执行；二者为可选步骤，失败或超时时跳过，
+        合并顺序固定为先 KG 后 RAG，与完成先后无关。
+        """
+        scheduler = StepScheduler(run, log=log, deadline=deadline)
+        images = [img.__dict__ for img in payload.images] if payload.images else None
+
+        # Step 1: Perception（多模态识别，Stub）
+        scheduler.add(
+            "perception",
+            lambda _: VisionService.perceive(text=payload.text, images=images),
+            input_data={"text": payload.text, "has_images": len(payload.images) > 0},
+            describe=lambda scene: scene.to_dict(),
+        )
+        # Step 2: Augmentation（补全，当前阶段跳过真实逻辑，仅保留调用结构）
+        if payload.params.get("enable_kg", False):
+            scheduler.add(
+                "kg_augmentation",
+                lambda deps: KnowledgeGraphService.augment(deps["perception"]),
+                deps=("perception",), optional=True,
+                describe=lambda kg_filled: {"filled": kg_filled},
+            )
+        if payload.params.get("enable_rag", False):
+            scheduler.add(
+                "rag_augmentation",
+                lambda deps: RagService.augment(deps["perception"]),
+                deps=("perception",), optional=True,
+                describe=lambda result: {"filled": result[0], "citations_count": len(result[1])},
+            )
+
+        results = scheduler.run_all()
+        scene = results["perception"]
+        log.add_artifact(run, "scene_spec", preview_text=f"Intent: {scene.intent}")
+
+        final_spec = FinalSpec(scene=scene)
+        kg_filled = results.get("kg_augmentation")
+        if kg_filled:
+            for k, v in kg_filled.items():
+                if k not in final_spec.filled or k in KG_OVERRIDE_KEYS:
+                    final_spec.filled[k] = v
+        if results.get("rag_augmentation"):
+            rag_filled, citations = results["rag_augmentation"]
+            final_spec.citations = citations
+            for k, v in rag_filled.items():
+                if k not in final_spec.filled or k in RAG_OVERRIDE_KEYS:
+                    final_spec.filled[k] = v
+
+        log.add_artifact(run, "final_spec", preview_text=f"Filled {len(final_spec.filled)} slots")
+        return final_spec
+
+    def _codegen(
+        self, run: Run, payload: InputPayload, final_spec: FinalSpec, provider_meta: dict, log=RunLogger,
+        deadline: Deadline = None,
+    ) -> str:
+        """
+        同步 codegen：先按 codegen_strategy 尝试本地布局 / 紧凑场景，不可用时由 LLM 直接生成 SVG，
+        最后经 _validate_svg 校验与修复
+        """
+        svg_text = self._structured_codegen(run, payload, final_spec, provider_meta, log=log, deadline=deadline)
+        if svg_text is not None:
+            return self._validate_svg(svg_text, provider_meta, deadline=deadline)
+
+        messages = self._build_messages(payload)
+        cache, cache_key, raw_content = self._cache_lookup(payload, messages, provider_meta)
+        hit = raw_content is not None
+        if not hit:
+            raw_content = self._call_provider(run, payload, messages, provider_meta, log=log, deadline=deadline)
+        svg_text = extract_svg(raw_content) or raw_content  # 提取失败时回退为原始内容
+        svg_text = self._validate_svg(svg_text, provider_meta, deadline=deadline)
+        if not hit:
+            self._cache_store(cache, cache_key, svg_text, provider_meta)
+        return svg_text
+
+    def _structured_codegen(
+        self, run: Run, payload: InputPayload, final_spec: FinalSpec, provider_meta: dict, log=RunLogger,
+        deadline: Deadline = None,
+    ) -> Optional[str]:
+        """
+        codegen_strategy 为 layout / compact 时的生成路径，返回 SVG；策略为 llm 或需要回退时返回 None。
+        实际使用的策略写入 provider_meta["strategy"]。
+        """
+        provider_meta["strategy"] = "llm"
+        strategy = _codegen_strategy(payload)
+        if strategy == "layout":
+            return self._layout_codegen(final_spec, provider_meta)
+        if strategy == "compact":
+            messages = self._build_messages(payload, scene_dsl.SYSTEM_PROMPT)
+            compact_meta = {}
+            cache, cache_key, raw_content = self._cache_lookup(payload, messages, compact_meta)
+            if raw_content is None:
+                # 不在调用时写缓存：展开成功后再写，避免缓存不合法的输出
+                raw_content = self._call_provider(run, payload, messages, compact_meta, log=log, deadline=deadline)
+            return self._expand_compact(raw_content, compact_meta, provider_meta, cache, cache_key)
+        return None
+
+    async def _acodegen(
+        self, run: Run, payload: InputPayload, final_spec: FinalSpec, provider_meta: dict, log=RunLogger,
+        deadline: Deadline = None,
+    ) -> str:
+        """_codegen 的 asyncio 版本：LLM 调用为原生协程，本地布局与缓存读写在线程池中执行"""
+        provider_meta["strategy"] = "llm"
+        strategy = _codegen_strategy(payload)
+        svg_text = None
+        if strategy == "layout":
+            svg_text = await sync_to_async(self._layout_codegen, thread_sensitive=False)(final_spec, provider_meta)
+        elif strategy == "compact":
+            messages = self._build_messages(payload, scene_dsl.SYSTEM_PROMPT)
+            compact_meta = {}
+            raw_content, cache, cache_key = await self._achat(run, payload, messages, compact_meta, log=log, deadline=deadline)
+            svg_text = await sync_to_async(self._expand_compact, thread_sensitive=False)(
+                raw_content, compact_meta, provider_meta, cache, cache_key,
             )
-            RunLogger.start_step(step_perception)
+        if svg_text is not None:
+            return await self._avalidate_svg(svg_text, provider_meta, deadline)
 
-            scene = VisionService.perceive(
-                text=payload.text,
-                images=[img.__dict__ for img in payload.images] if payload.images else None,
+        raw_content, cache, cache_key = await self._achat(
+            run, payload, self._build_messages(payload), provider_meta, log=log, deadline=deadline,
+        )
+        svg_text = extract_svg(raw_content) or raw_content  # 提取失败时回退为原始内容
+        svg_text = await self._avalidate_svg(svg_text, provider_meta, deadline)
+        if not provider_meta["cache"].get("hit"):
+            await sync_to_async(self._cache_store, thread_sensitive=False)(cache, cache_key, svg_text, provider_meta)
+        return svg_text
+
+    async def _achat(
+        self, run: Run, payload: InputPayload, messages: list, provider_meta: dict, log=RunLogger,
+        deadline: Deadline = None,
+    ):
+        """
+        异步 LLM 调用（先查缓存），返回 (content, cache, key)；不写缓存，由调用方校验后写入。
+        与 _call_provider 一样经单飞合并（与同步路径的请求也能合并）：LLM 调用仍是原生协程，
+        等待 leader 与锁行协调在线程池中执行，不阻塞事件循环。
+        """
+        cache, cache_key, content = await sync_to_async(self._cache_lookup, thread_sensitive=False)(
+            payload, messages, provider_meta
+        )
+        if content is not None:
+            return content, cache, cache_key
+        if deadline is not None:
+            provider_meta["deadline_s"] = round(deadline.remaining(), 3)
+
+        async def call() -> str:
+            return await get_router().achat(
+                messages, temperature=CODEGEN_TEMPERATURE, meta=provider_meta, hedge=_hedge_param(payload),
+                deadline=deadline,
             )
 
-            RunLogger.end_step(step_perception, output_data=scene.to_dict())
-            RunLogger.add_artifact(run, "scene_spec", preview_text=f"Intent: {scene.intent}")
-
-            # Step 2: Augmentation（补全，当前阶段跳过真实逻辑，仅保留调用结构）
-            final_spec = FinalSpec(scene=scene)
-
-            if payload.params.get("enable_kg", False):
-                step_kg = RunLogger.log_step(run, "kg_augmentation")
-                RunLogger.start_step(step_kg)
-                kg_filled = KnowledgeGraphService.augment(scene)
-                for k, v in kg_filled.items():
-                    if k not in final_spec.filled or k in ["工艺", "材料", "设备", "网络类型", "协议", "组件库", "样式"]:
-                        final_spec.filled[k] = v
-                RunLogger.end_step(step_kg, output_data={"filled": kg_filled})
-
-            if payload.params.get("enable_rag", False):
-                step_rag = RunLogger.log_step(run, "rag_augmentation")
-                RunLogger.start_step(step_rag)
-                rag_filled, citations = RagService.augment(scene)
-                final_spec.citations = citations
-                for k, v in rag_filled.items():
-                    if k not in final_spec.filled or k in ["参数", "标准", "配置参数", "安全标准", "设计规范", "响应式参数"]:
-                        final_spec.filled[k] = v
-                RunLogger.end_step(
-                    step_rag,
-                    output_data={"filled": rag_filled, "citations_count": len(citations)},
+        if not _param_enabled(payload.params, "coalesce"):
+            return await call(), cache, cache_key
+
+        key = normalize_key(resolve_model(), messages, CODEGEN_TEMPERATURE)
+        # leader 在线程池线程中经 async_to_sync 把调用交回本事件循环执行
+        content, leader_run_id = await sync_to_async(get_singleflight().do, thread_sensitive=False)(
+            key, str(run.id), async_to_sync(call), deadline=deadline,
+        )
+        if leader_run_id:
+            await sync_to_async(log.mark_coalesced)(run, leader_run_id)
+            provider_meta["coalesced_from"] = leader_run_id
+        return content, cache, cache_key
+
+    @staticmethod
+    def _validate_svg(svg_text: str, provider_meta: dict, deadline: Deadline = None, checker: SvgChecker = None) -> str:
+        """
+        codegen 之后的校验与修复（svg_repair.validate），报告写入 provider_meta["validation"]，随 codegen 步骤落库。
+        本地修复失败时发起一次只包含出错片段的修正调用（ORCHESTRATOR_SVG_FIX=0 关闭）。
+        """
+        svg_text, report = svg_repair.validate(svg_text, checker)
+        if report.get("remaining_error") and _svg_fix_enabled():
+            messages, span = svg_repair.fix_request(svg_text, report["remaining_error"])
+            fix_meta = {}
+            if deadline is not None:
+                fix_meta["deadline_s"] = round(deadline.remaining(), 3)
+            try:
+                reply = get_router().chat(messages, temperature=CODEGEN_TEMPERATURE, meta=fix_meta, deadline=deadline)
+            except ValueError as e:
+                logger.warning("SVG fix call failed: %s", e)
+                report["fix_error"] = {"message": str(e)}
+            else:
+                svg_text, report = svg_repair.apply_fix(svg_text, span, reply, report)
+            report["fix"] = fix_meta
+        return OrchestrationService._record_validation(svg_text, report, provider_meta)
+
+    @staticmethod
+    async def _avalidate_svg(svg_text: str, provider_meta: dict, deadline: Deadline) -> str:
+        """_validate_svg 的 asyncio 版本"""
+        svg_text, report = svg_repair.validate(svg_text)
+        if report.get("remaining_error") and _svg_fix_enabled():
+            messages, span = svg_repair.fix_request(svg_text, report["remaining_error"])
+            fix_meta = {"deadline_s": round(deadline.remaining(), 3)}
+            try:
+                reply = await get_router().achat(
+                    messages, temperature=CODEGEN_TEMPERATURE, meta=fix_meta, deadline=deadline,
                 )
+            except ValueError as e:
+                logger.warning("SVG fix call failed: %s", e)
+                report["fix_error"] = {"message": str(e)}
+            else:
+                svg_text, report = svg_repair.apply_fix(svg_text, span, reply, report)
+            report["fix"] = fix_meta
+        return OrchestrationService._record_validation(svg_text, report, provider_meta)
 
-            RunLogger.add_artifact(run, "final_spec", preview_text=f"Filled {len(final_spec.filled)} slots")
+    @staticmethod
+    def _record_validation(svg_text: str, report: dict, provider_meta: dict) -> str:
+        if not report["valid"]:
+            outcome = "invalid"
+        elif report["fixed_by"] == "llm":
+            outcome = "fixed"
+        else:
+            outcome = "repaired" if report["repairs"] else "valid"
+        metrics.SVG_VALIDATIONS.inc(result=outcome)
+        if outcome == "invalid":
+            logger.warning("Generated SVG is not well-formed: %s", report.get("error"))
+        provider_meta["validation"] = report
+        return svg_text
 
-            # 第一版：仅 SVG，不跑 dsl_router，直接进入 codegen
-            dsl_type = "svg"
-            router_reason = "第一版仅生成 SVG"
+    @staticmethod
+    def _layout_codegen(final_spec: FinalSpec, provider_meta: dict) -> Optional[str]:
+        """
+        由本地布局引擎直接渲染 SVG，布局统计写入 provider_meta["layout"]。
+        意图不支持或布局失败时返回 None，由调用方回退 LLM；回退原因写入 provider_meta["layout_fallback"]。
+        """
+        scene = final_spec.scene
+        if not layout.supports(scene):
+            provider_meta["layout_fallback"] = f"unsupported intent: {scene.intent if scene else None}"
+            return None
+        try:
+            svg_text, stats = layout.render_scene(scene)
+        except ValueError as e:
+            logger.warning("Layout codegen failed, falling back to LLM: %s", e)
+            provider_meta["layout_fallback"] = str(e)
+            return None
+        provider_meta["strategy"] = "layout"
+        provider_meta["layout"] = stats
+        return svg_text
 
-            # Step 3: Code Generation（调用 m3 SiliconFlow，非流式）
-            step_codegen = RunLogger.log_step(run, "codegen")
-            RunLogger.start_step(step_codegen)
-
-            messages = [
-                {"role": "system", "content": SVG_SYSTEM_PROMPT},
-                {"role": "user", "content": payload.text or "请输出一个最简单的 SVG，画一个矩形，写 Hello SVG"},
-            ]
-            raw_content = siliconflow_chat(messages, temperature=0.2)
-            svg_text = _extract_svg_from_llm_response(raw_content)
-            if not svg_text:
-                svg_text = raw_content  # 回退为原始内容
-
-            draft = DslDraft(
-                dsl_type="svg",
-                code=svg_text,
-                meta={
-                    "title": "SVG 草稿",
-                    "width": None,
-                    "height": None,
-                    "editable": True,
-                    "router_reason": router_reason,
-                },
-            )
+    @staticmethod
+    def _expand_compact(raw_content: str, compact_meta: dict, provider_meta: dict, cache=None, cache_key=None) -> Optional[str]:
+        """
+        校验并展开紧凑场景。成功时写入缓存，该次调用的元信息并入 provider_meta，展开统计写入 provider_meta["compact"]；
+        输出不合法时返回 None，由调用方回退为直接生成 SVG，失败原因与调用元信息写入 provider_meta["compact_fallback"]。
+        """
+        try:
+            svg_text, stats = scene_dsl.expand(scene_dsl.parse(raw_content))
+        except ValueError as e:
+            logger.warning("Compact scene invalid, falling back to direct SVG: %s", e)
+            provider_meta["compact_fallback"] = {"error": str(e), "provider": compact_meta}
+            return None
+        if cache is not None and not compact_meta["cache"].get("hit"):
+            cache.set(cache_key, raw_content)
+        provider_meta.update(compact_meta)
+        provider_meta["strategy"] = "compact"
+        provider_meta["compact"] = {**stats, "response_chars": len(raw_content), "svg_chars": len(svg_text)}
+        return svg_text
+
+    @staticmethod
+    def _cache_lookup(payload: InputPayload, messages: list, provider_meta: dict):
+        """
+        codegen 前查询 LLM 响应缓存，返回 (cache, key, content)。
+        缓存未启用或 params.use_cache 为 false 时 cache 为 None；未命中时 content 为 None。
+        命中与否及进程内命中统计写入 provider_meta["cache"]，随 codegen 步骤落库。
+        """
+        cache = get_cache()
+        if cache is None or not _param_enabled(payload.params, "use_cache"):
+            provider_meta["cache"] = {"enabled": False}
+            return None, None, None
 
-            RunLogger.end_step(step_codegen, output_data=draft.to_dict())
-            RunLogger.add_artifact(
-                run, "draft_svg", preview_text=(svg_text[:200] + "..." if len(svg_text) > 200 else svg_text)
+        key = make_key(resolve_model(), messages, CODEGEN_TEMPERATURE)
+        content, tier = cache.get(key)
+        provider_meta["cache"] = {"hit": content is not None, "tier": tier, "key": key[:16], **cache.stats()}
+        return cache, key, content
+
+    @staticmethod
+    def _cache_store(cache, cache_key: str, svg_text: str, provider_meta: dict) -> None:
+        """
+        把校验后的 SVG 写入 LLM 响应缓存（命中时无需再修复或修正）。输出被截断（finish_reason 不是 stop）
+        或校验后仍不合法时不写入，下次重新生成；是否写入记录在 provider_meta["cache"]["stored"]。
+        单飞合并的跟随者看不到调用的 finish_reason，由实际调用 LLM 的运行决定是否写入。
+        """
+        if cache is None or provider_meta.get("coalesced_from"):
+            return
+        finish = provider_meta.get("finish_reason")
+        stored = finish in (None, "stop") and provider_meta.get("validation", {}).get("valid", False)
+        if stored:
+            cache.set(cache_key, svg_text)
+        provider_meta["cache"]["stored"] = stored
+        if finish not in (None, "stop"):
+            provider_meta["cache"]["skip_reason"] = f"finish_reason={finish}"
+
+    @staticmethod
+    def _call_provider(
+        run: Run, payload: InputPayload, messages: list, provider_meta: dict, log=RunLogger, deadline: Deadline = None,
+    ) -> str:
+        """
+        调用 LLM（不写缓存，由调用方校验输出后经 _cache_store 写入）。默认经单飞合并：并发的相同请求只有一个真正调用 LLM，
+        其余复用其结果，并在各自 Run 上记录 coalesced_from；params.coalesce=false 时直接调用。
+        调用与等待都受 deadline 约束，codegen 开始时的剩余预算记入 provider_meta["deadline_s"]。
+        """
+        if deadline is not None:
+            provider_meta["deadline_s"] = round(deadline.remaining(), 3)
+
+        def call() -> str:
+            return get_router().chat(
+                messages, temperature=CODEGEN_TEMPERATURE, meta=provider_meta, hedge=_hedge_param(payload),
+                deadline=deadline,
             )
 
-            # m7 草稿：仅当 output_mode != "preview-only" 时写入
-            draft_model = None
-            output_mode = (payload.params or {}).get("output_mode", "auto")
+        if not _param_enabled(payload.params, "coalesce"):
+            return call()
+
+        key = normalize_key(resolve_model(), messages, CODEGEN_TEMPERATURE)
+        content, leader_run_id = get_singleflight().do(key, str(run.id), call, deadline=deadline)
+        if leader_run_id:
+            log.mark_coalesced(run, leader_run_id)
+            provider_meta["coalesced_from"] = leader_run_id
+        return content
+
+    @staticmethod
+    def _start_codegen(run: Run, input_data: dict = None, log=RunLogger) -> RunStepLog:
+        """创建并开始 codegen 步骤"""
+        step_codegen = log.log_step(run, "codegen", input_data=input_data)
+        log.start_step(step_codegen)
+        return step_codegen
+
+    @staticmethod
+    def _fail(run: Run, error: str, log=RunLogger) -> None:
+        """标记运行失败并记录 error 步骤"""
+        log.update_status(run, "failed")
+        log.log_step(run, "error", error=error)
+
+    @staticmethod
+    def _abort(run: Run, error: DeadlineExceeded, deadline: Deadline, open_step: RunStepLog = None, log=RunLogger) -> None:
+        """预算耗尽或被取消：结束未完成的步骤，标记运行失败并记录 deadline_exceeded 步骤"""
+        if open_step is not None and open_step.ended_at is None:
+            log.end_step(open_step, error=str(error))
+        log.update_status(run, "failed")
+        log.log_step(
+            run, "deadline_exceeded",
+            input_data={"budget_s": deadline.budget, "elapsed_s": round(deadline.elapsed(), 3), "reason": error.reason},
+            error=str(error),
+        )
+
+    @staticmethod
+    def _build_messages(payload: InputPayload, system_prompt: str = SVG_SYSTEM_PROMPT) -> list:
+        """构建 codegen 的 chat messages"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": payload.text or "请输出一个最简单的 SVG，画一个矩形，写 Hello SVG"},
+        ]
+
+    def _finish(
+        self,
+        run: Run,
+        payload: InputPayload,
+        final_spec: FinalSpec,
+        step_codegen: RunStepLog,
+        svg_text: str,
+        provider_meta: dict,
+        log=RunLogger,
+    ) -> dict:
+        """
+        codegen 之后的统一收尾：结束 codegen 步骤、写产物与 m7 草稿、标记成功，返回 API 结果。
+        草稿与缓冲的运行日志在同一个事务中写入。
+        """
+        draft = self._end_codegen(run, step_codegen, svg_text, provider_meta, log=log)
+
+        # m7 草稿：仅当 output_mode != "preview-only" 时写入
+        draft_model = None
+        output_mode = (payload.params or {}).get("output_mode", "auto")
+        with transaction.atomic():
             if output_mode != "preview-only":
                 from m7_editors.models import Draft
 
+                # 草稿保存优化后的代码（与 codegen 步骤输出、draft_svg 产物同一份内容，共用 blob）
                 draft_model = Draft.objects.create(
                     dsl_type="svg",
-                    code=svg_text,
+                    code=draft.code,
                     meta_json=draft.meta,
                     run=run,
                 )
-                RunLogger.add_artifact(run, "code", ref_id=str(draft_model.id), preview_text=svg_text[:100])
-
-            RunLogger.update_status(run, "success")
-
-            return {
-                "run_id": str(run.id),
-                "status": "success",
-                "draft": {
-                    "dsl_type": "svg",
-                    "code": svg_text,
-                    "meta": draft.meta,
-                },
-                "draft_id": draft_model.id if draft_model else None,
-                "final_spec": final_spec.to_dict(),
-            }
+                if draft_model.code_blob_id:
+                    BlobStore.retain(draft_model.code_blob_id)
+                log.add_artifact(
+                    run, "code", ref_id=str(draft_model.id), preview_text=draft.code[:100], blob_id=draft_model.code_blob_id,
+                )
 
-        except Exception as e:
-            logger.error("Orchestration failed: %s", e, exc_info=True)
-            RunLogger.update_status(run, "failed")
-            RunLogger.log_step(run, "error", error=str(e))
-            raise
+            log.update_status(run, "success")
+            log.flush()
+
+        return self._result(run, draft, draft_model.id if draft_model else None, final_spec)
+
+    @staticmethod
+    def _end_codegen(run: Run, step_codegen: RunStepLog, svg_text: str, provider_meta: dict, log=RunLogger) -> DslDraft:
+        """构建 SVG 草稿（校验通过时先做体积优化，meta 尺寸由 svg_geometry 推导），结束 codegen 步骤并记录 draft_svg 产物"""
+        optimizer_report = None
+        if provider_meta.get("validation", {}).get("valid", True):
+            svg_text, optimizer_report = svg_optimizer.optimize_if_enabled(svg_text, source="codegen")
+
+        # 第一版：仅 SVG，不跑 dsl_router，直接进入 codegen
+        router_reason = "第一版仅生成 SVG"
+
+        size = svg_geometry.measure(svg_text)
+        draft = DslDraft(
+            dsl_type="svg",
+            code=svg_text,
+            meta={
+                "title": "SVG 草稿",
+                "width": size["width"],
+                "height": size["height"],
+                "viewBox": size["viewBox"],
+                "bbox": size["bbox"],
+                "editable": True,
+                "router_reason": router_reason,
+            },
+        )
+
+        # 较大的 SVG 存入 blob 存储，codegen 步骤输出与 draft_svg 产物只保存引用
+        output = {**draft.to_dict(), "provider": provider_meta}
+        if optimizer_report:
+            output["optimizer"] = optimizer_report
+        blob_key = log.put_blob(svg_text, refs=2)
+        if blob_key:
+            del output["code"]
+            step_codegen.output_blob_id = blob_key
+        log.end_step(step_codegen, output_data=output)
+        log.add_artifact(
+            run, "draft_svg", preview_text=(svg_text[:200] + "..." if len(svg_text) > 200 else svg_text),
+            blob_id=blob_key,
+        )
+        return draft
+
+    @staticmethod
+    def _result(run: Run, draft: DslDraft, draft_id, final_spec: FinalSpec) -> dict:
+        """API 返回的运行结果"""
+        return {
+            "run_id": str(run.id),
+            "status": "success",
+            "draft": {
+                "dsl_type": draft.dsl_type,
+                "code": draft.code,
+                "meta": draft.meta,
+            },
+            "draft_id": draft_id,
+            "final_spec": final_spec.to_dict(),
+        }
@@ -0,0 +1,215 @@
+"""
+codegen 单飞（single-flight）合并：相同的 codegen 请求同一时刻只调用一次 LLM。
+- 进程内：第一个调用者成为 leader，并发的重复请求等待其结果（threading.Event）
+- 跨 worker：通过 CodegenFlight 锁行协调，等待者轮询锁行直到 leader 写回结果；
+  leader 执行期间由心跳线程每 1/3 租约续约一次（慢调用、重试不会被误接管），
+  leader 崩溃时租约（expires_at）过期，由等待者接管
+
+可通过环境变量调整（均为可选）：
+- ORCHESTRATOR_SINGLEFLIGHT_DB     是否启用跨 worker 锁行，默认 1
+- ORCHESTRATOR_SINGLEFLIGHT_LEASE  租约 / 最长等待时间（秒），默认 300
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from common.deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+# leader 完成后结果在锁行中保留的时长：恰好在完成瞬间到达的请求也能直接复用
+_RESULT_WINDOW = timedelta(seconds=5)
+# 已结束的锁行保留多久后清理
+_RETENTION = timedelta(minutes=10)
+
+
+def normalize_key(model: str, messages: List[Dict[str, str]], temperature: float) -> str:
+    """单飞键：对 (model, 折叠空白后的 messages, temperature) 取 sha256"""
+    normalized = [
+        {"role": m.get("role"), "content": " ".join(str(m.get("content") or "").split())}
+        for m in messages
+    ]
+    canonical = json.dumps(
+        {"model": model, "messages": normalized, "temperature": round(float(temperature), 4)},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """进程内一次进行中的调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self.leader_run_id: Optional[str] = None
+
+
+class SingleFlight:
+    """codegen 单飞协调器（进程级单例见 get_singleflight）"""
+
+    def __init__(self, lease_seconds: float = 300, poll_interval: float = 0.2, use_db: bool = True):
+        self.lease = timedelta(seconds=lease_seconds)
+        self.poll_interval = poll_interval
+        self.use_db = use_db
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+
+    def do(self, key: str, run_id: str, fn: Callable[[], str], deadline: Optional[Deadline] = None) -> Tuple[str, Optional[str]]:
+        """
+        执行或等待 key 对应的调用，返回 (结果, leader_run_id)。
+        当前调用者自己就是 leader 时 leader_run_id 为 None；leader 失败时等待者抛出 ValueError。
+        deadline 为等待者自己的运行截止时间：等待不超过剩余预算，耗尽时抛出 DeadlineExceeded。
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not is_leader:
+            wait = self.lease.total_seconds()
+            if deadline is not None:
+                wait = min(wait, deadline.remaining())
+            if not flight.done.wait(wait):
+                if deadline is not None and deadline.expired():
+                    raise deadline.error("coalesced codegen wait")
+                raise ValueError("Coalesced codegen timed out waiting for leader")
+            if flight.error is not None:
+                raise ValueError(f"Coalesced codegen failed: {flight.error}")
+            return flight.result, flight.leader_run_id
+
+        try:
+            if self.use_db:
+                result, leader_run_id = self._do_shared(key, run_id, fn, deadline)
+            else:
+                result, leader_run_id = fn(), None
+            flight.result = result
+            flight.leader_run_id = leader_run_id or str(run_id)
+            return result, leader_run_id
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    # ---------- 跨 worker（DB 锁行） ----------
+
+    def _do_shared(self, key: str, run_id: str, fn: Callable[[], str], deadline=None) -> Tuple[str, Optional[str]]:
+        from .models import CodegenFlight
+
+        waited = False
+        give_up_at = time.monotonic() + self.lease.total_seconds()
+        while True:
+            now = timezone.now()
+            row = CodegenFlight.objects.filter(key=key).first()
+
+            if row is None:
+                if self._create(key, run_id, now):
+                    return self._lead(key, run_id, fn), None
+                continue
+
+            # 锁行的 leader 就是本运行：上一次执行（如崩溃后被队列重新领取的任务）遗留，直接接管
+            own = str(row.leader_run_id) == str(run_id)
+            if own and row.status == 'done':
+                return row.result or "", None
+            if row.status == 'running' and row.expires_at > now and not own:
+                if time.monotonic() > give_up_at:
+                    raise ValueError("Coalesced codegen timed out waiting for leader")
+                waited = True
+                if deadline is not None:
+                    deadline.sleep(self.poll_interval, "coalesced codegen wait")
+                else:
+                    time.sleep(self.poll_interval)
+                continue
+
+            if row.status == 'done' and (waited or row.updated_at >= now - _RESULT_WINDOW):
+                return row.result or "", str(row.leader_run_id) if row.leader_run_id else None
+            if row.status == 'failed' and waited:
+                raise ValueError(f"Coalesced codegen failed: {row.error}")
+
+            # 过期 / 陈旧的锁行：以 updated_at 做乐观锁接管
+            taken = CodegenFlight.objects.filter(key=key, updated_at=row.updated_at).update(
+                status='running', leader_run_id=run_id, result=None, error=None,
+                expires_at=now + self.lease, updated_at=now,
+            )
+            if taken:
+                if row.status == 'running':
+                    logger.warning("Took over expired codegen flight %s from run %s", key[:12], row.leader_run_id)
+                return self._lead(key, run_id, fn), None
+
+    def _create(self, key: str, run_id: str, now) -> bool:
+        from .models import CodegenFlight
+        try:
+            with transaction.atomic():
+                CodegenFlight.objects.create(key=key, leader_run_id=run_id, status='running', expires_at=now + self.lease)
+            return True
+        except IntegrityError:
+            return False
+
+    def _lead(self, key: str, run_id: str, fn: Callable[[], str]) -> str:
+        """作为 leader 执行调用并把结果写回锁行；执行期间由心跳线程续约"""
+        from .models import CodegenFlight
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(key, run_id, done), daemon=True)
+        heartbeat.start()
+        try:
+            try:
+                result = fn()
+            finally:
+                done.set()
+                heartbeat.join()
+        except Exception as e:
+            CodegenFlight.objects.filter(key=key).update(status='failed', error=str(e)[:2000], updated_at=timezone.now())
+            raise
+
+        now = timezone.now()
+        CodegenFlight.objects.filter(key=key).update(status='done', result=result, updated_at=now)
+        # 顺带清理早已结束的锁行，保持表很小
+        CodegenFlight.objects.filter(~Q(status='running'), updated_at__lt=now - _RETENTION).delete()
+        return result
+
+    def _heartbeat(self, key: str, run_id: str, done: threading.Event) -> None:
+        from .models import CodegenFlight
+        interval = self.lease.total_seconds() / 3
+        try:
+            while not done.wait(interval):
+                now = timezone.now()
+                renewed = CodegenFlight.objects.filter(key=key, leader_run_id=run_id, status='running').update(
+                    expires_at=now + self.lease, updated_at=now,
+                )
+                if not renewed:
+                    logger.warning("Lost codegen flight %s lease for run %s", key[:12], run_id)
+                    return
+        finally:
+            connections.close_all()
+
+
+_singleflight: Optional[SingleFlight] = None
+_singleflight_lock = threading.Lock()
+
+
+def get_singleflight() -> SingleFlight:
+    """获取进程级单飞协调器"""
+    global _singleflight
+    if _singleflight is None:
+        with _singleflight_lock:
+            if _singleflight is None:
+                _singleflight = SingleFlight(
+                    lease_seconds=float(os.environ.get("ORCHESTRATOR_SINGLEFLIGHT_LEASE", 300)),
+                    use_db=os.environ.get("ORCHESTRATOR_SINGLEFLIGHT_DB", "1").lower() not in ("0", "false", "no"),
+                )
+    return _singleflight
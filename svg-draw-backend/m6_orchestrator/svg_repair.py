@@ -0,0 +1,406 @@
+"""
+codegen 之后的 SVG 提取、校验与修复
+- extract_svg：单次线性扫描取出 <svg>...</svg>（容忍 markdown 代码块与前后说明），截断的输出保留到末尾交给修复
+- SvgChecker：基于 expat 的增量良构检查（含命名空间前缀），可逐块喂入，流式编排边生成边检查
+- validate：检查 → 本地修复（补闭合标签、丢弃无效 / 重复属性、转义裸 & 与 <、
+  根元素补 xmlns / xmlns:xlink / viewBox）→ 再检查，返回最终文本与校验报告
+- fix_request / apply_fix：本地修复仍失败时，只截取出错位置附近的若干行交给 LLM 修正，再拼回原文重新校验
+"""
+import re
+import logging
+from html.entities import name2codepoint
+from typing import List, Optional, Tuple
+from xml.parsers import expat
+
+logger = logging.getLogger(__name__)
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+
+# 修正调用发送的片段：出错行前后各若干行，且距出错位置不超过若干字符（单行的长文档）
+FIX_CONTEXT_LINES = 8
+FIX_CONTEXT_CHARS = 1200
+
+FIX_SYSTEM_PROMPT = """你是 SVG 语法修复器。用户给出一段 SVG 片段与 XML 解析错误，只输出修正后的这段片段。
+要求：保持行数与内容基本不变，只修复语法；不要解释，不要 markdown 代码块，不要输出片段以外的内容。"""
+
+_TOKEN = re.compile(
+    r"<!--.*?-->"
+    r"|<!\[CDATA\[.*?\]\]>"
+    r"|<\?.*?\?>"
+    r"|<!DOCTYPE[^>]*>"
+    r"|</\s*(?P<close>[A-Za-z_][\w:.-]*)\s*>"
+    r"|<(?P<open>[A-Za-z_][\w:.-]*)(?P<attrs>(?:[^<>\"']|\"[^\"]*\"|'[^']*')*)>",
+    re.S | re.I,
+)
+_ATTR = re.compile(r"\s*([^\s=/>\"'<]+)(?:\s*=\s*(\"[^\"]*\"|'[^']*'|[^\s\"'>]+))?")
+# 全部为双引号值、无 & 与 < 的属性串：名称不重复且前缀已声明时原样保留
+_CLEAN_ATTRS = re.compile(r"(?:\s+[A-Za-z_][\w.-]*(?::[\w.-]+)?=\"[^\"<&]*\")*\s*/?\s*")
+_ATTR_NAME = re.compile(r"\s([A-Za-z_][\w.:-]*)=\"")
+_NAME = re.compile(r"^[A-Za-z_:][\w.:-]*$")
+_BARE_AMP = re.compile(r"&(?!(?:[A-Za-z][\w.-]*|#\d+|#x[0-9A-Fa-f]+);)")
+_ENTITY = re.compile(r"&([A-Za-z][\w.-]*);")
+_XML_ENTITIES = {"amp", "lt", "gt", "quot", "apos"}
+_PREFIX_DECL = re.compile(r"xmlns:([\w.-]+)\s*=")
+_DIMENSION = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(?:px)?\s*$")
+# 不产生可见内容的元素：本地修复后只剩这些时视为修复失败（截断在第一个图形内会修成空白画布）
+_NON_DRAWING = {"defs", "style", "title", "desc", "metadata", "script"}
+
+
+def extract_svg(raw: str) -> str:
+    """
+    从 LLM 返回文本中提取 SVG：第一个 <svg 到最后一个 </svg>（find / rfind 各扫描一次）。
+    没有 </svg>（输出被截断）时取到末尾并去掉代码块结尾，由 validate 补全；没有 <svg 时去掉代码块标记后原样返回。
+    """
+    text = (raw or "").strip()
+    start = text.find("<svg")
+    if start == -1:
+        if text.startswith("```"):
+            newline = text.find("\n")
+            text = text[newline + 1:] if newline != -1 else ""
+            end = text.rfind("```")
+            text = text[:end] if end != -1 else text
+        return text.strip()
+    end = text.rfind("</svg>")
+    if end < start:
+        tail = text[start:]
+        fence = tail.rfind("```")
+        return (tail[:fence] if fence != -1 else tail).strip()
+    return text[start:end + len("</svg>")]
+
+
+class SvgChecker:
+    """expat 增量良构检查：可分块 feed，遇到第一处错误后不再解析"""
+
+    def __init__(self):
+        self._parser = expat.ParserCreate(namespace_separator=" ")
+        self._parser.StartElementHandler = self._start
+        self.root: Optional[Tuple[str, dict]] = None  # (名称, 属性)；名称含命名空间，如 "http://www.w3.org/2000/svg svg"
+        self.drawing = 0  # 根元素以下可能产生可见内容的元素个数（不含 _NON_DRAWING）
+        self.error: Optional[dict] = None
+        self._closed = False
+
+    def _start(self, name, attrs):
+        if self.root is None:
+            self.root = (name, attrs)
+        elif name.rsplit(" ", 1)[-1] not in _NON_DRAWING:
+            self.drawing += 1
+
+    def _parse(self, text: str, final: bool):
+        try:
+            self._parser.Parse(text, final)
+        except expat.ExpatError as e:
+            self.error = {"message": expat.ErrorString(e.code), "line": e.lineno, "column": e.offset}
+
+    def feed(self, text: str):
+        if text and self.error is None and not self._closed:
+            self._parse(text, False)
+
+    def close(self) -> Optional[dict]:
+        """结束输入，返回第一处错误（{"message", "line", "column"}）或 None"""
+        if not self._closed:
+            self._closed = True
+            if self.error is None:
+                self._parse("", True)
+        return self.error
+
+    def root_issues(self) -> List[str]:
+        """良构文档的根元素问题：不是 svg / 缺少 xmlns / 缺少 viewBox"""
+        if self.root is None:
+            return ["no root element"]
+        name, attrs = self.root
+        if name.rsplit(" ", 1)[-1] != "svg":
+            return [f"root element is <{name.rsplit(' ', 1)[-1]}>"]
+        issues = []
+        if name != f"{SVG_NS} svg":
+            issues.append("missing xmlns")
+        if "viewBox" not in attrs:
+            issues.append("missing viewBox")
+        return issues
+
+
+def check(svg: str) -> SvgChecker:
+    checker = SvgChecker()
+    checker.feed(svg)
+    checker.close()
+    return checker
+
+
+# ---------- 本地修复 ----------
+
+def _fix_entities(text: str, actions: set) -> str:
+    """HTML 命名实体改为数字引用，未知实体与裸 & 转义，< 转义"""
+    def entity(m):
+        name = m.group(1)
+        if name in _XML_ENTITIES:
+            return m.group(0)
+        actions.add("replaced html entities")
+        code = name2codepoint.get(name)
+        return f"&#{code};" if code else f"&amp;{name};"
+
+    fixed, count = _BARE_AMP.subn("&amp;", text)
+    if count:
+        actions.add("escaped bare &")
+    fixed = _ENTITY.sub(entity, fixed)
+    if "<" in fixed:
+        fixed = fixed.replace("<", "&lt;")
+        actions.add("escaped bare <")
+    return fixed
+
+
+def _parse_attrs(body: str, actions: set, prefixes=None) -> Tuple[List[Tuple[str, str]], bool]:
+    """
+    解析起始标签中的属性，丢弃无效名称、无值、重复与未声明命名空间前缀（prefixes 不为 None 时检查）的属性；
+    返回 ([(名称, 已转义的值)], 是否自闭合)
+    """
+    body = body.rstrip()
+    self_closing = body.endswith("/")
+    if self_closing:
+        body = body[:-1]
+    attrs, seen, pos = [], set(), 0
+    while pos < len(body):
+        m = _ATTR.match(body, pos)
+        if not m:
+            if not body[pos].isspace():
+                actions.add("dropped invalid attribute text")
+            pos += 1
+            continue
+        pos = m.end()
+        name, value = m.group(1), m.group(2)
+        if value is None or not _NAME.match(name):
+            actions.add("dropped invalid attributes")
+            continue
+        prefix = name.split(":", 1)[0] if ":" in name else None
+        if prefixes is not None and prefix and prefix not in prefixes:
+            actions.add("dropped attributes with undeclared prefix")
+            continue
+        if name in seen:
+            actions.add("dropped duplicate attributes")
+            continue
+        seen.add(name)
+        if value[0] in "\"'":
+            quote, value = value[0], value[1:-1]
+        else:
+            quote = '"'
+            actions.add("quoted attribute values")
+        value = _fix_entities(value, actions)
+        if quote == "'" and '"' in value:
+            value = value.replace('"', "&quot;")
+        attrs.append((name, value))
+    return attrs, self_closing
+
+
+def _root_attrs(attrs: List[Tuple[str, str]], uses_xlink: bool, actions: set) -> List[Tuple[str, str]]:
+    """根 svg 补 xmlns / xmlns:xlink / viewBox（viewBox 取自数值型 width、height）"""
+    names = {name for name, _ in attrs}
+    if "xmlns" not in names:
+        attrs.insert(0, ("xmlns", SVG_NS))
+        actions.add("added xmlns")
+    if uses_xlink and "xmlns:xlink" not in names:
+        attrs.insert(1, ("xmlns:xlink", XLINK_NS))
+        actions.add("added xmlns:xlink")
+    if "viewBox" not in names:
+        values = dict(attrs)
+        width = _DIMENSION.match(values.get("width", ""))
+        height = _DIMENSION.match(values.get("height", ""))
+        if width and height:
+            attrs.append(("viewBox", f"0 0 {width.group(1)} {height.group(1)}"))
+            actions.add("added viewBox")
+    return attrs
+
+
+def _start_tag(name: str, attrs: List[Tuple[str, str]], self_closing: bool) -> str:
+    rendered = "".join(f' {key}="{value}"' for key, value in attrs)
+    return f"<{name}{rendered}{'/' if self_closing else ''}>"
+
+
+def _clean_names(names: List[str], prefixes: set) -> bool:
+    if len(set(names)) != len(names):
+        return False
+    return all(":" not in name or name.split(":", 1)[0] in prefixes for name in names)
+
+
+def repair(svg: str) -> Tuple[str, List[str]]:
+    """
+    按标签扫描一遍重建文档：错位的结束标签补齐中间元素的闭合，多余的结束标签丢弃，
+    末尾被截断的标签丢弃，未闭合的元素在末尾依次闭合，根元素之后的内容丢弃。
+    返回 (修复后的文本, 修复动作列表)；根元素不是 svg 时原样返回。
+    """
+    actions = set()
+    uses_xlink = "xlink:" in svg
+    prefixes = {"xml", "xmlns", "xlink"} | set(_PREFIX_DECL.findall(svg))
+    out, stack = [], []
+    root_seen = root_done = False
+    pos = 0
+
+    def text(segment: str, final: bool):
+        if root_done:
+            if segment.strip():
+                actions.add("dropped content after root")
+            return
+        if final and "<" in segment:
+            segment = segment[:segment.index("<")]
+            actions.add("dropped truncated tag")
+        if stack:
+            out.append(_fix_entities(segment, actions))
+        elif segment.strip():
+            actions.add("dropped text outside root")
+
+    for m in _TOKEN.finditer(svg):
+        text(svg[pos:m.start()], final=False)
+        pos = m.end()
+        if root_done:
+            actions.add("dropped content after root")
+            continue
+        token = m.group(0)
+        if m.group("open"):
+            name = m.group("open")
+            if not root_seen:
+                if name != "svg":
+                    return svg, []
+                root_seen = True
+            body = m.group("attrs")
+            if stack and _CLEAN_ATTRS.fullmatch(body) and _clean_names(_ATTR_NAME.findall(body), prefixes):
+                self_closing = body.rstrip().endswith("/")
+                out.append(token)
+            else:
+                attrs, self_closing = _parse_attrs(body, actions, prefixes)
+                if not stack:
+                    attrs = _root_attrs(attrs, uses_xlink, actions)
+                out.append(_start_tag(name, attrs, self_closing))
+            if not self_closing:
+                stack.append(name)
+            elif not stack:
+                root_done = True
+        elif m.group("close"):
+            name = m.group("close")
+            if name not in stack:
+                actions.add("dropped stray end tags")
+                continue
+            while stack[-1] != name:
+                out.append(f"</{stack.pop()}>")
+                actions.add("closed mismatched tags")
+            out.append(f"</{stack.pop()}>")
+            root_done = not stack
+        elif stack:
+            out.append(token)  # 注释、CDATA、处理指令
+        elif token.startswith("<?xml") and not root_seen:
+            out.append(token)
+
+    text(svg[pos:], final=True)
+    if stack:
+        actions.add(f"closed {len(stack)} unclosed tags")
+        out.extend(f"</{name}>" for name in reversed(stack))
+    if not root_seen:
+        return svg, []
+    return "".join(out), sorted(actions)
+
+
+def _patch_root(svg: str, actions: set) -> str:
+    """良构文档只重写根 svg 起始标签（补 xmlns / viewBox），其余内容保持原样"""
+    m = re.search(r"<svg\b((?:[^<>\"']|\"[^\"]*\"|'[^']*')*)>", svg)
+    if not m:
+        return svg
+    attrs, self_closing = _parse_attrs(m.group(1), actions)
+    attrs = _root_attrs(attrs, "xlink:" in svg, actions)
+    return svg[:m.start()] + _start_tag("svg", attrs, self_closing) + svg[m.end():]
+
+
+def validate(svg: str, checker: SvgChecker = None) -> Tuple[str, dict]:
+    """
+    校验并在本地修复 SVG。checker 为已喂入完整文本的 SvgChecker 时（流式编排）不再重复解析。
+    返回 (最终文本, 报告)，报告字段：
+    - well_formed：原始输出是否为良构 XML；error：原始输出的第一处错误
+    - repairs：本地修复动作；fixed_by：None / "local" / "llm"
+    - valid：最终文本是否为良构且根元素为 svg
+    - remaining_error：仍无法修复时的错误位置（可交给 fix_request）
+    本地修复后若不剩任何图形元素（如截断在第一个子元素内），视为修复失败：返回原文与原始错误位置，
+    交给修正调用，而不是保存一张空白画布。
+    """
+    checker = checker or check(svg)
+    error = checker.close()
+    report = {"well_formed": error is None, "repairs": [], "fixed_by": None}
+    if error is None:
+        issues = checker.root_issues()
+        if issues and not issues[0].startswith("missing"):
+            report.update(valid=False, error={"message": issues[0]})
+            return svg, report
+        if issues:
+            actions = set()
+            svg = _patch_root(svg, actions)
+            report.update(repairs=sorted(actions), fixed_by="local" if actions else None)
+        report["valid"] = True
+        return svg, report
+
+    report["error"] = error
+    repaired, actions = repair(svg)
+    if not actions:
+        # 根元素不是 svg 或无可修复之处：没有 <svg 的输出不交给修正调用
+        report["valid"] = False
+        if svg.lstrip().startswith("<svg"):
+            report["remaining_error"] = error
+        return svg, report
+    after = check(repaired)
+    report["repairs"] = actions
+    if after.close() is None and not [i for i in after.root_issues() if not i.startswith("missing")]:
+        if not after.drawing:
+            report.update(valid=False, remaining_error=error, repair_error="repair left no drawable content")
+            return svg, report
+        report.update(valid=True, fixed_by="local")
+        return repaired, report
+    report.update(valid=False, remaining_error=after.error or {"message": "invalid root"})
+    return repaired, report
+
+
+# ---------- 修正调用 ----------
+
+def _offset(svg: str, line: int, column: int) -> int:
+    """expat 的行号（从 1 开始）与列号（从 0 开始）换算为字符下标"""
+    pos = 0
+    for _ in range(line - 1):
+        pos = svg.find("\n", pos)
+        if pos == -1:
+            return len(svg)
+        pos += 1
+    return min(pos + column, len(svg))
+
+
+def fix_request(svg: str, error: dict) -> Tuple[list, Tuple[int, int]]:
+    """
+    构建片段修正调用的 messages，返回 (messages, (起始下标, 结束下标))。
+    片段为出错行前后 FIX_CONTEXT_LINES 行，并限制在出错位置前后 FIX_CONTEXT_CHARS 个字符内（截断处对齐到标签边界）。
+    """
+    at = _offset(svg, error["line"], error.get("column") or 0) if error.get("line") else len(svg)
+    start = end = at
+    for _ in range(FIX_CONTEXT_LINES + 1):
+        start = svg.rfind("\n", 0, max(start - 1, 0)) + 1 if start > 0 else 0
+    for _ in range(FIX_CONTEXT_LINES + 1):
+        newline = svg.find("\n", end + 1)
+        end = len(svg) if newline == -1 else newline
+    if at - start > FIX_CONTEXT_CHARS:
+        start = svg.find("<", at - FIX_CONTEXT_CHARS, at)
+        start = at - FIX_CONTEXT_CHARS if start == -1 else start
+    if end - at > FIX_CONTEXT_CHARS:
+        close = svg.rfind(">", at, at + FIX_CONTEXT_CHARS)
+        end = at + FIX_CONTEXT_CHARS if close == -1 else close + 1
+    fragment = svg[start:end]
+    where = "片段末尾" if at >= len(svg) else f"片段第 {svg.count(chr(10), start, at) + 1} 行"
+    return [
+        {"role": "system", "content": FIX_SYSTEM_PROMPT},
+        {"role": "user", "content": f"解析错误：{error.get('message')}（{where}）\n片段：\n{fragment}"},
+    ], (start, end)
+
+
+def apply_fix(svg: str, span: Tuple[int, int], reply: str, report: dict) -> Tuple[str, dict]:
+    """把修正后的片段拼回原文并重新校验；仍不合法时保留原文，错误记入 report["fix_error"]"""
+    fragment = (reply or "").strip()
+    if fragment.startswith("```"):
+        newline = fragment.find("\n")
+        fragment = fragment[newline + 1:] if newline != -1 else ""
+        fragment = fragment[:fragment.rfind("```")] if "```" in fragment else fragment
+    candidate = svg[:span[0]] + fragment.strip("\n") + svg[span[1]:]
+    fixed, after = validate(candidate)
+    if after["valid"]:
+        report = {k: v for k, v in report.items() if k != "remaining_error"}
+        return fixed, {**report, "valid": True, "fixed_by": "llm", "repairs": report["repairs"] + after["repairs"]}
+    return svg, {**report, "fix_error": after.get("remaining_error") or after.get("error")}
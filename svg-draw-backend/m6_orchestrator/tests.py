@@ -1,3 +1,1075 @@
-from django.test import TestCase
+import os
+import json
+import asyncio
+import time
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from common import metrics
+from common.deadline import Deadline, DeadlineExceeded
+from common.schemas import Entity, InputPayload, Relation, SceneSpec
+from common.svg_geometry import measure
+from m1_runs.models import Artifact, Run, RunBatch, RunStepLog
+from m3_llm_providers.siliconflow_client import chat_completion, chat_completion_stream
+from m3_llm_providers.tests import MockLLMMixin
+from m3_llm_providers.mock_server import generate_svg
+from m6_orchestrator import benchmarks, jobqueue, layout, scene_dsl, svg_repair
+from m6_orchestrator.models import CodegenFlight, RunJob
+from m6_orchestrator.scheduler import StepFailed, StepScheduler, step_timeout
+from m6_orchestrator.singleflight import SingleFlight, normalize_key
+from m6_orchestrator.services import OrchestrationService, SvgStreamExtractor, _run_deadline
+from m7_editors.models import Draft
+
+
+def payload(text="画一个三节点流程图", **params):
+    return InputPayload(text=text, params={"enable_kg": False, "enable_rag": False, "output_mode": "auto", **params})
+
+
+class OrchestrationPersistenceTests(MockLLMMixin, TransactionTestCase):
+    """codegen 结果落库：草稿、codegen 步骤与产物保存同一份（优化后的）SVG"""
+
+    def test_draft_row_stores_optimized_code(self):
+        self.configure_mock(shapes=30)
+        result = OrchestrationService().run(payload())
+
+        draft = Draft.objects.get(pk=result["draft_id"])
+        self.assertEqual(draft.code, result["draft"]["code"])
+        self.assertLess(len(draft.code), len(generate_svg(payload().text, 30)))
+
+        # 草稿、codegen 步骤输出与产物引用同一个 blob
+        step = RunStepLog.objects.get(run_id=result["run_id"], name="codegen")
+        self.assertIsNotNone(draft.code_blob_id)
+        self.assertEqual(draft.code_blob_id, step.output_blob_id)
+        blobs = set(Artifact.objects.filter(run_id=result["run_id"], type__in=["code", "draft_svg"]).values_list("blob_id", flat=True))
+        self.assertEqual(blobs, {draft.code_blob_id})
+        preview = Artifact.objects.get(run_id=result["run_id"], type="code").preview_text
+        self.assertTrue(draft.code.startswith(preview))
+
+
+class CodegenCacheTests(MockLLMMixin, TransactionTestCase):
+    """LLM 响应缓存只保存完整且校验通过的输出"""
+
+    # 关闭跨 worker 锁行：其结果窗口会让紧接着的相同请求复用上一次结果，与缓存无关
+    env = {"ORCHESTRATOR_SINGLEFLIGHT_DB": "0"}
+
+    def codegen_step(self, result):
+        return RunStepLog.objects.get(run_id=result["run_id"], name="codegen").output_data["provider"]
+
+    def test_complete_output_is_cached_after_validation(self):
+        self.configure_mock(markdown_ratio=1.0)
+        first = OrchestrationService().run(payload())
+        second = OrchestrationService().run(payload())
+
+        self.assertEqual(self.mock.stats["requests"], 1)
+        self.assertTrue(self.codegen_step(first)["cache"]["stored"])
+        provider = self.codegen_step(second)
+        self.assertTrue(provider["cache"]["hit"])
+        # 缓存的是提取并校验后的 SVG，命中时无需再修复
+        self.assertEqual(provider["validation"]["repairs"], [])
+        self.assertEqual(first["draft"]["code"], second["draft"]["code"])
+
+    def test_use_cache_false_bypasses_cache(self):
+        OrchestrationService().run(payload())
+        OrchestrationService().run(payload(use_cache=False))
+        self.assertEqual(self.mock.stats["requests"], 2)
+
+    def test_truncated_output_is_not_cached(self):
+        self.configure_mock(rate_truncate=1.0)
+        first = OrchestrationService().run(payload())
+        provider = self.codegen_step(first)
+        self.assertEqual(provider["finish_reason"], "length")
+        self.assertFalse(provider["cache"]["stored"])
+
+        self.configure_mock()
+        OrchestrationService().run(payload())
+        self.assertEqual(self.mock.stats["requests"], 2)
+
+    def test_interrupted_stream_is_not_cached(self):
+        self.configure_mock(rate_truncate=1.0)
+        events = list(OrchestrationService().run_stream(payload()))
+        self.assertIn(events[-1]["event"], ("done", "error"))
+
+        self.configure_mock()
+        events = list(OrchestrationService().run_stream(payload()))
+        self.assertEqual(events[-1]["event"], "done")
+        self.assertEqual(self.mock.stats["requests"], 2)
+        self.assertFalse(self.codegen_step(events[-1]["data"])["cache"]["hit"])
+
+
+class SvgRepairTests(SimpleTestCase):
+    """svg_repair.validate：本地修复与修复失败的判定"""
+
+    ROOT = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 10 10">'
+
+    def test_well_formed_passes_unchanged(self):
+        svg = self.ROOT + '<rect width="3" height="3"/></svg>'
+        out, report = svg_repair.validate(svg)
+        self.assertEqual(out, svg)
+        self.assertTrue(report["well_formed"])
+        self.assertTrue(report["valid"])
+
+    def test_root_issues(self):
+        out, report = svg_repair.validate('<svg viewBox="0 0 10 10"><rect width="3" height="3"/></svg>')
+        self.assertTrue(report["valid"])
+        self.assertEqual(report["repairs"], ["added xmlns"])
+        self.assertTrue(out.startswith(self.ROOT))
+
+        out, report = svg_repair.validate("<html><rect/></html>")
+        self.assertFalse(report["valid"])
+        self.assertEqual(report["error"]["message"], "root element is <html>")
+
+    def test_unclosed_tags_are_closed(self):
+        out, report = svg_repair.validate(self.ROOT + '<g><rect width="1" height="1"/>')
+        self.assertTrue(report["valid"])
+        self.assertEqual(report["repairs"], ["closed 2 unclosed tags"])
+        self.assertTrue(out.endswith("</g></svg>"))
+
+    def test_truncated_tail_is_repaired_locally(self):
+        out, report = svg_repair.validate(self.ROOT + '<rect width="3" height="3"/><circle r="2')
+        self.assertTrue(report["valid"])
+        self.assertEqual(report["fixed_by"], "local")
+        self.assertEqual(out, self.ROOT + '<rect width="3" height="3"/></svg>')
+
+    def test_repair_leaving_empty_canvas_fails(self):
+        svg = self.ROOT + '\n<rect x="0" y="0" wid'
+        out, report = svg_repair.validate(svg)
+        self.assertFalse(report["valid"])
+        self.assertIsNone(report["fixed_by"])
+        self.assertEqual(report["remaining_error"]["line"], 2)
+        # 返回原文，修正调用的片段覆盖被截断的标签
+        self.assertEqual(out, svg)
+        messages, (start, end) = svg_repair.fix_request(out, report["remaining_error"])
+        self.assertIn("<rect", svg[start:end])
+
+    def test_fix_reply_is_spliced_back(self):
+        svg = self.ROOT + '\n<rect x="0" y="0" wid'
+        out, report = svg_repair.validate(svg)
+        _, span = svg_repair.fix_request(out, report["remaining_error"])
+        reply = svg[span[0]:span[1]].replace("wid", 'width="4" height="4"/></svg>')
+        fixed, report = svg_repair.apply_fix(out, span, reply, report)
+        self.assertTrue(report["valid"])
+        self.assertEqual(report["fixed_by"], "llm")
+        self.assertIn('<rect x="0" y="0" width="4" height="4"/>', fixed)
+
+
+class SvgValidationPipelineTests(MockLLMMixin, TransactionTestCase):
+    """codegen 之后的校验：本地修复成空白画布时发起修正调用"""
+
+    SVG = ('<svg xmlns="http://www.w3.org/2000/svg"><rect x="10" y="10" width="80" height="80" '
+           'fill="#abcdef" stroke="#123456"/></svg>')
+
+    def test_empty_repair_falls_through_to_fix_call(self):
+        # 响应截断在第一个 <rect> 内；修正调用同样被截断，最终判定为不合法
+        self.configure_mock(svg=self.SVG, rate_truncate=1.0)
+        result = OrchestrationService().run(payload(use_cache=False))
+        validation = RunStepLog.objects.get(run_id=result["run_id"], name="codegen").output_data["provider"]["validation"]
+
+        self.assertEqual(self.mock.stats["requests"], 2)
+        self.assertFalse(validation["valid"])
+        self.assertIn("fix", validation)
+        self.assertIn("fix_error", validation)
+
+
+class SvgStreamExtractorTests(SimpleTestCase):
+    """SvgStreamExtractor：只增量产出 <svg>...</svg>，跨块切分的标签不丢失"""
+
+    SVG = '<svg xmlns="http://www.w3.org/2000/svg"><rect width="4" height="4"/></svg>'
+
+    def feed(self, chunks):
+        extractor = SvgStreamExtractor()
+        return extractor, [extractor.feed(chunk) for chunk in chunks]
+
+    def test_preamble_and_code_fence_are_skipped(self):
+        text = "好的，下面是 SVG：\n```xml\n" + self.SVG + "\n```\n以上。"
+        extractor, deltas = self.feed([text[i:i + 3] for i in range(0, len(text), 3)])
+        self.assertEqual("".join(deltas), self.SVG)
+        self.assertEqual(extractor.finish(), self.SVG)
+        self.assertEqual(extractor.raw, text)
+        self.assertIsNone(extractor.checker.close())
+
+    def test_output_is_incremental(self):
+        _, deltas = self.feed([self.SVG[:20], self.SVG[20:40], self.SVG[40:]])
+        self.assertTrue(deltas[0].startswith("<svg"))
+        self.assertTrue(all(deltas))
+
+    def test_nested_svg_closes_at_last_tag(self):
+        svg = '<svg xmlns="http://www.w3.org/2000/svg"><svg width="2"/><svg><rect/></svg></svg>'
+        extractor, deltas = self.feed([svg[:50], svg[50:], " 说明"])
+        self.assertEqual("".join(deltas), svg)
+        self.assertEqual(extractor.finish(), svg)
+
+    def test_unclosed_svg_falls_back_to_extraction(self):
+        extractor, _ = self.feed(["<svg><rect/>"])
+        self.assertIsNone(extractor.checker)
+        self.assertTrue(extractor.finish().startswith("<svg"))
+
+
+class RunStreamViewTests(MockLLMMixin, TransactionTestCase):
+    """SSE 接口：run → delta → done 事件序列"""
+
+    def events(self, response):
+        body = b"".join(response.streaming_content).decode()
+        events = []
+        for block in body.strip().split("\n\n"):
+            name, data = block.split("\n", 1)
+            events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+        return events
+
+    def test_events_in_order(self):
+        response = self.client.post(
+            "/api/orchestrator/run/stream/", {"text": "画一个矩形", "enable_kg": "false", "enable_rag": "false"},
+            content_type="application/json",
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        events = self.events(response)
+        names = [name for name, _ in events]
+        self.assertEqual(names[0], "run")
+        self.assertEqual(names[-1], "done")
+        self.assertGreater(names.count("delta"), 1)
+        streamed = "".join(data["svg"] for name, data in events if name == "delta")
+        self.assertTrue(streamed.startswith("<svg") and streamed.endswith("</svg>"))
+        self.assertEqual(events[-1][1]["run_id"], events[0][1]["run_id"])
+
+    def test_failure_is_reported_as_error_event(self):
+        self.configure_mock(rate_5xx=1.0)
+        response = self.client.post("/api/orchestrator/run/stream/", {"text": "画一个矩形"}, content_type="application/json")
+        name, data = self.events(response)[-1]
+        self.assertEqual(name, "error")
+        self.assertIn("injected upstream error", data["error"])
+
+
+class AsyncRunViewTests(MockLLMMixin, TransactionTestCase):
+    """原生异步视图：与同步接口返回相同结构，运行与草稿落库"""
+
+    def post(self, data):
+        return async_to_sync(AsyncClient().post)("/api/orchestrator/run/async/", data, content_type="application/json")
+
+    def test_async_run_persists_draft(self):
+        response = self.post({"text": "画一个矩形"})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["data"]
+        self.assertEqual(Draft.objects.get(pk=data["draft_id"]).code, data["draft"]["code"])
+        step = RunStepLog.objects.get(run_id=data["run_id"], name="codegen")
+        self.assertTrue(step.input_data["async"])
+
+    def test_provider_error_returns_500(self):
+        self.configure_mock(rate_5xx=1.0)
+        response = self.post({"text": "画一个矩形"})
+        self.assertEqual(response.status_code, 500)
+
+
+class SingleFlightTests(SimpleTestCase):
+    """进程内单飞：并发的相同调用只执行一次"""
+
+    def run_concurrently(self, flight, fn, n=5):
+        with ThreadPoolExecutor(n) as pool:
+            futures = [pool.submit(flight.do, "k", f"run-{i}", fn) for i in range(n)]
+        return futures
+
+    def test_key_normalizes_whitespace(self):
+        key = normalize_key("m", [{"role": "user", "content": "画 一个\n矩形"}], 0.2)
+        self.assertEqual(normalize_key("m", [{"role": "user", "content": " 画  一个 矩形 "}], 0.2), key)
+        self.assertNotEqual(normalize_key("m", [{"role": "user", "content": "画一个矩形"}], 0.2), key)
+
+    def test_concurrent_callers_share_one_call(self):
+        calls = []
+
+        def fn():
+            calls.append(1)
+            time.sleep(0.2)
+            return "<svg/>"
+
+        futures = self.run_concurrently(SingleFlight(use_db=False), fn)
+        results = [f.result() for f in futures]
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({r for r, _ in results}, {"<svg/>"})
+        leaders = [leader for _, leader in results]
+        self.assertEqual(leaders.count(None), 1)
+        self.assertEqual(len({leader for leader in leaders if leader}), 1)
+
+    def test_leader_failure_propagates(self):
+        def fn():
+            time.sleep(0.2)
+            raise ValueError("boom")
+
+        futures = self.run_concurrently(SingleFlight(use_db=False), fn)
+        for future in futures:
+            with self.assertRaisesRegex(ValueError, "boom"):
+                future.result()
+
+    def test_next_call_after_completion_runs_again(self):
+        flight = SingleFlight(use_db=False)
+        flight.do("k", "a", lambda: "1")
+        self.assertEqual(flight.do("k", "b", lambda: "2"), ("2", None))
+
+
+class SingleFlightLockRowTests(TransactionTestCase):
+    """跨 worker 单飞：CodegenFlight 锁行的等待、接管与结果复用"""
+
+    def setUp(self):
+        self.leader, self.follower = Run.objects.create(), Run.objects.create()
+        self.flight = SingleFlight(lease_seconds=5, poll_interval=0.05)
+
+    def row(self, **fields):
+        fields.setdefault("expires_at", timezone.now() + timedelta(seconds=5))
+        return CodegenFlight.objects.create(key="k", leader_run=self.leader, **fields)
+
+    def fail_if_called(self):
+        raise AssertionError("leader should not be called")
+
+    def test_waits_for_running_leader_in_other_worker(self):
+        self.row(status="running")
+
+        def finish():
+            time.sleep(0.2)
+            CodegenFlight.objects.filter(key="k").update(status="done", result="<svg/>", updated_at=timezone.now())
+
+        threading.Thread(target=finish).start()
+        result = self.flight.do("k", str(self.follower.id), self.fail_if_called)
+        self.assertEqual(result, ("<svg/>", str(self.leader.id)))
+
+    def test_leader_failure_in_other_worker_raises(self):
+        self.row(status="running")
+
+        def fail():
+            time.sleep(0.2)
+            CodegenFlight.objects.filter(key="k").update(status="failed", error="boom", updated_at=timezone.now())
+
+        threading.Thread(target=fail).start()
+        with self.assertRaisesRegex(ValueError, "boom"):
+            self.flight.do("k", str(self.follower.id), self.fail_if_called)
+
+    def test_expired_lease_is_taken_over(self):
+        self.row(status="running", expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.flight.do("k", str(self.follower.id), lambda: "<svg/>"), ("<svg/>", None))
+        row = CodegenFlight.objects.get(key="k")
+        self.assertEqual((row.status, row.leader_run_id, row.result), ("done", self.follower.id, "<svg/>"))
+
+    def test_leader_renews_lease_while_running(self):
+        flight = SingleFlight(lease_seconds=0.3, poll_interval=0.05)
+        started = timezone.now()
+
+        def slow():
+            time.sleep(0.5)  # 超过一个租约
+            return "<svg/>"
+
+        self.assertEqual(flight.do("k", str(self.leader.id), slow), ("<svg/>", None))
+        row = CodegenFlight.objects.get(key="k")
+        self.assertEqual(row.status, "done")
+        self.assertGreater(row.expires_at, started + timedelta(seconds=0.5))
+
+    def test_recent_result_is_reused(self):
+        self.row(status="done", result="<svg/>")
+        self.assertEqual(self.flight.do("k", str(self.follower.id), self.fail_if_called), ("<svg/>", str(self.leader.id)))
+
+    def test_stale_result_is_recomputed(self):
+        row = self.row(status="done", result="old")
+        CodegenFlight.objects.filter(key="k").update(updated_at=row.updated_at - timedelta(minutes=1))
+        self.assertEqual(self.flight.do("k", str(self.follower.id), lambda: "new"), ("new", None))
+
+
+class CoalescedRunTests(MockLLMMixin, TransactionTestCase):
+    """编排层：并发的相同请求只调用一次 LLM，其余运行记录 coalesced_from"""
+
+    env = {"ORCHESTRATOR_SINGLEFLIGHT_DB": "0"}
+
+    # 批量条目在线程池中并发执行、只写内存日志，适合在测试库上制造并发
+    def test_concurrent_runs_are_coalesced(self):
+        self.configure_mock(latency="fixed:0.5")
+        result = OrchestrationService().run_batch([payload(use_cache=False)] * 3, max_concurrency=3)
+
+        self.assertEqual(self.mock.stats["requests"], 1)
+        runs = Run.objects.filter(id__in=[item["run_id"] for item in result["items"]])
+        leaders = {run.coalesced_from_id for run in runs}
+        self.assertEqual(len(leaders - {None}), 1)
+        self.assertEqual(len({item["draft"]["code"] for item in result["items"]}), 1)
+
+    def test_concurrent_async_runs_are_coalesced(self):
+        self.configure_mock(latency="fixed:0.5")
+
+        async def runs():
+            service = OrchestrationService()
+            return await asyncio.gather(*(service.arun(payload(use_cache=False)) for _ in range(3)))
+
+        results = async_to_sync(runs)()
+        self.assertEqual(self.mock.stats["requests"], 1)
+        runs = Run.objects.filter(id__in=[result["run_id"] for result in results])
+        self.assertEqual(len({run.coalesced_from_id for run in runs} - {None}), 1)
+        self.assertEqual(len({result["draft"]["code"] for result in results}), 1)
+
+    def test_coalesce_false_calls_llm_each_time(self):
+        self.configure_mock(latency="fixed:0.3")
+        OrchestrationService().run_batch([payload(use_cache=False, coalesce=False)] * 2, max_concurrency=2)
+        self.assertEqual(self.mock.stats["requests"], 2)
+
+
+class BatchRunTests(MockLLMMixin, TransactionTestCase):
+    """批量接口：有界并发、逐条目结果与批次汇总"""
+
+    env = {"ORCHESTRATOR_SINGLEFLIGHT_DB": "0"}
+
+    def post(self, data):
+        return self.client.post("/api/orchestrator/run/batch/", data, content_type="application/json")
+
+    def test_items_run_with_bounded_concurrency(self):
+        self.configure_mock(latency="fixed:0.2")
+        response = self.post({"items": ["画一个矩形", "画一个圆", {"text": "画一条线"}], "max_concurrency": 2, "use_cache": False})
+        data = response.json()["data"]
+
+        self.assertEqual((data["status"], data["total"], data["succeeded"], data["max_concurrency"]), ("success", 3, 3, 2))
+        self.assertEqual([item["index"] for item in data["items"]], [0, 1, 2])
+        self.assertLessEqual(self.mock.stats["max_inflight"], 2)
+        self.assertEqual(Draft.objects.filter(run__batch_id=data["batch_id"]).count(), 3)
+        self.assertEqual(RunBatch.objects.get(pk=data["batch_id"]).status, "success")
+        for item in data["items"]:
+            self.assertEqual(Draft.objects.get(pk=item["draft_id"]).code, item["draft"]["code"])
+            self.assertEqual(Run.objects.get(pk=item["run_id"]).status, "success")
+
+    def test_failed_item_does_not_fail_batch(self):
+        self.configure_mock(latency="fixed:0.3")
+        data = self.post({"items": ["画一个矩形", {"text": "画一个圆", "deadline": 0.05}], "use_cache": False}).json()["data"]
+
+        self.assertEqual((data["status"], data["succeeded"], data["failed"]), ("partial", 1, 1))
+        failed = data["items"][1]
+        self.assertEqual(failed["status"], "failed")
+        self.assertIn("deadline", failed["error"].lower())
+        self.assertEqual(Run.objects.get(pk=failed["run_id"]).status, "failed")
+
+    def test_item_params_override_defaults(self):
+        self.post({"items": ["画一个矩形", "画一个矩形", {"text": "画一个矩形", "use_cache": False}], "max_concurrency": 1})
+        self.assertEqual(self.mock.stats["requests"], 2)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.post({"items": []}).status_code, 400)
+        self.assertEqual(self.post({"items": ["x"] * 101}).status_code, 400)
+        for data in (
+            {"items": "x"},
+            {"items": ["x", 1]},
+            {"items": [["x"]]},
+            {"items": ["x"], "max_concurrency": "two"},
+            {"items": ["x"], "max_concurrency": [2]},
+            {"items": ["x"], "max_concurrency": 0},
+            ["x"],
+        ):
+            self.assertEqual(self.post(data).status_code, 400, data)
+        missing = self.post({"items": [{"submission_id": 999999}]})
+        self.assertEqual(missing.status_code, 404)
+
+
+class BenchmarkToolsTests(SimpleTestCase):
+    """基准工具：百分位、汇总、对比、计时与结果落盘"""
+
+    def test_percentile_and_summary(self):
+        values = [i / 1000 for i in range(1, 101)]
+        self.assertEqual(benchmarks.percentile(values, 50), 0.05)
+        self.assertEqual(benchmarks.percentile(values, 99), 0.099)
+        self.assertIsNone(benchmarks.percentile([], 50))
+        summary = benchmarks.summarize(values, elapsed=2.0)
+        self.assertEqual((summary["count"], summary["p95_ms"], summary["max_ms"], summary["throughput_rps"]), (100, 95.0, 100.0, 50.0))
+        self.assertIsNone(benchmarks.summarize([])["p50_ms"])
+
+    def test_compare_walks_nested_results(self):
+        current = {"run": {"p50_ms": 110, "detail": {"p95_ms": 50}}, "new": {"p50_ms": 1}}
+        baseline = {"run": {"p50_ms": 100, "detail": {"p95_ms": 100}}}
+        self.assertEqual(benchmarks.compare(current, baseline), [
+            "run.p50_ms: 100 -> 110 (+10.0%)",
+            "run.detail.p95_ms: 100 -> 50 (-50.0%)",
+        ])
+
+    def test_timeit_runs_at_least_min_runs(self):
+        calls = []
+        stats = benchmarks.timeit(lambda: calls.append(1), min_time=0, min_runs=7)
+        self.assertEqual(stats["runs"], 7)
+        self.assertEqual(len(calls), 8)  # 含一次预热
+        self.assertLessEqual(stats["min_us"], stats["p50_us"])
+
+    def test_write_report(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        path = benchmarks.write_report("micro", {"a": 1}, output=f"{root}/out/micro.json")
+        self.assertEqual(json.loads(path.read_text(encoding="utf-8")), {"a": 1})
+
+    def test_micro_benchmark_cases(self):
+        results = benchmarks.MICRO_BENCHMARKS["extract"](0)
+        self.assertIn("fenced_large", results)
+        self.assertGreater(results["repair_large"]["input_bytes"], 0)
+
+
+class StepSchedulerTests(TestCase):
+    """DAG 调度：无依赖关系的步骤并发执行，可选步骤失败 / 超时后继续，必需步骤失败时终止"""
+
+    def setUp(self):
+        self.run = Run.objects.create()
+
+    def step(self, name):
+        return RunStepLog.objects.get(run=self.run, name=name)
+
+    def test_independent_steps_overlap(self):
+        def slow(value):
+            def fn(deps):
+                time.sleep(0.3)
+                return deps["root"] + value
+            return fn
+
+        scheduler = StepScheduler(self.run)
+        scheduler.add("root", lambda _: 1)
+        scheduler.add("left", slow(10), deps=("root",))
+        scheduler.add("right", slow(100), deps=("root",))
+        scheduler.add("join", lambda deps: deps["left"] + deps["right"], deps=("left", "right"))
+
+        started = time.monotonic()
+        results = scheduler.run_all()
+        self.assertLess(time.monotonic() - started, 0.55)
+        self.assertEqual(results, {"root": 1, "left": 11, "right": 101, "join": 112})
+
+        left, right, join = self.step("left"), self.step("right"), self.step("join")
+        self.assertLess(left.started_at, right.ended_at)
+        self.assertLess(right.started_at, left.ended_at)
+        self.assertGreaterEqual(join.started_at, max(left.ended_at, right.ended_at))
+
+    def test_unknown_dependency(self):
+        with self.assertRaises(ValueError):
+            StepScheduler(self.run).add("child", lambda _: None, deps=("missing",))
+
+    def test_optional_failure_continues(self):
+        def boom(_):
+            raise RuntimeError("kg down")
+
+        scheduler = StepScheduler(self.run)
+        scheduler.add("root", lambda _: 1)
+        scheduler.add("kg", boom, deps=("root",), optional=True)
+        scheduler.add("after", lambda deps: deps["kg"], deps=("kg",))
+        results = scheduler.run_all()
+        self.assertEqual(results, {"root": 1, "kg": None, "after": None})
+        self.assertEqual(self.step("kg").error, "kg down")
+
+    def test_required_failure_raises(self):
+        def boom(_):
+            raise RuntimeError("perception down")
+
+        scheduler = StepScheduler(self.run)
+        scheduler.add("perception", boom)
+        scheduler.add("after", lambda _: 1, deps=("perception",))
+        with self.assertRaises(StepFailed):
+            scheduler.run_all()
+        self.assertFalse(RunStepLog.objects.filter(run=self.run, name="after").exists())
+
+    def test_optional_timeout_is_skipped(self):
+        scheduler = StepScheduler(self.run)
+        scheduler.add("slow", lambda _: time.sleep(0.5), timeout=0.05, optional=True)
+        scheduler.add("fast", lambda _: "ok")
+        started = time.monotonic()
+        self.assertEqual(scheduler.run_all(), {"slow": None, "fast": "ok"})
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(self.step("slow").error, "timeout after 0.05s")
+
+    def test_deadline_aborts_even_optional_steps(self):
+        scheduler = StepScheduler(self.run, deadline=Deadline(0.05))
+        scheduler.add("slow", lambda _: time.sleep(0.5), optional=True)
+        with self.assertRaises(DeadlineExceeded):
+            scheduler.run_all()
+        self.assertIn("deadline", self.step("slow").error)
+
+    def test_step_timeout_env(self):
+        env = {"ORCHESTRATOR_STEP_TIMEOUT": "12", "ORCHESTRATOR_STEP_TIMEOUT_KG_AUGMENTATION": "3"}
+        with mock.patch.dict("os.environ", env):
+            self.assertEqual(step_timeout("kg_augmentation"), 3.0)
+            self.assertEqual(step_timeout("perception"), 12.0)
+        with mock.patch.dict("os.environ", {"ORCHESTRATOR_STEP_TIMEOUT": "abc"}):
+            self.assertEqual(step_timeout("perception"), 30.0)
+
+
+class JobQueueTests(TransactionTestCase):
+    """DB 队列：乐观锁领取、租约过期后重新领取、超过 max_attempts 后标记失败"""
+
+    # 负租约：领取后立即过期，模拟 worker 崩溃
+    expired = timedelta(seconds=-1)
+
+    def setUp(self):
+        self.job = jobqueue.enqueue(payload())
+
+    def test_payload_round_trip(self):
+        restored = jobqueue.payload_from_json(self.job.payload)
+        self.assertEqual((restored.text, restored.params), (payload().text, payload().params))
+        self.assertEqual(self.job.run.status, "created")
+
+    def test_job_is_claimed_once(self):
+        job = jobqueue.claim("w1")
+        self.assertEqual((job.pk, job.status, job.worker_id, job.attempts), (self.job.pk, "running", "w1", 1))
+        self.assertIsNone(jobqueue.claim("w2"))
+        self.assertEqual(jobqueue.job_depth(), {("queued",): 0, ("running",): 1})
+
+    def test_expired_lease_is_reclaimed(self):
+        job = jobqueue.claim("w1", lease=self.expired)
+        step = RunStepLog.objects.create(run=job.run, name="codegen", started_at=timezone.now())
+
+        reclaimed = jobqueue.claim("w2")
+        self.assertEqual((reclaimed.worker_id, reclaimed.attempts), ("w2", 2))
+        step.refresh_from_db()
+        self.assertIsNotNone(step.ended_at)
+        self.assertEqual(step.error, "Worker w1 lost, job reclaimed")
+
+        # 原 worker 已失去任务：续约与结果写入都不生效
+        self.assertFalse(jobqueue.renew(job, "w1"))
+        jobqueue.finish(job, "w1", error="late")
+        self.assertEqual(RunJob.objects.get(pk=job.pk).status, "running")
+        self.assertTrue(jobqueue.renew(reclaimed, "w2"))
+
+    def test_abandoned_after_max_attempts(self):
+        RunJob.objects.filter(pk=self.job.pk).update(max_attempts=2)
+        jobqueue.claim("w1", lease=self.expired)
+        jobqueue.claim("w2", lease=self.expired)
+        self.assertIsNone(jobqueue.claim("w3"))
+
+        job = RunJob.objects.get(pk=self.job.pk)
+        self.assertEqual(job.status, "failed")
+        self.assertIn("Abandoned after 2 attempts", job.error)
+        self.assertEqual(Run.objects.get(pk=self.job.run_id).status, "failed")
+
+
+class JobSubmitTests(MockLLMMixin, TransactionTestCase):
+    """提交接口立即返回 202，worker 执行任务，进度事件流以 done 结束"""
+
+    env = {"ORCHESTRATOR_SINGLEFLIGHT_DB": "0"}
+
+    def events(self, response):
+        body = b"".join(response.streaming_content).decode()
+        return [block.split("\n", 1)[0][len("event: "):] for block in body.strip().split("\n\n")]
+
+    def test_submit_then_work(self):
+        response = self.client.post(
+            "/api/orchestrator/run/submit/", {"text": "画一个矩形", "enable_kg": "false", "enable_rag": "false"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 202)
+        data = response.json()["data"]
+        self.assertEqual(data["status"], "created")
+        self.assertEqual(data["events_url"], f"/api/runs/{data['run_id']}/events/")
+        self.assertEqual(self.mock.stats["requests"], 0)
+
+        self.assertTrue(jobqueue.JobWorker("w1", poll_interval=0).run_once())
+        self.assertFalse(jobqueue.JobWorker("w1", poll_interval=0).run_once())
+
+        job = RunJob.objects.get(pk=data["run_id"])
+        self.assertEqual(job.status, "done")
+        self.assertEqual(job.result["status"], "success")
+        self.assertTrue(Draft.objects.filter(pk=job.result["draft_id"]).exists())
+
+        names = self.events(self.client.get(data["events_url"]))
+        self.assertIn("step", names)
+        self.assertEqual(names[-2:], ["status", "done"])
+
+    def test_failed_run_marks_job_failed(self):
+        self.configure_mock(rate_5xx=1.0)
+        job = jobqueue.enqueue(payload())
+        jobqueue.JobWorker("w1", poll_interval=0).run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertIn("injected upstream error", job.error)
+        self.assertEqual(job.run.status, "failed")
+
+
+class DeadlineTests(SimpleTestCase):
+    """Deadline：剩余预算、取消与可打断的等待"""
+
+    def test_budget(self):
+        deadline = Deadline(10)
+        self.assertEqual(deadline.timeout(3), 3)
+        self.assertLessEqual(deadline.timeout(30), 10)
+        self.assertEqual(Deadline().remaining(), float("inf"))
+
+    def test_cancel(self):
+        deadline = Deadline()
+        deadline.cancel("client disconnected")
+        self.assertTrue(deadline.expired())
+        with self.assertRaises(DeadlineExceeded) as ctx:
+            deadline.check("codegen")
+        self.assertEqual(ctx.exception.reason, "cancelled")
+        self.assertEqual(str(ctx.exception), "Run cancelled (client disconnected) during codegen")
+
+    def test_sleep_past_deadline_fails_fast(self):
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded) as ctx:
+            Deadline(0.2).sleep(5)
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual(ctx.exception.reason, "deadline")
+
+    def test_sleep_is_interrupted_by_cancel(self):
+        deadline = Deadline()
+        threading.Timer(0.05, deadline.cancel).start()
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            deadline.sleep(5)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_run_deadline_params(self):
+        with mock.patch.dict("os.environ", {"ORCHESTRATOR_DEADLINE": "20", "ORCHESTRATOR_DEADLINE_MAX": "60"}):
+            self.assertEqual(_run_deadline(payload()).budget, 20)
+            self.assertEqual(_run_deadline(payload(deadline="5")).budget, 5)
+            self.assertEqual(_run_deadline(payload(deadline=600)).budget, 60)
+            self.assertEqual(_run_deadline(payload(deadline="abc")).budget, 20)
+            self.assertEqual(_run_deadline(payload(deadline=0)).budget, 20)
+            self.assertEqual(_run_deadline(payload(deadline="nan")).budget, 20)
+            self.assertEqual(_run_deadline(payload(deadline=[5])).budget, 20)
+
+    def test_invalid_deadline_settings_fall_back_to_defaults(self):
+        env = {"ORCHESTRATOR_DEADLINE": "3m", "ORCHESTRATOR_DEADLINE_MAX": "-1"}
+        with mock.patch.dict("os.environ", env), self.assertLogs("m6_orchestrator.services", "WARNING") as logs:
+            self.assertEqual(_run_deadline(payload()).budget, 180)
+            self.assertEqual(_run_deadline(payload(deadline=900)).budget, 600)
+        self.assertIn("ORCHESTRATOR_DEADLINE='3m'", logs.output[0])
+
+    def test_coalesced_wait_is_bounded(self):
+        flight = SingleFlight(use_db=False)
+        release = threading.Event()
+        leader = threading.Thread(target=flight.do, args=("k", "leader", lambda: release.wait(5) and "<svg/>"))
+        leader.start()
+        time.sleep(0.05)
+        try:
+            with self.assertRaises(DeadlineExceeded):
+                flight.do("k", "follower", lambda: "<svg/>", deadline=Deadline(0.1))
+        finally:
+            release.set()
+            leader.join()
+
+
+class DeadlinePropagationTests(MockLLMMixin, TransactionTestCase):
+    """运行预算沿调用链传递：LLM 请求、重试退避与流式读取都不超过剩余预算"""
+
+    env = {"ORCHESTRATOR_SINGLEFLIGHT_DB": "0", "SILICONFLOW_MAX_RETRIES": "3"}
+    messages = [{"role": "user", "content": "画一个矩形"}]
+
+    def test_slow_upstream_returns_504(self):
+        self.configure_mock(latency="fixed:3")
+        started = time.monotonic()
+        response = self.client.post(
+            "/api/orchestrator/run/", {"text": "画一个矩形", "enable_kg": "false", "enable_rag": "false", "deadline": "0.5"},
+            content_type="application/json",
+        )
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(response.status_code, 504)
+
+        run = Run.objects.get()
+        self.assertEqual(run.status, "failed")
+        self.assertTrue(RunStepLog.objects.get(run=run, name="codegen").error)
+        aborted = RunStepLog.objects.get(run=run, name="deadline_exceeded")
+        self.assertEqual(aborted.input_data["budget_s"], 0.5)
+        self.assertEqual(aborted.input_data["reason"], "deadline")
+
+    def test_backoff_past_deadline_is_not_waited(self):
+        self.configure_mock(rate_429=1.0, retry_after=5)
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            chat_completion(self.messages, deadline=Deadline(2))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(self.mock.stats["requests"], 1)
+
+    def test_cancel_stops_stream(self):
+        self.configure_mock(tokens_per_sec=50, shapes=30)
+        deadline = Deadline()
+        threading.Timer(0.2, deadline.cancel, args=("client disconnected",)).start()
+        chunks = []
+        with self.assertRaises(DeadlineExceeded) as ctx:
+            for chunk in chat_completion_stream(self.messages, deadline=deadline):
+                chunks.append(chunk)
+        self.assertEqual(ctx.exception.reason, "cancelled")
+        self.assertTrue(chunks)
+        self.assertNotIn("</svg>", "".join(chunks))
+
+
+def dead_pid() -> int:
+    pid = 2 ** 22 - 1
+    while metrics._pid_alive(pid):
+        pid -= 1
+    return pid
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    """进程内指标：Prometheus 文本格式与多进程快照合并"""
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.registry.enabled = True
+
+    def test_render(self):
+        counter = self.registry.counter("t_total", "Test counter", ["kind"])
+        counter.inc(kind='a"b')
+        counter.inc(2, kind='a"b')
+        counter.inc(-1, kind='a"b')  # 计数器不减少
+        histogram = self.registry.histogram("t_seconds", "Test latency", buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value)
+
+        lines = self.registry.render().splitlines()
+        self.assertIn("# TYPE t_total counter", lines)
+        self.assertIn('t_total{kind="a\\"b"} 3', lines)
+        self.assertEqual(
+            [line for line in lines if line.startswith("t_seconds")],
+            ['t_seconds_bucket{le="0.1"} 1', 't_seconds_bucket{le="1"} 2', 't_seconds_bucket{le="+Inf"} 3',
+             "t_seconds_sum 5.55", "t_seconds_count 3"],
+        )
+
+    def test_label_and_type_checks(self):
+        counter = self.registry.counter("t_total", "Test counter", ["kind"])
+        self.assertIs(self.registry.counter("t_total", "Test counter", ["kind"]), counter)
+        with self.assertRaises(ValueError):
+            counter.inc(other="x")
+        with self.assertRaises(ValueError):
+            self.registry.gauge("t_total", "Test gauge")
+
+    def test_disabled(self):
+        self.registry.enabled = False
+        self.registry.counter("t_total", "Test counter").inc()
+        self.assertEqual(self.registry.render().splitlines()[-1], "# TYPE t_total counter")
+
+    def test_merge_process_snapshots(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.registry.directory = metrics.Path(directory)
+        self.registry.flush_interval = 3600
+        self.registry.counter("t_total", "Test counter").inc(2)
+        self.registry.gauge("t_inflight", "Test gauge").set(1)
+        self.registry.histogram("t_seconds", "Test latency", buckets=(1,)).observe(0.5)
+
+        self.registry.flush()
+        self.assertTrue(os.path.exists(os.path.join(directory, f"metrics-{os.getpid()}.json")))
+        other = self.registry.snapshot()
+        for pid in (os.getppid(), dead_pid()):
+            with open(os.path.join(directory, f"metrics-{pid}.json"), "w") as f:
+                json.dump({"pid": pid, "metrics": other}, f)
+
+        merged = self.registry.collect()
+        # 计数器与直方图按进程求和（含已退出进程），仪表只合并存活进程
+        self.assertEqual(merged["t_total"]["samples"][()], 6)
+        self.assertEqual(merged["t_inflight"]["samples"][()], 2)
+        self.assertEqual(merged["t_seconds"]["samples"][()], [[3, 0], 1.5, 3])
+
+
+class MetricsEndpointTests(MockLLMMixin, TransactionTestCase):
+    """/metrics：编排埋点与抓取时读取的队列深度"""
+
+    env = {"ORCHESTRATOR_SINGLEFLIGHT_DB": "0"}
+
+    def scrape(self) -> dict:
+        response = self.client.get("/metrics")
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_run_is_recorded(self):
+        before = self.scrape()
+        OrchestrationService().run(payload())
+        after = self.scrape()
+
+        def delta(name):
+            return after.get(name, 0) - before.get(name, 0)
+
+        self.assertEqual(delta('svgdraw_runs_finished_total{status="success"}'), 1)
+        self.assertEqual(delta('svgdraw_steps_started_total{step="codegen"}'), 1)
+        self.assertEqual(delta('svgdraw_step_duration_seconds_count{step="codegen",outcome="ok"}'), 1)
+        llm = [name for name in after if name.startswith("svgdraw_llm_request_duration_seconds_count")]
+        self.assertEqual(sum(delta(name) for name in llm), 1)
+        self.assertGreater(sum(delta(name) for name in after if name.startswith("svgdraw_llm_tokens_total")), 0)
+
+    def test_job_depth_read_at_scrape(self):
+        jobqueue.enqueue(payload())
+        self.assertEqual(self.scrape()['svgdraw_run_jobs{status="queued"}'], 1)
+
+    def test_token(self):
+        with mock.patch.dict(os.environ, {"METRICS_TOKEN": "secret"}):
+            self.assertEqual(self.client.get("/metrics").status_code, 401)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+
+
+def scene(edges, intent="process_flow", labels=None):
+    names = list(dict.fromkeys(name for edge in edges for name in edge[::2]))
+    entities = [Entity(name=name, type="node", attrs={"label": (labels or {}).get(name, name)}) for name in names]
+    return SceneSpec(intent=intent, entities=entities, relations=[Relation(src, rel, dst) for src, rel, dst in edges])
+
+
+class LayoutEngineTests(SimpleTestCase):
+    """本地分层布局：分层、去环、虚拟节点、交叉最小化与坐标"""
+
+    def layout(self, spec):
+        result = layout._Layout(spec, layout.LAYOUT_INTENTS[spec.intent])
+        result.run()
+        return result, {node.key: node for node in result.nodes[:result.real_count]}
+
+    def test_chain_is_vertical(self):
+        svg, stats = layout.render_scene(scene([("A", "next", "B"), ("B", "next", "C")]))
+        self.assertEqual((stats["nodes"], stats["edges"], stats["layers"], stats["crossings"]), (3, 2, 3, 0))
+        self.assertTrue(svg_repair.validate(svg)[1]["well_formed"])
+        _, nodes = self.layout(scene([("A", "next", "B"), ("B", "next", "C")]))
+        self.assertLess(nodes["A"].y, nodes["B"].y)
+        self.assertLess(nodes["B"].y, nodes["C"].y)
+        self.assertEqual({round(n.x, 3) for n in nodes.values()}, {round(nodes["A"].x, 3)})
+        self.assertEqual((nodes["A"].kind, nodes["B"].kind, nodes["C"].kind), ("start", "process", "end"))
+
+    def test_cycle_is_broken(self):
+        edges = [("A", "next", "B"), ("B", "next", "C"), ("C", "retry", "A")]
+        svg, stats = layout.render_scene(scene(edges))
+        self.assertEqual(stats["reversed_edges"], 1)
+        self.assertEqual(svg.count('marker-end="url(#arrow)"'), 3)
+        self.assertIn(">retry</text>", svg)
+
+    def test_long_edge_gets_dummy_nodes(self):
+        _, stats = layout.render_scene(scene([("A", "next", "B"), ("B", "next", "C"), ("C", "next", "D"), ("A", "next", "D")]))
+        self.assertEqual(stats["dummy_nodes"], 2)
+
+    def test_crossings_are_removed(self):
+        edges = [("r", "next", "a1"), ("r", "next", "a2"), ("a1", "next", "b2"), ("a2", "next", "b1"), ("b1", "next", "c"), ("b2", "next", "c")]
+        _, stats = layout.render_scene(scene(edges))
+        self.assertEqual(stats["crossings"], 0)
+
+    def test_same_layer_nodes_do_not_overlap(self):
+        edges = [("root", "next", f"第{i}个步骤") for i in range(6)]
+        _, nodes = self.layout(scene(edges))
+        row = sorted((n for n in nodes.values() if n.layer == 1), key=lambda n: n.x)
+        for left, right in zip(row, row[1:]):
+            self.assertGreaterEqual(right.x - left.x + 1e-6, (left.width + right.width) / 2 + layout.NODE_SEP)
+
+    def test_network_graph_is_left_to_right(self):
+        spec = scene([("A", "connects", "B"), ("B", "connects", "C")], intent="network_graph")
+        svg, stats = layout.render_scene(spec)
+        self.assertEqual(stats["direction"], "LR")
+        self.assertNotIn("marker-end", svg)
+        _, nodes = self.layout(spec)
+        self.assertLess(nodes["A"].x, nodes["B"].x)
+        self.assertEqual(nodes["A"].kind, "node")
+
+    def test_labels_are_escaped_and_loops_dropped(self):
+        spec = scene([("A", "next", "A"), ("A", "a<b", "B"), ("A", "a<b", "B")], labels={"A": "是否通过？", "B": "<&>"})
+        svg, stats = layout.render_scene(spec)
+        self.assertEqual(stats["edges"], 1)
+        self.assertIn("&lt;&amp;&gt;", svg)
+        self.assertIn("a&lt;b", svg)
+        self.assertIn('class="node decision"', svg)
+        self.assertTrue(svg_repair.validate(svg)[1]["well_formed"])
+
+    def test_unsupported_intent(self):
+        self.assertFalse(layout.supports(None))
+        self.assertFalse(layout.supports(SceneSpec(intent="process_flow")))
+        with self.assertRaises(ValueError):
+            layout.render_scene(scene([("A", "next", "B")], intent="ui_diagram"))
+
+
+class LayoutCodegenTests(MockLLMMixin, TransactionTestCase):
+    """codegen_strategy=layout：支持的意图本地渲染不调用 LLM，其余回退 LLM"""
+
+    env = {"ORCHESTRATOR_SINGLEFLIGHT_DB": "0"}
+
+    def provider(self, result):
+        return RunStepLog.objects.get(run_id=result["run_id"], name="codegen").output_data["provider"]
+
+    def test_supported_intent_skips_llm(self):
+        result = OrchestrationService().run(payload("draw a process flow", codegen_strategy="layout"))
+        self.assertEqual(self.mock.stats["requests"], 0)
+        provider = self.provider(result)
+        self.assertEqual(provider["strategy"], "layout")
+        self.assertEqual(provider["layout"]["nodes"], 3)
+        self.assertIn(">处理</text>", result["draft"]["code"])
+
+    def test_unsupported_intent_falls_back(self):
+        result = OrchestrationService().run(payload("draw a ui layout", codegen_strategy="layout"))
+        self.assertEqual(self.mock.stats["requests"], 1)
+        provider = self.provider(result)
+        self.assertEqual(provider["strategy"], "llm")
+        self.assertEqual(provider["layout_fallback"], "unsupported intent: ui_diagram")
+
+
+class SceneDslTests(SimpleTestCase):
+    """紧凑场景：解析、校验与本地展开"""
+
+    SCENE = {
+        "size": [400, 200],
+        "shapes": [
+            {"id": "a", "type": "rect", "x": 100, "y": 50, "w": 100, "h": 40, "text": "开始", "style": "primary"},
+            {"id": "b", "type": "circle", "x": 300, "y": 50, "r": 20, "style": "sparkly"},
+            {"type": "text", "x": 200, "y": 150, "text": "第一行\n<第二行>"},
+        ],
+        "edges": [["a", "b", "是"]],
+    }
+
+    def test_parse_tolerates_wrapping(self):
+        raw = "好的：\n```json\n" + json.dumps(self.SCENE, ensure_ascii=False) + "\n```\n以上。"
+        scene = scene_dsl.parse(raw)
+        a, b, note = scene["shapes"]
+        self.assertEqual((b["w"], b["h"], b["style"]), (40, 40, "default"))
+        self.assertEqual((note["id"], note["h"]), ("_2", 2 * scene_dsl.LINE_HEIGHT))
+        self.assertEqual(scene["edges"], [{"from": "a", "to": "b", "text": "是", "style": "default"}])
+
+    def test_invalid_scenes(self):
+        def broken(**changes):
+            return {**self.SCENE, **changes}
+
+        cases = {
+            "no JSON object": "这里没有场景",
+            "invalid JSON": '{"size": [1, 2],}',
+            "unknown keys": json.dumps(broken(title="x")),
+            "size must be": json.dumps(broken(size=[400])),
+            "size[0] must be a number": json.dumps(broken(size=[True, 200])),
+            "shapes must be a non-empty list": json.dumps(broken(shapes=[])),
+            "duplicate shape id": json.dumps(broken(shapes=[self.SCENE["shapes"][0]] * 2)),
+            "shapes[0].w must be positive": json.dumps(broken(shapes=[{"id": "a", "type": "rect", "x": 1, "y": 1, "w": 0, "h": 1}])),
+            "text is required": json.dumps(broken(shapes=[{"type": "text", "x": 1, "y": 1}], edges=[])),
+            "edges[0] to 'z' is not a shape id": json.dumps(broken(edges=[["a", "z"]])),
+        }
+        for message, raw in cases.items():
+            with self.assertRaises(ValueError, msg=message) as ctx:
+                scene_dsl.parse(raw)
+            self.assertIn(message, str(ctx.exception))
+
+    def test_expand(self):
+        svg, stats = scene_dsl.expand(scene_dsl.validate(self.SCENE))
+        self.assertEqual(stats, {"shapes": 3, "edges": 1, "styles": ["default", "primary"]})
+        self.assertTrue(svg_repair.validate(svg)[1]["well_formed"])
+        # 只输出用到的样式类
+        self.assertIn(".s-primary{", svg)
+        self.assertNotIn(".s-danger{", svg)
+        # 连线端点裁剪到矩形右边与圆的左侧轮廓
+        self.assertIn('d="M150,50L280,50"', svg)
+        self.assertIn('<tspan x="200" y="141">第一行</tspan><tspan x="200" y="159">&lt;第二行&gt;</tspan>', svg)
+        self.assertEqual(measure(svg)["viewBox"], "0 0 400 200")
+
+
+class CompactCodegenTests(MockLLMMixin, TransactionTestCase):
+    """codegen_strategy=compact：LLM 输出紧凑场景并在本地展开，不合法时回退为直接生成 SVG"""
+
+    env = {"ORCHESTRATOR_SINGLEFLIGHT_DB": "0"}
+
+    def provider(self, result):
+        return RunStepLog.objects.get(run_id=result["run_id"], name="codegen").output_data["provider"]
+
+    def test_scene_is_expanded_and_cached(self):
+        first = OrchestrationService().run(payload(codegen_strategy="compact"))
+        provider = self.provider(first)
+        self.assertEqual(provider["strategy"], "compact")
+        self.assertLess(provider["compact"]["response_chars"], provider["compact"]["svg_chars"])
+        self.assertTrue(first["draft"]["code"].startswith("<svg"))
+
+        second = OrchestrationService().run(payload(codegen_strategy="compact"))
+        self.assertEqual(self.mock.stats["requests"], 1)
+        self.assertTrue(self.provider(second)["cache"]["hit"])
+        self.assertEqual(second["draft"]["code"], first["draft"]["code"])
+
+    def test_invalid_scene_falls_back(self):
+        self.configure_mock(svg=generate_svg("矩形", 3))
+        result = OrchestrationService().run(payload(codegen_strategy="compact"))
+        self.assertEqual(self.mock.stats["requests"], 2)
+        provider = self.provider(result)
+        self.assertEqual(provider["strategy"], "llm")
+        self.assertIn("Compact scene", provider["compact_fallback"]["error"])
+        self.assertTrue(result["draft"]["code"].startswith("<svg"))
@@ -1,5 +1,8 @@
 from django.urls import path, re_path
-from .views import RunOrchestratorView
+from .views import (
+    RunOrchestratorView, RunOrchestratorStreamView, AsyncRunOrchestratorView, RunOrchestratorBatchView,
+    RunOrchestratorSubmitView,
+)
 
 app_name = 'orchestrator'
 
@@ -7,4 +10,12 @@ urlpatterns = [
     # 支持带斜杠和不带斜杠两种形式
     path('run/', RunOrchestratorView.as_view(), name='run'),
     re_path(r'^run$', RunOrchestratorView.as_view(), name='run-no-slash'),
+    path('run/stream/', RunOrchestratorStreamView.as_view(), name='run-stream'),
+    re_path(r'^run/stream$', RunOrchestratorStreamView.as_view(), name='run-stream-no-slash'),
+    path('run/async/', AsyncRunOrchestratorView.as_view(), name='run-async'),
+    re_path(r'^run/async$', AsyncRunOrchestratorView.as_view(), name='run-async-no-slash'),
+    path('run/batch/', RunOrchestratorBatchView.as_view(), name='run-batch'),
+    re_path(r'^run/batch$', RunOrchestratorBatchView.as_view(), name='run-batch-no-slash'),
+    path('run/submit/', RunOrchestratorSubmitView.as_view(), name='run-submit'),
+    re_path(r'^run/submit$', RunOrchestratorSubmitView.as_view(), name='run-submit-no-slash'),
 ]
@@ -1,71 +1,274 @@
 from rest_framework.views import APIView
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from django.http import StreamingHttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+from asgiref.sync import sync_to_async
 from .services import OrchestrationService
-from common.responses import success_response, error_response
+from common.deadline import DeadlineExceeded
+from common.responses import (
+    success_response, error_response, sse_event,
+    success_json_response, error_json_response,
+)
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def _build_payload(request, data=None):
+    """
+    从请求解析 InputPayload：提供 submission_id 时从数据库加载，否则从请求字段构建。
+    data 默认取 DRF 的 request.data；纯 Django 视图需传入已解析的表单/JSON 字段。
+    submission 不存在时抛出 InputSubmission.DoesNotExist。
+    """
+    from m2_inputs.models import InputSubmission
+    from common.schemas import InputPayload, ImageInfo
+
+    if data is None:
+        data = request.data
+
+    # 解析参数
+    submission_id = data.get('submission_id')
+    text = data.get('text')
+    image_file = request.FILES.get('image')
+
+    # 如果提供了 submission_id，从数据库加载
+    if submission_id:
+        from m2_inputs.services import get_input_payload
+        submission = InputSubmission.objects.get(id=submission_id)
+        return get_input_payload(submission, request)
+
+    # 否则从请求中构建
+    images = []
+    if image_file:
+        # 保存文件到 InputSubmission
+        submission = InputSubmission.objects.create(
+            text=text,
+            image_file=image_file,
+            params_json={
+                'enable_kg': data.get('enable_kg', 'false').lower() == 'true',
+                'enable_rag': data.get('enable_rag', 'false').lower() == 'true',
+                'output_mode': data.get('output_mode', 'auto')
+            }
+        )
+        images.append(ImageInfo(
+            id=str(submission.id),
+            url=request.build_absolute_uri(submission.image_url) if submission.image_url else '',
+            mime='image/jpeg'
+        ))
+
+    params = {
+        'enable_kg': data.get('enable_kg', 'false').lower() == 'true',
+        'enable_rag': data.get('enable_rag', 'false').lower() == 'true',
+        'output_mode': data.get('output_mode', 'auto'),
+        # 可选：false 时跳过 LLM 响应缓存，强制重新生成
+        'use_cache': data.get('use_cache', True),
+        # 可选：false 时不与并发的相同请求合并
+        'coalesce': data.get('coalesce', True),
+        # 可选：是否对 codegen 发起对冲请求，不传时取 SILICONFLOW_HEDGE
+        'hedge': data.get('hedge'),
+        # 可选：运行截止时间（秒），不传时取 ORCHESTRATOR_DEADLINE
+        'deadline': data.get('deadline'),
+        # 可选：codegen 策略 llm / layout / compact，不传时取 ORCHESTRATOR_CODEGEN_STRATEGY
+        'codegen_strategy': data.get('codegen_strategy'),
+    }
+
+    return InputPayload(
+        text=text,
+        images=images,
+        params=params
+    )
+
+
+def _build_batch_payloads(request, data):
+    """
+    解析批量请求：items 为字符串（text）或对象（text / submission_id / enable_kg / ...）列表，
+    顶层的 enable_kg / enable_rag / output_mode / use_cache / coalesce / hedge / deadline / codegen_strategy
+    作为各条目的默认值。
+    submission 不存在时抛出 InputSubmission.DoesNotExist；items 不是列表或条目既不是字符串也不是对象时抛出 ValueError。
+    """
+    from m2_inputs.models import InputSubmission
+    from m2_inputs.services import get_input_payload
+    from common.schemas import InputPayload
+
+    def as_bool(value):
+        if isinstance(value, str):
+            return value.strip().lower() == 'true'
+        return bool(value)
+
+    defaults = {
+        'enable_kg': as_bool(data.get('enable_kg', False)),
+        'enable_rag': as_bool(data.get('enable_rag', False)),
+        'output_mode': data.get('output_mode', 'auto'),
+        'use_cache': data.get('use_cache', True),
+        'coalesce': data.get('coalesce', True),
+        'hedge': data.get('hedge'),
+        'deadline': data.get('deadline'),
+        'codegen_strategy': data.get('codegen_strategy'),
+    }
+
+    items = data.get('items') or []
+    if not isinstance(items, list):
+        raise ValueError("items must be a list")
+    payloads = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {'text': item}
+        elif not isinstance(item, dict):
+            raise ValueError(f"items[{index}] must be a string or an object")
+        if item.get('submission_id'):
+            submission = InputSubmission.objects.get(id=item['submission_id'])
+            payloads.append(get_input_payload(submission, request))
+            continue
+        params = dict(defaults)
+        for key in ('enable_kg', 'enable_rag'):
+            if key in item:
+                params[key] = as_bool(item[key])
+        for key in ('output_mode', 'use_cache', 'coalesce', 'hedge', 'deadline', 'codegen_strategy'):
+            if key in item:
+                params[key] = item[key]
+        payloads.append(InputPayload(text=item.get('text'), images=[], params=params))
+    return payloads
+
+
 class RunOrchestratorView(APIView):
     """触发全链路编排"""
     parser_classes = [MultiPartParser, FormParser, JSONParser]
-    
+
     def post(self, request):
+        from m2_inputs.models import InputSubmission
         try:
-            # 解析参数
-            submission_id = request.data.get('submission_id')
-            text = request.data.get('text')
-            image_file = request.FILES.get('image')
-            
-            # 如果提供了 submission_id，从数据库加载
-            if submission_id:
-                from m2_inputs.models import InputSubmission
-                from m2_inputs.services import get_input_payload
-                try:
-                    submission = InputSubmission.objects.get(id=submission_id)
-                    payload = get_input_payload(submission, request)
-                except InputSubmission.DoesNotExist:
-                    return error_response(f"Submission {submission_id} not found", status=404)
-            else:
-                # 否则从请求中构建
-                from common.schemas import InputPayload, ImageInfo
-                images = []
-                if image_file:
-                    # 保存文件到 InputSubmission
-                    from m2_inputs.models import InputSubmission
-                    submission = InputSubmission.objects.create(
-                        text=text,
-                        image_file=image_file,
-                        params_json={
-                            'enable_kg': request.data.get('enable_kg', 'false').lower() == 'true',
-                            'enable_rag': request.data.get('enable_rag', 'false').lower() == 'true',
-                            'output_mode': request.data.get('output_mode', 'auto')
-                        }
-                    )
-                    images.append(ImageInfo(
-                        id=str(submission.id),
-                        url=request.build_absolute_uri(submission.image_url) if submission.image_url else '',
-                        mime='image/jpeg'
-                    ))
-                
-                params = {
-                    'enable_kg': request.data.get('enable_kg', 'false').lower() == 'true',
-                    'enable_rag': request.data.get('enable_rag', 'false').lower() == 'true',
-                    'output_mode': request.data.get('output_mode', 'auto')
-                }
-                
-                payload = InputPayload(
-                    text=text,
-                    images=images,
-                    params=params
-                )
-            
+            try:
+                payload = _build_payload(request)
+            except InputSubmission.DoesNotExist:
+                return error_response(f"Submission {request.data.get('submission_id')} not found", status=404)
+
             # 执行编排
             service = OrchestrationService()
             result = service.run(payload, request)
-            
+
             return success_response(result)
+        except DeadlineExceeded as e:
+            return error_response(str(e), status=504)
         except Exception as e:
             logger.error(f"Orchestration error: {str(e)}", exc_info=True)
             return error_response(str(e), status=500)
+
+
+class RunOrchestratorSubmitView(APIView):
+    """提交编排任务：立即返回 run_id，由 run_worker 进程异步执行；通过运行详情或进度事件流查看结果"""
+    parser_classes = [MultiPartParser, FormParser, JSONParser]
+
+    def post(self, request):
+        from m2_inputs.models import InputSubmission
+        from .jobqueue import enqueue
+        try:
+            try:
+                payload = _build_payload(request)
+            except InputSubmission.DoesNotExist:
+                return error_response(f"Submission {request.data.get('submission_id')} not found", status=404)
+
+            job = enqueue(payload)
+            run_id = str(job.run_id)
+            return success_response({
+                "run_id": run_id,
+                "status": job.run.status,
+                "detail_url": f"/api/runs/{run_id}/",
+                "events_url": f"/api/runs/{run_id}/events/",
+            }, status=202)
+        except Exception as e:
+            logger.error(f"Orchestration (submit) error: {str(e)}", exc_info=True)
+            return error_response(str(e), status=500)
+
+
+class RunOrchestratorBatchView(APIView):
+    """批量触发编排：条目在有界线程池中并行执行，返回各条目结果与批次汇总"""
+    parser_classes = [JSONParser]
+
+    def post(self, request):
+        from m2_inputs.models import InputSubmission
+        from .services import BATCH_MAX_ITEMS
+        try:
+            if not isinstance(request.data, dict):
+                return error_response("Request body must be a JSON object", status=400)
+            try:
+                payloads = _build_batch_payloads(request, request.data)
+            except InputSubmission.DoesNotExist as e:
+                return error_response(str(e), status=404)
+            except ValueError as e:
+                return error_response(str(e), status=400)
+
+            if not payloads:
+                return error_response("items is required", status=400)
+            if len(payloads) > BATCH_MAX_ITEMS:
+                return error_response(f"Too many items (max {BATCH_MAX_ITEMS})", status=400)
+
+            max_concurrency = request.data.get('max_concurrency')
+            if max_concurrency is not None:
+                try:
+                    max_concurrency = int(max_concurrency)
+                except (TypeError, ValueError):
+                    return error_response("max_concurrency must be an integer", status=400)
+                if max_concurrency < 1:
+                    return error_response("max_concurrency must be at least 1", status=400)
+            result = OrchestrationService().run_batch(payloads, max_concurrency)
+            return success_response(result)
+        except Exception as e:
+            logger.error(f"Orchestration (batch) error: {str(e)}", exc_info=True)
+            return error_response(str(e), status=500)
+
+
+class RunOrchestratorStreamView(APIView):
+    """触发全链路编排（SSE 流式返回 run / delta / done / error 事件）"""
+    parser_classes = [MultiPartParser, FormParser, JSONParser]
+
+    def post(self, request):
+        from m2_inputs.models import InputSubmission
+        try:
+            payload = _build_payload(request)
+        except InputSubmission.DoesNotExist:
+            return error_response(f"Submission {request.data.get('submission_id')} not found", status=404)
+        except Exception as e:
+            logger.error(f"Orchestration stream error: {str(e)}", exc_info=True)
+            return error_response(str(e), status=500)
+
+        events = OrchestrationService().run_stream(payload, request)
+        response = StreamingHttpResponse(
+            (sse_event(e["event"], e["data"]) for e in events),
+            content_type='text/event-stream',
+        )
+        # 禁止缓存与反向代理缓冲，保证增量即时到达浏览器
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncRunOrchestratorView(View):
+    """
+    触发全链路编排（原生异步视图）
+    在 ASGI 服务器下运行时，LLM 等待期间不占用工作线程，单进程可同时挂起大量请求。
+    """
+
+    async def post(self, request):
+        from m2_inputs.models import InputSubmission
+        try:
+            if request.content_type == 'application/json':
+                data = json.loads(request.body or b'{}')
+            else:
+                data = request.POST
+
+            try:
+                payload = await sync_to_async(_build_payload)(request, data)
+            except InputSubmission.DoesNotExist:
+                return error_json_response(f"Submission {data.get('submission_id')} not found", status=404)
+
+            result = await OrchestrationService().arun(payload, request)
+            return success_json_response(result)
+        except DeadlineExceeded as e:
+            return error_json_response(str(e), status=504)
+        except Exception as e:
+            logger.error(f"Orchestration (async) error: {str(e)}", exc_info=True)
+            return error_json_response(str(e), status=500)
@@ -6,7 +6,7 @@ from .models import Draft
 class DraftAdmin(admin.ModelAdmin):
     list_display = ['id', 'dsl_type', 'title_preview', 'created_at']
     list_filter = ['dsl_type', 'created_at']
-    search_fields = ['code', 'meta_json']
+    search_fields = ['meta_json']  # 代码列为压缩存储，不参与搜索
     
     def title_preview(self, obj):
         return obj.meta.get('title', '-')
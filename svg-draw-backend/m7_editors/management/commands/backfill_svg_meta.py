@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import SvgDraw
+from api.services import SvgDrawService
+from common.svg_geometry import META_KEYS, fill_meta
+from m7_editors.models import Draft
+
+
+class Command(BaseCommand):
+    help = '按 SVG 内容补齐已有 SVG 草稿 meta 的 width / height / viewBox / bbox 与 svg_draw 的尺寸字段（可重复执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='每个事务处理的行数，默认 200')
+        parser.add_argument('--force', action='store_true', help='已有尺寸的行也重新计算')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        force = options['force']
+
+        updated = 0
+        pks = list(Draft.objects.filter(dsl_type='svg').values_list('pk', flat=True))
+        for chunk in _chunks(pks, batch_size):
+            with transaction.atomic():
+                for draft in Draft.objects.filter(pk__in=chunk).only('id', 'code_text', 'code_blob', 'meta_json'):
+                    if not force and all(draft.meta.get(key) is not None for key in META_KEYS):
+                        continue
+                    meta = fill_meta(draft.meta, draft.code, force=force)
+                    if meta != draft.meta:
+                        Draft.objects.filter(pk=draft.pk).update(meta_json=meta)
+                        updated += 1
+        self.stdout.write(f'草稿：{updated} 条补齐尺寸元数据')
+
+        updated = 0
+        rows = SvgDraw.objects.all() if force else SvgDraw.objects.filter(view_box='')
+        pks = list(rows.values_list('pk', flat=True))
+        for chunk in _chunks(pks, batch_size):
+            with transaction.atomic():
+                for draw in SvgDraw.objects.filter(pk__in=chunk).only('id', 'svg_content'):
+                    fields = SvgDrawService.size_fields(draw.svg_content)
+                    if fields['view_box']:
+                        SvgDraw.objects.filter(pk=draw.pk).update(**fields)
+                        updated += 1
+        self.stdout.write(self.style.SUCCESS(f'svg_draw：{updated} 条补齐尺寸字段'))
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
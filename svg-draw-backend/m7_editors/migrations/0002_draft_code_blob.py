@@ -0,0 +1,29 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('m7_editors', '0001_initial'),
+        ('m8_blobs', '0001_initial'),
+    ]
+
+    operations = [
+        # 字段改名为 code_text（code 改为读写 blob 的属性），数据库列名不变
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(model_name='draft', old_name='code', new_name='code_text'),
+                migrations.AlterField(
+                    model_name='draft',
+                    name='code_text',
+                    field=models.TextField(blank=True, db_column='code'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='draft',
+            name='code_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='drafts', to='m8_blobs.blob'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:41
+
+import common.fields
+from common.fields import convert_rows
+from django.db import migrations
+
+
+def compress_rows(apps, schema_editor):
+    convert_rows(apps.get_model('m7_editors', 'Draft'), 'code_text', using=schema_editor.connection.alias)
+
+
+def decompress_rows(apps, schema_editor):
+    convert_rows(apps.get_model('m7_editors', 'Draft'), 'code_text', to_text=True, using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('m7_editors', '0002_draft_code_blob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='draft',
+            name='code_text',
+            field=common.fields.CompressedTextField(blank=True, db_column='code'),
+        ),
+        # 已有的未压缩行分批转换为压缩格式
+        migrations.RunPython(compress_rows, decompress_rows),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from m8_blobs.services import BlobStore
+from common.fields import CompressedTextField
 import json
 
 
@@ -11,7 +13,9 @@ class Draft(models.Model):
     ]
     
     dsl_type = models.CharField(max_length=20, choices=DSL_TYPE_CHOICES)
-    code = models.TextField()
+    # 代码正文：小于 BLOB_STORE_MIN_SIZE 时内联，否则存入 blob 存储（code_text 为空）；统一通过 code 属性读写
+    code_text = CompressedTextField(db_column='code', blank=True)
+    code_blob = models.ForeignKey('m8_blobs.Blob', on_delete=models.PROTECT, null=True, blank=True, related_name='drafts')
     meta_json = models.JSONField(default=dict)  # {title, width, height, editable, router_reason}
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -23,8 +27,42 @@ class Draft(models.Model):
         db_table = 'drafts'
         ordering = ['-created_at']
     
+    _code = None
+    _code_changed = False
+
     def __str__(self):
         return f"Draft {self.id} ({self.dsl_type})"
+
+    @property
+    def code(self) -> str:
+        """代码正文（内联或从 blob 存储读取）"""
+        if self._code is None:
+            self._code = BlobStore.get(self.code_blob_id) if self.code_blob_id else self.code_text
+        return self._code
+
+    @code.setter
+    def code(self, value):
+        self._code = value
+        self._code_changed = True
+
+    def store_code(self):
+        """把新设置的代码写入 code_text 或 blob 存储；save() 会自动调用，bulk_create 前需手动调用"""
+        if not self._code_changed:
+            return
+        old_blob = self.code_blob_id
+        if old_blob and BlobStore.should_store(self._code) and BlobStore.key(self._code) == old_blob:
+            self._code_changed = False
+            return
+        blob = BlobStore.put_if_large(self._code)
+        self.code_blob_id = blob.key if blob else None
+        self.code_text = '' if blob else (self._code or '')
+        if old_blob:
+            BlobStore.release(old_blob)
+        self._code_changed = False
+
+    def save(self, *args, **kwargs):
+        self.store_code()
+        super().save(*args, **kwargs)
     
     @property
     def meta(self):
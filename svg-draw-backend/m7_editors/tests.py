@@ -1,3 +1,170 @@
-from django.test import TestCase
+import os
+from io import StringIO
+from unittest import mock
+from xml.etree import ElementTree as ET
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from common.svg_geometry import measure
+from common.svg_optimizer import canvas_precision, optimize, optimize_if_enabled
+from m7_editors.models import Draft
+
+
+SVG_NS = 'xmlns="http://www.w3.org/2000/svg"'
+
+
+def attrs(svg: str, tag: str) -> dict:
+    root = ET.fromstring(svg)
+    return next(el for el in root.iter() if el.tag.endswith("}" + tag)).attrib
+
+
+class SvgOptimizerPrecisionTests(SimpleTestCase):
+    """数字舍入的小数位随画布大小变化"""
+
+    def test_default_canvas_rounds_to_precision(self):
+        out, _ = optimize(f'<svg {SVG_NS} viewBox="0 0 200 100"><rect x="10.12345" y="20.5" width="30" height="40"/></svg>')
+        self.assertEqual(attrs(out, "rect")["x"], "10.12")
+
+    def test_small_view_box_keeps_significant_digits(self):
+        svg = (
+            f'<svg {SVG_NS} viewBox="0 0 .1 .1"><rect x="0.0123" y="0.0456" width="0.0333" height="0.02"/>'
+            '<path d="M 0.0111 0.0222 L 0.0555 0.0666"/></svg>'
+        )
+        out, _ = optimize(svg)
+        rect = attrs(out, "rect")
+        self.assertEqual((rect["x"], rect["y"], rect["width"], rect["height"]), (".0123", ".0456", ".0333", ".02"))
+        self.assertEqual(attrs(out, "svg")["viewBox"], "0 0 .1 .1")
+        self.assertEqual(attrs(out, "path")["d"], "M.0111.0222.0555.0666")
+
+    def test_width_height_used_without_view_box(self):
+        out, _ = optimize(f'<svg {SVG_NS} width="1" height="1"><circle cx="0.12345" cy="0.5" r="0.25"/></svg>')
+        self.assertEqual(attrs(out, "circle")["cx"], ".1235")
+
+    def test_canvas_precision(self):
+        def digits(attributes):
+            return canvas_precision(ET.fromstring(f"<svg {SVG_NS} {attributes}/>"), 2)
+
+        self.assertEqual(digits('viewBox="0 0 800 600"'), 2)
+        self.assertEqual(digits('viewBox="0 0 10 5"'), 3)
+        self.assertEqual(digits('viewBox="0 0 .1 .05"'), 5)
+        self.assertEqual(digits('width="2px" height="1px"'), 4)
+        self.assertEqual(digits('width="100%" height="100%"'), 2)
+        self.assertEqual(digits(""), 2)
+
+
+class SvgOptimizerPassesTests(SimpleTestCase):
+    """各遍处理缩小文档而不改变渲染结果；无法解析时原样返回"""
+
+    def test_cleanup_passes(self):
+        svg = (
+            f'<svg {SVG_NS} version="1.1" viewBox="0 0 200 100"><!-- c --><metadata>m</metadata>\n  <g>\n '
+            '<rect x="0" y="1" width="10" height="10" opacity="1" class=" "/>\n</g><g/><defs></defs>'
+            '<text x="5" y="5"> a  b </text></svg>'
+        )
+        out, report = optimize(svg)
+        self.assertEqual(
+            out, f'<svg {SVG_NS} viewBox="0 0 200 100"><rect y="1" width="10" height="10"/><text x="5" y="5"> a  b </text></svg>',
+        )
+        for name in ("comments", "whitespace", "default_attributes", "empty_groups"):
+            self.assertGreater(report["passes"][name], 0, name)
+        self.assertEqual(report["output_bytes"], len(out))
+        self.assertEqual(sum(report["passes"].values()), report["input_bytes"] - report["output_bytes"])
+
+    def test_path_data(self):
+        out, _ = optimize(f'<svg {SVG_NS} viewBox="0 0 200 100"><path d="M 10 10 L 20 10 L 30 10 L 30 20 Z"/></svg>')
+        self.assertEqual(attrs(out, "path")["d"], "M10 10H20 30V20z")
+
+    def test_repeated_styles_become_classes(self):
+        rects = "".join(f'<rect x="{i}" width="5" height="5" style="fill:red;stroke:blue"/>' for i in range(1, 4))
+        out, _ = optimize(f'<svg {SVG_NS} viewBox="0 0 200 100">{rects}</svg>')
+        self.assertIn("<style>.s0{fill:red;stroke:blue}</style>", out)
+        self.assertEqual(out.count('class="s0"'), 3)
+        self.assertNotIn('style="', out)
+
+    def test_complex_selectors_keep_inline_styles(self):
+        rects = "".join(f'<rect x="{i}" width="5" height="5" style="fill:red;stroke:blue"/>' for i in range(1, 4))
+        out, report = optimize(f'<svg {SVG_NS} viewBox="0 0 200 100"><style>g rect{{fill:red}}</style>{rects}</svg>')
+        self.assertEqual(out.count('style="fill:red;stroke:blue"'), 3)
+        self.assertEqual((report["passes"]["style_classes"], report["passes"]["use_dedup"]), (0, 0))
+
+    def test_typed_class_rule_keeps_inline_styles(self):
+        # rect.a 的优先级高于 .s0：提升后 fill 会从 blue 变成 red
+        rects = "".join(f'<rect class="a" x="1" width="{i}" height="5" style="fill:blue;stroke:blue"/>' for i in range(1, 4))
+        circles = "".join(f'<circle class="a" cx="1" r="{i}" style="fill:blue;stroke:blue"/>' for i in range(1, 4))
+        out, _ = optimize(f'<svg {SVG_NS} viewBox="0 0 200 100"><style>rect.a{{fill:red}}</style>{rects}{circles}</svg>')
+        self.assertEqual(out.count('style="fill:blue;stroke:blue"'), 3)
+        self.assertNotIn('<rect class="a s0"', out)
+        self.assertEqual(out.count('class="a s0"'), 3)
+
+    def test_translated_copies_become_use(self):
+        shapes = "".join(
+            f'<path transform="translate({i * 20},0)" d="M0 0L10 0L10 10L0 10Z" fill="#123456" stroke="#000"/>' for i in range(4)
+        )
+        out, _ = optimize(f'<svg {SVG_NS} viewBox="0 0 200 100">{shapes}</svg>')
+        root = ET.fromstring(out)
+        self.assertEqual(len([el for el in root.iter() if el.tag.endswith("}path")]), 1)
+        uses = [el for el in root.iter() if el.tag.endswith("}use")]
+        self.assertEqual([el.get("transform") for el in uses], [f"translate({i * 20},0)" for i in range(4)])
+
+    def test_unparseable_input_is_returned(self):
+        for svg, reason in (("<svg", "not well-formed"), (f"<html {SVG_NS}/>", "root element is <html>")):
+            out, report = optimize(svg)
+            self.assertEqual(out, svg)
+            self.assertTrue(report["skipped"].startswith(reason))
+
+    def test_disabled(self):
+        svg = f'<svg {SVG_NS}><!-- c --></svg>'
+        with mock.patch.dict(os.environ, {"SVG_OPTIMIZER_ENABLED": "0"}):
+            self.assertEqual(optimize_if_enabled(svg, "test"), (svg, None))
+        self.assertEqual(optimize_if_enabled(svg, "test")[0], f"<svg {SVG_NS}/>")
+
+
+class SvgGeometryMeasureTests(SimpleTestCase):
+    """measure：width / height / viewBox / bbox 的推导"""
+
+    def test_declared_view_box_is_kept(self):
+        size = measure(f'<svg {SVG_NS} viewBox="0 0 200 100"><rect x="10" y="10" width="20" height="20" stroke="#000" stroke-width="2"/></svg>')
+        self.assertEqual(size, {"width": 200, "height": 100, "viewBox": "0 0 200 100", "bbox": [9, 9, 22, 22]})
+
+    def test_absolute_size_without_view_box_uses_origin_canvas(self):
+        size = measure(f'<svg {SVG_NS} width="300" height="150"><rect x="10" y="20" width="30" height="40"/></svg>')
+        self.assertEqual(size["viewBox"], "0 0 300 150")
+        self.assertEqual((size["width"], size["height"]), (300, 150))
+        self.assertEqual(size["bbox"], [10, 20, 30, 40])
+
+    def test_units_are_converted_to_px(self):
+        size = measure(f'<svg {SVG_NS} width="1in" height="48pt"><circle cx="10" cy="10" r="5"/></svg>')
+        self.assertEqual(size["viewBox"], "0 0 96 64")
+
+    def test_no_size_falls_back_to_content_box(self):
+        size = measure(f'<svg {SVG_NS}><rect x="10.5" y="20" width="30" height="40"/></svg>')
+        self.assertEqual(size["viewBox"], "10 20 31 40")
+        self.assertEqual((size["width"], size["height"]), (31, 40))
+
+    def test_one_dimension_follows_view_box_ratio(self):
+        size = measure(f'<svg {SVG_NS} width="400" viewBox="0 0 200 100"/>')
+        self.assertEqual((size["width"], size["height"]), (400, 200))
+
+    def test_unparseable_svg(self):
+        self.assertEqual(measure("<svg"), {"width": None, "height": None, "viewBox": None, "bbox": None})
+
+
+class BackfillSvgMetaTests(TestCase):
+    """backfill_svg_meta：只补齐缺失的尺寸，--force 全部重算"""
+
+    def setUp(self):
+        svg = f'<svg {SVG_NS} width="300" height="150"><rect x="10" y="20" width="30" height="40"/></svg>'
+        self.draft = Draft.objects.create(dsl_type="svg", code=svg, meta_json={"title": "t", "width": 640})
+
+    def backfill(self, *args):
+        call_command("backfill_svg_meta", *args, stdout=StringIO())
+        self.draft.refresh_from_db()
+        return self.draft.meta
+
+    def test_missing_keys_are_filled(self):
+        meta = self.backfill()
+        self.assertEqual(meta, {"title": "t", "width": 640, "height": 150, "viewBox": "0 0 300 150", "bbox": [10, 20, 30, 40]})
+
+    def test_force_recomputes(self):
+        self.assertEqual(self.backfill("--force")["width"], 300)
@@ -3,6 +3,8 @@ from rest_framework.parsers import JSONParser
 from django.shortcuts import get_object_or_404
 from .models import Draft
 from common.responses import success_response, error_response
+from common.svg_geometry import fill_meta
+from common.svg_optimizer import optimize_if_enabled
 import logging
 
 logger = logging.getLogger(__name__)
@@ -64,6 +66,14 @@ class DraftCreateView(APIView):
             if dsl_type not in ['mermaid', 'graphviz', 'svg']:
                 return error_response(f"Invalid dsl_type: {dsl_type}", status=400)
             
+            # SVG 草稿保存前做体积优化（请求可传 optimize: false 关闭）
+            optimizer_report = None
+            if dsl_type == 'svg' and request.data.get('optimize', True) is not False:
+                code, optimizer_report = optimize_if_enabled(code, source="draft")
+            # SVG 草稿补齐 meta 中缺失的 width / height / viewBox / bbox
+            if dsl_type == 'svg':
+                meta = fill_meta(meta, code)
+            
             draft = Draft.objects.create(
                 dsl_type=dsl_type,
                 code=code,
@@ -76,7 +86,8 @@ class DraftCreateView(APIView):
                 'id': draft.id,
                 'dsl_type': draft.dsl_type,
                 'code': draft.code,
-                'meta': draft.meta
+                'meta': draft.meta,
+                'optimizer': optimizer_report
             }, status=201)
         except Exception as e:
             logger.error(f"Error creating draft: {str(e)}")
@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import Blob
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ['key', 'size', 'stored_size', 'codec', 'refcount', 'created_at', 'updated_at']
+    list_filter = ['codec', 'created_at']
+    search_fields = ['key']
+    exclude = ['data']
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class BlobsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'm8_blobs'
+
+    def ready(self):
+        # 引用行删除时释放 blob 引用计数
+        from . import signals  # noqa: F401
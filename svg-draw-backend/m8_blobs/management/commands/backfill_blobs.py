@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from m1_runs.models import Artifact, RunStepLog
+from m7_editors.models import Draft
+from m8_blobs.services import BlobStore
+
+
+class Command(BaseCommand):
+    help = '把已有草稿代码与 codegen 步骤输出中的大文本移入 blob 存储，并让对应产物引用同一 blob（可重复执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='每个事务处理的行数，默认 200')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        moved = 0
+        pks = list(Draft.objects.filter(code_blob=None).values_list('pk', flat=True))
+        for chunk in _chunks(pks, batch_size):
+            with transaction.atomic():
+                for draft in Draft.objects.filter(pk__in=chunk).only('id', 'code_text'):
+                    blob = BlobStore.put_if_large(draft.code_text)
+                    if blob:
+                        Draft.objects.filter(pk=draft.pk).update(code_text='', code_blob=blob.key)
+                        moved += 1
+        self.stdout.write(f'草稿：{moved} 条移入 blob 存储')
+
+        moved = 0
+        pks = list(RunStepLog.objects.filter(name='codegen', output_blob=None).values_list('pk', flat=True))
+        for chunk in _chunks(pks, batch_size):
+            with transaction.atomic():
+                for step in RunStepLog.objects.filter(pk__in=chunk).only('id', 'output_data'):
+                    output = dict(step.output_data or {})
+                    blob = BlobStore.put_if_large(output.get('code'))
+                    if blob:
+                        del output['code']
+                        RunStepLog.objects.filter(pk=step.pk).update(output_data=output, output_blob=blob.key)
+                        moved += 1
+        self.stdout.write(f'codegen 步骤：{moved} 条移入 blob 存储')
+
+        linked = 0
+        # code 产物引用对应草稿的 blob，draft_svg 产物引用同一运行 codegen 步骤的 blob
+        pks = list(Artifact.objects.filter(blob=None, type__in=['code', 'draft_svg']).values_list('pk', flat=True))
+        for chunk in _chunks(pks, batch_size):
+            with transaction.atomic():
+                for art in Artifact.objects.filter(pk__in=chunk).only('id', 'type', 'ref_id', 'run_id'):
+                    if art.type == 'code':
+                        if not (art.ref_id or '').isdigit():
+                            continue
+                        key = Draft.objects.filter(pk=int(art.ref_id)).values_list('code_blob', flat=True).first()
+                    else:
+                        key = (
+                            RunStepLog.objects.filter(run_id=art.run_id, name='codegen', output_blob__isnull=False)
+                            .values_list('output_blob', flat=True).first()
+                        )
+                    if key:
+                        BlobStore.retain(key)
+                        Artifact.objects.filter(pk=art.pk).update(blob=key)
+                        linked += 1
+        self.stdout.write(self.style.SUCCESS(f'产物：{linked} 条关联到 blob'))
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -0,0 +1,138 @@
+import os
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.models import SvgDraw
+from common.fields import codec_of, decode_text, encode_text, load_dictionary, save_dictionary, train_dictionary
+from m1_runs.models import RunStepLog
+from m7_editors.models import Draft
+from m8_blobs.models import Blob
+from m8_blobs.services import BlobStore
+
+# 压缩存储的列：(显示名, 模型, 字段名)
+COMPRESSED_COLUMNS = [
+    ('svg_draw.svg_content', SvgDraw, 'svg_content'),
+    ('drafts.code', Draft, 'code_text'),
+    ('run_step_logs.output_data', RunStepLog, 'output_data'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        '压缩存储报表：各压缩列与 blob 表的行数、原始 / 存储字节数、压缩比与编码分布，'
+        '以及在样本上对比 zlib / lzma / zlib+字典 的压缩比与编解码耗时；--train-dict 从现有 SVG 训练预置字典'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=int, default=200, help='编解码基准的样本数（取最近的 SVG），默认 200')
+        parser.add_argument('--train-dict', action='store_true', help='用样本训练 zlib 预置字典并保存')
+        parser.add_argument('--dict-size', type=int, default=32 * 1024, help='训练字典的字节数上限，默认 32768')
+        parser.add_argument('--dict', dest='dict_id', help='参与对比的已有字典 ID（默认取 COMPRESSED_FIELD_DICT）')
+
+    def handle(self, *args, **options):
+        self.stdout.write('存储现状')
+        for label, model, field_name in COMPRESSED_COLUMNS:
+            self._column_stats(label, model, field_name)
+        self._blob_stats()
+
+        samples = self._samples(options['sample'])
+        if not samples:
+            self.stdout.write(self.style.WARNING('\n没有可用的 SVG 样本，跳过编解码基准'))
+            return
+
+        zdict_id = options['dict_id'] or os.environ.get('COMPRESSED_FIELD_DICT')
+        if options['train_dict']:
+            try:
+                zdict = train_dictionary(samples, size=options['dict_size'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            zdict_id = save_dictionary(zdict)
+            self.stdout.write(self.style.SUCCESS(
+                f'\n已训练字典 {zdict_id}（{len(zdict)} 字节，{len(samples)} 个样本）；'
+                f'设置 COMPRESSED_FIELD_DICT={zdict_id} 后新写入的数据将使用该字典'
+            ))
+        if zdict_id:
+            try:
+                load_dictionary(zdict_id)
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        self.stdout.write(f'\n编解码基准（{len(samples)} 个样本，共 {sum(len(s.encode()) for s in samples)} 字节）')
+        cases = [('zlib', {'codec': 'zlib'}), ('lzma', {'codec': 'lzma'})]
+        if zdict_id:
+            cases.append((f'zlib+dict({zdict_id})', {'codec': 'zlib', 'zdict_id': zdict_id}))
+        for name, kwargs in cases:
+            self._bench_codec(name, samples, kwargs)
+
+    def _column_stats(self, label, model, field_name):
+        """直接读取原始列值，统计存储字节与逻辑字节"""
+        column = model._meta.get_field(field_name).column
+        quote = connection.ops.quote_name
+        rows = raw_total = stored_total = 0
+        codecs = Counter()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {quote(column)} FROM {quote(model._meta.db_table)} WHERE {quote(column)} IS NOT NULL')
+            while True:
+                batch = cursor.fetchmany(500)
+                if not batch:
+                    break
+                for (value,) in batch:
+                    rows += 1
+                    codecs[codec_of(value)] += 1
+                    stored_total += len(value.encode('utf-8')) if isinstance(value, str) else len(value)
+                    raw_total += len(decode_text(value).encode('utf-8'))
+        self.stdout.write(
+            f'  {label:<28} rows={rows:<7} raw={raw_total:<10} stored={stored_total:<10} '
+            f'ratio={_ratio(raw_total, stored_total)} codecs={dict(codecs)}'
+        )
+
+    def _blob_stats(self):
+        rows = raw_total = stored_total = 0
+        codecs = Counter()
+        for size, stored_size, codec in Blob.objects.values_list('size', 'stored_size', 'codec').iterator():
+            rows += 1
+            raw_total += size
+            stored_total += stored_size
+            codecs[codec] += 1
+        self.stdout.write(
+            f"  {'blobs':<28} rows={rows:<7} raw={raw_total:<10} stored={stored_total:<10} "
+            f'ratio={_ratio(raw_total, stored_total)} codecs={dict(codecs)}'
+        )
+
+    def _samples(self, limit):
+        """最近的 SVG：草稿（含 blob 中的）与 SvgDraw"""
+        samples = []
+        for draft in Draft.objects.filter(dsl_type='svg').order_by('-created_at')[:limit]:
+            samples.append(draft.code)
+        for draw in SvgDraw.objects.order_by('-created_at')[:max(0, limit - len(samples))]:
+            samples.append(draw.svg_content)
+        if len(samples) < limit:
+            keys = Blob.objects.order_by('-created_at').values_list('key', flat=True)[:limit - len(samples)]
+            samples.extend(BlobStore.get(key) for key in keys)
+        return [s for s in samples if s]
+
+    def _bench_codec(self, name, samples, kwargs):
+        raw_total = stored_total = 0
+        encode_time = decode_time = 0.0
+        for text in samples:
+            started = time.perf_counter()
+            packed = encode_text(text, **kwargs)
+            encode_time += time.perf_counter() - started
+            started = time.perf_counter()
+            decode_text(packed)
+            decode_time += time.perf_counter() - started
+            raw_total += len(text.encode('utf-8'))
+            stored_total += len(packed)
+        mb = raw_total / 1e6
+        self.stdout.write(
+            f'  {name:<24} stored={stored_total:<10} ratio={_ratio(raw_total, stored_total)} '
+            f'encode={encode_time * 1000:.1f}ms ({mb / encode_time if encode_time else 0:.1f}MB/s) '
+            f'decode={decode_time * 1000:.1f}ms ({mb / decode_time if decode_time else 0:.1f}MB/s)'
+        )
+
+
+def _ratio(raw_total, stored_total):
+    return f'{raw_total / stored_total:.2f}x' if raw_total and stored_total else '-'
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from m8_blobs.services import BlobStore
+
+
+class Command(BaseCommand):
+    help = '回收无引用的 blob（草稿、步骤输出、产物都不再引用且计数归零）；--recount 先按引用行重算引用计数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=float, default=3600,
+                            help='计数归零后至少保留的秒数，避开引用尚未落库的运行，默认 3600')
+        parser.add_argument('--recount', action='store_true', help='先按实际引用行重算引用计数')
+        parser.add_argument('--dry-run', action='store_true', help='只统计，不删除')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            fixed = BlobStore.recount()
+            self.stdout.write(f'修正了 {fixed} 个 blob 的引用计数')
+
+        count, size = BlobStore.gc(grace=timedelta(seconds=options['grace']), dry_run=options['dry_run'])
+        verb = '可回收' if options['dry_run'] else '已回收'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {count} 个 blob，共 {size} 字节'))
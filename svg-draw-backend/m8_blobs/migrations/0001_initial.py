@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.PositiveIntegerField()),
+                ('stored_size', models.PositiveIntegerField()),
+                ('codec', models.CharField(choices=[('raw', '未压缩'), ('zlib', 'zlib')], default='raw', max_length=10)),
+                ('data', models.BinaryField(blank=True, null=True)),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'blobs',
+                'indexes': [models.Index(fields=['refcount', 'updated_at'], name='blobs_gc_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('m8_blobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blob',
+            name='codec',
+            field=models.CharField(choices=[('raw', '未压缩'), ('zlib', 'zlib'), ('packed', 'common.fields 编码（lzma / zlib+字典）')], default='raw', max_length=10),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import models
+
+
+class Blob(models.Model):
+    """按内容哈希（SHA-256）寻址的大文本，相同内容只存一份"""
+    CODEC_CHOICES = [
+        ('raw', '未压缩'),
+        ('zlib', 'zlib'),
+        ('packed', 'common.fields 编码（lzma / zlib+字典）'),
+    ]
+
+    key = models.CharField(max_length=64, primary_key=True)  # UTF-8 内容的 SHA-256
+    size = models.PositiveIntegerField()                      # 原始字节数
+    stored_size = models.PositiveIntegerField()               # 编码后字节数
+    codec = models.CharField(max_length=10, choices=CODEC_CHOICES, default='raw')
+    # 为空时内容在 BLOB_STORE_DIR 下的文件中
+    data = models.BinaryField(null=True, blank=True)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'blobs'
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at'], name='blobs_gc_idx'),
+        ]
+
+    def __str__(self):
+        return f"Blob {self.key[:12]} ({self.size} bytes, refs={self.refcount})"
+
+    @property
+    def on_disk(self) -> bool:
+        return self.data is None
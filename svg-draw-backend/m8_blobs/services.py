@@ -0,0 +1,217 @@
+"""
+内容寻址 blob 存储：同一份生成的 SVG 只存一次，Draft / RunStepLog / Artifact 通过外键引用
+- key 为 UTF-8 内容的 SHA-256；内容不可变，读取结果可在进程内缓存
+- 默认 zlib 压缩（压缩后更小时才使用）；设置了 COMPRESSED_FIELD_CODEC=lzma 或 COMPRESSED_FIELD_DICT 时
+  与压缩字段使用同一编码（见 common/fields.py）；设置 BLOB_STORE_DIR 时内容写入
+  <BLOB_STORE_DIR>/<key 前两位>/<key> 文件，数据库只保存元数据
+- 引用计数：写入引用时 put / retain 加一，引用行删除时（post_delete 信号）release 减一；
+  gc 只删除计数归零、超过宽限期且确实没有任何引用行的 blob，计数偏差可用 recount 按引用行重算
+
+可通过环境变量调整（均为可选）：
+- BLOB_STORE_DIR         blob 文件目录（相对路径基于项目目录），不设置时存入数据库
+- BLOB_STORE_MIN_SIZE    不小于该字节数的文本才移入 blob 存储，默认 1024
+- BLOB_STORE_COMPRESS    是否 zlib 压缩，默认 1
+- BLOB_STORE_CACHE_SIZE  进程内缓存的 blob 数，默认 64
+"""
+import os
+import zlib
+import hashlib
+import logging
+import tempfile
+from datetime import timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from common.fields import decode_text, encode_text
+from .models import Blob
+
+logger = logging.getLogger(__name__)
+
+BLOB_STORE_MIN_SIZE = int(os.environ.get("BLOB_STORE_MIN_SIZE", 1024))
+BLOB_STORE_COMPRESS = os.environ.get("BLOB_STORE_COMPRESS", "1").lower() not in ("0", "false", "no")
+BLOB_STORE_CACHE_SIZE = int(os.environ.get("BLOB_STORE_CACHE_SIZE", 64))
+
+
+def blob_dir() -> Optional[Path]:
+    """blob 文件目录；未设置 BLOB_STORE_DIR 时返回 None（内容存数据库）"""
+    value = os.environ.get("BLOB_STORE_DIR")
+    if not value:
+        return None
+    path = Path(value)
+    return path if path.is_absolute() else Path(settings.BASE_DIR) / path
+
+
+def _blob_path(root: Path, key: str) -> Path:
+    return root / key[:2] / key
+
+
+def _encode(text: str, raw: bytes) -> Tuple[str, bytes]:
+    if not BLOB_STORE_COMPRESS:
+        return "raw", raw
+    codec = os.environ.get("COMPRESSED_FIELD_CODEC") or "zlib"
+    zdict_id = os.environ.get("COMPRESSED_FIELD_DICT")
+    if codec == "lzma" or zdict_id:
+        return "packed", encode_text(text, codec=codec, zdict_id=zdict_id if codec == "zlib" else None)
+    packed = zlib.compress(raw, 6)
+    if len(packed) < len(raw):
+        return "zlib", packed
+    return "raw", raw
+
+
+def _decode(codec: str, data: bytes) -> str:
+    if codec == "packed":
+        return decode_text(data)
+    if codec == "zlib":
+        data = zlib.decompress(data)
+    return data.decode("utf-8")
+
+
+def _write_file(root: Path, key: str, data: bytes) -> None:
+    """
+    原子写入：先写临时文件再改名。文件已存在时同样重写（同一 key 内容相同）：
+    不能据此跳过，该文件可能属于 gc 刚删除、即将删除的 blob。
+    """
+    path = _blob_path(root, key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+@lru_cache(maxsize=BLOB_STORE_CACHE_SIZE)
+def _load(key: str) -> str:
+    blob = Blob.objects.only("key", "codec", "data").get(key=key)
+    return BlobStore.content(blob)
+
+
+class BlobStore:
+    """blob 存储服务"""
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def should_store(text: Optional[str]) -> bool:
+        """文本是否大到值得移入 blob 存储（小文本内联更省查询）"""
+        return bool(text) and len(text.encode("utf-8")) >= BLOB_STORE_MIN_SIZE
+
+    @staticmethod
+    def put(text: str, refs: int = 1) -> Blob:
+        """写入文本并增加 refs 个引用；内容已存在时只增加引用计数"""
+        key = BlobStore.key(text)
+        now = timezone.now()
+        if Blob.objects.filter(key=key).update(refcount=F("refcount") + refs, updated_at=now):
+            return Blob(key=key)
+
+        raw = text.encode("utf-8")
+        codec, data = _encode(text, raw)
+        root = blob_dir()
+        if root is not None:
+            _write_file(root, key, data)
+        try:
+            with transaction.atomic():
+                blob = Blob.objects.create(
+                    key=key, size=len(raw), stored_size=len(data), codec=codec,
+                    data=None if root is not None else data, refcount=refs,
+                )
+        except IntegrityError:
+            # 并发写入了同一内容
+            Blob.objects.filter(key=key).update(refcount=F("refcount") + refs, updated_at=now)
+            return Blob(key=key)
+        logger.info(f"Stored blob {key[:12]} ({len(raw)} -> {len(data)} bytes, {codec})")
+        return blob
+
+    @staticmethod
+    def put_if_large(text: Optional[str], refs: int = 1) -> Optional[Blob]:
+        """文本达到 BLOB_STORE_MIN_SIZE 时写入并返回 blob，否则返回 None（调用方内联保存）"""
+        if not BlobStore.should_store(text):
+            return None
+        return BlobStore.put(text, refs=refs)
+
+    @staticmethod
+    def retain(blob: Union[Blob, str], refs: int = 1) -> None:
+        """为已存在的 blob 增加引用"""
+        key = blob.key if isinstance(blob, Blob) else blob
+        Blob.objects.filter(key=key).update(refcount=F("refcount") + refs, updated_at=timezone.now())
+
+    @staticmethod
+    def release(key: str, refs: int = 1) -> None:
+        """释放引用；计数归零的 blob 由 gc 回收"""
+        Blob.objects.filter(key=key).update(refcount=F("refcount") - refs, updated_at=timezone.now())
+
+    @staticmethod
+    def get(key: str) -> str:
+        """按 key 读取文本（进程内 LRU 缓存）"""
+        return _load(key)
+
+    @staticmethod
+    def content(blob: Blob) -> str:
+        """解码已加载的 blob 实例"""
+        if blob.data is not None:
+            return _decode(blob.codec, bytes(blob.data))
+        root = blob_dir()
+        if root is None:
+            raise ValueError(f"Blob {blob.key} is stored on disk but BLOB_STORE_DIR is not set")
+        return _decode(blob.codec, _blob_path(root, blob.key).read_bytes())
+
+    @staticmethod
+    def recount() -> int:
+        """按实际引用行重算引用计数，返回修正的 blob 数"""
+        from m1_runs.models import Artifact, RunStepLog
+        from m7_editors.models import Draft
+
+        counts = {}
+        for model, field in ((Draft, "code_blob"), (RunStepLog, "output_blob"), (Artifact, "blob")):
+            rows = model.objects.filter(**{f"{field}__isnull": False}).values(field).annotate(n=Count("pk"))
+            for row in rows:
+                counts[row[field]] = counts.get(row[field], 0) + row["n"]
+
+        fixed = 0
+        for key, refcount in Blob.objects.values_list("key", "refcount").iterator():
+            actual = counts.get(key, 0)
+            if actual != refcount:
+                Blob.objects.filter(key=key).update(refcount=actual, updated_at=timezone.now())
+                fixed += 1
+        return fixed
+
+    @staticmethod
+    def gc(grace: timedelta = timedelta(hours=1), dry_run: bool = False) -> Tuple[int, int]:
+        """
+        删除无引用的 blob，返回 (个数, 编码后字节数)。
+        宽限期用于避开“blob 已写入、引用行尚在缓冲中未落库”的运行。
+        """
+        candidates = Blob.objects.filter(
+            refcount__lte=0, updated_at__lt=timezone.now() - grace,
+            drafts=None, run_steps=None, artifacts=None,
+        )
+        rows = list(candidates.values_list("key", "stored_size"))
+        if dry_run or not rows:
+            return len(rows), sum(size for _, size in rows)
+
+        keys = [key for key, _ in rows]
+        root = blob_dir()
+        with transaction.atomic():
+            # 再次检查计数，跳过期间新增了引用的 blob
+            Blob.objects.filter(key__in=keys, refcount__lte=0).delete()
+            remaining = set(Blob.objects.filter(key__in=keys).values_list("key", flat=True))
+            deleted = [(key, size) for key, size in rows if key not in remaining]
+            # 在提交前删除文件：并发的 put 要等删除行提交后才会发现 key 不存在并重写文件，
+            # 提交后再删会删掉它刚写入的文件
+            if root is not None:
+                for key, _ in deleted:
+                    _blob_path(root, key).unlink(missing_ok=True)
+        logger.info(f"Blob gc removed {len(deleted)} blobs")
+        return len(deleted), sum(size for _, size in deleted)
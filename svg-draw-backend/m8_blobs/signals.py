@@ -0,0 +1,25 @@
+"""引用行删除时释放 blob 引用（Run 级联删除步骤与产物时同样会触发）"""
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from m1_runs.models import Artifact, RunStepLog
+from m7_editors.models import Draft
+from .services import BlobStore
+
+
+@receiver(post_delete, sender=Draft)
+def release_draft_code(sender, instance, **kwargs):
+    if instance.code_blob_id:
+        BlobStore.release(instance.code_blob_id)
+
+
+@receiver(post_delete, sender=RunStepLog)
+def release_step_output(sender, instance, **kwargs):
+    if instance.output_blob_id:
+        BlobStore.release(instance.output_blob_id)
+
+
+@receiver(post_delete, sender=Artifact)
+def release_artifact(sender, instance, **kwargs):
+    if instance.blob_id:
+        BlobStore.release(instance.blob_id)
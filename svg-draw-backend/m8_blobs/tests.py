@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from m7_editors.models import Draft
+from m8_blobs import services
+from m8_blobs.models import Blob
+from m8_blobs.services import BlobStore
+
+
+def svg(label: str) -> str:
+    return '<svg xmlns="http://www.w3.org/2000/svg">' + f'<text>{label}</text>' * 80 + "</svg>"
+
+
+class BlobRefcountTests(TestCase):
+    """引用计数与 gc：计数归零且超过宽限期、没有引用行的 blob 才被回收"""
+
+    def setUp(self):
+        services._load.cache_clear()
+
+    def test_small_text_stays_inline(self):
+        self.assertIsNone(BlobStore.put_if_large("<svg/>"))
+
+    def test_same_content_is_stored_once(self):
+        text = svg("a")
+        first = BlobStore.put(text)
+        second = BlobStore.put(text, refs=2)
+        self.assertEqual(first.key, second.key)
+        self.assertEqual(Blob.objects.get(key=first.key).refcount, 3)
+        self.assertEqual(BlobStore.get(first.key), text)
+
+    def test_gc_respects_refcount_and_grace(self):
+        key = BlobStore.put(svg("a")).key
+        self.assertEqual(BlobStore.gc(grace=timedelta(0)), (0, 0))
+        BlobStore.release(key)
+        self.assertEqual(BlobStore.gc()[0], 0)  # 仍在宽限期内
+        count, size = BlobStore.gc(grace=timedelta(0), dry_run=True)
+        self.assertEqual(count, 1)
+        self.assertGreater(size, 0)
+        self.assertTrue(Blob.objects.filter(key=key).exists())
+        self.assertEqual(BlobStore.gc(grace=timedelta(0))[0], 1)
+        self.assertFalse(Blob.objects.filter(key=key).exists())
+
+    def test_referenced_blob_survives_bad_count(self):
+        draft = Draft.objects.create(dsl_type="svg", code=svg("a"))
+        Blob.objects.filter(key=draft.code_blob_id).update(refcount=0)
+        self.assertEqual(BlobStore.gc(grace=timedelta(0))[0], 0)
+        self.assertEqual(BlobStore.recount(), 1)
+        self.assertEqual(Blob.objects.get(key=draft.code_blob_id).refcount, 1)
+
+    def test_draft_delete_releases_reference(self):
+        draft = Draft.objects.create(dsl_type="svg", code=svg("a"))
+        key = draft.code_blob_id
+        draft.delete()
+        self.assertEqual(Blob.objects.get(key=key).refcount, 0)
+        self.assertEqual(BlobStore.gc(grace=timedelta(0))[0], 1)
+
+
+class BlobFileStoreTests(TransactionTestCase):
+    """BLOB_STORE_DIR 模式：内容写入文件，gc 与 put 交错时不丢文件"""
+
+    def setUp(self):
+        services._load.cache_clear()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        patcher = mock.patch.dict(os.environ, {"BLOB_STORE_DIR": self.root})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def path(self, key):
+        return services._blob_path(services.blob_dir(), key)
+
+    def test_content_lives_on_disk(self):
+        text = svg("a")
+        key = BlobStore.put(text).key
+        self.assertTrue(Blob.objects.get(key=key).on_disk)
+        self.assertTrue(self.path(key).exists())
+        self.assertEqual(BlobStore.get(key), text)
+
+    def test_put_rewrites_file_left_by_deleted_row(self):
+        # gc 已删除行、尚未删除文件时 put 同一内容：不能因文件存在而跳过写入
+        text = svg("a")
+        key = BlobStore.put(text).key
+        Blob.objects.filter(key=key).delete()
+        self.path(key).write_bytes(b"stale")
+        BlobStore.put(text)
+        self.assertEqual(BlobStore.get(key), text)
+
+    def test_gc_unlinks_files_before_commit(self):
+        key = BlobStore.put(svg("a")).key
+        BlobStore.release(key)
+        unlink = services.Path.unlink
+        in_transaction = []
+
+        def record(path, *args, **kwargs):
+            in_transaction.append(connection.in_atomic_block and Blob.objects.filter(key=key).exists() is False)
+            return unlink(path, *args, **kwargs)
+
+        with mock.patch.object(services.Path, "unlink", record):
+            self.assertEqual(BlobStore.gc(grace=timedelta(0))[0], 1)
+        self.assertFalse(self.path(key).exists())
+        self.assertEqual(in_transaction, [True])